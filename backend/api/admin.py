@@ -0,0 +1,72 @@
+from fastapi import APIRouter, HTTPException, Depends
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.matrix_cache import get_matrix_cache
+from utils.sqlite_pool import connect, pool_stats
+from utils.schema_migrations import check_schema
+from database import DB_GEO_PATH, get_db
+from backend.api.auth import get_current_user, UserResponse
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+# User ids of the platform operators (comma separated). These routes expose and
+# change process-wide state shared by every company, so the per-company is_admin
+# flag (which every self-registered company creator gets) is not enough.
+OPERATOR_USER_IDS = {int(x) for x in os.getenv("GEOROUTE_OPERATOR_IDS", "").split(",") if x.strip().isdigit()}
+
+
+def require_operator(current_user: UserResponse = Depends(get_current_user)) -> UserResponse:
+    if current_user.id not in OPERATOR_USER_IDS:
+        raise HTTPException(status_code=403, detail="Acesso reservado aos operadores da plataforma")
+    return current_user
+
+
+@router.get("/matrix-cache")
+def get_matrix_cache_stats(current_user: UserResponse = Depends(require_operator)):
+    """Hit/miss counters and size of the persistent distance matrix cache."""
+    return get_matrix_cache().get_stats()
+
+
+@router.delete("/matrix-cache")
+def clear_matrix_cache(current_user: UserResponse = Depends(require_operator)):
+    get_matrix_cache().clear()
+    return {"status": "success", "message": "Cache de matrizes limpa"}
+
+
+@router.get("/db-pools")
+def get_db_pool_stats(current_user: UserResponse = Depends(require_operator)):
+    """Per-database connection pool counters (opened, reused, in use, idle)."""
+    return {"pools": pool_stats()}
+
+
+@router.get("/schema")
+def get_schema_status(current_user: UserResponse = Depends(require_operator)):
+    """Applied migrations, missing indexes and hot queries that fall back to a full table scan."""
+    with get_db() as conn:
+        report = {"multi": check_schema(conn, "multi")}
+    if os.path.exists(DB_GEO_PATH):
+        conn = connect(DB_GEO_PATH, readonly=True)
+        try:
+            report["geo"] = check_schema(conn, "geo")
+        finally:
+            conn.close()
+    return report
+
+
+@router.get("/solver-portfolio")
+def get_solver_portfolio_stats(days: int = 30, current_user: UserResponse = Depends(require_operator)):
+    """How often each portfolio configuration produced the best solution in the last days."""
+    with get_db() as conn:
+        rows = conn.execute(
+            """SELECT winner, COUNT(*) AS wins FROM solver_portfolio_runs
+               WHERE created_at >= datetime('now', ?) GROUP BY winner ORDER BY wins DESC""",
+            (f"-{max(1, int(days))} days",)
+        ).fetchall()
+    total = sum(r["wins"] for r in rows)
+    return {
+        "days": days,
+        "runs": total,
+        "configs": [{"name": r["winner"], "wins": r["wins"], "share": round(r["wins"] / total, 3)} for r in rows],
+    }
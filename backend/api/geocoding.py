@@ -8,6 +8,10 @@ from pydantic import BaseModel
 
 from typing import List, Optional
 
+import threading
+
+import time
+
 import io
 
 import uuid
@@ -16,6 +20,8 @@ import os
 DB_MULTI_PATH = os.getenv("DB_MULTI_PATH", "geocoding_multi.db")
 DB_GEO_PATH = os.getenv("DB_GEO_PATH", "geocoding.db")
 
+GEOCODE_BACKGROUND_FILL = os.getenv("GEOCODE_BACKGROUND_FILL", "1") == "1"
+
 
 
 import shutil
@@ -34,6 +40,18 @@ from database import get_db, get_projeto
 
 from utils.geocoder_engine import WaterfallGeocoder
 
+from utils.geocoding_pipeline import run_geocoding_pipeline
+
+from utils.persistence_manager import serialize_state, deserialize_state
+
+from utils.route_store import load_routes, save_routes
+
+from utils.geocode_cache import address_key
+
+from utils.external_geocoding import get_external_stage
+
+from utils.sqlite_pool import connect, pooled_connection
+
 from backend.api.auth import get_current_user, UserResponse
 
 
@@ -80,6 +98,8 @@ class ColumnMapping(BaseModel):
 
     col_lon: Optional[str] = None
 
+    background_fill: Optional[bool] = None
+
 
 
 class DeliveryCorrection(BaseModel):
@@ -171,9 +191,177 @@ async def upload_file(file: UploadFile = File(...), current_user: UserResponse =
 
 
 
+# Latest per-chunk progress of /start, keyed by project id
+
+_progress = {}
+
+_progress_lock = threading.Lock()
+
+
+
+
+
+def _set_progress(project_id: int, **fields):
+
+    with _progress_lock:
+
+        entry = _progress.setdefault(project_id, {})
+
+        if fields.get("status") == "running" and entry.get("status") in ("done", "failed"):
+
+            entry.clear()
+
+        entry.update(fields)
+
+        entry["updated_at"] = time.time()
+
+
+
+
+
+def _schedule_background_fill(project_id: int, geocoder: WaterfallGeocoder) -> int:
+
+    """
+
+    Queues every delivery of the project still above quality 2 on the async external
+
+    stage. Rows sharing an address are resolved once; each improvement is written
+
+    back as soon as it arrives. Returns the number of unique addresses queued.
+
+    """
+
+    with get_db() as conn:
+
+        rows = conn.execute("""
+
+            SELECT id, morada, codigo_postal, _concelho, latitude, longitude, nivel_qualidade, fonte_match, morada_encontrada
+
+            FROM entregas
+
+            WHERE projeto_id = ? AND nivel_qualidade > 2 AND COALESCE(fonte_match, '') != 'FICHEIRO'
+
+        """, (project_id,)).fetchall()
+
+        
+
+    groups = {}
+
+    for r in rows:
+
+        groups.setdefault(address_key(r["morada"], r["codigo_postal"], r["_concelho"]), []).append(r)
+
+    if not groups:
+
+        return 0
+
+        
+
+    keys = list(groups)
+
+    items = []
+
+    for key in keys:
+
+        r = groups[key][0]
+
+        local = None
+
+        if r["latitude"] and r["longitude"] and r["nivel_qualidade"] < 99:
+
+            local = {
+
+                "lat": r["latitude"],
+
+                "lon": r["longitude"],
+
+                "address": r["morada_encontrada"],
+
+                "score": 0,
+
+                "quality_level": r["nivel_qualidade"],
+
+                "source": r["fonte_match"]
+
+            }
+
+        items.append((geocoder._clean_address(r["morada"]), r["codigo_postal"], r["_concelho"], local))
+
+        
+
+    state = {"status": "running", "pending": len(items), "improved": 0}
+
+    state_lock = threading.Lock()
+
+    _set_progress(project_id, background=dict(state))
+
+    
+
+    def on_result(pos, result, learned):
+
+        group = groups[keys[pos]]
+
+        first = group[0]
+
+        improved = bool(result and result.get("lat") and result.get("lon") and result.get("quality_level", 99) < first["nivel_qualidade"])
+
+        if improved:
+
+            with get_db() as conn:
+
+                conn.executemany("""
+
+                    UPDATE entregas
+
+                    SET latitude = ?, longitude = ?, nivel_qualidade = ?, fonte_match = ?, morada_encontrada = ?
+
+                    WHERE id = ? AND nivel_qualidade = ?
+
+                """, [(
+
+                    result["lat"], result["lon"], result["quality_level"], result.get("source", "EXTERNO"),
+
+                    result.get("address") or "", r["id"], r["nivel_qualidade"]
+
+                ) for r in group])
+
+                conn.commit()
+
+        if learned:
+
+            geocoder.save_learned_batch([learned])
+
+        if geocoder.result_cache is not None:
+
+            geocoder.result_cache.put(first["morada"], first["codigo_postal"], first["_concelho"], result)
+
+            
+
+        with state_lock:
+
+            state["pending"] -= 1
+
+            state["improved"] += len(group) if improved else 0
+
+            if state["pending"] == 0:
+
+                state["status"] = "done"
+
+            snapshot = dict(state)
+
+        _set_progress(project_id, background=snapshot)
+
+        
+
+    get_external_stage().submit(geocoder, items, on_result)
+
+    return len(items)
+
+
+
 @router.post("/start")
 
-async def start_geocoding(mapping: ColumnMapping, current_user: UserResponse = Depends(get_current_user)):
+def start_geocoding(mapping: ColumnMapping, current_user: UserResponse = Depends(get_current_user)):
 
     # 1. Find the uploaded file
 
@@ -269,67 +457,65 @@ async def start_geocoding(mapping: ColumnMapping, current_user: UserResponse = D
 
             
 
-        success_count = 0
-
-        fail_count = 0
+        has_name = bool(mapping.col_name and mapping.col_name in df.columns)
 
-        
+        has_priority = bool(mapping.col_priority and mapping.col_priority in df.columns)
 
-        for idx, row in df.iterrows():
+        has_start = bool(mapping.col_start_window and mapping.col_start_window in df.columns)
 
-            code = str(row[mapping.col_code])
+        has_end = bool(mapping.col_end_window and mapping.col_end_window in df.columns)
 
-            name = str(row[mapping.col_name]) if (mapping.col_name and mapping.col_name in df.columns) else code if (mapping.col_name and mapping.col_name in df.columns) else code
+        has_file_coords = bool(mapping.col_lat and mapping.col_lat in df.columns and mapping.col_lon and mapping.col_lon in df.columns)
 
-            addr = str(row[mapping.col_addr])
+        
 
-            cp = str(row[mapping.col_cp]) if pd.notna(row[mapping.col_cp]) else ""
+        records = []
 
-            city = str(row[mapping.col_city]) if pd.notna(row[mapping.col_city]) else ""
+        for row in df.to_dict("records"):
 
-            weight = float(row[mapping.col_weight]) if pd.notna(row[mapping.col_weight]) else 0.0
+            code = str(row[mapping.col_code])
 
-            volume = float(row[mapping.col_volume]) if pd.notna(row[mapping.col_volume]) else 0.0
+            addr = str(row[mapping.col_addr])
 
-            
+            rec = {
 
-            priority = 2
+                "code": code,
 
-            if mapping.col_priority and mapping.col_priority in df.columns:
+                "name": str(row[mapping.col_name]) if has_name else code,
 
-                try:
+                "address": addr,
 
-                    priority = int(row[mapping.col_priority])
+                "cp": str(row[mapping.col_cp]) if pd.notna(row[mapping.col_cp]) else "",
 
-                except Exception:
+                "concelho": str(row[mapping.col_city]) if pd.notna(row[mapping.col_city]) else "",
 
-                    priority = 2
+                "weight": float(row[mapping.col_weight]) if pd.notna(row[mapping.col_weight]) else 0.0,
 
-                    
+                "volume": float(row[mapping.col_volume]) if pd.notna(row[mapping.col_volume]) else 0.0,
 
-            start_window = "08:00"
+                "priority": 2,
 
-            if mapping.col_start_window and mapping.col_start_window in df.columns:
+                "start_window": str(row[mapping.col_start_window]) if has_start else "08:00",
 
-                start_window = str(row[mapping.col_start_window])
+                "end_window": str(row[mapping.col_end_window]) if has_end else "18:00",
 
-                
+                "result": None
 
-            end_window = "18:00"
+            }
 
-            if mapping.col_end_window and mapping.col_end_window in df.columns:
+            if has_priority:
 
-                end_window = str(row[mapping.col_end_window])
+                try:
 
-                
+                    rec["priority"] = int(row[mapping.col_priority])
 
-            has_coords = False
+                except Exception:
 
-            lat_val = 0.0
+                    rec["priority"] = 2
 
-            lon_val = 0.0
+                    
 
-            if mapping.col_lat and mapping.col_lat in df.columns and mapping.col_lon and mapping.col_lon in df.columns:
+            if has_file_coords:
 
                 try:
 
@@ -345,85 +531,85 @@ async def start_geocoding(mapping: ColumnMapping, current_user: UserResponse = D
 
                         if lat_val != 0 and -90 <= lat_val <= 90:
 
-                            has_coords = True
+                            rec["result"] = {
 
-                except Exception:
+                                "lat": lat_val,
 
-                    has_coords = False
+                                "lon": lon_val,
 
-                    
+                                "quality_level": 0,
 
-            if has_coords:
+                                "source": "FICHEIRO",
 
-                res = {
+                                "morada_encontrada": addr
 
-                    "lat": lat_val,
+                            }
 
-                    "lon": lon_val,
-
-                    "quality_level": 0,
+                except Exception:
 
-                    "source": "FICHEIRO",
+                    pass
 
-                    "morada_encontrada": addr
+            records.append(rec)
 
-                }
+            
 
-            else:
+        counts = {"success": 0, "failed": 0}
 
-                try:
+        
 
-                    resolve_res = geocoder.resolve_address(addr, cp, city, fast_mode=True)
+        def write_chunk(chunk):
 
-                    if isinstance(resolve_res, tuple):
+            rows = []
 
-                        res = resolve_res[0]
+            for rec, res in chunk:
 
-                    else:
+                if res and res.get('lat') and res.get('lon'):
 
-                        res = resolve_res
+                    lat = res['lat']
 
-                except Exception:
+                    lon = res['lon']
 
-                    res = None
+                    quality = res.get('quality_level', 1)
 
-                    
+                    source = res.get('source', 'NOMINATIM')
 
-            if res and res.get('lat') and res.get('lon'):
+                    morada_encontrada = res.get('morada_encontrada', rec["address"])
 
-                lat = res['lat']
+                    counts["success"] += 1
 
-                lon = res['lon']
+                else:
 
-                quality = res.get('quality_level', 1)
+                    lat = 0.0
 
-                source = res.get('source', 'NOMINATIM')
+                    lon = 0.0
 
-                morada_encontrada = res.get('morada_encontrada', addr)
+                    quality = 99
 
-                success_count += 1
+                    source = "FALHA"
 
-            else:
+                    morada_encontrada = ""
 
-                lat = 0.0
+                    counts["failed"] += 1
 
-                lon = 0.0
+                rows.append((
 
-                quality = 99
+                    mapping.project_id, rec["code"], rec["name"], rec["address"], rec["cp"], rec["concelho"],
 
-                source = "FALHA"
+                    rec["weight"], rec["volume"], rec["priority"], rec["start_window"], rec["end_window"],
 
-                morada_encontrada = ""
+                    lat, lon, quality, source, morada_encontrada
 
-                fail_count += 1
+                ))
 
                 
 
+            # One transaction per chunk
+
             with get_db() as conn:
 
                 cursor = conn.cursor()
 
-                cursor.execute("""
+                cursor.executemany("""
 
                     INSERT INTO entregas (
 
@@ -435,19 +621,35 @@ async def start_geocoding(mapping: ColumnMapping, current_user: UserResponse = D
 
                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 
-                """, (
+                """, rows)
 
-                    mapping.project_id, code, name, addr, cp, city,
+                conn.commit()
 
-                    weight, volume, priority, start_window, end_window,
+                
 
-                    lat, lon, quality, source, morada_encontrada
+        def report(stats):
 
-                ))
+            _set_progress(mapping.project_id, status="running", success=counts["success"], failed=counts["failed"], **stats)
 
-                conn.commit()
+            
 
-                
+        _set_progress(mapping.project_id, status="running", total=len(records), processed=0)
+
+        stats = run_geocoding_pipeline(records, geocoder, write_chunk, progress_callback=report)
+
+        _set_progress(mapping.project_id, status="done", success=counts["success"], failed=counts["failed"], **stats)
+
+        
+
+        # Slow waterfall levels (scraper, Nominatim, Google) fill the gaps in background
+
+        background_pending = 0
+
+        if mapping.background_fill if mapping.background_fill is not None else GEOCODE_BACKGROUND_FILL:
+
+            background_pending = _schedule_background_fill(mapping.project_id, geocoder)
+
+        
 
         os.remove(file_path)
 
@@ -459,14 +661,22 @@ async def start_geocoding(mapping: ColumnMapping, current_user: UserResponse = D
 
             "total": len(df),
 
-            "success": success_count,
+            "success": counts["success"],
+
+            "failed": counts["failed"],
 
-            "failed": fail_count
+            "unique_addresses": stats["unique"],
+
+            "chunks": stats["chunks"],
+
+            "background_pending": background_pending
 
         }
 
     except Exception as e:
 
+        _set_progress(mapping.project_id, status="failed", error=str(e))
+
         if os.path.exists(file_path):
 
             os.remove(file_path)
@@ -477,6 +687,26 @@ async def start_geocoding(mapping: ColumnMapping, current_user: UserResponse = D
 
 
 
+@router.get("/progress/{project_id}")
+
+def get_geocoding_progress(project_id: int, current_user: UserResponse = Depends(get_current_user)):
+
+    proj = get_projeto(project_id)
+
+    if not proj or proj["empresa_id"] != current_user.empresa_id:
+
+        raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
+
+    with _progress_lock:
+
+        entry = dict(_progress.get(project_id, {}))
+
+    return entry or {"status": "idle"}
+
+
+
+
+
 def get_failure_reason(morada: str, cp: str, concelho: str, lat: float, lon: float, quality: int) -> str:
 
     if lat != 0.0 and lon != 0.0 and quality < 99:
@@ -581,18 +811,12 @@ def get_suggestions(
 
         db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), DB_GEO_PATH)
 
-        conn = sqlite3.connect(db_path)
-
-        conn.row_factory = sqlite3.Row
-
-        cursor = conn.cursor()
-
-        
-
         query_parts = []
 
         params = []
 
+        exact_concelho = False
+
         
 
         if cp and len(cp.replace('-', '')) >= 4:
@@ -607,9 +831,21 @@ def get_suggestions(
 
         if concelho:
 
-            query_parts.append("LOWER(cc_desig) LIKE ?")
+            # cc_norm is indexed: exact concelho on its own, "contains" once CP4 has narrowed the rows
+
+            if query_parts:
+
+                query_parts.append("cc_norm LIKE ?")
+
+                params.append(f"%{concelho.strip()}%")
 
-            params.append(f"%{concelho.lower().strip()}%")
+            else:
+
+                query_parts.append("cc_norm = UPPER(TRIM(?))")
+
+                params.append(concelho)
+
+                exact_concelho = True
 
             
 
@@ -619,26 +855,42 @@ def get_suggestions(
 
             
 
-        query = f"""
+        def suggestions_query(parts):
 
-            SELECT DISTINCT full_street, CP4, cc_desig, LATITUDE, LONGITUDE
+            return f"""
 
-            FROM pt_addresses
+                SELECT DISTINCT full_street, CP4, cc_desig, LATITUDE, LONGITUDE
 
-            WHERE {' AND '.join(query_parts)}
+                FROM pt_addresses
 
-            AND LATITUDE IS NOT NULL
+                WHERE {' AND '.join(parts)}
 
-            LIMIT 50
+                AND LATITUDE IS NOT NULL
 
-        """
+                LIMIT 50
+
+            """
 
         
 
-        cursor.execute(query, params)
+        conn = connect(db_path, readonly=True, row_factory=sqlite3.Row)
+
+        cursor = conn.cursor()
+
+        cursor.execute(suggestions_query(query_parts), params)
 
         rows = cursor.fetchall()
 
+        if not rows and exact_concelho:
+
+            # Partial concelho name: fall back to the (unindexed) substring match
+
+            fallback_parts = ["cc_norm LIKE ?"]
+
+            cursor.execute(suggestions_query(fallback_parts), [f"%{concelho.strip()}%"])
+
+            rows = cursor.fetchall()
+
         conn.close()
 
         
@@ -796,6 +1048,42 @@ def get_deliveries(project_id: int, current_user: UserResponse = Depends(get_cur
 
 
 
+def _patch_route_stops(project_id: int, client_code, corr, user_id: int):
+
+    """Mirrors a coordinate correction into route_stops as row-level updates."""
+
+    try:
+
+        stored = load_routes(project_id)
+
+        if stored is None:
+
+            return
+
+        routes, version = stored
+
+        code = str(client_code).strip().upper()
+
+        changed = False
+
+        for r in routes:
+
+            if str(r.get("Cliente", "")).strip().upper() == code:
+
+                r.update(Latitude=corr.latitude, Longitude=corr.longitude, Morada=corr.morada, Localidade=corr.concelho)
+
+                changed = True
+
+        if changed:
+
+            save_routes(project_id, routes, user_id, "correcao", expected_version=version)
+
+    except Exception as e:
+
+        print(f"[AVISO] Não foi possível atualizar route_stops: {e}")
+
+
+
 @router.put("/delivery/{delivery_id}")
 
 def update_delivery_correction(delivery_id: int, corr: DeliveryCorrection, current_user: UserResponse = Depends(get_current_user)):
@@ -808,7 +1096,7 @@ def update_delivery_correction(delivery_id: int, corr: DeliveryCorrection, curre
 
             cursor.execute("""
 
-                SELECT e.id, p.empresa_id 
+                SELECT e.id, p.empresa_id, e.morada, e.codigo_postal, e._concelho 
 
                 FROM entregas e 
 
@@ -844,7 +1132,7 @@ def update_delivery_correction(delivery_id: int, corr: DeliveryCorrection, curre
                 try:
                     import sqlite3
                     from datetime import datetime
-                    with sqlite3.connect(DB_GEO_PATH) as geo_conn:
+                    with pooled_connection(DB_GEO_PATH) as geo_conn:
                         geo_cur = geo_conn.cursor()
                         cp_raw = str(corr.codigo_postal or "").strip()
                         cp4_str = cp_raw.split("-")[0].strip() if cp_raw else ""
@@ -898,6 +1186,10 @@ def update_delivery_correction(delivery_id: int, corr: DeliveryCorrection, curre
 
             conn.commit()
 
+            if deliv_info:
+
+                _patch_route_stops(deliv_info["projeto_id"], deliv_info["codigo_cliente"], corr, current_user.id)
+
             
 
             try:
@@ -934,6 +1226,14 @@ def update_delivery_correction(delivery_id: int, corr: DeliveryCorrection, curre
 
                 geocoder.save_learned_batch([learned_entry])
 
+                # Future uploads of the original (and corrected) address reuse the manual fix
+
+                if geocoder.result_cache is not None and corr.latitude != 0.0 and corr.longitude != 0.0:
+
+                    geocoder.result_cache.put_manual(row["morada"], row["codigo_postal"], row["_concelho"], corr.latitude, corr.longitude, corr.morada)
+
+                    geocoder.result_cache.put_manual(corr.morada, corr.codigo_postal, corr.concelho, corr.latitude, corr.longitude)
+
             except Exception as e:
 
                 print(f"Error saving learned batch: {e}")
@@ -16,6 +16,7 @@ import pandas as pd
 import io
 import unicodedata
 from backend.api.auth import get_current_user, UserResponse
+from utils.sqlite_pool import connect
 
 router = APIRouter()
 
@@ -26,14 +27,11 @@ CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
 os.makedirs(CACHE_DIR, exist_ok=True)
 
 def get_geo_db():
-    conn = sqlite3.connect(DB_GEO_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # The CTT address base is only read here
+    return connect(DB_GEO_PATH, readonly=True, row_factory=sqlite3.Row)
 
 def get_multi_db():
-    conn = sqlite3.connect(DB_MULTI_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(DB_MULTI_PATH, row_factory=sqlite3.Row)
 
 def init_db_tables():
     conn = get_multi_db()
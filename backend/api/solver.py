@@ -5,6 +5,8 @@ from typing import List, Dict, Any, Optional
 import os
 import sys
 import io
+import json
+import time
 import pandas as pd
 from datetime import datetime, timedelta
 import math
@@ -13,9 +15,15 @@ import math
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from database import get_db, get_projeto
 from utils.distance_calculator import calculate_haversine_matrix
+from utils.routing_engine import get_matrix_provider
 from utils.optimization_solver import AdvancedRouteOptimizer
+from utils.local_search import improve_route
+from utils.insertion import InsertionEngine, InsertionRoute
+from utils.timing import StageTimer, profile, timed
 from utils.persistence_manager import serialize_state, deserialize_state
+from utils.route_store import RouteVersionConflict, get_route_changes, load_project_state, replace_routes, save_routes
 from backend.api.auth import get_current_user, UserResponse
+from backend.solver_jobs import get_job_manager, TERMINAL_STATES
 
 router = APIRouter(prefix="/solver", tags=["solver"])
 
@@ -89,6 +97,32 @@ class OptimizeRouteRequest(BaseModel):
     project_id: int
     route_name: str
 
+class EditOperation(BaseModel):
+    op: str  # move | reorder | swap | transfer | unassign
+    client_code: Optional[str] = None
+    delivery_id: Optional[int] = None
+    address: Optional[str] = None
+    new_route: Optional[str] = None
+    route_name: Optional[str] = None
+    new_order: Optional[int] = None
+    other_client_code: Optional[str] = None
+    other_delivery_id: Optional[int] = None
+    other_address: Optional[str] = None
+    source_route: Optional[str] = None
+    target_route: Optional[str] = None
+
+class BatchEditRequest(BaseModel):
+    project_id: int
+    operations: List[EditOperation]
+    expected_version: Optional[int] = None
+
+class InsertRequest(BaseModel):
+    project_id: int
+    delivery_ids: Optional[List[int]] = None  # default: every "Por Distribuir" stop
+    route_names: Optional[List[str]] = None   # default: every route of the fleet
+    max_insertions: Optional[int] = None
+    expected_version: Optional[int] = None
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     R = 6371.0
     lat1, lon1, lat2, lon2 = map(math.radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
@@ -180,6 +214,7 @@ def get_depot_coords(warehouses_df, wh_name=None):
         return float(warehouses_df.iloc[0]["Latitude"]), float(warehouses_df.iloc[0]["Longitude"])
     return 38.6593, -9.1758
 
+@timed("recalculate_route_stops", rows=len)
 def recalculate_route_stops(stops_iterable, depot_lat: float, depot_lon: float, start_time_str: str = "09:50", avg_speed: float = 50.0, default_service_time: int = 15) -> list:
     updated_stops = []
     if avg_speed <= 0:
@@ -237,113 +272,543 @@ def recalculate_route_stops(stops_iterable, depot_lat: float, depot_lon: float,
         
     return updated_stops
 
-@router.post("/solve")
-def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_current_user)):
-    proj = get_projeto(req.project_id)
-    if not proj or proj["empresa_id"] != current_user.empresa_id:
-        raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
+def _load_routes_state(project_id: int, missing_detail: str):
+    """Latest project state with the current routes (route_stops over the snapshot) and their version."""
+    state_dict, version = load_project_state(project_id)
+    if state_dict is None:
+        raise HTTPException(status_code=400, detail=missing_detail)
+        
+    raw_routes = state_dict.get("routes_solution")
+    if raw_routes is None:
+        raise HTTPException(status_code=400, detail="Não existem rotas ativas neste projeto.")
         
+    df_routes = raw_routes if isinstance(raw_routes, pd.DataFrame) else pd.DataFrame(raw_routes)
+    if df_routes.empty:
+        raise HTTPException(status_code=400, detail="A lista de rotas está vazia.")
+    return state_dict, df_routes, version
+
+def _persist_route_edit(project_id: int, df_new_routes: pd.DataFrame, user_id: int, operation: str, expected_version: int) -> int:
+    """Row-level write of an edited plan; 409 if someone else changed the routes meanwhile."""
     try:
-        # 1. Get latest snapshot
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (req.project_id,))
-            row = cursor.fetchone()
+        version, _ = save_routes(project_id, df_new_routes, user_id, operation, expected_version=expected_version)
+    except RouteVersionConflict:
+        raise HTTPException(status_code=409, detail="As rotas foram alteradas entretanto. Recarregue o plano e tente novamente.")
+    return version
+
+class RoutePlan:
+    """
+    A project's routes loaded for manual editing. Edit operations only mark the
+    routes they touch as dirty; recompute() re-times just those routes and
+    delta() returns their stops, so moving one stop no longer reprocesses every route.
+    """
+    
+    def __init__(self, state_dict: Dict[str, Any], df_routes: pd.DataFrame):
+        warehouses_df = state_dict.get("warehouses_geocoded")
+        if warehouses_df is None or (isinstance(warehouses_df, pd.DataFrame) and warehouses_df.empty):
+            warehouses_df = state_dict.get("warehouses_used", pd.DataFrame())
+        fleet_config = state_dict.get("fleet_config") or state_dict.get("fleet_config_used", {})
+        self.warehouses_df = warehouses_df
+        self.fleet_dict = extract_fleet_dict(fleet_config, warehouses_df)
+        self.df = df_routes.reset_index(drop=True)
+        self.dirty = set()
+        self.changed = set()
+        
+    @staticmethod
+    def route_key(name) -> str:
+        return "Por Distribuir" if is_pending_route(name) else name
+        
+    def route_keys(self) -> pd.Series:
+        return self.df["Rota"].map(self.route_key)
+        
+    def mark_dirty(self, *names):
+        self.dirty.update(self.route_key(n) for n in names)
+        
+    def route_stops(self, route_name: str) -> pd.DataFrame:
+        return self.df[self.df["Rota"] == route_name].sort_values(by="Ordem")
+        
+    def find_stop(self, delivery_id=None, client_code=None, address=None, candidates: Optional[pd.DataFrame] = None):
+        """Index of a stop by delivery id, then client code + address, then client code."""
+        df = self.df if candidates is None else candidates
+        
+        # Match by delivery_id / ID_Original if supplied
+        if delivery_id is not None:
+            for col in ("id", "ID_Original"):
+                if col in df.columns:
+                    m_id = df[df[col] == delivery_id].index
+                    if len(m_id) > 0:
+                        return m_id[0]
+                        
+        # Match by client_code AND address if supplied
+        if client_code and address:
+            t_code = str(client_code).strip().upper()
+            t_addr = str(address).strip().upper()
+            m_both = df[
+                (df["Cliente"].astype(str).str.strip().str.upper() == t_code) &
+                (df["Morada"].astype(str).str.strip().str.upper() == t_addr)
+            ].index
+            if len(m_both) > 0:
+                return m_both[0]
+                
+        # Match by client_code
+        if client_code:
+            t_code = str(client_code).strip().upper()
+            m_code = df[df["Cliente"].astype(str).str.strip().str.upper() == t_code].index
+            if len(m_code) == 0:
+                m_code = df[df["Cliente"].astype(str).str.contains(t_code, case=False, na=False, regex=False)].index
+            if len(m_code) > 0:
+                return m_code[0]
+        return None
+        
+    # ---------- edit operations ----------
+    
+    def move(self, idx, new_route: str):
+        new_route = self.route_key(new_route)
+        old_route = self.df.at[idx, "Rota"]
+        self.df.at[idx, "Rota"] = new_route
+        if not is_pending_route(new_route):
+            self.df.at[idx, "Ordem"] = 99999
+        self.mark_dirty(old_route, new_route)
+        
+    def transfer(self, source_route: str, target_route: str) -> int:
+        """Moves every stop of source_route to target_route; returns how many moved."""
+        src_clean = source_route.strip()
+        tgt_clean = self.route_key(target_route.strip())
+        if is_pending_route(src_clean):
+            src_mask = self.df["Rota"].astype(str).apply(is_pending_route)
+        else:
+            src_mask = self.df["Rota"].astype(str).str.strip().str.upper() == src_clean.upper()
+        if not src_mask.any():
+            return 0
             
-            if not row:
-                raise HTTPException(status_code=400, detail="Por favor configure a frota e os armazéns antes de otimizar.")
+        self.mark_dirty(*self.df.loc[src_mask, "Rota"].unique(), tgt_clean)
+        self.df.loc[src_mask, "Rota"] = tgt_clean
+        if not is_pending_route(tgt_clean):
+            self.df.loc[src_mask, "Ordem"] = 99999
+        return int(src_mask.sum())
+        
+    def swap(self, idx_a, idx_b):
+        """Exchanges the route and position of two stops."""
+        for col in ("Rota", "Ordem"):
+            a, b = self.df.at[idx_a, col], self.df.at[idx_b, col]
+            self.df.at[idx_a, col], self.df.at[idx_b, col] = b, a
+        self.mark_dirty(self.df.at[idx_a, "Rota"], self.df.at[idx_b, "Rota"])
+        
+    def reorder(self, route_name: str, idx, new_order: int):
+        indices = list(self.route_stops(route_name).index)
+        target_pos = max(0, min(len(indices) - 1, new_order - 1))
+        indices.insert(target_pos, indices.pop(indices.index(idx)))
+        for new_pos, i in enumerate(indices, 1):
+            self.df.at[i, "Ordem"] = new_pos
+        self.mark_dirty(route_name)
+        
+    def optimize_route(self, route_name: str) -> bool:
+        """Time-window aware nearest neighbour + local search on one route; False if there is nothing to reorder."""
+        df_routes = self.df
+        route_stops = df_routes[df_routes["Rota"] == route_name]
+        if len(route_stops) <= 1:
+            return False
+            
+        v_info = self.fleet_dict.get(route_name, {})
+        warehouses_df = self.warehouses_df
+        wh_name = v_info.get("warehouse", warehouses_df.iloc[0]["Nome_Armazem"] if warehouses_df is not None and not warehouses_df.empty else "")
+        depot_lat, depot_lon = get_depot_coords(warehouses_df, wh_name)
+        
+        # Stop data read once; local search works on positions (depot = 0, stops = 1..n)
+        stop_indices = list(route_stops.index)
+        windows = [parse_time_window_str(str(w)) for w in route_stops.get("Janela_Horaria", pd.Series("Qualquer", index=route_stops.index))]
+        service = [clean_int(s, 15) or 15 for s in route_stops.get("Tempo_Entrega", pd.Series(15, index=route_stops.index))]
+        dist_m = np.asarray(calculate_haversine_matrix(
+            [(depot_lat, depot_lon)] + list(zip(route_stops["Latitude"].astype(float), route_stops["Longitude"].astype(float)))
+        ))
+        
+        # Nearest neighbour inside each group of equal window start, earliest group first
+        ordered = []
+        cur_pos = 0
+        for w_val in sorted({w_s for w_s, _ in windows}):
+            cluster = [k + 1 for k, (w_s, _) in enumerate(windows) if w_s == w_val]
+            while cluster:
+                best = min(cluster, key=lambda p: dist_m[cur_pos, p])
+                ordered.append(best)
+                cluster.remove(best)
+                cur_pos = best
                 
-            state_dict = deserialize_state(row["payload_json"])
+        # 2-opt / Or-opt / relocate without making any stop later than its window allows
+        ordered = improve_route(
+            dist_m, ordered, 0, closed=False,
+            windows=[windows[p - 1] for p in ordered], service=[service[p - 1] for p in ordered],
+            speed_kmh=float(v_info.get("speed", 50.0)),
+            start_time=parse_time_to_minutes(str(v_info.get("start_time", "09:50")), 590),
+            min_gain=0.01
+        ).route
+        ordered_indices = [stop_indices[p - 1] for p in ordered]
+                    
+        for pos, idx in enumerate(ordered_indices, 1):
+            df_routes.loc[idx, "Ordem"] = pos
+        self.mark_dirty(route_name)
+        return True
+        
+    def insert_pending(self, delivery_ids=None, route_names=None, max_insertions=None, client_warehouses=None):
+        """
+        Cheapest feasible insertion of "Por Distribuir" stops into the routes
+        (utils.insertion), respecting capacity, volume, time windows, shift end and
+        the delivery's warehouse. Returns the inserted stops and the ids left pending.
+        """
+        keys = self.route_keys()
+        pending = self.df[keys == "Por Distribuir"]
+        if delivery_ids is not None:
+            pending = pending[pending["id"].astype(int).isin({int(d) for d in delivery_ids})]
+        names = list(dict.fromkeys([*self.fleet_dict, *(k for k in keys.unique() if not is_pending_route(k))]))
+        if route_names is not None:
+            names = [n for n in names if n in set(route_names)]
+        if pending.empty or not names:
+            return [], [int(d) for d in pending["id"]]
             
-        # 2. Load deliveries from database
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM entregas WHERE projeto_id = ? ORDER BY id ASC", (req.project_id,))
-            rows = cursor.fetchall()
+        # Nodes: one per depot, then every route stop, then the pending stops
+        points, node_of_depot, row_of_node = [], {}, {}
+        windows, service, demands, volumes = {}, {}, {}, {}
+        default_wh = self.warehouses_df.iloc[0]["Nome_Armazem"] if self.warehouses_df is not None and not self.warehouses_df.empty else ""
+        
+        def add_stop(idx, row):
+            node = len(points)
+            points.append((float(row["Latitude"]), float(row["Longitude"])))
+            row_of_node[node] = idx
+            windows[node] = parse_time_window_str(str(row.get("Janela_Horaria", "Qualquer")))
+            service[node] = clean_int(row.get("Tempo_Entrega"), 15) or 15
+            demands[node] = clean_num(row.get("Peso_KG"), 50.0)
+            volumes[node] = clean_num(row.get("Volume_m3"), 0.1)
+            return node
             
-            if not rows:
-                raise HTTPException(status_code=400, detail="Nenhum cliente georreferenciado encontrado no projeto.")
+        routes, route_wh = [], []
+        for name in names:
+            v_info = self.fleet_dict.get(name, {})
+            wh_name = v_info.get("warehouse", default_wh)
+            depot = get_depot_coords(self.warehouses_df, wh_name)
+            if depot not in node_of_depot:
+                node_of_depot[depot] = len(points)
+                points.append(depot)
+            stops = [add_stop(idx, row) for idx, row in self.route_stops(name).iterrows()]
+            routes.append(InsertionRoute(
+                depot=node_of_depot[depot], stops=stops,
+                speed_kmh=float(v_info.get("speed", 50.0)) or 50.0,
+                start_time=parse_time_to_minutes(str(v_info.get("start_time", "09:50")), 590),
+                end_time=parse_time_to_minutes(str(v_info["end_time"]), 1080) if v_info.get("end_time") else math.inf,
+                capacity=float(v_info.get("capacity", math.inf)),
+                volume_capacity=float(v_info.get("capacity_volume", math.inf)),
+            ))
+            route_wh.append(str(wh_name).strip().lower())
+        pending_nodes = [add_stop(idx, row) for idx, row in pending.iterrows()]
+        
+        # A delivery tied to a warehouse that has routes only goes on those routes
+        allowed = {}
+        for node in pending_nodes:
+            wh = str((client_warehouses or {}).get(int(self.df.at[row_of_node[node], "id"])) or "").strip().lower()
+            if wh and wh.upper() not in ("N/A", "NONE", "NAN") and wh in route_wh:
+                allowed[node] = {r for r, r_wh in enumerate(route_wh) if r_wh == wh}
                 
-            col_names = [d[0] for d in cursor.description]
-            delivery_rows = [dict(zip(col_names, r)) for r in rows]
+        engine = InsertionEngine(
+            np.asarray(calculate_haversine_matrix(points)), routes,
+            windows=windows, service=service, demands=demands, volumes=volumes
+        )
+        applied = engine.insert(pending_nodes, allowed=allowed, max_insertions=max_insertions)
+        
+        changed = sorted({ins.route for ins in applied})
+        inserted_nodes = {ins.node for ins in applied}
+        for r in changed:
+            for pos, node in enumerate(engine.stops[r], 1):
+                idx = row_of_node[node]
+                self.df.at[idx, "Rota"] = names[r]
+                self.df.at[idx, "Ordem"] = pos
+                if node in inserted_nodes:
+                    self.df.at[idx, "Armazem"] = self.fleet_dict.get(names[r], {}).get("warehouse", default_wh)
+        if changed:
+            self.mark_dirty("Por Distribuir", *(names[r] for r in changed))
+            
+        inserted = [
+            {"id": int(self.df.at[row_of_node[ins.node], "id"]), "Rota": names[ins.route],
+             "Ordem": engine.stops[ins.route].index(ins.node) + 1, "KM_Extra": round(ins.cost, 2)}
+            for ins in applied
+        ]
+        remaining = [int(self.df.at[row_of_node[n], "id"]) for n in pending_nodes if n not in inserted_nodes]
+        return inserted, remaining
+        
+    # ---------- recomputation ----------
+    
+    def _recompute_route(self, r_name: str, r_clients: pd.DataFrame) -> list:
+        if is_pending_route(r_name):
+            rows = []
+            for ord_num, (_, row_c) in enumerate(r_clients.iterrows(), 1):
+                row_c = row_c.copy()
+                row_c["Rota"] = "Por Distribuir"
+                row_c["Ordem"] = ord_num
+                row_c["Chegada"] = "00:00"
+                row_c["Tempo_Espera"] = 0
+                row_c["Tempo_Entrega"] = 0
+                row_c["Saida"] = "00:00"
+                row_c["KM_Anterior"] = 0.0
+                row_c["Dist_Acum"] = 0.0
+                rows.append(row_c.to_dict())
+            return rows
             
-            df_rows = []
-            for dr in delivery_rows:
-                df_rows.append({
-                    "id": dr["id"],
-                    "Codigo_Cliente": dr["codigo_cliente"],
-                "Nome_Cliente": dr.get("nome_cliente") or dr["codigo_cliente"],
-                    "Morada": dr["morada"],
-                    "Codigo_Postal": dr["codigo_postal"],
-                    "Localidade": dr.get("_concelho") or dr.get("concelho", ""),
-                    "Peso_KG": float(dr.get("peso_kg") or 50.0),
-                    "Volume_m3": float(dr.get("volume_m3") or 0.1),
-                    "Prioridade": dr.get("prioridade", 1),
-                    "Slot1_Inicio": dr.get("janela_inicio", ""),
-                    "Slot1_Fim": dr.get("janela_fim", ""),
-                    "Latitude": float(dr["latitude"]),
-                    "Longitude": float(dr["longitude"]),
-                    "Nivel_Qualidade": int(dr.get("nivel_qualidade") or 0),
-                    "Armazem": dr.get("armazem")
-                })
-            deliveries_df = pd.DataFrame(df_rows)
+        r_clients = r_clients.sort_values(by="Ordem")
+        v_info = self.fleet_dict.get(r_name, {})
+        warehouses_df = self.warehouses_df
+        wh_name = v_info.get("warehouse", warehouses_df.iloc[0]["Nome_Armazem"] if warehouses_df is not None and not warehouses_df.empty else "")
+        depot_lat, depot_lon = get_depot_coords(warehouses_df, wh_name)
+        v_start = str(v_info.get("start_time", "09:50"))
+        v_speed = float(v_info.get("speed", 50.0))
+        return recalculate_route_stops(r_clients.to_dict(orient="records"), depot_lat, depot_lon, v_start, v_speed)
+        
+    def recompute(self):
+        """Re-times the dirty routes only; every other row is left untouched."""
+        if not self.dirty:
+            return
+        keys = self.route_keys()
+        dirty_mask = keys.isin(self.dirty)
+        new_rows = []
+        for r_name in self.dirty:
+            new_rows.extend(self._recompute_route(r_name, self.df[keys == r_name]))
+        parts = [self.df[~dirty_mask]]
+        if new_rows:
+            parts.append(pd.DataFrame(new_rows))
+        self.df = pd.concat(parts, ignore_index=True)
+        self.changed |= self.dirty
+        self.dirty = set()
+        
+    def delta(self) -> Dict[str, Any]:
+        """Stops of every route changed since the plan was loaded (emptied routes are listed with no stops)."""
+        changed_rows = self.df[self.route_keys().isin(self.changed)].sort_values(by=["Rota", "Ordem"])
+        return {
+            "changed_routes": sorted(self.changed, key=str),
+            "routes": changed_rows.to_dict(orient="records")
+        }
+
+def _load_route_plan(project_id: int, missing_detail: str):
+    state_dict, df_routes, version = _load_routes_state(project_id, missing_detail)
+    return RoutePlan(state_dict, df_routes), version
+
+def _commit_route_plan(project_id: int, plan: RoutePlan, user_id: int, operation: str, expected_version: int) -> Dict[str, Any]:
+    """Recomputes dirty routes, persists row-level and returns the delta response."""
+    plan.recompute()
+    version = _persist_route_edit(project_id, plan.df, user_id, operation, expected_version) if plan.changed else expected_version
+    return sanitize_json_data({"status": "success", "version": version, **plan.delta()})
+
+def _apply_edit_operation(plan: RoutePlan, op: EditOperation):
+    """Applies one batch-edit operation in memory; HTTPException if it cannot be applied."""
+    kind = (op.op or "").strip().lower()
+    if kind in ("move", "unassign"):
+        new_route = "Por Distribuir" if kind == "unassign" else op.new_route
+        if not new_route:
+            raise HTTPException(status_code=400, detail="Indique a rota de destino (new_route).")
+        idx = plan.find_stop(op.delivery_id, op.client_code, op.address)
+        if idx is None:
+            raise HTTPException(status_code=404, detail="Cliente/Entrega não encontrado nas rotas.")
+        plan.move(idx, new_route)
+    elif kind == "reorder":
+        if not op.route_name or op.new_order is None:
+            raise HTTPException(status_code=400, detail="Indique a rota (route_name) e a nova posição (new_order).")
+        idx = plan.find_stop(op.delivery_id, op.client_code, op.address, candidates=plan.route_stops(op.route_name))
+        if idx is None:
+            raise HTTPException(status_code=404, detail="Paragem não encontrada na rota indicada.")
+        plan.reorder(op.route_name, idx, op.new_order)
+    elif kind == "swap":
+        idx_a = plan.find_stop(op.delivery_id, op.client_code, op.address)
+        idx_b = plan.find_stop(op.other_delivery_id, op.other_client_code, op.other_address)
+        if idx_a is None or idx_b is None:
+            raise HTTPException(status_code=404, detail="Cliente/Entrega não encontrado nas rotas.")
+        plan.swap(idx_a, idx_b)
+    elif kind == "transfer":
+        if not op.source_route or not op.target_route:
+            raise HTTPException(status_code=400, detail="Indique a rota de origem e a rota de destino.")
+        if plan.transfer(op.source_route, op.target_route) == 0:
+            raise HTTPException(status_code=404, detail=f"A rota '{op.source_route.strip()}' não tem paragens atribuídas.")
+    else:
+        raise HTTPException(status_code=400, detail=f"Operação desconhecida: '{op.op}'.")
+
+def _report(progress_callback, stage: str, **extra):
+    if progress_callback:
+        progress_callback({"stage": stage, **extra})
+
+def _record_portfolio_run(project_id: int, num_clients: int, result: Dict[str, Any], portfolio: Dict[str, Any]):
+    """Keeps which portfolio configuration won (GET /admin/solver-portfolio aggregates them)."""
+    with get_db() as conn:
+        conn.execute(
+            """INSERT INTO solver_portfolio_runs
+               (projeto_id, num_clientes, winner, first_solution, metaheuristic, total_distance, dropped, runs_json)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (project_id, num_clients, portfolio["winner"], portfolio.get("first_solution"), portfolio.get("metaheuristic"),
+             result.get("total_distance"), len(result.get("dropped_nodes", [])), json.dumps(portfolio.get("runs", [])))
+        )
+        conn.commit()
+
+def _warm_start_params(project_id: int, deliveries_df: pd.DataFrame, vehicle_names: List[str], client_start_idx: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Re-optimization mode: the current plan becomes the solver's initial routes.
+    params["locked_routes"] (route names) are kept as they are and
+    params["locked_stops"] (delivery ids) stay on their current route.
+    """
+    _, df_current, _ = _load_routes_state(project_id, "Não existe um plano para reotimizar neste projeto.")
+    node_of = {int(d_id): client_start_idx + i for i, d_id in enumerate(deliveries_df["id"])}
+    vehicle_of = {str(name): v for v, name in enumerate(vehicle_names)}
+    
+    initial_routes = [[] for _ in vehicle_names]
+    locked_nodes = {}
+    locked_stops = {int(d_id) for d_id in params.get("locked_stops") or []}
+    for _, stop in df_current.sort_values(by="Ordem").iterrows():
+        v = vehicle_of.get(str(stop["Rota"]))
+        node = node_of.get(int(stop["id"]))
+        if v is None or node is None or is_pending_route(stop["Rota"]):
+            continue
+        initial_routes[v].append(node)
+        if int(stop["id"]) in locked_stops:
+            locked_nodes[node] = v
             
-        # 3. Prepare warehouses and fleet DataFrames
-        raw_wh = state_dict.get("warehouses_geocoded")
-        if raw_wh is None or (isinstance(raw_wh, pd.DataFrame) and raw_wh.empty):
-            raise HTTPException(status_code=400, detail="Nenhum armazém configurado no projeto.")
-        warehouses_df = raw_wh if isinstance(raw_wh, pd.DataFrame) else pd.DataFrame(raw_wh)
-        
-        fleet_config = state_dict.get("fleet_config")
-        if not fleet_config:
-            raise HTTPException(status_code=400, detail="Nenhum veículo configurado na frota.")
+    return {
+        "initial_routes": initial_routes,
+        "locked_vehicles": [vehicle_of[name] for name in params.get("locked_routes") or [] if name in vehicle_of],
+        "locked_nodes": locked_nodes,
+    }
+
+def run_solver_pipeline(project_id: int, params: Dict[str, Any], user_id: int, progress_callback=None, job_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Full /solve pipeline (load snapshot + deliveries, build matrix, optimize, persist snapshot).
+    Runs both inline for /solve and inside the background solver job workers.
+    Stage timings are logged as one JSON line per run and returned under
+    "timings" when params["debug"] is set; params["profile"] ("cprofile" or
+    "sampling") also dumps a profile of the whole run, one file per job, when
+    the server runs with SOLVER_PROFILING enabled.
+    """
+    params = params or {}
+    timer = StageTimer("solve_timings")
+    name = f"solve_{project_id}_{job_id or datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    prof = {"path": None}
+    status = "failed"
+    try:
+        with timer.activate(), profile(params.get("profile"), name) as prof:
+            response = _solve_project(project_id, params, user_id, progress_callback, timer)
+        status = "success"
+    finally:
+        timer.log(project_id=project_id, job_id=job_id, status=status, profile=prof["path"])
+        
+    if params.get("debug"):
+        response["timings"] = timer.report()
+        if prof["path"]:
+            response["timings"]["profile"] = prof["path"]
+    return response
+
+def _solve_project(project_id: int, params: Dict[str, Any], user_id: int, progress_callback, timer: StageTimer) -> Dict[str, Any]:
+    # 1. Get latest snapshot
+    _report(progress_callback, "loading")
+    with timer.span("load_snapshot"), get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (project_id,))
+        row = cursor.fetchone()
+        
+        if not row:
+            raise HTTPException(status_code=400, detail="Por favor configure a frota e os armazéns antes de otimizar.")
             
-        # 4. Build coordinates locations array and solver demands
-        locations = []
-        location_names = []
-        demands = []
-        volume_demands = []
-        
-        # Add warehouses first
-        warehouse_indices = {}
-        for idx, row in warehouses_df.iterrows():
-            wh_name = str(row["Nome_Armazem"])
-            locations.append((float(row["Latitude"]), float(row["Longitude"])))
-            location_names.append(wh_name)
-            demands.append(0.0)
-            volume_demands.append(0.0)
-            warehouse_indices[wh_name] = len(locations) - 1
+        state_dict = deserialize_state(row["payload_json"])
+        
+    # 2. Load deliveries from database
+    with timer.span("load_deliveries") as span, get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM entregas WHERE projeto_id = ? ORDER BY id ASC", (project_id,))
+        rows = cursor.fetchall()
+        
+        if not rows:
+            raise HTTPException(status_code=400, detail="Nenhum cliente georreferenciado encontrado no projeto.")
             
-        num_warehouses = len(locations)
-        client_start_idx = num_warehouses
+        col_names = [d[0] for d in cursor.description]
+        delivery_rows = [dict(zip(col_names, r)) for r in rows]
+        
+        df_rows = []
+        for dr in delivery_rows:
+            df_rows.append({
+                "id": dr["id"],
+                "Codigo_Cliente": dr["codigo_cliente"],
+            "Nome_Cliente": dr.get("nome_cliente") or dr["codigo_cliente"],
+                "Morada": dr["morada"],
+                "Codigo_Postal": dr["codigo_postal"],
+                "Localidade": dr.get("_concelho") or dr.get("concelho", ""),
+                "Peso_KG": float(dr.get("peso_kg") or 50.0),
+                "Volume_m3": float(dr.get("volume_m3") or 0.1),
+                "Prioridade": dr.get("prioridade", 1),
+                "Slot1_Inicio": dr.get("janela_inicio", ""),
+                "Slot1_Fim": dr.get("janela_fim", ""),
+                "Latitude": float(dr["latitude"]),
+                "Longitude": float(dr["longitude"]),
+                "Nivel_Qualidade": int(dr.get("nivel_qualidade") or 0),
+                "Armazem": dr.get("armazem")
+            })
+        deliveries_df = pd.DataFrame(df_rows)
+        span["rows"] = len(deliveries_df)
         
-        # Add clients
+    # 3. Prepare warehouses and fleet DataFrames
+    raw_wh = state_dict.get("warehouses_geocoded")
+    if raw_wh is None or (isinstance(raw_wh, pd.DataFrame) and raw_wh.empty):
+        raise HTTPException(status_code=400, detail="Nenhum armazém configurado no projeto.")
+    warehouses_df = raw_wh if isinstance(raw_wh, pd.DataFrame) else pd.DataFrame(raw_wh)
+    
+    fleet_config = state_dict.get("fleet_config")
+    if not fleet_config:
+        raise HTTPException(status_code=400, detail="Nenhum veículo configurado na frota.")
+        
+    # 4. Build coordinates locations array and solver demands
+    locations = []
+    location_names = []
+    demands = []
+    volume_demands = []
+    
+    # Add warehouses first
+    warehouse_indices = {}
+    for idx, row in warehouses_df.iterrows():
+        wh_name = str(row["Nome_Armazem"])
+        locations.append((float(row["Latitude"]), float(row["Longitude"])))
+        location_names.append(wh_name)
+        demands.append(0.0)
+        volume_demands.append(0.0)
+        warehouse_indices[wh_name] = len(locations) - 1
+        
+    num_warehouses = len(locations)
+    client_start_idx = num_warehouses
+    
+    # Add clients
+    with timer.span("build_locations", rows=len(deliveries_df)):
         for idx, row in deliveries_df.iterrows():
             c_lat = float(row["Latitude"])
             c_lon = float(row["Longitude"])
-            
+        
             # Auto-correction for inverted coordinates in Portugal bounds
             if (c_lat < 0 and c_lon > 0) or (-10.0 <= c_lat <= -6.0 and 36.0 <= c_lon <= 43.0):
                 c_lat, c_lon = c_lon, c_lat
                 deliveries_df.at[idx, "Latitude"] = c_lat
                 deliveries_df.at[idx, "Longitude"] = c_lon
-                try:
-                    with get_db() as c_conn:
-                        c_cursor = c_conn.cursor()
-                        c_cursor.execute("UPDATE entregas SET latitude = ?, longitude = ? WHERE id = ?", (c_lat, c_lon, row["id"]))
-                        c_conn.commit()
-                except Exception:
-                    pass
+                with timer.span("coordinate_fixes", rows=1):
+                    try:
+                        with get_db() as c_conn:
+                            c_cursor = c_conn.cursor()
+                            c_cursor.execute("UPDATE entregas SET latitude = ?, longitude = ? WHERE id = ?", (c_lat, c_lon, row["id"]))
+                            c_conn.commit()
+                    except Exception:
+                        pass
 
             locations.append((c_lat, c_lon))
             location_names.append(row.get("Codigo_Cliente", f"Cliente_{idx}"))
             demands.append(float(row.get("Peso_KG", 50.0)))
             volume_demands.append(float(row.get("Volume_m3", 0.1)))
-            
-        # Calculate distance matrix
-        distance_matrix = calculate_haversine_matrix(locations)
+        
+    # Calculate distance matrix
+    _report(progress_callback, "matrix", locations=len(locations))
+    try:
+        matrix_provider = get_matrix_provider(params.get("matrix_provider"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Fornecedor de matriz inválido: {e}")
+    with timer.span("matrix", rows=len(locations)):
+        distance_matrix = matrix_provider.distance_matrix(locations)
+                
+    with timer.span("parse_fleet") as span:
         fleet_dict = extract_fleet_dict(fleet_config, warehouses_df)
-                    
+        span["rows"] = len(fleet_dict)
+        
         # Prepare fleet configurations for solver with working shifts
         vehicle_capacities = []
         vehicle_volume_capacities = []
@@ -352,7 +817,7 @@ def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_curr
         vehicle_warehouses = []
         vehicle_start_times = []
         vehicle_end_times = []
-        
+    
         for vehicle_name, vehicle_data in fleet_dict.items():
             vehicle_capacities.append(vehicle_data["capacity"])
             vehicle_volume_capacities.append(vehicle_data["capacity_volume"])
@@ -360,13 +825,14 @@ def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_curr
             depot_indices.append(warehouse_indices.get(wh_name, 0))
             vehicle_names.append(vehicle_name)
             vehicle_warehouses.append(wh_name)
-            
+        
             s_min = parse_time_to_minutes(vehicle_data.get("start_time", "09:50"), 590)
             e_min = parse_time_to_minutes(vehicle_data.get("end_time", "18:00"), 1080)
             vehicle_start_times.append(s_min)
             vehicle_end_times.append(e_min)
 
-        # Parse client time windows
+    # Parse client time windows
+    with timer.span("time_windows", rows=len(deliveries_df)):
         client_time_windows = []
         for idx, row in deliveries_df.iterrows():
             win_s_str = str(row.get("Slot1_Inicio", "") or "").strip()
@@ -377,32 +843,39 @@ def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_curr
             else:
                 cs_min, ce_min = 0, 1440
             client_time_windows.append((cs_min, ce_min))
-            
-        # 5. Run solver
-        solver_params = dict(req.params or {})
-        if "time_limit" in solver_params and "time_limit_seconds" not in solver_params:
-            solver_params["time_limit_seconds"] = solver_params["time_limit"]
-            
-        # Parse max duration if given as HH:MM or minutes
-        raw_max_dur = solver_params.get("max_route_duration") or solver_params.get("max_travel_time")
-        if raw_max_dur:
-            if isinstance(raw_max_dur, str) and ":" in raw_max_dur:
-                parts = raw_max_dur.split(":")
-                dur_min = int(parts[0]) * 60 + int(parts[1])
-                solver_params["max_travel_time_hours"] = round(dur_min / 60.0, 2)
-            else:
-                try:
-                    val = float(raw_max_dur)
-                    if val > 24.0: # minutes
-                        solver_params["max_travel_time_hours"] = round(val / 60.0, 2)
-                    else: # hours
-                        solver_params["max_travel_time_hours"] = val
-                except ValueError:
-                    pass
-            
-        client_warehouses = list(deliveries_df["Armazem"].fillna(""))
         
-        optimizer = AdvancedRouteOptimizer()
+    # 5. Run solver
+    solver_params = dict(params or {})
+    if "time_limit" in solver_params and "time_limit_seconds" not in solver_params:
+        solver_params["time_limit_seconds"] = solver_params["time_limit"]
+        
+    # Parse max duration if given as HH:MM or minutes
+    raw_max_dur = solver_params.get("max_route_duration") or solver_params.get("max_travel_time")
+    if raw_max_dur:
+        if isinstance(raw_max_dur, str) and ":" in raw_max_dur:
+            parts = raw_max_dur.split(":")
+            dur_min = int(parts[0]) * 60 + int(parts[1])
+            solver_params["max_travel_time_hours"] = round(dur_min / 60.0, 2)
+        else:
+            try:
+                val = float(raw_max_dur)
+                if val > 24.0: # minutes
+                    solver_params["max_travel_time_hours"] = round(val / 60.0, 2)
+                else: # hours
+                    solver_params["max_travel_time_hours"] = val
+            except ValueError:
+                pass
+        
+    client_warehouses = list(deliveries_df["Armazem"].fillna(""))
+    
+    # Re-optimize from the current plan instead of a cold start
+    if str(solver_params.get("mode", "") or "").lower() in ["reoptimize", "reotimizar"]:
+        with timer.span("warm_start_plan"):
+            solver_params.update(_warm_start_params(project_id, deliveries_df, vehicle_names, client_start_idx, solver_params))
+        
+    _report(progress_callback, "solving")
+    with timer.span("solve", rows=len(deliveries_df)):
+        optimizer = AdvancedRouteOptimizer(progress_callback=progress_callback)
         result = optimizer.optimize_routes(
             distance_matrix,
             demands,
@@ -419,17 +892,18 @@ def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_curr
             client_time_windows=client_time_windows,
             locations=locations
         )
-        
-        # 6. Convert solver output to routes list
+    
+    # 6. Convert solver output to routes list
+    with timer.span("convert_routes") as span:
         routes_list = []
         visited_client_indices = set()
-        
+    
         for vehicle_idx, route in enumerate(result["routes"]):
             vehicle_name = vehicle_names[vehicle_idx] if vehicle_idx < len(vehicle_names) else f"Veículo {vehicle_idx + 1}"
             v_info = fleet_dict.get(vehicle_name, {})
             warehouse_origin = v_info.get("warehouse", warehouses_df.iloc[0]["Nome_Armazem"])
             depot_lat, depot_lon = get_depot_coords(warehouses_df, warehouse_origin)
-            
+        
             raw_stops = []
             for i in range(1, len(route) - 1):
                 loc_idx = route[i]
@@ -437,11 +911,11 @@ def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_curr
                     client_idx = loc_idx - client_start_idx
                     client_row = deliveries_df.iloc[client_idx]
                     visited_client_indices.add(client_idx)
-                    
+                
                     win_s = str(client_row.get("Slot1_Inicio", "") or "").strip()
                     win_e = str(client_row.get("Slot1_Fim", "") or "").strip()
                     combined_window = f"{win_s} - {win_e}" if (win_s and win_e) else "Qualquer"
-                    
+                
                     deliv_id = int(client_row.get("id", client_idx + 1))
                     raw_stops.append({
                         "id": deliv_id,
@@ -461,32 +935,34 @@ def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_curr
                         "Tempo_Entrega": 15,
                         "Nivel_Qualidade": int(client_row.get("Nivel_Qualidade", 0))
                     })
-                    
+                
             if raw_stops:
                 v_start_str = str(v_info.get("start_time", "09:50"))
                 v_speed = float(v_info.get("speed", 50.0))
                 processed_stops = recalculate_route_stops(raw_stops, depot_lat, depot_lon, v_start_str, v_speed)
                 routes_list.extend(processed_stops)
-                    
-        # 7. Process dropped nodes (unassigned deliveries -> Por Distribuir)
+        span["rows"] = len(routes_list)
+                
+    # 7. Process dropped nodes (unassigned deliveries -> Por Distribuir)
+    with timer.span("dropped_stops") as span:
         dropped_nodes = result.get("dropped_nodes", [])
         dropped_client_indices = set()
         for loc_idx in dropped_nodes:
             if loc_idx >= client_start_idx:
                 dropped_client_indices.add(loc_idx - client_start_idx)
-                
+            
         # Also catch any client that was not visited
         for c_idx in range(len(deliveries_df)):
             if c_idx not in visited_client_indices:
                 dropped_client_indices.add(c_idx)
-                
+            
         pending_order = 1
         for client_idx in sorted(dropped_client_indices):
             client_row = deliveries_df.iloc[client_idx]
             win_s = str(client_row.get("Slot1_Inicio", "") or "").strip()
             win_e = str(client_row.get("Slot1_Fim", "") or "").strip()
             combined_window = f"{win_s} - {win_e}" if (win_s and win_e) else "Qualquer"
-            
+        
             deliv_id = int(client_row.get("id", client_idx + 1))
             routes_list.append({
                 "id": deliv_id,
@@ -513,37 +989,111 @@ def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_curr
                 "Carga_Vol_Acum": round(float(client_row.get("Volume_m3", 0.1)), 2)
             })
             pending_order += 1
-            
-        # 8. Save snapshot with optimized solution
-        df_routes = pd.DataFrame(routes_list)
-        state_dict["routes_solution"] = df_routes
-        state_dict["fleet_config_used"] = fleet_dict
-        state_dict["warehouses_used"] = warehouses_df
-        state_dict["optimization_params"] = req.params
+        span["rows"] = pending_order - 1
         
+    # 8. Save snapshot with optimized solution
+    _report(progress_callback, "saving")
+    df_routes = pd.DataFrame(routes_list)
+    state_dict["routes_solution"] = df_routes
+    state_dict["fleet_config_used"] = fleet_dict
+    state_dict["warehouses_used"] = warehouses_df
+    state_dict["optimization_params"] = params
+    
+    with timer.span("serialize_snapshot"):
         payload = serialize_state(state_dict)
-        snapshot_name = f"Otimização VRP ({datetime.now().strftime('%H:%M:%S')})"
-        user_id = current_user.id
+    snapshot_name = f"Otimização VRP ({datetime.now().strftime('%H:%M:%S')})"
+    
+    with timer.span("snapshot_insert"), get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, ?, ?, ?)",
+            (project_id, user_id, 3, snapshot_name, payload)
+        )
+        conn.commit()
+        snapshot_id = cursor.lastrowid
         
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, ?, ?, ?)",
-                (req.project_id, user_id, 3, snapshot_name, payload)
-            )
-            conn.commit()
-            
-        return {
-            "status": "success",
-            "routes": routes_list,
-            "vehicles": vehicle_names,
-            "quality_metrics": result.get("quality_metrics", {})
-        }
+    # The new solution becomes the base of the row-level route table
+    with timer.span("save_routes", rows=len(routes_list)):
+        routes_version = replace_routes(project_id, routes_list, user_id, "solve", snapshot_id=snapshot_id)
+        
+    quality_metrics = dict(result.get("quality_metrics", {}))
+    quality_metrics["matrix_source"] = matrix_provider.last_source
+    if "portfolio" in quality_metrics:
+        # The plan is already saved; a failed stats write must not fail the solve
+        try:
+            _record_portfolio_run(project_id, len(deliveries_df), result, quality_metrics["portfolio"])
+        except Exception as e:
+            print(f"[AVISO] Não foi possível registar a execução do portfólio: {e}")
+        
+    return {
+        "status": "success",
+        "routes": routes_list,
+        "vehicles": vehicle_names,
+        "quality_metrics": quality_metrics,
+        "version": routes_version
+    }
+
+@router.post("/solve")
+def run_solver(req: SolverRequest, current_user: UserResponse = Depends(get_current_user)):
+    proj = get_projeto(req.project_id)
+    if not proj or proj["empresa_id"] != current_user.empresa_id:
+        raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
+        
+    try:
+        return run_solver_pipeline(req.project_id, req.params, current_user.id)
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/jobs")
+def submit_solver_job(req: SolverRequest, current_user: UserResponse = Depends(get_current_user)):
+    proj = get_projeto(req.project_id)
+    if not proj or proj["empresa_id"] != current_user.empresa_id:
+        raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
+        
+    job = get_job_manager().submit(req.project_id, current_user.id, current_user.empresa_id, req.params)
+    return {"status": "queued", "job_id": job.id}
+
+def _get_owned_job(job_id: str, current_user: UserResponse):
+    job = get_job_manager().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job de otimização não encontrado.")
+    if job.empresa_id != current_user.empresa_id:
+        raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este job.")
+    return job
+
+@router.get("/jobs/{job_id}")
+def get_solver_job(job_id: str, current_user: UserResponse = Depends(get_current_user)):
+    job = _get_owned_job(job_id, current_user)
+    return sanitize_json_data(job.to_dict(include_result=job.status == "done"))
+
+@router.get("/jobs/{job_id}/stream")
+def stream_solver_job(job_id: str, current_user: UserResponse = Depends(get_current_user)):
+    """Server-Sent Events: one status event per second until the job finishes."""
+    _get_owned_job(job_id, current_user)
+    manager = get_job_manager()
+    
+    def event_stream():
+        while True:
+            job = manager.get(job_id)
+            if job is None:
+                break
+            finished = job.status in TERMINAL_STATES
+            payload = sanitize_json_data(job.to_dict(include_result=finished and job.status == "done"))
+            yield f"event: {'end' if finished else 'progress'}\ndata: {json.dumps(payload, default=str)}\n\n"
+            if finished:
+                break
+            time.sleep(1.0)
+            
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.delete("/jobs/{job_id}")
+def cancel_solver_job(job_id: str, current_user: UserResponse = Depends(get_current_user)):
+    _get_owned_job(job_id, current_user)
+    job = get_job_manager().cancel(job_id)
+    return {"status": job.status, "job_id": job.id}
+
 @router.get("/{project_id}")
 def get_solver_solution(project_id: int, current_user: UserResponse = Depends(get_current_user)):
     proj = get_projeto(project_id)
@@ -551,61 +1101,67 @@ def get_solver_solution(project_id: int, current_user: UserResponse = Depends(ge
         raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
         
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (project_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                return {"status": "none", "routes": []}
-                
-            state_dict = deserialize_state(row["payload_json"])
-            raw_routes = state_dict.get("routes_solution")
+        state_dict, routes_version = load_project_state(project_id)
+        
+        if state_dict is None:
+            return {"status": "none", "routes": []}
             
-            routes_list = []
-            if raw_routes is not None:
-                df_routes = raw_routes if isinstance(raw_routes, pd.DataFrame) else pd.DataFrame(raw_routes)
-                if not df_routes.empty:
-                    for idx, r in df_routes.iterrows():
-                        r_name = str(r.get("Rota", "Por Distribuir") if pd.notna(r.get("Rota")) else "Por Distribuir")
-                        if "PENDENTE" in r_name.upper():
-                            r_name = "Por Distribuir"
-                        d_id = clean_int(r.get("id") or r.get("ID_Original"), idx + 1)
-                        routes_list.append({
-                            "id": d_id,
-                            "ID_Original": d_id,
-                            "Rota": r_name,
-                            "Armazem": str(r.get("Armazem", "N/A") if pd.notna(r.get("Armazem")) else "N/A"),
-                            "Ordem": clean_int(r.get("Ordem"), 1),
-                            "Cliente": str(r.get("Cliente", "") if pd.notna(r.get("Cliente")) else ""),
-                            "Nome_Cliente": str(r.get("Nome_Cliente", r.get("Cliente", "")) if pd.notna(r.get("Nome_Cliente")) else str(r.get("Cliente", "") if pd.notna(r.get("Cliente")) else "")),
-                            "Morada": str(r.get("Morada", "") if pd.notna(r.get("Morada")) else ""),
-                            "CP": str(r.get("CP", "") if pd.notna(r.get("CP")) else ""),
-                            "Localidade": str(r.get("Localidade", "") if pd.notna(r.get("Localidade")) else ""),
-                            "Janela_Horaria": str(r.get("Janela_Horaria", "Qualquer") if pd.notna(r.get("Janela_Horaria")) else "Qualquer"),
-                            "Latitude": clean_num(r.get("Latitude"), 0.0),
-                            "Longitude": clean_num(r.get("Longitude"), 0.0),
-                            "Chegada": str(r.get("Chegada", "00:00") if pd.notna(r.get("Chegada")) else "00:00"),
-                            "Tempo_Espera": clean_int(r.get("Tempo_Espera"), 0),
-                            "Tempo_Entrega": clean_int(r.get("Tempo_Entrega"), 15),
-                            "Saida": str(r.get("Saida", "00:00") if pd.notna(r.get("Saida")) else "00:00"),
-                            "Nivel_Qualidade": clean_int(r.get("Nivel_Qualidade"), 1),
-                            "KM_Anterior": clean_num(r.get("KM_Anterior"), 0.0),
-                            "Dist_Acum": clean_num(r.get("Dist_Acum"), 0.0),
-                            "Peso_KG": clean_num(r.get("Peso_KG"), 50.0),
-                            "Carga_Acum": clean_num(r.get("Carga_Acum"), 0.0),
-                            "Carga_Vol_Acum": clean_num(r.get("Carga_Vol_Acum"), 0.0)
-                        })
-                        
-            resp_data = {
-                "status": "success" if routes_list else "none",
-                "routes": routes_list,
-                "quality_metrics": sanitize_json_data(state_dict.get("routes_metrics", {}))
-            }
-            return sanitize_json_data(resp_data)
+        raw_routes = state_dict.get("routes_solution")
+        
+        routes_list = []
+        if raw_routes is not None:
+            df_routes = raw_routes if isinstance(raw_routes, pd.DataFrame) else pd.DataFrame(raw_routes)
+            if not df_routes.empty:
+                for idx, r in df_routes.iterrows():
+                    r_name = str(r.get("Rota", "Por Distribuir") if pd.notna(r.get("Rota")) else "Por Distribuir")
+                    if "PENDENTE" in r_name.upper():
+                        r_name = "Por Distribuir"
+                    d_id = clean_int(r.get("id") or r.get("ID_Original"), idx + 1)
+                    routes_list.append({
+                        "id": d_id,
+                        "ID_Original": d_id,
+                        "Rota": r_name,
+                        "Armazem": str(r.get("Armazem", "N/A") if pd.notna(r.get("Armazem")) else "N/A"),
+                        "Ordem": clean_int(r.get("Ordem"), 1),
+                        "Cliente": str(r.get("Cliente", "") if pd.notna(r.get("Cliente")) else ""),
+                        "Nome_Cliente": str(r.get("Nome_Cliente", r.get("Cliente", "")) if pd.notna(r.get("Nome_Cliente")) else str(r.get("Cliente", "") if pd.notna(r.get("Cliente")) else "")),
+                        "Morada": str(r.get("Morada", "") if pd.notna(r.get("Morada")) else ""),
+                        "CP": str(r.get("CP", "") if pd.notna(r.get("CP")) else ""),
+                        "Localidade": str(r.get("Localidade", "") if pd.notna(r.get("Localidade")) else ""),
+                        "Janela_Horaria": str(r.get("Janela_Horaria", "Qualquer") if pd.notna(r.get("Janela_Horaria")) else "Qualquer"),
+                        "Latitude": clean_num(r.get("Latitude"), 0.0),
+                        "Longitude": clean_num(r.get("Longitude"), 0.0),
+                        "Chegada": str(r.get("Chegada", "00:00") if pd.notna(r.get("Chegada")) else "00:00"),
+                        "Tempo_Espera": clean_int(r.get("Tempo_Espera"), 0),
+                        "Tempo_Entrega": clean_int(r.get("Tempo_Entrega"), 15),
+                        "Saida": str(r.get("Saida", "00:00") if pd.notna(r.get("Saida")) else "00:00"),
+                        "Nivel_Qualidade": clean_int(r.get("Nivel_Qualidade"), 1),
+                        "KM_Anterior": clean_num(r.get("KM_Anterior"), 0.0),
+                        "Dist_Acum": clean_num(r.get("Dist_Acum"), 0.0),
+                        "Peso_KG": clean_num(r.get("Peso_KG"), 50.0),
+                        "Carga_Acum": clean_num(r.get("Carga_Acum"), 0.0),
+                        "Carga_Vol_Acum": clean_num(r.get("Carga_Vol_Acum"), 0.0)
+                    })
+                    
+        resp_data = {
+            "status": "success" if routes_list else "none",
+            "routes": routes_list,
+            "quality_metrics": sanitize_json_data(state_dict.get("routes_metrics", {})),
+            "version": routes_version
+        }
+        return sanitize_json_data(resp_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{project_id}/changes")
+def get_route_change_log(project_id: int, since_version: int = 0, current_user: UserResponse = Depends(get_current_user)):
+    """Compact history of route edits (changed fields per stop) after since_version."""
+    proj = get_projeto(project_id)
+    if not proj or proj["empresa_id"] != current_user.empresa_id:
+        raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
+        
+    return {"project_id": project_id, "changes": get_route_changes(project_id, since_version)}
+
 @router.post("/reassign")
 def reassign_client_route(req: ReassignRequest, current_user: UserResponse = Depends(get_current_user)):
     proj = get_projeto(req.project_id)
@@ -613,119 +1169,16 @@ def reassign_client_route(req: ReassignRequest, current_user: UserResponse = Dep
         raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
         
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (req.project_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                raise HTTPException(status_code=400, detail="Não existem rotas calculadas para reatribuir.")
-                
-            state_dict = deserialize_state(row["payload_json"])
-            raw_routes = state_dict.get("routes_solution")
-            
-            if raw_routes is None:
-                raise HTTPException(status_code=400, detail="Não existem rotas ativas neste projeto.")
-                
-            df_routes = raw_routes if isinstance(raw_routes, pd.DataFrame) else pd.DataFrame(raw_routes)
-            
-        if df_routes.empty:
-            raise HTTPException(status_code=400, detail="A lista de rotas está vazia.")
-            
-        target_idx = None
+        plan, routes_version = _load_route_plan(req.project_id, "Não existem rotas calculadas para reatribuir.")
         
-        # Match by delivery_id / ID_Original if supplied
-        if req.delivery_id is not None:
-            if "id" in df_routes.columns:
-                m_id = df_routes[df_routes["id"] == req.delivery_id].index
-                if len(m_id) > 0:
-                    target_idx = m_id[0]
-            if target_idx is None and "ID_Original" in df_routes.columns:
-                m_id = df_routes[df_routes["ID_Original"] == req.delivery_id].index
-                if len(m_id) > 0:
-                    target_idx = m_id[0]
-                    
-        # Match by client_code AND address if supplied
-        if target_idx is None and req.client_code and req.address:
-            t_code = str(req.client_code).strip().upper()
-            t_addr = str(req.address).strip().upper()
-            m_both = df_routes[
-                (df_routes["Cliente"].astype(str).str.strip().str.upper() == t_code) &
-                (df_routes["Morada"].astype(str).str.strip().str.upper() == t_addr)
-            ].index
-            if len(m_both) > 0:
-                target_idx = m_both[0]
-                
-        # Match by client_code
-        if target_idx is None and req.client_code:
-            t_code = str(req.client_code).strip().upper()
-            m_code = df_routes[df_routes["Cliente"].astype(str).str.strip().str.upper() == t_code].index
-            if len(m_code) == 0:
-                m_code = df_routes[df_routes["Cliente"].astype(str).str.contains(t_code, case=False, na=False)].index
-            if len(m_code) > 0:
-                target_idx = m_code[0]
-                
+        target_idx = plan.find_stop(req.delivery_id, req.client_code, req.address)
         if target_idx is None:
             raise HTTPException(status_code=404, detail="Cliente/Entrega não encontrado nas rotas.")
         
-        new_route_clean = req.new_route
-        if is_pending_route(new_route_clean):
-            new_route_clean = "Por Distribuir"
-            
-        df_routes.loc[target_idx, "Rota"] = new_route_clean
-        if not is_pending_route(new_route_clean):
-            df_routes.loc[target_idx, "Ordem"] = 99999
-            
-        warehouses_df = state_dict.get("warehouses_geocoded")
-        if warehouses_df is None or (isinstance(warehouses_df, pd.DataFrame) and warehouses_df.empty):
-            warehouses_df = state_dict.get("warehouses_used", pd.DataFrame())
-        fleet_config = state_dict.get("fleet_config") or state_dict.get("fleet_config_used", {})
-        fleet_dict = extract_fleet_dict(fleet_config, warehouses_df)
-        
-        updated_rows = []
-        unique_routes = df_routes["Rota"].unique()
-        
-        for r_name in unique_routes:
-            route_clients = df_routes[df_routes["Rota"] == r_name].copy()
-            if is_pending_route(r_name):
-                order = 1
-                for idx, row_c in route_clients.iterrows():
-                    row_c["Rota"] = "Por Distribuir"
-                    row_c["Ordem"] = order
-                    row_c["Chegada"] = "00:00"
-                    row_c["Tempo_Espera"] = 0
-                    row_c["Tempo_Entrega"] = 0
-                    row_c["Saida"] = "00:00"
-                    row_c["KM_Anterior"] = 0.0
-                    row_c["Dist_Acum"] = 0.0
-                    updated_rows.append(row_c.to_dict())
-                    order += 1
-                continue
-                
-            route_clients = route_clients.sort_values(by="Ordem")
-            v_info = fleet_dict.get(r_name, {})
-            wh_name = v_info.get("warehouse", warehouses_df.iloc[0]["Nome_Armazem"] if warehouses_df is not None and not warehouses_df.empty else "")
-            depot_lat, depot_lon = get_depot_coords(warehouses_df, wh_name)
-            v_start = str(v_info.get("start_time", "09:50"))
-            v_speed = float(v_info.get("speed", 50.0))
-            
-            recalc_stops = recalculate_route_stops(route_clients.to_dict(orient="records"), depot_lat, depot_lon, v_start, v_speed)
-            updated_rows.extend(recalc_stops)
-                
-        df_new_routes = pd.DataFrame(updated_rows)
-        state_dict["routes_solution"] = df_new_routes
-        payload = serialize_state(state_dict)
-        
-        snapshot_name = f"Reatribuição Manual ({datetime.now().strftime('%H:%M:%S')})"
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, ?, ?, ?)",
-                (req.project_id, current_user.id, 3, snapshot_name, payload)
-            )
-            conn.commit()
-            
-        return sanitize_json_data({"status": "success", "routes": df_new_routes.to_dict(orient="records")})
+        plan.move(target_idx, req.new_route)
+        return _commit_route_plan(req.project_id, plan, current_user.id, "reassign", routes_version)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -736,92 +1189,80 @@ def reassign_entire_route(req: BulkReassignRouteRequest, current_user: UserRespo
         raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
         
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (req.project_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                raise HTTPException(status_code=400, detail="Não existem rotas calculadas.")
-                
-            state_dict = deserialize_state(row["payload_json"])
-            raw_routes = state_dict.get("routes_solution")
-            
-            if raw_routes is None:
-                raise HTTPException(status_code=400, detail="Não existem rotas ativas neste projeto.")
-                
-            df_routes = raw_routes if isinstance(raw_routes, pd.DataFrame) else pd.DataFrame(raw_routes)
-            
-        if df_routes.empty:
-            raise HTTPException(status_code=400, detail="A lista de rotas está vazia.")
-            
-        src_clean = req.source_route.strip()
-        tgt_clean = req.target_route.strip()
-        if is_pending_route(tgt_clean):
-            tgt_clean = "Por Distribuir"
-            
-        if is_pending_route(src_clean):
-            src_mask = df_routes["Rota"].astype(str).apply(is_pending_route)
-        else:
-            src_mask = df_routes["Rota"].astype(str).str.strip().str.upper() == src_clean.upper()
-            
-        if not src_mask.any():
-            raise HTTPException(status_code=404, detail=f"A rota '{src_clean}' não tem paragens atribuídas.")
-            
-        df_routes.loc[src_mask, "Rota"] = tgt_clean
-        if not is_pending_route(tgt_clean):
-            df_routes.loc[src_mask, "Ordem"] = 99999
+        plan, routes_version = _load_route_plan(req.project_id, "Não existem rotas calculadas.")
+        
+        if plan.transfer(req.source_route, req.target_route) == 0:
+            raise HTTPException(status_code=404, detail=f"A rota '{req.source_route.strip()}' não tem paragens atribuídas.")
             
-        warehouses_df = state_dict.get("warehouses_geocoded")
-        if warehouses_df is None or (isinstance(warehouses_df, pd.DataFrame) and warehouses_df.empty):
-            warehouses_df = state_dict.get("warehouses_used", pd.DataFrame())
-        fleet_config = state_dict.get("fleet_config") or state_dict.get("fleet_config_used", {})
-        fleet_dict = extract_fleet_dict(fleet_config, warehouses_df)
+        return _commit_route_plan(req.project_id, plan, current_user.id, "reassign-entire-route", routes_version)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/batch-edit")
+def batch_edit_routes(req: BatchEditRequest, current_user: UserResponse = Depends(get_current_user)):
+    """
+    Applies an ordered list of edits against one loaded plan, re-times the
+    affected routes once and persists once. All or nothing: if any operation
+    fails, nothing is saved.
+    """
+    proj = get_projeto(req.project_id)
+    if not proj or proj["empresa_id"] != current_user.empresa_id:
+        raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
+    if not req.operations:
+        raise HTTPException(status_code=400, detail="Nenhuma operação indicada.")
         
-        updated_rows = []
-        unique_routes = df_routes["Rota"].unique()
-        
-        for r_name in unique_routes:
-            route_clients = df_routes[df_routes["Rota"] == r_name].copy()
-            if is_pending_route(r_name):
-                order = 1
-                for idx, row_c in route_clients.iterrows():
-                    row_c["Rota"] = "Por Distribuir"
-                    row_c["Ordem"] = order
-                    row_c["Chegada"] = "00:00"
-                    row_c["Tempo_Espera"] = 0
-                    row_c["Tempo_Entrega"] = 0
-                    row_c["Saida"] = "00:00"
-                    row_c["KM_Anterior"] = 0.0
-                    row_c["Dist_Acum"] = 0.0
-                    updated_rows.append(row_c.to_dict())
-                    order += 1
-                continue
-                
-            route_clients = route_clients.sort_values(by="Ordem")
-            v_info = fleet_dict.get(r_name, {})
-            wh_name = v_info.get("warehouse", warehouses_df.iloc[0]["Nome_Armazem"] if warehouses_df is not None and not warehouses_df.empty else "")
-            depot_lat, depot_lon = get_depot_coords(warehouses_df, wh_name)
-            v_start = str(v_info.get("start_time", "09:50"))
-            v_speed = float(v_info.get("speed", 50.0))
+    try:
+        plan, routes_version = _load_route_plan(req.project_id, "Não existem rotas calculadas para editar.")
+        if req.expected_version is not None and req.expected_version != routes_version:
+            raise HTTPException(status_code=409, detail="As rotas foram alteradas entretanto. Recarregue o plano e tente novamente.")
             
-            recalc_stops = recalculate_route_stops(route_clients.to_dict(orient="records"), depot_lat, depot_lon, v_start, v_speed)
-            updated_rows.extend(recalc_stops)
+        for i, op in enumerate(req.operations, 1):
+            try:
+                _apply_edit_operation(plan, op)
+            except HTTPException as e:
+                raise HTTPException(status_code=e.status_code, detail=f"Operação {i} ({op.op}): {e.detail} Nenhuma alteração foi gravada.")
                 
-        df_new_routes = pd.DataFrame(updated_rows)
-        state_dict["routes_solution"] = df_new_routes
-        payload = serialize_state(state_dict)
+        result = _commit_route_plan(req.project_id, plan, current_user.id, "batch-edit", routes_version)
+        result["applied"] = len(req.operations)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/insert")
+def insert_pending_stops(req: InsertRequest, current_user: UserResponse = Depends(get_current_user)):
+    """
+    Places "Por Distribuir" stops in the cheapest feasible position of the
+    existing routes, all in one batch, without re-solving the plan.
+    """
+    proj = get_projeto(req.project_id)
+    if not proj or proj["empresa_id"] != current_user.empresa_id:
+        raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
         
-        snapshot_name = f"Transferência Rota {src_clean} -> {tgt_clean} ({datetime.now().strftime('%H:%M:%S')})"
+    try:
+        plan, routes_version = _load_route_plan(req.project_id, "Não existem rotas calculadas para inserir paragens.")
+        if req.expected_version is not None and req.expected_version != routes_version:
+            raise HTTPException(status_code=409, detail="As rotas foram alteradas entretanto. Recarregue o plano e tente novamente.")
+        if req.delivery_ids:
+            pending_ids = set(plan.df.loc[plan.route_keys() == "Por Distribuir", "id"].astype(int))
+            missing = [d for d in req.delivery_ids if int(d) not in pending_ids]
+            if missing:
+                raise HTTPException(status_code=404, detail=f"Entregas não encontradas em 'Por Distribuir': {missing}")
+                
         with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, ?, ?, ?)",
-                (req.project_id, current_user.id, 3, snapshot_name, payload)
-            )
-            conn.commit()
-            
-        return sanitize_json_data({"status": "success", "routes": df_new_routes.to_dict(orient="records")})
+            rows = conn.execute("SELECT id, armazem FROM entregas WHERE projeto_id = ?", (req.project_id,)).fetchall()
+        client_warehouses = {int(r["id"]): r["armazem"] for r in rows}
+        
+        inserted, remaining = plan.insert_pending(req.delivery_ids, req.route_names, req.max_insertions, client_warehouses)
+        result = _commit_route_plan(req.project_id, plan, current_user.id, "insert", routes_version)
+        result["inserted"] = inserted
+        result["not_inserted"] = remaining
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -832,95 +1273,16 @@ def reorder_route_stop(req: ReorderRequest, current_user: UserResponse = Depends
         raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
         
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (req.project_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                raise HTTPException(status_code=400, detail="Não existem rotas calculadas para reordenar.")
-                
-            state_dict = deserialize_state(row["payload_json"])
-            raw_routes = state_dict.get("routes_solution")
-            
-            if raw_routes is None:
-                raise HTTPException(status_code=400, detail="Não existem rotas ativas neste projeto.")
-                
-            df_routes = raw_routes if isinstance(raw_routes, pd.DataFrame) else pd.DataFrame(raw_routes)
-            
-        if df_routes.empty:
-            raise HTTPException(status_code=400, detail="A lista de rotas está vazia.")
-            
-        route_mask = df_routes["Rota"] == req.route_name
-        route_stops = df_routes[route_mask].copy().sort_values(by="Ordem")
-        
-        clean_code = str(req.client_code).strip().upper()
-        current_idx = None
-        for i, (idx, r) in enumerate(route_stops.iterrows()):
-            if str(r["Cliente"]).strip().upper() == clean_code:
-                current_idx = i
-                break
-                
-        if current_idx is None:
-            raise HTTPException(status_code=404, detail="Paragem não encontrada na rota indicada.")
-            
-        target_idx = max(0, min(len(route_stops) - 1, req.new_order - 1))
-        
-        indices = list(route_stops.index)
-        elem = indices.pop(current_idx)
-        indices.insert(target_idx, elem)
-        
-        for new_pos, idx in enumerate(indices, 1):
-            df_routes.loc[idx, "Ordem"] = new_pos
-            
-        warehouses_df = state_dict.get("warehouses_geocoded")
-        if warehouses_df is None or (isinstance(warehouses_df, pd.DataFrame) and warehouses_df.empty):
-            warehouses_df = state_dict.get("warehouses_used", pd.DataFrame())
-        fleet_config = state_dict.get("fleet_config") or state_dict.get("fleet_config_used", {})
-        fleet_dict = extract_fleet_dict(fleet_config, warehouses_df)
+        plan, routes_version = _load_route_plan(req.project_id, "Não existem rotas calculadas para reordenar.")
         
-        updated_rows = []
-        for r_name in df_routes["Rota"].unique():
-            r_clients = df_routes[df_routes["Rota"] == r_name].copy()
-            if is_pending_route(r_name):
-                ord_num = 1
-                for idx, row_c in r_clients.iterrows():
-                    row_c["Rota"] = "Por Distribuir"
-                    row_c["Ordem"] = ord_num
-                    row_c["Chegada"] = "00:00"
-                    row_c["Tempo_Espera"] = 0
-                    row_c["Tempo_Entrega"] = 0
-                    row_c["Saida"] = "00:00"
-                    row_c["KM_Anterior"] = 0.0
-                    row_c["Dist_Acum"] = 0.0
-                    updated_rows.append(row_c.to_dict())
-                    ord_num += 1
-                continue
-                
-            r_clients = r_clients.sort_values(by="Ordem")
-            v_info = fleet_dict.get(r_name, {})
-            wh_name = v_info.get("warehouse", warehouses_df.iloc[0]["Nome_Armazem"] if warehouses_df is not None and not warehouses_df.empty else "")
-            depot_lat, depot_lon = get_depot_coords(warehouses_df, wh_name)
-            v_start = str(v_info.get("start_time", "09:50"))
-            v_speed = float(v_info.get("speed", 50.0))
-            
-            recalc_stops = recalculate_route_stops(r_clients.to_dict(orient="records"), depot_lat, depot_lon, v_start, v_speed)
-            updated_rows.extend(recalc_stops)
-                
-        df_new_routes = pd.DataFrame(updated_rows)
-        state_dict["routes_solution"] = df_new_routes
-        payload = serialize_state(state_dict)
-        
-        snapshot_name = f"Reordenação Rota {req.route_name} ({datetime.now().strftime('%H:%M:%S')})"
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, ?, ?, ?)",
-                (req.project_id, current_user.id, 3, snapshot_name, payload)
-            )
-            conn.commit()
+        stop_idx = plan.find_stop(req.delivery_id, req.client_code, req.address, candidates=plan.route_stops(req.route_name))
+        if stop_idx is None:
+            raise HTTPException(status_code=404, detail="Paragem não encontrada na rota indicada.")
             
-        return sanitize_json_data({"status": "success", "routes": df_new_routes.to_dict(orient="records")})
+        plan.reorder(req.route_name, stop_idx, req.new_order)
+        return _commit_route_plan(req.project_id, plan, current_user.id, "reorder", routes_version)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -931,161 +1293,11 @@ def optimize_single_route(req: OptimizeRouteRequest, current_user: UserResponse
         raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
         
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (req.project_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                raise HTTPException(status_code=400, detail="Não existem rotas calculadas para otimizar.")
-                
-            state_dict = deserialize_state(row["payload_json"])
-            raw_routes = state_dict.get("routes_solution")
-            
-            if raw_routes is None:
-                raise HTTPException(status_code=400, detail="Não existem rotas ativas neste projeto.")
-                
-            df_routes = raw_routes if isinstance(raw_routes, pd.DataFrame) else pd.DataFrame(raw_routes)
-            
-        if df_routes.empty:
-            raise HTTPException(status_code=400, detail="A lista de rotas está vazia.")
-            
-        route_mask = df_routes["Rota"] == req.route_name
-        route_stops = df_routes[route_mask].copy()
-        
-        if len(route_stops) <= 1:
-            return sanitize_json_data({"status": "success", "routes": df_routes.to_dict(orient="records")})
-            
-        warehouses_df = state_dict.get("warehouses_geocoded")
-        if warehouses_df is None or (isinstance(warehouses_df, pd.DataFrame) and warehouses_df.empty):
-            warehouses_df = state_dict.get("warehouses_used", pd.DataFrame())
-        fleet_config = state_dict.get("fleet_config") or state_dict.get("fleet_config_used", {})
-        fleet_dict = extract_fleet_dict(fleet_config, warehouses_df)
-        v_info = fleet_dict.get(req.route_name, {})
-        
-        wh_name = v_info.get("warehouse", warehouses_df.iloc[0]["Nome_Armazem"] if warehouses_df is not None and not warehouses_df.empty else "")
-        depot_lat, depot_lon = get_depot_coords(warehouses_df, wh_name)
-        v_start_min = parse_time_to_minutes(v_info.get("start_time", "09:50"), 590)
-        v_speed = float(v_info.get("speed", 50.0))
-        
-        # Time-Window Aware Routing for Single Route
-        # Group stops by window start time
-        stop_indices = list(route_stops.index)
-        
-        def get_stop_window_start(idx):
-            w_str = str(df_routes.loc[idx, "Janela_Horaria"])
-            w_s, _ = parse_time_window_str(w_str)
-            return w_s
-            
-        # Sort stops primarily by opening window, preserving feasibility
-        distinct_windows = sorted(list(set([get_stop_window_start(idx) for idx in stop_indices])))
-        
-        ordered_indices = []
-        cur_lat, cur_lon = depot_lat, depot_lon
-        
-        for w_val in distinct_windows:
-            window_cluster = [idx for idx in stop_indices if get_stop_window_start(idx) == w_val]
-            
-            # Nearest neighbor within the same time window cluster
-            unvisited_cluster = list(window_cluster)
-            while unvisited_cluster:
-                best_idx = None
-                best_dist = float("inf")
-                for idx in unvisited_cluster:
-                    c_lat = float(df_routes.loc[idx, "Latitude"])
-                    c_lon = float(df_routes.loc[idx, "Longitude"])
-                    d = haversine_distance(cur_lat, cur_lon, c_lat, c_lon)
-                    if d < best_dist:
-                        best_dist = d
-                        best_idx = idx
-                ordered_indices.append(best_idx)
-                unvisited_cluster.remove(best_idx)
-                cur_lat = float(df_routes.loc[best_idx, "Latitude"])
-                cur_lon = float(df_routes.loc[best_idx, "Longitude"])
-                
-        # 2-Opt local refinement strictly within the ordered sequence that does not violate time windows
-        def calc_path_dist(idx_list):
-            d_total = 0.0
-            p_lat, p_lon = depot_lat, depot_lon
-            for i in idx_list:
-                clat = float(df_routes.loc[i, "Latitude"])
-                clon = float(df_routes.loc[i, "Longitude"])
-                d_total += haversine_distance(p_lat, p_lon, clat, clon)
-                p_lat, p_lon = clat, clon
-            return d_total
-            
-        improved = True
-        while improved:
-            improved = False
-            best_path_dist = calc_path_dist(ordered_indices)
-            for i in range(len(ordered_indices) - 1):
-                for j in range(i + 1, len(ordered_indices)):
-                    new_idx_list = ordered_indices[:i] + ordered_indices[i:j+1][::-1] + ordered_indices[j+1:]
-                    
-                    # Verify that reversing does not invert time windows (e.g. putting 12:30 before 10:30)
-                    is_valid_windows = True
-                    for k in range(len(new_idx_list) - 1):
-                        w_curr = get_stop_window_start(new_idx_list[k])
-                        w_next = get_stop_window_start(new_idx_list[k+1])
-                        if w_curr > w_next and w_curr > 0 and w_next > 0:
-                            is_valid_windows = False
-                            break
-                            
-                    if is_valid_windows:
-                        new_d = calc_path_dist(new_idx_list)
-                        if new_d < best_path_dist - 0.01:
-                            ordered_indices = new_idx_list
-                            best_path_dist = new_d
-                            improved = True
-                            break
-                if improved:
-                    break
-                    
-        for pos, idx in enumerate(ordered_indices, 1):
-            df_routes.loc[idx, "Ordem"] = pos
-            
-        updated_rows = []
-        for r_name in df_routes["Rota"].unique():
-            r_clients = df_routes[df_routes["Rota"] == r_name].copy()
-            if is_pending_route(r_name):
-                ord_num = 1
-                for idx, row_c in r_clients.iterrows():
-                    row_c["Rota"] = "Por Distribuir"
-                    row_c["Ordem"] = ord_num
-                    row_c["Chegada"] = "00:00"
-                    row_c["Tempo_Espera"] = 0
-                    row_c["Tempo_Entrega"] = 0
-                    row_c["Saida"] = "00:00"
-                    row_c["KM_Anterior"] = 0.0
-                    row_c["Dist_Acum"] = 0.0
-                    updated_rows.append(row_c.to_dict())
-                    ord_num += 1
-                continue
-                
-            r_clients = r_clients.sort_values(by="Ordem")
-            v_curr_info = fleet_dict.get(r_name, {})
-            curr_wh = v_curr_info.get("warehouse", warehouses_df.iloc[0]["Nome_Armazem"] if warehouses_df is not None and not warehouses_df.empty else "")
-            depot_c_lat, depot_c_lon = get_depot_coords(warehouses_df, curr_wh)
-            curr_v_start = str(v_curr_info.get("start_time", "09:50"))
-            curr_v_speed = float(v_curr_info.get("speed", 50.0))
-            
-            recalc_stops = recalculate_route_stops(r_clients.to_dict(orient="records"), depot_c_lat, depot_c_lon, curr_v_start, curr_v_speed)
-            updated_rows.extend(recalc_stops)
-                
-        df_new_routes = pd.DataFrame(updated_rows)
-        state_dict["routes_solution"] = df_new_routes
-        payload = serialize_state(state_dict)
-        
-        snapshot_name = f"Otimização Rota {req.route_name} ({datetime.now().strftime('%H:%M:%S')})"
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, ?, ?, ?)",
-                (req.project_id, current_user.id, 3, snapshot_name, payload)
-            )
-            conn.commit()
-            
-        return sanitize_json_data({"status": "success", "routes": df_new_routes.to_dict(orient="records")})
+        plan, routes_version = _load_route_plan(req.project_id, "Não existem rotas calculadas para otimizar.")
+        plan.optimize_route(req.route_name)
+        return _commit_route_plan(req.project_id, plan, current_user.id, "optimize-single-route", routes_version)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1096,21 +1308,16 @@ def export_full_project(project_id: int, current_user: UserResponse = Depends(ge
         raise HTTPException(status_code=403, detail="Não tem permissão para aceder a este projeto.")
         
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (project_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                raise HTTPException(status_code=400, detail="Não existem dados exportáveis.")
-                
-            state_dict = deserialize_state(row["payload_json"])
+        state_dict, _ = load_project_state(project_id)
+        
+        if state_dict is None:
+            raise HTTPException(status_code=400, detail="Não existem dados exportáveis.")
             
-            routes_df = state_dict.get('routes_solution')
-            wh_raw = state_dict.get('warehouses_geocoded')
-            warehouses_df = wh_raw if (wh_raw is not None and not (isinstance(wh_raw, pd.DataFrame) and wh_raw.empty)) else state_dict.get('warehouses_used')
-            fleet_config = state_dict.get('fleet_config') or state_dict.get('fleet_config_used')
-            optimization_params = state_dict.get("optimization_params")
+        routes_df = state_dict.get('routes_solution')
+        wh_raw = state_dict.get('warehouses_geocoded')
+        warehouses_df = wh_raw if (wh_raw is not None and not (isinstance(wh_raw, pd.DataFrame) and wh_raw.empty)) else state_dict.get('warehouses_used')
+        fleet_config = state_dict.get('fleet_config') or state_dict.get('fleet_config_used')
+        optimization_params = state_dict.get("optimization_params")
             
         from utils.export_engine import generate_full_project_excel
         excel_data = generate_full_project_excel(
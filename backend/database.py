@@ -1,14 +1,16 @@
 import sqlite3
 import os
+import sys
 from contextlib import contextmanager
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.sqlite_pool import connect
+
 # Reference the central database file in the workspace root
 DB_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geocoding_multi.db')
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(DB_FILE, row_factory=sqlite3.Row)
 
 @contextmanager
 def get_db():
@@ -6,8 +6,9 @@ import os
 # Ensure root import works
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from backend.api import auth, projects, geocoding, fleet, solver, maps
-from database import init_database
+from backend.api import auth, projects, geocoding, fleet, solver, maps, admin
+from database import init_database, DB_GEO_PATH
+from utils.schema_migrations import migrate_geocoding_db
 
 # Initialize database
 try:
@@ -15,6 +16,11 @@ try:
 except Exception as e:
     print(f"Error initializing database: {e}")
 
+try:
+    migrate_geocoding_db(DB_GEO_PATH)
+except Exception as e:
+    print(f"Error migrating geocoding database: {e}")
+
 app = FastAPI(
     title='GeoRoute Pro API',
     description='Backend API for professional vehicle routing and geocoding',
@@ -36,6 +42,7 @@ app.include_router(projects.router, prefix='/api')
 app.include_router(geocoding.router, prefix='/api')
 app.include_router(fleet.router, prefix='/api')
 app.include_router(solver.router, prefix='/api')
+app.include_router(admin.router, prefix='/api')
 app.include_router(maps.router)
 
 @app.get('/')
@@ -0,0 +1,322 @@
+"""
+Solver Jobs - Fila local de otimizações assíncronas
+Cada job corre num processo separado (pool limitado), reporta progresso
+(fase + custo incumbente) através de uma Queue e o resultado final é
+persistido na tabela solver_jobs. Não depende de nenhum broker externo.
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import get_db
+
+MAX_WORKERS = int(os.getenv("SOLVER_MAX_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+
+# Minimum interval between incumbent updates sent from a worker to the parent
+PROGRESS_INTERVAL_S = 0.25
+
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+
+def _solve_project_target(payload: Dict[str, Any], emit: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """Default job target: the same pipeline used by POST /solver/solve."""
+    from backend.api.solver import run_solver_pipeline
+    return run_solver_pipeline(
+        payload["project_id"], payload.get("params") or {}, payload["user_id"], progress_callback=emit, job_id=payload.get("job_id")
+    )
+
+
+def _worker_entry(target: Callable, payload: Dict[str, Any], out_queue) -> None:
+    """Runs inside the child process. Never raises: errors go back through the queue."""
+    last_sent = [0.0]
+
+    def emit(event: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        if event.get("stage") == "search" and now - last_sent[0] < PROGRESS_INTERVAL_S:
+            return
+        last_sent[0] = now
+        out_queue.put(("progress", event))
+
+    try:
+        result = target(payload, emit)
+        out_queue.put(("result", result))
+    except Exception as e:
+        out_queue.put(("error", str(getattr(e, "detail", None) or e)))
+
+
+class SolverJob:
+    def __init__(self, job_id: str, project_id: int, user_id: int, empresa_id: int, params: Dict[str, Any]):
+        self.id = job_id
+        self.project_id = project_id
+        self.user_id = user_id
+        self.empresa_id = empresa_id
+        self.params = params
+        self.status = "queued"
+        self.stage = None
+        self.error = None
+        self.result = None
+        self.incumbent_cost = None
+        self.solutions = 0
+        # One (elapsed_s, incumbent_cost) sample per second of search
+        self.convergence: List[List[float]] = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.process = None
+        self.cancel_requested = False
+
+    def elapsed(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return round((self.finished_at or time.time()) - self.started_at, 2)
+
+    def to_dict(self, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "stage": self.stage,
+            "elapsed_seconds": self.elapsed(),
+            "incumbent_cost": self.incumbent_cost,
+            "solutions": self.solutions,
+            "convergence": self.convergence,
+            "error": self.error,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class SolverJobManager:
+    """
+    In-process job queue. A dispatcher thread starts at most max_workers
+    solver processes at a time; one watcher thread per running job drains
+    its progress queue and persists the final state.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, target: Callable = _solve_project_target):
+        self.max_workers = max(1, int(max_workers))
+        self.target = target
+        self._ctx = multiprocessing.get_context("spawn")
+        self._jobs: Dict[str, SolverJob] = {}
+        self._pending: "queue.Queue[str]" = queue.Queue()
+        self._slots = threading.Semaphore(self.max_workers)
+        self._lock = threading.Lock()
+        self._dispatcher = None
+
+    # ---------- public API ----------
+
+    def submit(self, project_id: int, user_id: int, empresa_id: int, params: Optional[Dict[str, Any]] = None) -> SolverJob:
+        job = SolverJob(uuid.uuid4().hex, project_id, user_id, empresa_id, dict(params or {}))
+        with self._lock:
+            self._jobs[job.id] = job
+        self._persist(job, insert=True)
+        self._ensure_dispatcher()
+        self._pending.put(job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[SolverJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job or self._load(job_id)
+
+    def cancel(self, job_id: str) -> Optional[SolverJob]:
+        job = self.get(job_id)
+        if not job or job.status in TERMINAL_STATES:
+            return job
+        job.cancel_requested = True
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+        elif job.process is not None and job.process.is_alive():
+            job.process.terminate()
+        return job
+
+    def shutdown(self):
+        """Terminates the running solver processes (registered with atexit)."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            process = job.process
+            if process is not None and process.is_alive():
+                job.cancel_requested = True
+                process.terminate()
+                process.join(timeout=1)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[SolverJob]:
+        """Blocks until the job reaches a terminal state (used by tests/scripts)."""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            job = self.get(job_id)
+            if job is None or job.status in TERMINAL_STATES:
+                return job
+            if deadline and time.time() > deadline:
+                return job
+            time.sleep(0.05)
+
+    # ---------- scheduling ----------
+
+    def _ensure_dispatcher(self):
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="solver-dispatcher", daemon=True)
+                self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        while True:
+            job_id = self._pending.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+            self._slots.acquire()
+            if job.status != "queued":
+                self._slots.release()
+                continue
+            try:
+                self._start(job)
+            except Exception as e:
+                self._slots.release()
+                job.error = str(e)
+                self._finish(job, "failed")
+
+    def _start(self, job: SolverJob):
+        out_queue = self._ctx.Queue()
+        payload = {"project_id": job.project_id, "user_id": job.user_id, "params": job.params, "job_id": job.id}
+        # Not daemonic so the solver can start its own worker pool (portfolio mode);
+        # shutdown() terminates whatever is still running when the server exits
+        job.process = self._ctx.Process(target=_worker_entry, args=(self.target, payload, out_queue), daemon=False)
+        job.status = "running"
+        job.started_at = time.time()
+        job.process.start()
+        self._persist(job)
+        threading.Thread(target=self._watch, args=(job, out_queue), name=f"solver-job-{job.id[:8]}", daemon=True).start()
+
+    def _watch(self, job: SolverJob, out_queue):
+        outcome = None
+        last_sample = 0
+        try:
+            while True:
+                try:
+                    kind, data = out_queue.get(timeout=0.2)
+                except queue.Empty:
+                    if not job.process.is_alive():
+                        # Drain anything flushed right before exit
+                        try:
+                            kind, data = out_queue.get(timeout=0.5)
+                        except queue.Empty:
+                            break
+                    else:
+                        continue
+
+                if kind == "progress":
+                    job.stage = data.get("stage", job.stage)
+                    if data.get("incumbent_cost") is not None:
+                        job.incumbent_cost = data["incumbent_cost"]
+                        job.solutions += 1
+                        second = int(job.elapsed())
+                        if second > last_sample or not job.convergence:
+                            job.convergence.append([job.elapsed(), job.incumbent_cost])
+                            last_sample = second
+                elif kind == "result":
+                    job.result = data
+                    outcome = "done"
+                elif kind == "error":
+                    job.error = data
+                    outcome = "failed"
+            job.process.join(timeout=1)
+        finally:
+            self._slots.release()
+
+        if job.cancel_requested:
+            self._finish(job, "cancelled")
+        elif outcome:
+            self._finish(job, outcome)
+        else:
+            job.error = job.error or f"Processo do solver terminou inesperadamente (exit code {job.process.exitcode})."
+            self._finish(job, "failed")
+
+    def _finish(self, job: SolverJob, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        job.process = None
+        self._persist(job)
+
+    # ---------- persistence ----------
+
+    def _persist(self, job: SolverJob, insert: bool = False):
+        try:
+            with get_db() as conn:
+                cursor = conn.cursor()
+                if insert:
+                    cursor.execute("""
+                        INSERT INTO solver_jobs (id, projeto_id, utilizador_id, empresa_id, status, params_json)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (job.id, job.project_id, job.user_id, job.empresa_id, job.status, json.dumps(job.params, default=str)))
+                else:
+                    cursor.execute("""
+                        UPDATE solver_jobs
+                        SET status = ?, stage = ?, error = ?, incumbent_cost = ?, progress_json = ?,
+                            result_json = ?, started_at = ?, finished_at = ?
+                        WHERE id = ?
+                    """, (
+                        job.status, job.stage, job.error, job.incumbent_cost,
+                        json.dumps({"solutions": job.solutions, "convergence": job.convergence}),
+                        json.dumps(job.result, default=str) if job.result is not None else None,
+                        datetime.fromtimestamp(job.started_at).isoformat() if job.started_at else None,
+                        datetime.fromtimestamp(job.finished_at).isoformat() if job.finished_at else None,
+                        job.id
+                    ))
+                conn.commit()
+        except Exception as e:
+            print(f"[SOLVER JOBS] Erro ao persistir job {job.id}: {e}")
+
+    def _load(self, job_id: str) -> Optional[SolverJob]:
+        """Rebuilds a finished job from the DB (e.g. after a server restart)."""
+        try:
+            with get_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT * FROM solver_jobs WHERE id = ?", (job_id,))
+                row = cursor.fetchone()
+        except Exception:
+            return None
+        if not row:
+            return None
+
+        job = SolverJob(row["id"], row["projeto_id"], row["utilizador_id"], row["empresa_id"], json.loads(row["params_json"] or "{}"))
+        # A job that was still queued/running when the process died can never finish
+        job.status = row["status"] if row["status"] in TERMINAL_STATES else "failed"
+        job.stage = row["stage"]
+        job.error = row["error"] if row["status"] in TERMINAL_STATES else (row["error"] or "Servidor reiniciado durante a otimização.")
+        job.incumbent_cost = row["incumbent_cost"]
+        progress = json.loads(row["progress_json"] or "{}")
+        job.solutions = progress.get("solutions", 0)
+        job.convergence = progress.get("convergence", [])
+        job.result = json.loads(row["result_json"]) if row["result_json"] else None
+        for attr, col in (("started_at", "started_at"), ("finished_at", "finished_at")):
+            if row[col]:
+                try:
+                    setattr(job, attr, datetime.fromisoformat(row[col]).timestamp())
+                except ValueError:
+                    pass
+        return job
+
+
+_manager: Optional[SolverJobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> SolverJobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SolverJobManager()
+            atexit.register(_manager.shutdown)
+        return _manager
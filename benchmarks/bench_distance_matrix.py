@@ -0,0 +1,79 @@
+"""
+Benchmark - Matriz de Distâncias (Haversine / Euclidiana)
+Uso: python benchmarks/bench_distance_matrix.py [--sizes 100,500,1000] [--dtype float32]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import numpy as np
+
+from utils.distance_calculator import (
+    haversine_distance,
+    calculate_haversine_matrix,
+    calculate_euclidean_matrix,
+)
+
+DEFAULT_SIZES = [100, 500, 1000, 2000, 5000, 10000]
+
+# Above this size the old double loop would take minutes, so it is skipped
+LEGACY_MAX_N = 500
+
+
+def legacy_haversine_matrix(locations):
+    """Old per-pair implementation, kept here only as a reference point."""
+    n = len(locations)
+    matrix = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            if i != j:
+                matrix[i][j] = haversine_distance(
+                    locations[i][0], locations[i][1],
+                    locations[j][0], locations[j][1]
+                )
+    return matrix
+
+
+def random_locations(n, seed=42):
+    """Random points inside mainland Portugal bounds."""
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(37.0, 42.0, n)
+    lons = rng.uniform(-9.5, -6.5, n)
+    return list(zip(lats.tolist(), lons.tolist()))
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, time.perf_counter() - t0
+
+
+def run(sizes, dtype):
+    print(f"{'n':>7} | {'legacy (s)':>10} | {'haversine (s)':>13} | {'euclid (s)':>10} | {'MB':>8} | {'max err km':>10}")
+    print("-" * 72)
+    for n in sizes:
+        locs = random_locations(n)
+
+        legacy_t = None
+        legacy_m = None
+        if n <= LEGACY_MAX_N:
+            legacy_m, legacy_t = _timed(legacy_haversine_matrix, locs)
+
+        hav_m, hav_t = _timed(calculate_haversine_matrix, locs, dtype=dtype)
+        _, euc_t = _timed(calculate_euclidean_matrix, locs, dtype=dtype)
+
+        max_err = float(np.max(np.abs(hav_m - legacy_m))) if legacy_m is not None else float("nan")
+        legacy_str = f"{legacy_t:10.3f}" if legacy_t is not None else f"{'-':>10}"
+        print(f"{n:>7} | {legacy_str} | {hav_t:13.3f} | {euc_t:10.3f} | {hav_m.nbytes / 1e6:8.1f} | {max_err:10.2e}")
+        del hav_m
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da matriz de distâncias")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument("--dtype", default="float64", choices=["float64", "float32"])
+    args = parser.parse_args()
+
+    run([int(s) for s in args.sizes.split(",") if s.strip()], np.dtype(args.dtype))
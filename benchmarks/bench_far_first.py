@@ -0,0 +1,77 @@
+"""
+Benchmark - Estratégia far-first (zonas/radial)
+Mede o tempo do recrutamento dos clusters e da estratégia completa
+(recrutamento + sequenciação) em instâncias sintéticas de vários tamanhos.
+Uso: python benchmarks/bench_far_first.py [--sizes 1000,2000,5000] [--repeat 3]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import statistics
+import time
+import numpy as np
+
+from utils.distance_calculator import calculate_haversine_matrix
+from utils.optimization_solver import AdvancedRouteOptimizer, _recruit_far_first_clusters
+
+
+def build_instance(n_clients, seed=1):
+    rng = np.random.default_rng(seed)
+    warehouses = [(38.72, -9.14), (41.15, -8.61)]
+    centers = np.array(warehouses)[rng.integers(0, 2, n_clients)]
+    clients = [tuple(p) for p in centers + rng.normal(0.0, 0.08, (n_clients, 2))]
+    n_vehicles = max(2, n_clients // 20)
+    windows = [(0, 1440) if rng.random() < 0.7 else (int(w), int(w) + 120) for w in rng.choice([540, 660, 780], n_clients)]
+    return {
+        "distance_matrix": np.asarray(calculate_haversine_matrix(warehouses + clients)),
+        "demands": [0.0, 0.0] + rng.uniform(5, 60, n_clients).round(1).tolist(),
+        "capacities": [1200.0] * n_vehicles,
+        "depots": [v % 2 for v in range(n_vehicles)],
+        "vehicle_warehouses": ["Lisboa" if v % 2 == 0 else "Porto" for v in range(n_vehicles)],
+        "client_warehouses": ["Lisboa" if lat < 40.0 else "Porto" for lat, _ in clients],
+        "windows": windows,
+        "starts": [480] * n_vehicles,
+        "ends": [1080] * n_vehicles,
+    }
+
+
+def time_recruitment(inst):
+    t0 = time.perf_counter()
+    routes = _recruit_far_first_clusters(
+        inst["distance_matrix"], inst["demands"], inst["capacities"], inst["depots"], 2, None, None,
+        inst["client_warehouses"], inst["vehicle_warehouses"], inst["starts"], inst["ends"], inst["windows"],
+        list(range(len(inst["capacities"]))), "full"
+    )
+    return time.perf_counter() - t0, sum(len(r) for r in routes.values())
+
+
+def time_strategy(inst):
+    t0 = time.perf_counter()
+    result = AdvancedRouteOptimizer().optimize_routes(
+        inst["distance_matrix"], inst["demands"], inst["capacities"], inst["depots"],
+        optimization_params={"strategy": "far_first"}, num_warehouses=2,
+        client_warehouses=inst["client_warehouses"], vehicle_warehouses=inst["vehicle_warehouses"],
+        vehicle_start_times=inst["starts"], vehicle_end_times=inst["ends"], client_time_windows=inst["windows"]
+    )
+    return time.perf_counter() - t0, len(result["dropped_nodes"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da estratégia far-first")
+    parser.add_argument("--sizes", default="1000,2000,5000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-full", action="store_true", help="Só mede o recrutamento")
+    args = parser.parse_args()
+
+    print(f"{'clientes':>8} | {'recrutamento (ms)':>17} | {'atribuídos':>10} | {'estratégia (ms)':>15} | {'por distribuir':>14}")
+    for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        inst = build_instance(n)
+        runs = [time_recruitment(inst) for _ in range(args.repeat)]
+        rec_ms = statistics.median(r[0] for r in runs) * 1000
+        full = "-", "-"
+        if not args.skip_full:
+            t, dropped = time_strategy(inst)
+            full = f"{t * 1000:.0f}", dropped
+        print(f"{n:>8} | {rec_ms:17.1f} | {runs[0][1]:>10} | {full[0]:>15} | {full[1]:>14}")
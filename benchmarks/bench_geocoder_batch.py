@@ -0,0 +1,58 @@
+"""
+Benchmark - WaterfallGeocoder.resolve_batch (rapidfuzz cdist por CP4) vs _try_local morada a morada
+Verifica também que os níveis de qualidade e moradas escolhidas são idênticos.
+Uso: python benchmarks/bench_geocoder_batch.py [--db geocoding.db] [--queries 5000] [--cp4s 200]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import tempfile
+import time
+
+from benchmarks.bench_geocoder_local import synthetic_rows, sample_queries
+from tests.test_geocoder import build_address_db
+from utils.geocoder_engine import WaterfallGeocoder
+
+
+def run(db_path, n_queries):
+    queries = sample_queries(db_path, n_queries)
+    geocoder = WaterfallGeocoder(db_path, google_api_key=None)
+    cleaned = [(geocoder._clean_address(a), cp, cc) for a, cp, cc in queries]
+
+    # Warm the CP4 index so both paths measure matching only
+    for _, cp, _ in cleaned:
+        geocoder.cp4_index.get(cp.split('-')[0])
+
+    t0 = time.perf_counter()
+    single = [geocoder._try_local(a, cp, cc) for a, cp, cc in cleaned]
+    single_t = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = geocoder.resolve_batch(queries, fast_mode=True)
+    batch_t = time.perf_counter() - t0
+
+    mismatches = sum(
+        1 for s, (b, _) in zip(single, batch)
+        if (s['quality_level'], s['address']) != (b['quality_level'], b['address'])
+    )
+    print(f"queries: {len(queries)} | mismatches: {mismatches}")
+    print(f"{'single (s)':>11} | {'batch (s)':>10} | {'single q/s':>10} | {'batch q/s':>10} | {'speedup':>7}")
+    print(f"{single_t:11.3f} | {batch_t:10.3f} | {len(queries) / single_t:10.0f} | {len(queries) / batch_t:10.0f} | {single_t / batch_t:6.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do geocoder local em lote")
+    parser.add_argument("--db", default=None, help="pt_addresses existente (por omissão gera uma sintética)")
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--cp4s", type=int, default=200)
+    parser.add_argument("--streets", type=int, default=150, help="Ruas por CP4 na base sintética")
+    args = parser.parse_args()
+
+    if args.db:
+        run(args.db, args.queries)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = build_address_db(os.path.join(tmp, "geocoding.db"), synthetic_rows(args.cp4s, args.streets))
+            run(db, args.queries)
@@ -0,0 +1,108 @@
+"""
+Benchmark - Geocoder local (_try_local) com e sem índice CP4 em memória
+Usa o mesmo WaterfallGeocoder(db_path, google_api_key=None) dos testes em tests/test_geocoder.py.
+Sem --db gera uma pt_addresses sintética num diretório temporário.
+Uso: python benchmarks/bench_geocoder_local.py [--db geocoding.db] [--queries 5000] [--cp4s 200]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+
+from rapidfuzz import process, fuzz
+
+from tests.test_geocoder import build_address_db
+from utils.geocoder_engine import WaterfallGeocoder
+from utils.validation import validate_cp4
+
+STREET_TYPES = ["Rua", "Avenida", "Travessa", "Largo", "Praça", "Estrada", "Beco"]
+STREET_NAMES = ["da Prata", "Augusta", "do Ouro", "da Liberdade", "de Santo António", "dos Bombeiros",
+                "Dom Afonso Henriques", "da República", "do Comércio", "das Flores", "Nova", "do Castelo"]
+
+
+def legacy_try_local(db_path, address, cp4, concelho):
+    """Old implementation: new connection and up to two queries per address."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    candidates = []
+    target_cp4 = str(cp4).split('-')[0].strip() if cp4 else None
+    if target_cp4 and validate_cp4(target_cp4):
+        query = "SELECT full_street, LATITUDE, LONGITUDE, CP4, quality_score FROM pt_addresses WHERE CP4 = ?"
+        if concelho:
+            cursor.execute(query + " AND UPPER(TRIM(cc_desig)) = ?", [target_cp4, concelho.upper().strip()])
+            candidates = cursor.fetchall()
+            if not candidates:
+                cursor.execute(query, [target_cp4])
+                candidates = cursor.fetchall()
+        else:
+            cursor.execute(query, [target_cp4])
+            candidates = cursor.fetchall()
+    if not candidates:
+        conn.close()
+        return None
+    match = process.extractOne(address, [c[0] for c in candidates], scorer=fuzz.token_set_ratio)
+    conn.close()
+    return match
+
+
+def synthetic_rows(n_cp4, streets_per_cp4, seed=7):
+    rnd = random.Random(seed)
+    rows = []
+    for k in range(n_cp4):
+        cp4 = str(1000 + k * 7)
+        concelho = f"Concelho {k % 40}"
+        for s in range(streets_per_cp4):
+            name = f"{rnd.choice(STREET_TYPES)} {rnd.choice(STREET_NAMES)} {s}"
+            rows.append((name, 38.0 + rnd.random(), -9.0 + rnd.random(), cp4, concelho))
+    return rows
+
+
+def sample_queries(db_path, n, seed=11):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT full_street, CP4, cc_desig FROM pt_addresses").fetchall()
+    conn.close()
+    rnd = random.Random(seed)
+    # Skewed towards a subset of postal areas, as in real delivery files
+    hot = rnd.sample(rows, min(len(rows), max(1, n // 10)))
+    return [(street.upper(), f"{cp4}-001", cc) for street, cp4, cc in (rnd.choice(hot) for _ in range(n))]
+
+
+def run(db_path, n_queries):
+    queries = sample_queries(db_path, n_queries)
+    geocoder = WaterfallGeocoder(db_path, google_api_key=None)
+
+    t0 = time.perf_counter()
+    for addr, cp, cc in queries:
+        legacy_try_local(db_path, addr, cp, cc)
+    legacy_t = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for addr, cp, cc in queries:
+        geocoder._try_local(addr, cp, cc)
+    indexed_t = time.perf_counter() - t0
+
+    index = geocoder.cp4_index
+    print(f"queries: {len(queries)} | CP4 loads: {index.misses} | index hits: {index.hits}")
+    print(f"{'legacy (s)':>12} | {'indexed (s)':>12} | {'legacy q/s':>11} | {'indexed q/s':>11} | {'speedup':>7}")
+    print(f"{legacy_t:12.3f} | {indexed_t:12.3f} | {len(queries) / legacy_t:11.0f} | {len(queries) / indexed_t:11.0f} | {legacy_t / indexed_t:6.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do geocoder local")
+    parser.add_argument("--db", default=None, help="pt_addresses existente (por omissão gera uma sintética)")
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--cp4s", type=int, default=200)
+    parser.add_argument("--streets", type=int, default=150, help="Ruas por CP4 na base sintética")
+    args = parser.parse_args()
+
+    if args.db:
+        run(args.db, args.queries)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = build_address_db(os.path.join(tmp, "geocoding.db"), synthetic_rows(args.cp4s, args.streets))
+            run(db, args.queries)
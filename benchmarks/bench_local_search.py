@@ -0,0 +1,65 @@
+"""
+Benchmark - Pesquisa local numa rota (utils.local_search)
+Compara o 2-opt ingénuo (recalcula a rota inteira por movimento, recomeça após cada
+melhoria) com a pesquisa local por arrays (deltas O(1), listas de vizinhos, Or-opt).
+Uso: python benchmarks/bench_local_search.py [--sizes 25,50,100,200] [--neighbors 10]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import numpy as np
+
+from utils.distance_calculator import calculate_haversine_matrix
+from utils.local_search import improve_route
+
+
+def build_route(n_stops, seed=1):
+    rng = np.random.default_rng(seed)
+    points = [(38.72, -9.14)] + [tuple(p) for p in rng.normal((38.72, -9.14), 0.08, (n_stops, 2))]
+    return np.asarray(calculate_haversine_matrix(points)), [int(c) for c in rng.permutation(np.arange(1, n_stops + 1))]
+
+
+def naive_two_opt(dist, route):
+    """Old RoutePlan.optimize_route refinement (open path, first improvement, restart)."""
+    def length(r):
+        path = [0] + r
+        return sum(dist[a, b] for a, b in zip(path, path[1:]))
+
+    improved = True
+    while improved:
+        improved = False
+        best = length(route)
+        for i in range(len(route) - 1):
+            for j in range(i + 1, len(route)):
+                cand = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                d = length(cand)
+                if d < best - 0.01:
+                    route, improved = cand, True
+                    break
+            if improved:
+                break
+    return route, length(route)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da pesquisa local numa rota")
+    parser.add_argument("--sizes", default="25,50,100,200")
+    parser.add_argument("--neighbors", type=int, default=10)
+    parser.add_argument("--naive-max", type=int, default=100, help="Maior rota para o 2-opt ingénuo")
+    args = parser.parse_args()
+
+    print(f"{'paragens':>8} | {'ingénuo (ms)':>12} | {'km':>8} | {'local search (ms)':>17} | {'km':>8} | movimentos")
+    for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        dist, route = build_route(n)
+        naive = "-", "-"
+        if n <= args.naive_max:
+            t0 = time.perf_counter()
+            _, km = naive_two_opt(dist, list(route))
+            naive = f"{(time.perf_counter() - t0) * 1000:.0f}", f"{km:.1f}"
+        t0 = time.perf_counter()
+        result = improve_route(dist, route, 0, closed=False, neighbors=args.neighbors, min_gain=0.01)
+        ls_ms = (time.perf_counter() - t0) * 1000
+        print(f"{n:>8} | {naive[0]:>12} | {naive[1]:>8} | {ls_ms:17.1f} | {result.distance:8.1f} | {result.moves}")
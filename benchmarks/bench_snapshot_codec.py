@@ -0,0 +1,101 @@
+"""
+Benchmark - Snapshots binários (colunar + zlib) vs JSON duplamente codificado
+Mede latência de escrita (serialize + INSERT), de leitura (SELECT + deserialize)
+e tamanho em disco, numa base SQLite temporária com a tabela snapshots.
+Uso: python benchmarks/bench_snapshot_codec.py [--rows 20000] [--repeat 5] [--source geocoding_multi.db]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.persistence_manager import deserialize_state, serialize_state
+
+
+def synthetic_state(n_rows, seed=7):
+    rng = np.random.default_rng(seed)
+    concelhos = np.array(["Lisboa", "Porto", "Braga", "Coimbra", "Faro", "Setúbal", "Aveiro", "Leiria"])
+    clients = pd.DataFrame({
+        "ID": np.arange(n_rows),
+        "Morada": [f"Rua {i % 997} n.º {i % 180}" for i in range(n_rows)],
+        "Codigo_Postal": [f"{1000 + i % 8900:04d}-{i % 999:03d}" for i in range(n_rows)],
+        "Concelho": concelhos[rng.integers(0, len(concelhos), n_rows)],
+        "Latitude": rng.uniform(37.0, 42.0, n_rows),
+        "Longitude": rng.uniform(-9.5, -6.2, n_rows),
+        "Peso_kg": rng.uniform(0.5, 80.0, n_rows).round(2),
+        "Volume_m3": rng.uniform(0.01, 1.5, n_rows).round(3),
+        "Nivel_Qualidade": rng.integers(1, 9, n_rows),
+        "Fonte": np.where(rng.random(n_rows) > 0.2, "LOCAL", "OSM"),
+    })
+    routes = [{"vehicle_id": f"V{v}", "stops": list(range(v * 40, v * 40 + 40)), "distance_km": float(rng.uniform(20, 200))}
+              for v in range(max(1, n_rows // 40))]
+    return {
+        "clients_geocoded": clients,
+        "phase_1_complete": True,
+        "warehouses_geocoded": clients.head(5).copy(),
+        "routes_solution": routes,
+        "optimization_params": {"max_time": 60, "strategy": "far_first"},
+    }
+
+
+def states_from_db(path, limit):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT payload_json FROM snapshots ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    conn.close()
+    return [s for s in (deserialize_state(r[0]) for r in rows) if s]
+
+
+def measure(states, fmt, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshots.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE snapshots (id INTEGER PRIMARY KEY, payload_json TEXT NOT NULL)")
+        write_t, read_t, sizes = [], [], []
+        for _ in range(repeat):
+            for state in states:
+                t0 = time.perf_counter()
+                payload = serialize_state(state, fmt=fmt)
+                cur = conn.execute("INSERT INTO snapshots (payload_json) VALUES (?)", (payload,))
+                conn.commit()
+                write_t.append(time.perf_counter() - t0)
+                sizes.append(len(payload if isinstance(payload, bytes) else payload.encode("utf-8")))
+
+                t0 = time.perf_counter()
+                row = conn.execute("SELECT payload_json FROM snapshots WHERE id = ?", (cur.lastrowid,)).fetchone()
+                restored = deserialize_state(row[0])
+                read_t.append(time.perf_counter() - t0)
+                assert restored.keys() == {k for k in state if k in restored}
+        conn.close()
+        file_mb = os.path.getsize(path) / 1e6
+    return statistics.median(write_t), statistics.median(read_t), statistics.mean(sizes), file_mb
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do formato de snapshots")
+    parser.add_argument("--rows", type=int, default=20000, help="Entregas no estado sintético")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--source", default=None, help="Base com snapshots reais (usa os mais recentes)")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    states = states_from_db(args.source, args.limit) if args.source else [synthetic_state(args.rows)]
+    if not states:
+        sys.exit("Sem snapshots legíveis na base indicada")
+
+    print(f"snapshots: {len(states)} x {args.repeat}")
+    print(f"{'formato':>8} | {'escrita (ms)':>12} | {'leitura (ms)':>12} | {'payload (KB)':>12} | {'ficheiro (MB)':>13}")
+    results = {}
+    for fmt in ("json", "binary"):
+        results[fmt] = measure(states, fmt, args.repeat)
+        w, r, size, file_mb = results[fmt]
+        print(f"{fmt:>8} | {w * 1000:12.1f} | {r * 1000:12.1f} | {size / 1024:12.1f} | {file_mb:13.2f}")
+    (jw, jr, js, _), (bw, br, bs, _) = results["json"], results["binary"]
+    print(f"ganho: escrita {jw / bw:.1f}x | leitura {jr / br:.1f}x | tamanho {js / bs:.1f}x")
@@ -0,0 +1,341 @@
+"""
+Benchmark - Solver (optimize_routes) em instâncias reprodutíveis
+Gera instâncias com semente através de utils.template_manager
+(generate_random_deliveries / generate_random_fleet_warehouses) e/ou repete
+instâncias gravadas (snapshots de produção anonimizados, em JSON), e corre cada
+estratégia do optimize_routes num processo novo. Por execução mede tempo, pico
+de memória, km totais, clientes por distribuir e violações de janelas/turnos.
+Sem --db gera uma pt_addresses sintética (área de Lisboa) num diretório temporário.
+
+Uso:
+  python benchmarks/bench_solver.py [--sizes 50,200,1000,5000] [--strategies distance,far_first,portfolio,decomposition]
+                                    [--instances benchmarks/instances/*.json] [--json resultado.json] [--baseline base.json]
+  python benchmarks/bench_solver.py --export-project 12 --out benchmarks/instances/projeto12.json
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import math
+import multiprocessing
+import platform
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from utils.distance_calculator import calculate_haversine_matrix
+from utils.optimization_solver import DEFAULT_SPEED_KMH, SERVICE_TIME_MIN, AdvancedRouteOptimizer
+from utils.template_manager import generate_random_deliveries, generate_random_fleet_warehouses
+
+STRATEGIES = ["distance", "far_first", "portfolio", "decomposition"]
+# Generated deliveries weigh 5-200 kg; about six fit an average generated vehicle
+STOPS_PER_VEHICLE = 6
+# Schedules are rebuilt from float minutes; the model works in truncated 0.01 min
+LATE_TOLERANCE_MIN = 0.5
+# Fixed size so an instance only depends on (size, seed), not on the other sizes requested
+SYNTHETIC_ADDRESSES = 12000
+# Wall time changes below this are noise, whatever the relative change
+MIN_TIME_DELTA_S = 0.5
+CONCELHOS = [("Lisboa", 38.73, -9.15), ("Cascais", 38.70, -9.42), ("Sintra", 38.80, -9.38),
+             ("Oeiras", 38.69, -9.31), ("Loures", 38.83, -9.17)]
+
+
+def parse_minutes(value, default):
+    """"HH:MM" -> minutes (the same reading as run_solver_pipeline)"""
+    from backend.api.solver import parse_time_to_minutes
+    return parse_time_to_minutes(value, default)
+
+
+def build_address_db(path, n_rows, seed=1):
+    """pt_addresses sintética com as colunas usadas pelos geradores"""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE pt_addresses (
+            full_street TEXT, CP4 TEXT, cc_desig TEXT, dd_desig TEXT,
+            LATITUDE REAL, LONGITUDE REAL, quality_score INTEGER
+        )
+    """)
+    rows = []
+    for k in range(n_rows):
+        name, lat, lon = CONCELHOS[k % len(CONCELHOS)]
+        dlat, dlon = rng.normal(0.0, 0.04, 2)
+        rows.append((f"Rua Sintética {k}", str(1000 + (k % 900)), name, "Lisboa",
+                     round(lat + dlat, 6), round(lon + dlon, 6), int(rng.integers(1, 4))))
+    conn.executemany("INSERT INTO pt_addresses VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def generate_instance(n_stops, seed, db_path):
+    """Instância no formato dos templates (entregas, armazéns, frota)"""
+    deliveries = pd.read_excel(BytesIO(generate_random_deliveries(
+        n_stops, db_path=db_path, seed=seed, missing_coords=0.0
+    )))
+    n_vehicles = max(3, math.ceil(n_stops / STOPS_PER_VEHICLE))
+    sheets = pd.read_excel(BytesIO(generate_random_fleet_warehouses(
+        n_vehicles, db_path=db_path, seed=seed, max_vehicles=n_vehicles
+    )), sheet_name=None)
+    return {
+        "name": f"sintetico-{n_stops}-s{seed}",
+        "deliveries": deliveries,
+        "warehouses": sheets["Armazéns"],
+        "fleet": sheets["Frota"],
+    }
+
+
+def load_instance(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        "name": data.get("name") or os.path.splitext(os.path.basename(path))[0],
+        "deliveries": pd.DataFrame(data["deliveries"]),
+        "warehouses": pd.DataFrame(data["warehouses"]),
+        "fleet": pd.DataFrame(data["fleet"]),
+    }
+
+
+def export_project(project_id, out_path):
+    """
+    Grava a instância de um projeto (último snapshot + entregas) sem dados
+    pessoais: sem nomes, moradas nem códigos, coordenadas a 3 casas decimais
+    (~100 m), armazéns e veículos renomeados.
+    """
+    from backend.api.solver import extract_fleet_dict
+    from database import get_db
+    from utils.persistence_manager import deserialize_state
+
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (project_id,)
+        ).fetchone()
+        if not row:
+            raise SystemExit(f"Projeto {project_id} sem snapshot")
+        state = deserialize_state(row["payload_json"])
+        rows = conn.execute(
+            "SELECT latitude, longitude, peso_kg, volume_m3, janela_inicio, janela_fim, armazem "
+            "FROM entregas WHERE projeto_id = ? AND latitude IS NOT NULL ORDER BY id ASC", (project_id,)
+        ).fetchall()
+
+    raw_wh = state.get("warehouses_geocoded")
+    warehouses_df = raw_wh if isinstance(raw_wh, pd.DataFrame) else pd.DataFrame(raw_wh)
+    wh_alias = {str(name).strip().lower(): f"Armazém {k + 1}" for k, name in enumerate(warehouses_df["Nome_Armazem"])}
+
+    def alias(name):
+        return wh_alias.get(str(name or "").strip().lower(), "")
+
+    instance = {
+        "name": f"projeto-{project_id}",
+        "warehouses": [
+            {"Nome_Armazem": alias(r["Nome_Armazem"]), "Latitude": round(float(r["Latitude"]), 3),
+             "Longitude": round(float(r["Longitude"]), 3)}
+            for _, r in warehouses_df.iterrows()
+        ],
+        "fleet": [
+            {"Veiculo": f"Veículo {k + 1}", "Armazem": alias(v["warehouse"]), "Capacidade_KG": v["capacity"],
+             "Cap_Volume_m3": v["capacity_volume"], "Velocidade_Media": v["speed"],
+             "Horario_Inicio": v["start_time"], "Horario_Fim": v["end_time"]}
+            for k, v in enumerate(extract_fleet_dict(state.get("fleet_config") or {}, warehouses_df).values())
+        ],
+        "deliveries": [
+            {"Latitude": round(float(r["latitude"]), 3), "Longitude": round(float(r["longitude"]), 3),
+             "Peso_KG": float(r["peso_kg"] or 50.0), "Volume_m3": float(r["volume_m3"] or 0.1),
+             "Janela_Inicio": r["janela_inicio"] or "", "Janela_Fim": r["janela_fim"] or "",
+             "Armazem": alias(r["armazem"])}
+            for r in rows
+        ],
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(instance, f, ensure_ascii=False, indent=1)
+    print(f"Instância gravada em {out_path}: {len(instance['deliveries'])} entregas, {len(instance['fleet'])} veículos")
+
+
+def solver_inputs(instance):
+    """optimize_routes kwargs, built the way run_solver_pipeline builds them"""
+    from backend.api.solver import extract_fleet_dict
+
+    warehouses, deliveries = instance["warehouses"], instance["deliveries"]
+    locations = [(float(r["Latitude"]), float(r["Longitude"])) for _, r in warehouses.iterrows()]
+    warehouse_indices = {str(name): k for k, name in enumerate(warehouses["Nome_Armazem"])}
+    num_warehouses = len(locations)
+    locations += [(float(r["Latitude"]), float(r["Longitude"])) for _, r in deliveries.iterrows()]
+
+    windows = []
+    for _, r in deliveries.iterrows():
+        s, e = str(r.get("Janela_Inicio") or "").strip(), str(r.get("Janela_Fim") or "").strip()
+        windows.append((parse_minutes(s, 0), parse_minutes(e, 1440)) if s and e and s != "nan" and e != "nan" else (0, 1440))
+
+    fleet = extract_fleet_dict(instance["fleet"], warehouses)
+    client_warehouses = deliveries["Armazem"].fillna("").astype(str).tolist() if "Armazem" in deliveries else [""] * len(deliveries)
+    return {
+        "distance_matrix": calculate_haversine_matrix(locations),
+        "demands": [0.0] * num_warehouses + deliveries["Peso_KG"].fillna(50.0).astype(float).tolist(),
+        "vehicle_capacities": [v["capacity"] for v in fleet.values()],
+        "depot_indices": [warehouse_indices.get(v["warehouse"], 0) for v in fleet.values()],
+        "volume_demands": [0.0] * num_warehouses + deliveries["Volume_m3"].fillna(0.1).astype(float).tolist(),
+        "vehicle_volume_capacities": [v["capacity_volume"] for v in fleet.values()],
+        "client_warehouses": client_warehouses,
+        "vehicle_warehouses": [v["warehouse"] for v in fleet.values()],
+        "num_warehouses": num_warehouses,
+        "vehicle_start_times": [parse_minutes(v.get("start_time", "09:50"), 590) for v in fleet.values()],
+        "vehicle_end_times": [parse_minutes(v.get("end_time", "18:00"), 1080) for v in fleet.values()],
+        "client_time_windows": windows,
+        "locations": locations,
+    }
+
+
+def schedule_violations(problem, routes):
+    """Stops served after their window end and routes back after the shift end, as the model times them"""
+    dist = problem["distance_matrix"]
+    nw = problem["num_warehouses"]
+    windows = problem["client_time_windows"]
+    late_stops, late_minutes, overruns = 0, 0.0, 0
+    for v, route in enumerate(routes):
+        if len(route) <= 2:
+            continue
+        t = float(problem["vehicle_start_times"][v])
+        for a, b in zip(route, route[1:]):
+            t += (SERVICE_TIME_MIN if a >= nw else 0.0) + dist[a][b] * 60.0 / DEFAULT_SPEED_KMH
+            if b >= nw:
+                win_s, win_e = windows[b - nw]
+                t = max(t, win_s)
+                if t > win_e + LATE_TOLERANCE_MIN:
+                    late_stops += 1
+                    late_minutes += t - win_e
+        if t > problem["vehicle_end_times"][v] + LATE_TOLERANCE_MIN:
+            overruns += 1
+    return late_stops, round(late_minutes, 1), overruns
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(max(own, children) / scale, 1)
+
+
+def run_strategy(instance, strategy, time_limit):
+    """Runs in a fresh process so the peak memory is this run's own"""
+    problem = solver_inputs(instance)
+    t0 = time.perf_counter()
+    result = AdvancedRouteOptimizer().optimize_routes(
+        **problem, optimization_params={"strategy": strategy, "time_limit_seconds": time_limit}
+    )
+    wall = time.perf_counter() - t0
+    late_stops, late_minutes, overruns = schedule_violations(problem, result.get("routes", []))
+    return {
+        "instance": instance["name"],
+        "stops": len(instance["deliveries"]),
+        "vehicles": len(problem["vehicle_capacities"]),
+        "strategy": strategy,
+        "status": result.get("status"),
+        "wall_s": round(wall, 2),
+        "peak_mb": peak_memory_mb(),
+        "total_km": round(float(result.get("total_distance", 0.0)), 2),
+        "dropped": len(result.get("dropped_nodes", [])),
+        "tw_violations": late_stops,
+        "late_minutes": late_minutes,
+        "shift_overruns": overruns,
+        "stop_reason": result.get("quality_metrics", {}).get("search", {}).get("stop_reason"),
+    }
+
+
+def compare(results, baseline, km_tolerance, time_tolerance):
+    """Prints the deltas against a stored report and returns the regressions"""
+    base = {(r["instance"], r["strategy"]): r for r in baseline.get("results", [])}
+    regressions = []
+    print()
+    print(f"{'instância':<22} | {'estratégia':<13} | {'km':>8} | {'tempo':>8} | {'por distr.':>10} | {'violações':>9}")
+    for r in results:
+        b = base.get((r["instance"], r["strategy"]))
+        if not b:
+            continue
+        km = (r["total_km"] - b["total_km"]) / b["total_km"] * 100.0 if b["total_km"] else 0.0
+        wall = (r["wall_s"] - b["wall_s"]) / b["wall_s"] * 100.0 if b["wall_s"] else 0.0
+        dropped = r["dropped"] - b["dropped"]
+        late = r["tw_violations"] - b["tw_violations"]
+        print(f"{r['instance']:<22} | {r['strategy']:<13} | {km:+7.1f}% | {wall:+7.1f}% | {dropped:+10d} | {late:+9d}")
+        slower = wall > time_tolerance * 100.0 and r["wall_s"] - b["wall_s"] > MIN_TIME_DELTA_S
+        if km > km_tolerance * 100.0 or slower or dropped > 0 or late > 0:
+            regressions.append((r["instance"], r["strategy"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do solver (tempo, memória e qualidade por estratégia)")
+    parser.add_argument("--sizes", default="50,200,1000,5000", help="Instâncias sintéticas (número de entregas); vazio para nenhuma")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--instances", nargs="*", default=[], help="Instâncias gravadas (JSON de --export-project)")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--time-limit", type=int, default=15, help="time_limit_seconds pedido ao solver")
+    parser.add_argument("--db", help="Base de dados com pt_addresses (por omissão, uma sintética)")
+    parser.add_argument("--json", help="Gravar o relatório neste ficheiro")
+    parser.add_argument("--baseline", help="Relatório anterior para comparação")
+    parser.add_argument("--km-tolerance", type=float, default=0.02, help="Aumento de km aceite face à base")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="Aumento de tempo aceite face à base")
+    parser.add_argument("--export-project", type=int, help="Exportar a instância anonimizada de um projeto e sair")
+    parser.add_argument("--out", help="Ficheiro de saída de --export-project")
+    args = parser.parse_args()
+
+    if args.export_project is not None:
+        export_project(args.export_project, args.out or f"projeto-{args.export_project}.json")
+        sys.exit(0)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    instances = [load_instance(path) for path in args.instances]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or build_address_db(os.path.join(tmp, "pt_addresses.db"), max(sizes + [SYNTHETIC_ADDRESSES // 2]) * 2)
+        instances = [generate_instance(n, args.seed, db_path) for n in sizes] + instances
+
+    results = []
+    print(f"{'instância':<22} | {'estratégia':<13} | {'tempo (s)':>9} | {'pico (MB)':>9} | {'km':>9} | {'por distr.':>10} | {'violações':>9} | paragem")
+    # "spawn": a fresh interpreter per run, so ru_maxrss is not inherited from this process
+    ctx = multiprocessing.get_context("spawn")
+    for instance in instances:
+        for strategy in strategies:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                r = pool.submit(run_strategy, instance, strategy, args.time_limit).result()
+            results.append(r)
+            print(f"{r['instance']:<22} | {r['strategy']:<13} | {r['wall_s']:9.2f} | {r['peak_mb'] or '-':>9} | "
+                  f"{r['total_km']:9.2f} | {r['dropped']:>10} | {r['tw_violations'] + r['shift_overruns']:>9} | {r['stop_reason'] or '-'}")
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "time_limit_seconds": args.time_limit,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"\nRelatório gravado em {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.km_tolerance, args.time_tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regressões: " + ", ".join(f"{i}/{s}" for i, s in regressions))
+            sys.exit(1)
@@ -11,15 +11,15 @@ DB_GEO_PATH = os.getenv("DB_GEO_PATH", "geocoding.db")
 
 from datetime import datetime
 from contextlib import contextmanager
+from utils.sqlite_pool import connect
+from utils.schema_migrations import MULTI_MIGRATIONS, migrate
 
 DB_FILE = DB_MULTI_PATH
 
 
 def get_db_connection():
-    """Criar conexão com a base de dados"""
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Conexão do pool partilhado (close() devolve-a ao pool)"""
+    return connect(DB_FILE, row_factory=sqlite3.Row)
 
 
 @contextmanager
@@ -195,6 +195,65 @@ def init_database():
             )
         """)
         
+        # Tabela de Jobs assíncronos do Solver (fila local)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS solver_jobs (
+                id TEXT PRIMARY KEY,
+                projeto_id INTEGER NOT NULL,
+                utilizador_id INTEGER NOT NULL,
+                empresa_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                stage TEXT,
+                params_json TEXT,
+                progress_json TEXT,
+                incumbent_cost REAL,
+                result_json TEXT,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (projeto_id) REFERENCES projetos (id)
+            )
+        """)
+        
+        # Paragens das rotas (uma linha por entrega) - edições manuais são UPDATEs linha a linha
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS route_stops (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                projeto_id INTEGER NOT NULL,
+                entrega_id INTEGER NOT NULL,
+                rota TEXT,
+                armazem TEXT,
+                ordem INTEGER,
+                chegada TEXT,
+                tempo_espera INTEGER,
+                tempo_entrega INTEGER,
+                saida TEXT,
+                km_anterior REAL,
+                dist_acum REAL,
+                carga_acum REAL,
+                carga_vol_acum REAL,
+                dados_json TEXT,
+                versao INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (projeto_id, entrega_id),
+                FOREIGN KEY (projeto_id) REFERENCES projetos (id)
+            )
+        """)
+        
+        # Histórico compacto das alterações às rotas (só os campos alterados)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS route_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                projeto_id INTEGER NOT NULL,
+                versao INTEGER NOT NULL,
+                utilizador_id INTEGER,
+                operacao TEXT NOT NULL,
+                alteracoes_json TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (projeto_id) REFERENCES projetos (id)
+            )
+        """)
+        
         # Garantir coluna armazem na tabela entregas para novas instalacoes e upgrades
         try:
             cursor.execute("ALTER TABLE entregas ADD COLUMN armazem TEXT")
@@ -204,8 +263,17 @@ def init_database():
             cursor.execute("ALTER TABLE entregas ADD COLUMN nome_cliente TEXT")
         except sqlite3.OperationalError:
             pass
+        # Contador de versão das rotas e snapshot base de route_stops
+        for column in ("versao_rotas INTEGER DEFAULT 0", "rotas_snapshot_id INTEGER"):
+            try:
+                cursor.execute(f"ALTER TABLE projetos ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
             
         conn.commit()
+        
+        # Índices e restantes alterações versionadas (schema_migrations)
+        migrate(conn, MULTI_MIGRATIONS)
         print("[DB] Base de dados inicializada com sucesso!")
 
 
@@ -4,6 +4,7 @@ import React, { useState, useEffect, useRef, useMemo } from "react";
 import DashboardLayout from "@/components/DashboardLayout";
 import { useProjects } from "@/context/ProjectContext";
 import { apiRequest } from "@/utils/api";
+import { applyRouteDelta } from "@/utils/routeDelta";
 import dynamic from "next/dynamic";
 
 const MapComponent = dynamic(() => import("@/components/MapComponent"), { ssr: false });
@@ -313,10 +314,7 @@ export default function TacticalPage() {
           route_name: routeName,
         }),
       });
-      const cleaned = (res.routes || []).map((r: any) => ({
-        ...r,
-        Rota: isPendingRoute(r.Rota) ? "Por Distribuir" : r.Rota,
-      }));
+      const cleaned = applyRouteDelta(routes, res);
       setRoutes(cleaned);
       broadcastUpdate(cleaned, vehicles, warehouses);
     } catch (err: any) {
@@ -346,10 +344,7 @@ export default function TacticalPage() {
           target_route: tgtDisplay,
         }),
       });
-      const cleaned = (res.routes || []).map((r: any) => ({
-        ...r,
-        Rota: isPendingRoute(r.Rota) ? "Por Distribuir" : r.Rota,
-      }));
+      const cleaned = applyRouteDelta(routes, res);
       setRoutes(cleaned);
       broadcastUpdate(cleaned, vehicles, warehouses);
       
@@ -375,10 +370,7 @@ export default function TacticalPage() {
           new_route: targetRoute,
         }),
       });
-      const cleaned = (res.routes || []).map((r: any) => ({
-        ...r,
-        Rota: isPendingRoute(r.Rota) ? "Por Distribuir" : r.Rota,
-      }));
+      const cleaned = applyRouteDelta(routes, res);
       setRoutes(cleaned);
       broadcastUpdate(cleaned, vehicles, warehouses);
     } catch (e: any) {
@@ -405,10 +397,7 @@ export default function TacticalPage() {
           new_order: newOrder,
         }),
       });
-      const cleaned = (res.routes || []).map((r: any) => ({
-        ...r,
-        Rota: isPendingRoute(r.Rota) ? "Por Distribuir" : r.Rota,
-      }));
+      const cleaned = applyRouteDelta(routes, res);
       setRoutes(cleaned);
       broadcastUpdate(cleaned, vehicles, warehouses);
     } catch (e: any) {
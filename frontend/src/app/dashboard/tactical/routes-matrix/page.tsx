@@ -2,6 +2,7 @@
 
 import React, { useState, useEffect, useRef, useMemo } from "react";
 import { apiRequest } from "@/utils/api";
+import { applyRouteDelta } from "@/utils/routeDelta";
 import { useProjects } from "@/context/ProjectContext";
 
 const routeColors = [
@@ -250,10 +251,7 @@ export default function RoutesMatrixPage() {
           target_route: tgtDisplay,
         }),
       });
-      const updated: RouteStop[] = (res.routes || []).map((r: any) => ({
-        ...r,
-        Rota: isPendingRoute(r.Rota) ? "Por Distribuir" : r.Rota,
-      }));
+      const updated: RouteStop[] = applyRouteDelta(routes, res);
       setRoutes(updated);
       broadcastUpdate(updated, vehicles, warehouses);
       setStatusMsg(`Carga total da rota "${sourceRoute}" transferida para "${tgtDisplay}" com sucesso.`);
@@ -280,10 +278,7 @@ export default function RoutesMatrixPage() {
           new_route: targetRoute,
         }),
       });
-      const updated: RouteStop[] = (res.routes || []).map((r: any) => ({
-        ...r,
-        Rota: isPendingRoute(r.Rota) ? "Por Distribuir" : r.Rota,
-      }));
+      const updated: RouteStop[] = applyRouteDelta(routes, res);
       setRoutes(updated);
       broadcastUpdate(updated, vehicles, warehouses);
       setStatusMsg(`Cliente ${clientCode} movido para ${targetRoute}.`);
@@ -311,10 +306,7 @@ export default function RoutesMatrixPage() {
           new_order: newOrder,
         }),
       });
-      const updated: RouteStop[] = (res.routes || []).map((r: any) => ({
-        ...r,
-        Rota: isPendingRoute(r.Rota) ? "Por Distribuir" : r.Rota,
-      }));
+      const updated: RouteStop[] = applyRouteDelta(routes, res);
       setRoutes(updated);
       broadcastUpdate(updated, vehicles, warehouses);
     } catch (err: any) {
@@ -366,10 +358,7 @@ export default function RoutesMatrixPage() {
           route_name: routeName,
         }),
       });
-      const updated: RouteStop[] = (res.routes || []).map((r: any) => ({
-        ...r,
-        Rota: isPendingRoute(r.Rota) ? "Por Distribuir" : r.Rota,
-      }));
+      const updated: RouteStop[] = applyRouteDelta(routes, res);
       setRoutes(updated);
       broadcastUpdate(updated, vehicles, warehouses);
       setStatusMsg(`Rota ${routeName} reordenada otimamente.`);
@@ -0,0 +1,25 @@
+function isPendingRoute(routeName: string) {
+  if (!routeName) return true;
+  const s = routeName.toUpperCase();
+  return s.includes("PENDENTE") || s.includes("DISTRIBUIR");
+}
+
+function routeKey(routeName: string) {
+  return isPendingRoute(routeName) ? "Por Distribuir" : routeName;
+}
+
+/**
+ * Merges a route-edit response into the current stop list.
+ * The solver edit endpoints only return the stops of the routes they changed
+ * (`changed_routes`); every other route is kept as it is.
+ */
+export function applyRouteDelta<T extends { id?: number; Rota: string }>(current: T[], res: any): T[] {
+  const changed = new Set<string>((res.changed_routes || []).map((r: string) => routeKey(r)));
+  const incoming: T[] = (res.routes || []).map((r: any) => ({
+    ...r,
+    Rota: routeKey(r.Rota),
+  }));
+  const incomingIds = new Set(incoming.map((r) => r.id));
+  const kept = current.filter((r) => !changed.has(routeKey(r.Rota)) && !incomingIds.has(r.id));
+  return [...kept, ...incoming];
+}
@@ -1,6 +1,7 @@
 import pandas as pd
 import sqlite3
 import os
+from utils.schema_migrations import GEO_MIGRATIONS, migrate
 
 # Configuration
 CSV_FILE = 'ctt-lat-lng - Original.csv'
@@ -16,6 +17,7 @@ def setup_database():
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='pt_addresses'")
     if cursor.fetchone():
         print("Table 'pt_addresses' already exists. Skipping import.")
+        migrate(conn, GEO_MIGRATIONS)
         conn.close()
         return
 
@@ -70,6 +72,8 @@ def setup_database():
     cursor.execute("CREATE INDEX idx_distrito ON pt_addresses(dd_desig)")
     
     conn.commit()
+    print("Applying schema migrations (normalized concelho, composite indices)...")
+    migrate(conn, GEO_MIGRATIONS)
     conn.close()
     print("Database setup complete!")
 
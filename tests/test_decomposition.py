@@ -0,0 +1,178 @@
+"""
+Testes Unitários - Decomposição de instâncias grandes (armazém + setores, reparação de fronteiras)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from utils.decomposition import (
+    repair_boundaries, split_instance, subproblem_inputs, warehouse_eligibility
+)
+from utils.distance_calculator import calculate_haversine_matrix
+from utils.optimization_solver import AdvancedRouteOptimizer
+
+
+def build_problem(n_clients=300, n_vehicles=12, seed=5):
+    """Dois armazéns (Lisboa, Porto), clientes à volta de cada um"""
+    rng = np.random.default_rng(seed)
+    warehouses = [(38.72, -9.14), (41.15, -8.61)]
+    centers = np.array(warehouses)[rng.integers(0, 2, n_clients)]
+    clients = [tuple(p) for p in centers + rng.normal(0.0, 0.05, (n_clients, 2))]
+    locations = warehouses + clients
+    return {
+        "distance_matrix": np.asarray(calculate_haversine_matrix(locations)),
+        "demands": [0.0, 0.0] + rng.uniform(5, 40, n_clients).round(1).tolist(),
+        "vehicle_capacities": [1000.0 if v % 3 else 1500.0 for v in range(n_vehicles)],
+        "depot_indices": [v % 2 for v in range(n_vehicles)],
+        "volume_demands": None,
+        "vehicle_volume_capacities": None,
+        "client_warehouses": ["Lisboa" if lat < 40.0 else "Porto" for lat, _ in clients],
+        "vehicle_warehouses": ["Lisboa" if v % 2 == 0 else "Porto" for v in range(n_vehicles)],
+        "num_warehouses": 2,
+        "vehicle_start_times": [480] * n_vehicles,
+        "vehicle_end_times": [1080] * n_vehicles,
+        "client_time_windows": [(0, 1440)] * n_clients,
+        "locations": locations,
+        "vehicle_speeds": None,
+    }
+
+
+class TestSplitInstance:
+    """Testes para utils.decomposition.split_instance"""
+
+    @pytest.mark.parametrize("with_locations", [True, False])
+    def test_particao_completa(self, with_locations):
+        p = build_problem()
+        subs = split_instance(
+            p["distance_matrix"], p["demands"], p["vehicle_capacities"], p["depot_indices"], 2,
+            p["client_warehouses"], p["vehicle_warehouses"], p["locations"] if with_locations else None, max_clients=60
+        )
+
+        clients = sorted(c for s in subs for c in s.clients)
+        vehicles = sorted(v for s in subs for v in s.vehicles)
+        assert clients == list(range(2, 302))
+        assert vehicles == list(range(12))
+        assert len(subs) > 2
+        for s in subs:
+            assert s.vehicles, s.name
+            wh = s.name.split("#")[0]
+            assert {p["client_warehouses"][c - 2].lower() for c in s.clients} == {wh}
+            assert {p["vehicle_warehouses"][v].lower() for v in s.vehicles} == {wh}
+
+    def test_frota_proporcional_a_procura(self):
+        p = build_problem()
+        subs = split_instance(
+            p["distance_matrix"], p["demands"], p["vehicle_capacities"], p["depot_indices"], 2,
+            p["client_warehouses"], p["vehicle_warehouses"], p["locations"], max_clients=80
+        )
+        for s in subs:
+            demand = sum(p["demands"][c] for c in s.clients)
+            capacity = sum(p["vehicle_capacities"][v] for v in s.vehicles)
+            assert capacity >= demand * 0.6
+
+    def test_clientes_sem_armazem_vao_para_o_mais_proximo(self):
+        p = build_problem(n_clients=40, n_vehicles=4)
+        p["client_warehouses"] = [""] * 40
+        subs = split_instance(
+            p["distance_matrix"], p["demands"], p["vehicle_capacities"], p["depot_indices"], 2,
+            p["client_warehouses"], p["vehicle_warehouses"], p["locations"]
+        )
+        porto = next(s for s in subs if s.name == "porto")
+        assert porto.clients and all(p["locations"][c][0] > 40.0 for c in porto.clients)
+
+    def test_subproblema_local(self):
+        p = build_problem(n_clients=50, n_vehicles=4)
+        sub = split_instance(
+            p["distance_matrix"], p["demands"], p["vehicle_capacities"], p["depot_indices"], 2,
+            p["client_warehouses"], p["vehicle_warehouses"], p["locations"]
+        )[1]
+        nodes, local = subproblem_inputs(sub, p["distance_matrix"], p)
+
+        assert nodes[0] == 1 and local["num_warehouses"] == 1
+        assert local["depot_indices"] == [0] * len(sub.vehicles)
+        assert np.array_equal(local["distance_matrix"], p["distance_matrix"][np.ix_(nodes, nodes)])
+        assert local["demands"][1:] == [p["demands"][c] for c in sub.clients]
+        assert local["client_warehouses"] == ["Porto"] * len(sub.clients)
+
+
+class TestRepairBoundaries:
+    """Testes para utils.decomposition.repair_boundaries"""
+
+    def test_insere_por_distribuir_e_respeita_capacidade(self):
+        p = build_problem(n_clients=30, n_vehicles=2)
+        lisboa = [c for c in range(2, 32) if p["client_warehouses"][c - 2] == "Lisboa"]
+        porto = [c for c in range(2, 32) if p["client_warehouses"][c - 2] == "Porto"]
+        routes = {0: lisboa[:-2], 1: porto}
+        dropped = lisboa[-2:]
+        eligible = warehouse_eligibility(p["client_warehouses"], p["vehicle_warehouses"], 2)
+
+        stats = repair_boundaries(p["distance_matrix"], routes, dropped, {c: 0 for c in range(2, 32)}, p, eligible)
+
+        assert stats["inserted"] == 2 and dropped == []
+        assert sorted(routes[0]) == sorted(lisboa)
+        assert sorted(routes[1]) == sorted(porto)
+
+    def test_move_cliente_de_fronteira(self):
+        """Um cliente ao lado da rota vizinha muda de rota quando isso encurta a solução"""
+        pts = [(0.0, 0.0), (0.0, 0.1), (0.0, 0.2), (0.0, -0.1), (0.0, -0.2), (0.0, 0.21)]
+        dist = np.asarray(calculate_haversine_matrix(pts))
+        p = {
+            "num_warehouses": 1, "demands": [0.0] + [10.0] * 5, "vehicle_capacities": [100.0, 100.0],
+            "depot_indices": [0, 0], "vehicle_start_times": [480, 480], "vehicle_end_times": [1080, 1080],
+        }
+        routes = {0: [1, 2], 1: [3, 4, 5]}
+        sector_of = {1: 0, 2: 0, 3: 1, 4: 1, 5: 1}
+
+        def total():
+            return sum(dist[a, b] for r in routes.values() for a, b in zip([0] + r, r + [0]))
+
+        before = total()
+        stats = repair_boundaries(dist, routes, [], sector_of, p, lambda c, v: True)
+
+        assert stats["relocated"] >= 1
+        assert sorted(routes[0] + routes[1]) == [1, 2, 3, 4, 5]
+        assert total() < before - 10.0
+
+
+class TestDecomposedSolve:
+    """optimize_routes em modo decomposição devolve o formato habitual"""
+
+    def test_resultado_valido(self):
+        p = build_problem(n_clients=120, n_vehicles=6)
+        result = AdvancedRouteOptimizer().optimize_routes(
+            **{k: v for k, v in p.items()},
+            optimization_params={"strategy": "decomposition", "sector_max_clients": 40, "time_limit_seconds": 3, "decompose_workers": 1}
+        )
+
+        assert result["status"] == "SUCCESS"
+        assert len(result["routes"]) == 6
+        visited = [c for r in result["routes"] for c in r[1:-1]]
+        assert len(visited) == len(set(visited))
+        assert sorted(visited + result["dropped_nodes"]) == list(range(2, 122))
+        for v, route in enumerate(result["routes"]):
+            assert route[0] == route[-1] == p["depot_indices"][v]
+            assert result["route_loads"][v] <= p["vehicle_capacities"][v]
+            assert all(p["client_warehouses"][c - 2] == p["vehicle_warehouses"][v] for c in route[1:-1])
+        report = result["quality_metrics"]["decomposition"]
+        assert sum(s["clients"] for s in report["subproblems"]) == 120
+        assert result["total_distance"] == pytest.approx(sum(result["route_distances"]), abs=0.05)
+
+    def test_sem_processos_divide_o_orcamento(self, monkeypatch):
+        """Sem pool de processos os subproblemas correm em série e partilham o orçamento"""
+        import utils.optimization_solver as solver_module
+        monkeypatch.setattr(solver_module, "_processes_available", lambda workers: False)
+        p = build_problem(n_clients=120, n_vehicles=6)
+        result = AdvancedRouteOptimizer().optimize_routes(
+            **p, optimization_params={"strategy": "decomposition", "sector_max_clients": 40, "time_limit_seconds": 12, "decompose_workers": 4}
+        )
+
+        report = result["quality_metrics"]["decomposition"]
+        solved = [s for s in report["subproblems"] if s["clients"] and s["vehicles"]]
+        assert report["workers"] == 1
+        assert report["time_limit_per_subproblem"] == max(3, 12 // len(solved))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,124 @@
+"""
+Testes Unitários - Fase externa assíncrona de geocodificação e rate limiting
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import threading
+import time
+
+import pytest
+import utils.external_geocoding as external_geocoding
+from utils.external_geocoding import ExternalGeocodingStage
+from utils.geocoder_engine import WaterfallGeocoder
+from utils.rate_limit import TokenBucket, get_rate_limiter
+from tests.test_geocoder import build_address_db
+
+OSM_RESULT = {'lat': 38.72, 'lon': -9.14, 'address': "Rua Boa, Lisboa", 'score': 100, 'quality_level': 2, 'source': 'OSM', 'match_type': 'road'}
+
+
+class TestTokenBucket:
+    """Testes para o token bucket"""
+
+    def test_reservas_espacadas(self):
+        """Após o burst cada reserva espera 1/rate a mais"""
+        bucket = TokenBucket(rate=20, burst=2)
+        delays = [bucket.reserve() for _ in range(5)]
+
+        assert delays[0] == 0 and delays[1] == 0
+        assert delays[2] == pytest.approx(0.05, abs=0.01)
+        assert delays[4] == pytest.approx(0.15, abs=0.01)
+
+    def test_nominatim_limitado_a_1_por_segundo(self):
+        """O bucket global do Nominatim nunca passa de 1 req/s"""
+        bucket = get_rate_limiter("nominatim")
+        assert bucket.rate <= 1.0
+        assert bucket.burst == 1
+        assert get_rate_limiter("nominatim") is bucket
+
+    def test_rate_invalido(self):
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestExternalGeocodingStage:
+    """Testes para a fase externa assíncrona"""
+
+    @pytest.fixture
+    def geocoder(self, tmp_path, monkeypatch):
+        db_path = build_address_db(tmp_path / "geocoding.db", [("Rua Augusta", 38.711, -9.138, "1100", "Lisboa")])
+        geocoder = WaterfallGeocoder(db_path, google_api_key=None)
+        geocoder.calls = []
+        lock = threading.Lock()
+
+        def fake_call_provider(provider, args):
+            with lock:
+                geocoder.calls.append((provider, args))
+            time.sleep(0.05)
+            if provider == 'nominatim' and args[0] == "Rua Boa":
+                return dict(OSM_RESULT)
+            return None
+
+        monkeypatch.setattr(geocoder, "call_provider", fake_call_provider)
+        fast = {name: TokenBucket(rate=1000, burst=100) for name in ("nominatim", "google", "scraper")}
+        monkeypatch.setattr(external_geocoding, "get_rate_limiter", fast.get)
+        return geocoder
+
+    def test_coalescencia_pedidos_identicos(self, geocoder):
+        """Pedidos idênticos em curso partilham uma única chamada ao fornecedor"""
+        stage = ExternalGeocodingStage(max_concurrency=8)
+        items = [("Rua Boa", "1100", "Lisboa", None)] * 5 + [("Rua Má", "1100", "Lisboa", None)]
+
+        results = asyncio.run(stage.resolve_many(geocoder, items))
+
+        assert [r['quality_level'] for r, _ in results] == [2, 2, 2, 2, 2, 8]
+        assert len(geocoder.calls) == 2
+        assert stage.stats["coalesced"] == 4
+        assert results[0][1]['result']['source'] == 'OSM'
+
+    def test_mesmo_resultado_que_caminho_sincrono(self, geocoder, monkeypatch):
+        """A fase assíncrona segue a mesma cascata que resolve_address"""
+        import utils.geocoder_engine as engine
+        monkeypatch.setattr(engine, "get_rate_limiter", lambda provider: TokenBucket(rate=1000, burst=100))
+        local = {'lat': 38.7, 'lon': -9.1, 'address': "Rua Augusta", 'score': 60, 'quality_level': 5, 'source': 'LOCAL', 'match_type': 'FUZZY'}
+
+        sync_result = geocoder._resolve_after_local("Rua Boa", "1100-001", "Lisboa", local, fast_mode=False)
+        async_result = asyncio.run(ExternalGeocodingStage().resolve_one(geocoder, "Rua Boa", "1100-001", "Lisboa", local))
+
+        assert sync_result == async_result
+        # CP7 completo passa primeiro pelo scraper
+        assert [p for p, _ in geocoder.calls] == ['scraper', 'nominatim', 'scraper', 'nominatim']
+
+    def test_fornecedor_lento_nao_bloqueia_os_outros(self, geocoder, monkeypatch):
+        """Pedidos à espera do bucket do Nominatim não ocupam os slots de concorrência"""
+        buckets = {"nominatim": TokenBucket(rate=2, burst=1), "google": TokenBucket(rate=1000, burst=100)}
+        monkeypatch.setattr(external_geocoding, "get_rate_limiter", buckets.get)
+        stage = ExternalGeocodingStage(max_concurrency=2)
+
+        async def scenario():
+            start = time.monotonic()
+            slow = [asyncio.create_task(stage._call(geocoder, "nominatim", (f"Rua {k}", "1100", "Lisboa"))) for k in range(6)]
+            await asyncio.sleep(0.1)
+            await stage._call(geocoder, "google", ("Rua G", "1100", "Lisboa"))
+            google_done = time.monotonic() - start
+            await asyncio.gather(*slow)
+            return google_done
+
+        assert asyncio.run(scenario()) < 0.5
+
+    def test_submit_em_background(self, geocoder):
+        """submit devolve logo e entrega cada resultado pelo callback"""
+        stage = ExternalGeocodingStage()
+        seen = []
+
+        future = stage.submit(geocoder, [("Rua Boa", "1100", "", None), ("Outra", "1100", "", None)],
+                              lambda pos, result, learned: seen.append((pos, result['quality_level'])))
+        future.result(timeout=5)
+
+        assert sorted(seen) == [(0, 2), (1, 8)]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
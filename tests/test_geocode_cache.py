@@ -0,0 +1,95 @@
+"""
+Testes Unitários - Cache persistente de resultados de geocodificação
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import utils.geocode_cache as geocode_cache
+from utils.geocode_cache import GeocodeResultCache
+from utils.geocoder_engine import WaterfallGeocoder
+from tests.test_geocoder import build_address_db
+
+OK_RESULT = {'lat': 38.71, 'lon': -9.13, 'address': "Rua da Prata", 'score': 100, 'quality_level': 1, 'source': 'LOCAL', 'match_type': 'FUZZY'}
+APPROX_RESULT = dict(OK_RESULT, quality_level=4, match_type='CP4_FALLBACK')
+FAILED_RESULT = {'quality_level': 8, 'source': 'FAILED', 'score': 0, 'lat': None, 'lon': None, 'address': None}
+
+
+class TestGeocodeResultCache:
+    """Testes para a cache de resultados"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return GeocodeResultCache(str(tmp_path / "geocoding.db"))
+
+    def test_chave_normalizada(self, cache):
+        """Espaços e maiúsculas partilham a mesma entrada"""
+        cache.put("Rua da  Prata", "1100-001", "Lisboa", OK_RESULT)
+
+        assert cache.get("RUA DA PRATA ", "1100-001", "lisboa") == OK_RESULT
+        assert cache.get("Rua da Prata", "1100-002", "Lisboa") is None
+
+    def test_falhas_expiram(self, cache, monkeypatch):
+        """Falhas têm TTL próprio"""
+        cache.put("Morada má", "1000", "", FAILED_RESULT, fast_mode=True)
+        assert cache.get("Morada má", "1000", "", fast_mode=True)['quality_level'] == 8
+
+        monkeypatch.setattr(geocode_cache, "GEOCODE_CACHE_TTL_FAIL_DAYS", -1)
+        cache.put("Outra má", "1000", "", FAILED_RESULT, fast_mode=True)
+        assert cache.get("Outra má", "1000", "", fast_mode=True) is None
+
+    def test_modo_completo_ignora_resultados_rapidos_fracos(self, cache):
+        """Um resultado só local de nível 4 não serve um pedido completo"""
+        cache.put("Rua A", "1100", "", APPROX_RESULT, fast_mode=True)
+        cache.put("Rua B", "1100", "", OK_RESULT, fast_mode=True)
+
+        assert cache.get("Rua A", "1100", "", fast_mode=False) is None
+        assert cache.get("Rua A", "1100", "", fast_mode=True) is not None
+        assert cache.get("Rua B", "1100", "", fast_mode=False) is not None
+
+    def test_correcao_manual_prevalece(self, cache):
+        """put_manual substitui e não é sobrescrito por novos resultados"""
+        cache.put("Rua C", "1100", "Lisboa", FAILED_RESULT)
+        cache.put_manual("Rua C", "1100", "Lisboa", 38.5, -9.5)
+        cache.put("Rua C", "1100", "Lisboa", OK_RESULT)
+
+        result = cache.get("Rua C", "1100", "Lisboa")
+        assert result['source'] == 'CORRECAO_MANUAL'
+        assert (result['lat'], result['lon']) == (38.5, -9.5)
+
+
+class TestGeocoderComCache:
+    """Integração da cache no WaterfallGeocoder"""
+
+    @pytest.fixture
+    def geocoder(self, tmp_path):
+        db_path = build_address_db(tmp_path / "geocoding.db", [("Rua Augusta", 38.711, -9.138, "1100", "Lisboa")])
+        return WaterfallGeocoder(db_path, google_api_key=None)
+
+    def test_segundo_pedido_nao_repete_matching(self, geocoder, monkeypatch):
+        """Morada já resolvida vem da cache sem fuzzy matching"""
+        first, _ = geocoder.resolve_address("Rua Augusta", "1100-100", "Lisboa", fast_mode=True)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("_try_local não devia ser chamado")
+        monkeypatch.setattr(geocoder, "_try_local", fail)
+        monkeypatch.setattr(geocoder, "_try_local_batch", fail)
+
+        second, learned = geocoder.resolve_address("rua augusta", "1100-100", "LISBOA", fast_mode=True)
+        batch = geocoder.resolve_batch([("Rua Augusta", "1100-100", "Lisboa")])
+
+        assert second == first
+        assert learned is None
+        assert batch[0][0] == first
+
+    def test_falha_local_fica_em_cache(self, geocoder):
+        """Falhas também são lembradas"""
+        geocoder.resolve_batch([("Rua X", "9999-000", "Nenhum")], fast_mode=True)
+
+        cached = geocoder.result_cache.get("Rua X", "9999-000", "Nenhum", fast_mode=True)
+        assert cached['quality_level'] == 8
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -48,9 +48,10 @@ class TestGeocoderEngine:
     """Testes para o motor de geocoding"""
     
     @pytest.fixture
-    def geocoder(self):
-        """Criar instância do geocoder para testes"""
-        return WaterfallGeocoder("geocoding.db", google_api_key=None)
+    def geocoder(self, tmp_path):
+        """Criar instância do geocoder para testes (base de dados em tmp_path, não na raiz do repositório)"""
+        db_path = build_address_db(tmp_path / "geocoding.db", [("Rua da Prata", 38.710, -9.137, "1100", "Lisboa")])
+        return WaterfallGeocoder(db_path, google_api_key=None)
     
     def test_clean_address(self, geocoder):
         """Testar limpeza de moradas"""
@@ -81,6 +82,136 @@ class TestGeocoderEngine:
         assert result['lat'] is None
 
 
+def build_address_db(path, rows):
+    """Cria uma pt_addresses mínima: (full_street, lat, lon, CP4, cc_desig)"""
+    import sqlite3
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE pt_addresses (
+            full_street TEXT, LATITUDE REAL, LONGITUDE REAL, CP4 TEXT, cc_desig TEXT,
+            quality_score INTEGER, match_type TEXT, source TEXT, google_place_id TEXT, last_validated TEXT
+        )
+    """)
+    conn.executemany("INSERT INTO pt_addresses (full_street, LATITUDE, LONGITUDE, CP4, cc_desig) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.execute("CREATE INDEX idx_cp4 ON pt_addresses(CP4)")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+class TestCP4Index:
+    """Testes para o índice CP4 em memória usado por _try_local"""
+
+    @pytest.fixture
+    def geocoder(self, tmp_path):
+        db_path = build_address_db(tmp_path / "geocoding.db", [
+            ("Rua da Prata", 38.710, -9.137, "1100", "Lisboa"),
+            ("Rua Augusta", 38.711, -9.138, "1100", "Lisboa"),
+            ("Rua do Ouro", 38.712, -9.139, "1100", "LISBOA"),
+            ("Rua da Prata", 38.800, -9.300, "1100", "Sintra"),
+            ("Avenida da Boavista", 41.158, -8.640, "4100", "Porto"),
+        ])
+        return WaterfallGeocoder(db_path, google_api_key=None)
+
+    def test_match_exato_normalizado(self, geocoder):
+        """Maiúsculas e pontuação não afetam o score"""
+        result = geocoder._try_local("RUA AUGUSTA,", "1100-148", "Lisboa")
+
+        assert result['quality_level'] == 1
+        assert result['address'] == "Rua Augusta"
+        assert result['lat'] == 38.711
+
+    def test_subindice_concelho(self, geocoder):
+        """Concelho restringe candidatos; sem match estrito usa o CP4 completo"""
+        assert geocoder._try_local("Rua da Prata", "1100", "Sintra")['lat'] == 38.800
+        assert geocoder._try_local("Rua da Prata", "1100", " lisboa ")['lat'] == 38.710
+        assert geocoder._try_local("Rua do Ouro", "1100", "Inexistente")['address'] == "Rua do Ouro"
+
+    def test_repeticoes_nao_consultam_sqlite(self, geocoder):
+        """O mesmo CP4 só é carregado da base de dados uma vez"""
+        index = geocoder.cp4_index
+        for _ in range(5):
+            geocoder._try_local("Rua do Ouro", "1100", "Lisboa")
+
+        assert index.misses == 1
+        assert index.hits == 4
+
+    def test_cp4_sem_moradas(self, geocoder):
+        """CP4 válido sem linhas devolve None"""
+        assert geocoder._try_local("Rua X", "9999", None) is None
+
+    def test_save_learned_invalida_cp4(self, geocoder):
+        """Moradas aprendidas ficam visíveis na pesquisa seguinte"""
+        geocoder._try_local("Rua Nova", "4100", "Porto")
+        geocoder.save_learned_batch([{
+            'result': {'address': "Rua Nova do Porto", 'lat': 41.15, 'lon': -8.61, 'quality_level': 2, 'match_type': 'FUZZY', 'source': 'NOMINATIM'},
+            'cp4': "4100-001",
+            'concelho': "Porto",
+        }])
+
+        result = geocoder._try_local("Rua Nova do Porto", "4100", "Porto")
+        assert result['address'] == "Rua Nova do Porto"
+
+    def test_resolve_batch_igual_a_try_local(self, geocoder):
+        """resolve_batch devolve os mesmos níveis e moradas que _try_local"""
+        items = [
+            ("Rua da Prata", "1100-001", "Lisboa"),
+            ("R. Augusta 20", "1100", "Lisboa"),
+            ("Travessa Qualquer", "1100", None),
+            ("Rua da Prata", "1100", "Sintra"),
+            ("Av. da Boavista", "4100-100", "Porto"),
+            ("Sem CP", None, "Lisboa"),
+            ("Rua X", "9999", None),
+        ]
+
+        batch = geocoder.resolve_batch(items, fast_mode=True)
+
+        assert len(batch) == len(items)
+        for (address, cp4, concelho), (result, learned) in zip(items, batch):
+            expected = geocoder._try_local(geocoder._clean_address(address), cp4, concelho)
+            assert learned is None
+            if expected is None:
+                assert result['quality_level'] == 8
+            else:
+                assert result['quality_level'] == expected['quality_level']
+                assert result['address'] == expected['address']
+                assert result['score'] == expected['score']
+
+    def test_resolve_batch_cdist(self, geocoder, monkeypatch):
+        """Caminho cdist paralelo escolhe os mesmos candidatos que extractOne"""
+        import utils.geocoder_engine as engine
+        items = [("Rua da Prata", "1100", "Lisboa"), ("rua do ouro", "1100", "Lisboa"), ("Rua Augsta", "1100", None)]
+        expected = [r for r, _ in geocoder.resolve_batch(items)]
+
+        monkeypatch.setattr(engine, "CPU_COUNT", 4)
+        monkeypatch.setattr(engine, "CDIST_MIN_CELLS", 0)
+        batch = [r for r, _ in geocoder.resolve_batch(items)]
+
+        assert [(r['quality_level'], r['address'], r['score']) for r in batch] == \
+               [(r['quality_level'], r['address'], r['score']) for r in expected]
+
+    def test_morada_sem_coordenadas(self, tmp_path):
+        """Linhas com LATITUDE/LONGITUDE NULL devolvem None, não NaN"""
+        import json
+        db_path = build_address_db(tmp_path / "nulls.db", [("Rua Sem Coordenadas", None, None, "2000", "Santarém")])
+        result = WaterfallGeocoder(db_path, google_api_key=None)._try_local("Rua Sem Coordenadas", "2000", "Santarém")
+
+        assert result['lat'] is None and result['lon'] is None
+        json.dumps(result, allow_nan=False)
+
+    def test_lru_limitado(self, tmp_path):
+        """O índice não guarda mais CP4 do que o limite"""
+        from utils.address_index import CP4Index
+        db_path = build_address_db(tmp_path / "lru.db", [(f"Rua {i}", 38.0, -9.0, str(1000 + i), "X") for i in range(10)])
+        index = CP4Index(db_path, max_entries=3)
+
+        for i in range(10):
+            index.get(str(1000 + i))
+
+        assert len(index._entries) == 3
+        assert list(index._entries) == ["1007", "1008", "1009"]
+
+
 class TestDistanceCalculator:
     """Testes para cálculo de distâncias"""
     
@@ -111,6 +242,46 @@ class TestDistanceCalculator:
         lisboa_porto = matrix[0][1]
         assert 250 < lisboa_porto < 300
 
+    def test_haversine_matrix_por_blocos(self):
+        """Matriz calculada por blocos deve coincidir com o cálculo par-a-par"""
+        import numpy as np
+        from utils.distance_calculator import calculate_haversine_matrix, haversine_distance
+
+        rng = np.random.default_rng(0)
+        locations = list(zip(rng.uniform(37, 42, 37), rng.uniform(-9.5, -6.5, 37)))
+
+        matrix = calculate_haversine_matrix(locations, block_size=8)
+
+        assert matrix.shape == (37, 37)
+        assert np.allclose(matrix, matrix.T)
+        assert np.all(np.diag(matrix) == 0)
+        for i, j in [(0, 36), (5, 12), (20, 3)]:
+            ref = haversine_distance(locations[i][0], locations[i][1], locations[j][0], locations[j][1])
+            assert abs(matrix[i][j] - ref) < 1e-9
+
+    def test_haversine_matrix_float32(self):
+        """Opção float32 deve reduzir memória mantendo precisão ao metro"""
+        import numpy as np
+        from utils.distance_calculator import calculate_haversine_matrix
+
+        locations = [(38.7223, -9.1393), (41.1579, -8.6291), (37.0194, -7.9322)]
+        m64 = calculate_haversine_matrix(locations)
+        m32 = calculate_haversine_matrix(locations, dtype=np.float32)
+
+        assert m32.dtype == np.float32
+        assert np.max(np.abs(m64 - m32)) < 1e-3
+
+    def test_euclidean_matrix(self):
+        """Matriz euclidiana (graus) deve ser simétrica e correta"""
+        from utils.distance_calculator import calculate_euclidean_matrix
+
+        matrix = calculate_euclidean_matrix([(0.0, 0.0), (3.0, 4.0), (6.0, 8.0)], block_size=2)
+
+        assert matrix[0][1] == 5.0
+        assert matrix[0][2] == 10.0
+        assert matrix[2][1] == 5.0
+        assert matrix[1][1] == 0.0
+
 
 class TestOptimization:
     """Testes para o solver de otimização"""
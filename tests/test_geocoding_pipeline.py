@@ -0,0 +1,89 @@
+"""
+Testes Unitários - Pipeline de geocodificação em lote
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+
+import pytest
+from utils.geocoding_pipeline import address_key, run_geocoding_pipeline
+
+
+class CountingGeocoder:
+    """Geocoder de teste: coordenadas derivadas do CP, conta chamadas"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def resolve_address(self, address, cp4=None, concelho=None, fast_mode=False):
+        with self._lock:
+            self.calls.append((address, cp4, concelho))
+        if address == "erro":
+            raise RuntimeError("falha simulada")
+        return {"lat": 38.0 + int(cp4[:4]) / 10000, "lon": -9.0, "quality_level": 1, "source": "LOCAL"}, None
+
+
+def make_records(n_rows, n_unique):
+    return [
+        {"address": f"Rua {i % n_unique}", "cp": f"{1000 + i % n_unique}-001", "concelho": "Lisboa", "result": None}
+        for i in range(n_rows)
+    ]
+
+
+class TestGeocodingPipeline:
+    """Testes para o pipeline de geocodificação"""
+
+    def test_address_key_normaliza(self):
+        """Espaços e maiúsculas não devem gerar chaves diferentes"""
+        assert address_key("Rua  da Prata ", "1100-001", "LISBOA") == address_key("rua da prata", "1100-001", "lisboa")
+
+    def test_dedupe_entre_chunks(self):
+        """Cada morada única é geocodificada uma só vez, mesmo em chunks diferentes"""
+        geocoder = CountingGeocoder()
+        written = []
+        progress = []
+
+        stats = run_geocoding_pipeline(
+            make_records(95, 12), geocoder, written.append,
+            chunk_size=20, max_workers=4, progress_callback=progress.append
+        )
+
+        assert len(geocoder.calls) == 12
+        assert stats["unique"] == 12
+        assert stats["chunks"] == 5
+        assert [len(chunk) for chunk in written] == [20, 20, 20, 20, 15]
+        assert [p["processed"] for p in progress] == [20, 40, 60, 80, 95]
+        # Ordem das linhas preservada
+        flat = [rec["address"] for chunk in written for rec, _ in chunk]
+        assert flat == [f"Rua {i % 12}" for i in range(95)]
+
+    def test_resultado_do_ficheiro_nao_geocodifica(self):
+        """Linhas com coordenadas no ficheiro não passam pelo geocoder"""
+        geocoder = CountingGeocoder()
+        preset = {"lat": 41.0, "lon": -8.0, "quality_level": 0, "source": "FICHEIRO"}
+        records = make_records(3, 3)
+        records[1]["result"] = preset
+        written = []
+
+        run_geocoding_pipeline(records, geocoder, written.extend, chunk_size=10)
+
+        assert len(geocoder.calls) == 2
+        assert written[1][1] is preset
+
+    def test_erro_no_geocoder_marca_falha(self):
+        """Exceções no geocoder resultam em falha e não interrompem o lote"""
+        geocoder = CountingGeocoder()
+        records = [{"address": "erro", "cp": "1000-001", "concelho": "", "result": None}] + make_records(2, 2)
+        written = []
+
+        run_geocoding_pipeline(records, geocoder, written.extend, chunk_size=10)
+
+        assert written[0][1]["lat"] is None
+        assert written[1][1]["lat"] is not None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,115 @@
+"""
+Testes Unitários - Motor de inserção mais barata (utils.insertion)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import math
+import numpy as np
+import pytest
+from utils.insertion import InsertionEngine, InsertionRoute
+
+
+def feasible(dist, route, stops, windows, service=15.0):
+    """Horário completo da rota, com a mesma regra dos solvers"""
+    t, prev = route.start_time, route.depot
+    for s in stops:
+        t = max(t + dist[prev, s] * 60.0 / route.speed_kmh, windows[s][0])
+        if t > windows[s][1] + 1e-9:
+            return False
+        t += service
+        prev = s
+    if route.closed:
+        t += dist[prev, route.depot] * 60.0 / route.speed_kmh
+    return t <= route.end_time + 1e-9
+
+
+def length(dist, route, stops):
+    path = [route.depot] + stops + ([route.depot] if route.closed else [])
+    return sum(dist[a, b] for a, b in zip(path, path[1:]))
+
+
+def build(seed, n=14):
+    rng = np.random.default_rng(seed)
+    pts = rng.random((n, 2)) * 30
+    dist = np.linalg.norm(pts[:, None] - pts[None], axis=2)
+    windows = {i: (0, 1440) if rng.random() < 0.5 else (float(w), float(w) + 60) for i, w in zip(range(n), rng.choice([480, 540, 600, 660], n))}
+    demands = {i: float(rng.uniform(5, 30)) for i in range(1, n)}
+    closed = bool(seed % 2)
+    base = InsertionRoute(0, [], speed_kmh=40.0, start_time=480.0, end_time=800.0, capacity=200.0, closed=closed)
+    routes, pending = [[], []], []
+    for c in (int(c) for c in rng.permutation(np.arange(1, n))):
+        if len(pending) < 4:
+            pending.append(c)
+            continue
+        for stops in routes:
+            if feasible(dist, base, stops + [c], windows) and sum(demands[s] for s in stops + [c]) <= 200.0:
+                stops.append(c)
+                break
+        else:
+            pending.append(c)
+    return dist, [base._replace(stops=s) for s in routes], pending, windows, demands
+
+
+class TestInsertionEngine:
+    """Testes para utils.insertion.InsertionEngine"""
+
+    @pytest.mark.parametrize("seed", range(40))
+    def test_igual_a_forca_bruta(self, seed):
+        """A melhor inserção com deltas O(1) é a mesma que testar todas as posições com o horário completo"""
+        dist, routes, pending, windows, demands = build(seed)
+        best = math.inf
+        for c in pending:
+            for route in routes:
+                if sum(demands[s] for s in route.stops) + demands[c] > route.capacity:
+                    continue
+                for k in range(len(route.stops) + 1):
+                    cand = route.stops[:k] + [c] + route.stops[k:]
+                    if feasible(dist, route, cand, windows):
+                        best = min(best, length(dist, route, cand) - length(dist, route, route.stops))
+
+        applied = InsertionEngine(dist, routes, windows=windows, demands=demands).insert(pending, max_insertions=1)
+        if math.isinf(best):
+            assert applied == []
+        else:
+            assert applied[0].cost == pytest.approx(best)
+
+    @pytest.mark.parametrize("seed", range(40))
+    def test_lote_mantem_rotas_viaveis(self, seed):
+        dist, routes, pending, windows, demands = build(seed)
+        engine = InsertionEngine(dist, routes, windows=windows, demands=demands)
+        applied = engine.insert(pending)
+
+        for route, stops in zip(routes, engine.stops):
+            assert feasible(dist, route, stops, windows)
+            assert sum(demands[s] for s in stops) <= route.capacity + 1e-9
+        visited = [s for stops in engine.stops for s in stops]
+        assert sorted(visited) == sorted([s for r in routes for s in r.stops] + [a.node for a in applied])
+
+    def test_rotas_permitidas_e_limite(self):
+        dist = np.abs(np.subtract.outer(np.arange(6.0), np.arange(6.0)))
+        routes = [InsertionRoute(0, [1]), InsertionRoute(0, [4])]
+        engine = InsertionEngine(dist, routes)
+
+        # Open paths: 0 -> 2 -> 4 costs nothing extra
+        applied = engine.insert([2, 5], allowed={5: {0}}, max_insertions=1)
+        assert [(a.node, a.route, a.position) for a in applied] == [(2, 1, 0)]
+        applied = engine.insert([5], allowed={5: {0}})
+        assert engine.stops == [[1, 5], [2, 4]]
+        assert applied[0].cost == pytest.approx(4.0)
+
+    def test_plano_atrasado_nao_piora(self):
+        """Uma paragem já atrasada não aceita inserções antes dela"""
+        dist = np.abs(np.subtract.outer(np.arange(4.0), np.arange(4.0))) * 10
+        windows = {1: (0, 1440), 2: (480, 481), 3: (0, 1440)}
+        routes = [InsertionRoute(0, [2], speed_kmh=60.0, start_time=480.0)]
+        engine = InsertionEngine(dist, routes, windows=windows)
+
+        applied = engine.insert([1, 3])
+        assert engine.stops == [[2, 1, 3]] or engine.stops == [[2, 3, 1]]
+        assert all(a.position > 0 for a in applied)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
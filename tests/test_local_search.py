@@ -0,0 +1,103 @@
+"""
+Testes Unitários - Pesquisa local numa rota (2-opt, Or-opt, relocate com janelas horárias)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from utils.local_search import improve_route
+
+
+def euclidean(points):
+    pts = np.asarray(points, dtype=float)
+    return np.linalg.norm(pts[:, None] - pts[None], axis=2)
+
+
+def path_length(dist, route, depot=0, closed=True):
+    path = [depot] + list(route) + ([depot] if closed else [])
+    return sum(dist[a, b] for a, b in zip(path, path[1:]))
+
+
+def schedule(dist, route, windows, service=15.0, speed=45.0, start=480.0):
+    """Início de serviço em cada paragem, com a mesma regra dos solvers"""
+    t, prev, out = start, 0, {}
+    for c in route:
+        t = max(t + (service if prev else 0.0) + dist[prev, c] / speed * 60.0, windows[c][0])
+        out[c] = t
+        prev = c
+    return out
+
+
+class TestLocalSearch:
+    """Testes para utils.local_search"""
+
+    @pytest.mark.parametrize("seed", range(20))
+    @pytest.mark.parametrize("closed", [True, False])
+    def test_distancia_delta_coincide(self, seed, closed):
+        """A distância acumulada pelos deltas O(1) bate com a recalculada, mesmo com matriz assimétrica"""
+        rng = np.random.default_rng(seed)
+        n = int(rng.integers(2, 12))
+        dist = euclidean(rng.random((n + 1, 2))) + rng.random((n + 1, n + 1)) * 0.3
+        route = [int(c) for c in rng.permutation(np.arange(1, n + 1))]
+
+        result = improve_route(dist, route, 0, closed=closed, neighbors=4)
+        assert sorted(result.route) == sorted(route)
+        assert result.distance == pytest.approx(path_length(dist, result.route, closed=closed))
+        assert result.initial_distance == pytest.approx(path_length(dist, route, closed=closed))
+        assert result.distance <= result.initial_distance + 1e-9
+
+    def test_pontos_em_circulo(self):
+        """Sem cruzamentos o ótimo de pontos convexos é a ordem do círculo"""
+        angles = np.linspace(0, 2 * np.pi, 25, endpoint=False)
+        dist = euclidean(np.c_[np.cos(angles), np.sin(angles)])
+        route = [int(c) for c in np.random.default_rng(3).permutation(np.arange(1, 25))]
+
+        result = improve_route(dist, route, 0, neighbors=24)
+        assert result.distance == pytest.approx(path_length(dist, range(1, 25)))
+        assert result.moves["two_opt"] > 0
+
+    def test_janelas_respeitadas(self):
+        """A ordem mais curta viola a janela; a pesquisa local não a aceita"""
+        dist = euclidean([(0, 0), (10, 0), (20, 0), (30, 0)])
+        windows = {1: (0, 1440), 2: (0, 1440), 3: (480, 520)}
+        route = [3, 1, 2]
+        assert schedule(dist, route, windows)[3] <= 520
+
+        free = improve_route(dist, route, 0, closed=False)
+        assert free.route == [1, 2, 3]
+        timed = improve_route(dist, route, 0, closed=False, windows=[windows[c] for c in route], service=15.0, start_time=480)
+        assert schedule(dist, timed.route, windows)[3] <= 520
+        assert timed.distance <= timed.initial_distance
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_rota_inviavel_nao_piora(self, seed):
+        """Paragens já atrasadas nunca ficam mais atrasadas do que estavam"""
+        rng = np.random.default_rng(seed)
+        n = 10
+        dist = euclidean(rng.random((n + 1, 2)) * 40)
+        windows = {c: (0, 1440) if rng.random() < 0.4 else (int(w), int(w) + 45) for c, w in zip(range(1, n + 1), rng.choice([500, 560, 620], n))}
+        route = sorted(range(1, n + 1), key=lambda c: windows[c][0])
+        before = schedule(dist, route, windows)
+
+        result = improve_route(dist, route, 0, windows=[windows[c] for c in route], service=15.0, start_time=480)
+        after = schedule(dist, result.route, windows)
+        for c in route:
+            assert after[c] <= max(windows[c][1], before[c]) + 1e-6
+
+    def test_fim_de_turno(self):
+        """end_time limita a chegada ao armazém"""
+        dist = euclidean([(0, 0), (30, 0), (0, 30), (30, 30)])
+        result = improve_route(dist, [1, 2, 3], 0, end_time=480 + 400, start_time=480, service=15.0)
+        assert sorted(result.route) == [1, 2, 3]
+        assert result.distance < result.initial_distance
+
+    def test_rotas_triviais(self):
+        dist = euclidean([(0, 0), (1, 1)])
+        assert improve_route(dist, [], 0).route == []
+        assert improve_route(dist, [1], 0).route == [1]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,105 @@
+"""
+Testes Unitários - Cache persistente de matrizes de distância
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import numpy as np
+from utils.distance_calculator import calculate_haversine_matrix
+from utils.matrix_cache import MatrixCache
+
+
+def random_locations(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return list(zip(rng.uniform(38.6, 38.9, n), rng.uniform(-9.3, -9.0, n)))
+
+
+class TestMatrixCache:
+    """Testes para a cache de matrizes"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return MatrixCache(db_path=str(tmp_path / "matrix_cache.db"), max_mb=64)
+
+    def test_miss_depois_hit(self, cache):
+        """Segundo pedido com o mesmo conjunto deve vir da cache"""
+        locations = random_locations(30)
+
+        first = cache.haversine_matrix(locations)
+        second = cache.haversine_matrix(locations)
+
+        assert np.allclose(first, calculate_haversine_matrix(locations))
+        assert np.array_equal(first, second)
+        stats = cache.get_stats()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+        assert stats["entries"] == 1
+
+    def test_ordem_diferente_mesma_entrada(self, cache):
+        """Conjunto de pontos é independente da ordem do pedido"""
+        locations = random_locations(20)
+        cache.haversine_matrix(locations)
+
+        shuffled = locations[::-1]
+        matrix = cache.haversine_matrix(shuffled)
+
+        assert np.allclose(matrix, calculate_haversine_matrix(shuffled))
+        assert cache.get_stats()["hits"] == 1
+
+    def test_preenchimento_incremental(self, cache):
+        """Pontos novos só calculam as linhas/colunas em falta"""
+        locations = random_locations(40)
+        cache.haversine_matrix(locations[:35])
+
+        matrix = cache.haversine_matrix(locations)
+
+        assert np.allclose(matrix, calculate_haversine_matrix(locations))
+        stats = cache.get_stats()
+        assert stats["partial_hits"] == 1
+        assert stats["cells_reused"] == 35 * 35
+
+    def test_pontos_duplicados(self, cache):
+        """Paragens repetidas (ex: armazém) devem ser suportadas"""
+        locations = random_locations(10)
+        locations = [locations[0]] + locations + [locations[0]]
+
+        matrix = cache.haversine_matrix(locations)
+
+        assert matrix.shape == (12, 12)
+        assert matrix[0][11] == 0
+        assert np.allclose(matrix, calculate_haversine_matrix(locations), atol=1e-3)
+
+    def test_evicao_lru(self, tmp_path):
+        """Com limite de tamanho, as entradas menos usadas são removidas"""
+        cache = MatrixCache(db_path=str(tmp_path / "small.db"), max_mb=0.05)
+
+        for seed in range(5):
+            cache.haversine_matrix(random_locations(60, seed=100 + seed))
+
+        stats = cache.get_stats()
+        assert stats["evictions"] > 0
+        assert stats["size_mb"] <= stats["max_mb"]
+
+
+class TestAdminOperator:
+    """As rotas /admin exigem um operador da plataforma, não o admin da empresa"""
+
+    def test_admin_da_empresa_rejeitado(self, monkeypatch):
+        from fastapi import HTTPException
+        import backend.api.admin as admin
+        from backend.api.auth import UserResponse
+        monkeypatch.setattr(admin, "OPERATOR_USER_IDS", {7})
+
+        tenant_admin = UserResponse(id=3, nome="A", email="a@x.pt", empresa_id=2, is_admin=True)
+        with pytest.raises(HTTPException) as exc:
+            admin.require_operator(tenant_admin)
+        assert exc.value.status_code == 403
+
+        operator = UserResponse(id=7, nome="O", email="o@x.pt", empresa_id=1, is_admin=False)
+        assert admin.require_operator(operator) is operator
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,302 @@
+"""
+Testes Unitários - Motor de Otimização (AdvancedRouteOptimizer)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import numpy as np
+from utils.distance_calculator import calculate_haversine_matrix
+from utils.optimization_solver import AdvancedRouteOptimizer, _recruit_far_first_clusters, _time_budget
+
+
+def build_instance(n_clients=20, n_warehouses=1, seed=7):
+    """Instância sintética: armazéns + clientes à volta de Lisboa"""
+    rng = np.random.default_rng(seed)
+    warehouses = [(38.72 + 0.05 * i, -9.14) for i in range(n_warehouses)]
+    clients = list(zip(rng.uniform(38.60, 38.85, n_clients), rng.uniform(-9.30, -9.00, n_clients)))
+    locations = warehouses + clients
+    return {
+        "locations": locations,
+        "distance_matrix": calculate_haversine_matrix(locations),
+        "demands": [0.0] * n_warehouses + [float(x) for x in rng.uniform(10, 60, n_clients)],
+        "volume_demands": [0.0] * n_warehouses + [0.2] * n_clients,
+        "num_warehouses": n_warehouses,
+    }
+
+
+class TestAdvancedRouteOptimizer:
+    """Testes para o solver OR-Tools e clustering far-first"""
+
+    def test_ortools_visita_todos_os_clientes(self):
+        """Com capacidade suficiente nenhum cliente deve ficar por distribuir"""
+        inst = build_instance(n_clients=15)
+        result = AdvancedRouteOptimizer().optimize_routes(
+            inst["distance_matrix"], inst["demands"], [1000.0, 1000.0], [0, 0],
+            optimization_params={"time_limit_seconds": 3},
+            volume_demands=inst["volume_demands"], vehicle_volume_capacities=[10.0, 10.0],
+            num_warehouses=1
+        )
+
+        assert result["status"] == "SUCCESS"
+        assert result["dropped_nodes"] == []
+        visited = sorted(n for r in result["routes"] for n in r[1:-1])
+        assert visited == list(range(1, 16))
+        for route in result["routes"]:
+            assert route[0] == 0 and route[-1] == 0
+
+    def test_ortools_velocidades_por_veiculo(self):
+        """Velocidades diferentes por veículo devem produzir uma solução válida"""
+        inst = build_instance(n_clients=10)
+        result = AdvancedRouteOptimizer().optimize_routes(
+            inst["distance_matrix"], inst["demands"], [1000.0, 1000.0], [0, 0],
+            optimization_params={"time_limit_seconds": 3},
+            num_warehouses=1, vehicle_speeds=[30.0, 60.0]
+        )
+
+        assert result["status"] == "SUCCESS"
+        assert result["dropped_nodes"] == []
+
+    def test_far_first_respeita_capacidade(self):
+        """Estratégia far-first não deve exceder a capacidade de cada veículo"""
+        inst = build_instance(n_clients=25)
+        caps = [300.0, 300.0, 300.0, 300.0]
+        result = AdvancedRouteOptimizer().optimize_routes(
+            inst["distance_matrix"], inst["demands"], caps, [0, 0, 0, 0],
+            optimization_params={"strategy": "far_first"},
+            num_warehouses=1
+        )
+
+        assert result["status"] == "SUCCESS"
+        for load, cap in zip(result["route_loads"], caps):
+            assert load <= cap
+
+
+class TestPortfolio:
+    """Modo portfólio: várias configurações, fica a melhor e regista a vencedora"""
+
+    def solve(self, n_clients=15, **params):
+        inst = build_instance(n_clients=n_clients)
+        return AdvancedRouteOptimizer().optimize_routes(
+            inst["distance_matrix"], inst["demands"], [1000.0, 1000.0], [0, 0],
+            optimization_params={"strategy": "portfolio", **params},
+            volume_demands=inst["volume_demands"], vehicle_volume_capacities=[10.0, 10.0],
+            num_warehouses=1
+        )
+
+    def test_sequencial_escolhe_a_melhor(self):
+        result = self.solve(time_limit_seconds=6, portfolio_workers=1, portfolio_configs=["savings_gls", "far_first_gls"])
+
+        portfolio = result["quality_metrics"]["portfolio"]
+        assert [r["name"] for r in portfolio["runs"]] == ["savings_gls", "far_first_gls"]
+        assert portfolio["workers"] == 1 and portfolio["time_limit_per_config"] == 3
+        best = min(portfolio["runs"], key=lambda r: (r["dropped"], r["total_distance"]))
+        assert portfolio["winner"] == best["name"]
+        assert result["total_distance"] == best["total_distance"]
+        assert result["dropped_nodes"] == []
+
+    def test_orcamento_corta_configuracoes(self):
+        """Com 3 s e um worker só cabe a primeira configuração"""
+        result = self.solve(time_limit_seconds=3, portfolio_workers=1)
+        assert [r["name"] for r in result["quality_metrics"]["portfolio"]["runs"]] == ["savings_gls"]
+
+    def test_processos_em_paralelo(self):
+        result = self.solve(time_limit_seconds=3, portfolio_workers=2, portfolio_configs=["savings_gls", "parallel_insertion_sa"])
+
+        portfolio = result["quality_metrics"]["portfolio"]
+        assert portfolio["workers"] == 2
+        assert {r["status"] for r in portfolio["runs"]} == {"SUCCESS"}
+        assert sorted(n for r in result["routes"] for n in r[1:-1]) == list(range(1, 16))
+
+    def test_sem_processos_respeita_orcamento(self, monkeypatch):
+        """Num processo daemon as configurações correm em série dentro do mesmo orçamento"""
+        import utils.optimization_solver as solver_module
+        monkeypatch.setattr(solver_module, "_processes_available", lambda workers: False)
+        result = self.solve(time_limit_seconds=6, portfolio_workers=2,
+                            portfolio_configs=["savings_gls", "parallel_insertion_sa", "far_first_gls"])
+
+        portfolio = result["quality_metrics"]["portfolio"]
+        assert portfolio["workers"] == 1 and portfolio["time_limit_per_config"] == 3
+        assert [r["name"] for r in portfolio["runs"]] == ["savings_gls", "far_first_gls"]
+
+    def test_vencedora_registada(self, tmp_path, monkeypatch):
+        import database
+        from backend.api.admin import get_solver_portfolio_stats
+        from backend.api.auth import UserResponse
+        from backend.api.solver import _record_portfolio_run
+
+        monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "multi.db"))
+        database.init_database()
+        emp = database.criar_empresa("E", "e@x.pt")
+        pid = database.criar_projeto(emp, "P")
+        result = {"total_distance": 10.0, "dropped_nodes": []}
+        for winner in ("savings_gls", "far_first_gls", "savings_gls"):
+            _record_portfolio_run(pid, 15, result, {"winner": winner, "first_solution": "SAVINGS", "metaheuristic": "GUIDED_LOCAL_SEARCH", "runs": []})
+
+        admin = UserResponse(id=1, nome="A", email="a@x.pt", empresa_id=emp, is_admin=True)
+        stats = get_solver_portfolio_stats(days=30, current_user=admin)
+        assert stats["runs"] == 3
+        assert stats["configs"][0] == {"name": "savings_gls", "wins": 2, "share": 0.667}
+
+
+class TestWarmStart:
+    """Reotimização a partir do plano atual (initial_routes, rotas e paragens bloqueadas)"""
+
+    def solve(self, inst, **params):
+        return AdvancedRouteOptimizer().optimize_routes(
+            inst["distance_matrix"], inst["demands"], [1000.0] * 3, [0, 0, 0],
+            optimization_params={"time_limit_seconds": 3, **params},
+            volume_demands=inst["volume_demands"], vehicle_volume_capacities=[10.0] * 3,
+            num_warehouses=1
+        )
+
+    def test_plano_sem_alteracoes(self):
+        """Partindo de uma solução, a descida só aceita melhorias"""
+        inst = build_instance(n_clients=30)
+        plan = [r[1:-1] for r in self.solve(inst)["routes"]]
+
+        result = self.solve(inst, initial_routes=plan)
+        warm = result["quality_metrics"]["warm_start"]
+        assert warm["planned_stops"] == 30 and warm["unplanned_stops"] == 0
+        assert result["total_distance"] <= warm["initial_distance"] + 0.01
+        assert result["dropped_nodes"] == []
+
+    @pytest.mark.parametrize("strategy", ["distance", "far_first"])
+    def test_novos_clientes_e_bloqueios(self, strategy):
+        inst = build_instance(n_clients=30)
+        plan = [list(range(1, 8)), list(range(11, 21)), list(range(21, 31))]
+        new_clients = [8, 9, 10]
+        locked_stop = 25
+
+        result = self.solve(inst, strategy=strategy, initial_routes=plan, locked_vehicles=[1], locked_nodes={locked_stop: 2})
+
+        assert result["routes"][1][1:-1] == plan[1]
+        assert locked_stop in result["routes"][2]
+        visited = [c for r in result["routes"] for c in r[1:-1]]
+        assert sorted(visited) == list(range(1, 31))
+        warm = result["quality_metrics"]["warm_start"]
+        assert warm["inserted"] == 3 and warm["locked_routes"] == 1 and warm["locked_stops"] == 1
+        assert all(c in visited for c in new_clients)
+
+    def test_plano_com_excesso_de_carga(self):
+        """Paragens que não cabem no veículo ficam fora do plano inicial e são reinseridas"""
+        inst = build_instance(n_clients=30)
+        plan = [list(range(1, 31)), [], []]
+
+        result = self.solve(inst, initial_routes=plan)
+        assert sum(inst["demands"]) > 1000.0
+        assert max(result["route_loads"]) <= 1000.0
+        assert result["quality_metrics"]["warm_start"]["planned_stops"] < 30
+        assert result["dropped_nodes"] == []
+
+
+class TestTimeBudget:
+    """Orçamento de tempo adaptativo e paragem por estagnação"""
+
+    def solve(self, inst, **params):
+        return AdvancedRouteOptimizer().optimize_routes(
+            inst["distance_matrix"], inst["demands"], [1000.0, 1000.0], [0, 0],
+            optimization_params=params, num_warehouses=1
+        )
+
+    def test_orcamento_por_tamanho(self):
+        """O orçamento cresce com o número de clientes e nunca passa o limite pedido"""
+        assert _time_budget(20, {"time_limit_seconds": 15}) == pytest.approx(2.5)
+        assert _time_budget(400, {"time_limit_seconds": 15}) == pytest.approx(12.0)
+        assert _time_budget(400, {"time_limit_seconds": 5}) == pytest.approx(5.0)
+        assert _time_budget(5000, {"time_limit_seconds": 300}) == pytest.approx(30.0)
+        assert _time_budget(20, {"time_limit_seconds": 15, "time_budget": "fixed"}) == pytest.approx(15.0)
+
+    def test_para_por_estagnacao(self):
+        """Uma instância pequena para muito antes do limite pedido"""
+        inst = build_instance(n_clients=15)
+        result = self.solve(inst, time_limit_seconds=15)
+
+        search = result["quality_metrics"]["search"]
+        assert search["stop_reason"] in ("plateau", "local_optimum")
+        assert search["elapsed_seconds"] < 5.0
+        assert result["dropped_nodes"] == []
+        costs = [cost for _, cost in search["convergence"]]
+        assert costs and search["improvements"] >= len(costs) > 0
+        assert all(b <= a for a, b in zip(costs, costs[1:]))
+
+    def test_orcamento_fixo_sem_estagnacao(self):
+        inst = build_instance(n_clients=15)
+        result = self.solve(inst, time_limit_seconds=3, time_budget="fixed", plateau_seconds=60)
+
+        search = result["quality_metrics"]["search"]
+        assert search["time_limit_seconds"] == pytest.approx(3.0)
+        assert search["stop_reason"] == "time_limit"
+
+
+def naive_recruit(D, demands, caps, depots, nw, client_wh, vehicle_wh, starts, ends, windows):
+    """Recrutamento far-first candidato a candidato (implementação original, sem índices)"""
+    norm = lambda x: str(x).strip().lower()
+    open_clients = list(range(nw, len(D)))
+    routes = {v: [] for v in range(len(caps))}
+    for v in sorted(range(len(caps)), key=lambda v: (starts[v], -caps[v])):
+        depot = depots[v]
+        elig = lambda c: not client_wh[c - nw] or norm(client_wh[c - nw]) == norm(vehicle_wh[v])
+        def depot_dist(c):
+            wh = client_wh[c - nw]
+            return D[depots[vehicle_wh.index(wh)] if wh in vehicle_wh else 0][c]
+        eligible = sorted([c for c in open_clients if elig(c)], key=depot_dist, reverse=True)
+        if not eligible:
+            continue
+        cluster = [eligible[0]]
+        open_clients.remove(eligible[0])
+        kg = demands[eligible[0]]
+        t = max(starts[v] + D[depot][eligible[0]] / 45.0 * 60.0, windows[eligible[0] - nw][0]) + 15.0
+        while True:
+            best, best_score, best_t = None, float("inf"), t
+            for c in [c for c in open_clients if elig(c)]:
+                t_arr = t + D[cluster[-1]][c] / 45.0 * 60.0
+                ws, we = windows[c - nw]
+                wait = max(0.0, ws - t_arr) if ws > 0 else 0.0
+                if kg + demands[c] > caps[v] or t_arr + wait > we:
+                    continue
+                if t_arr + wait + 15.0 + D[c][depot] / 45.0 * 60.0 > ends[v] + 15.0:
+                    continue
+                score = min(D[n][c] for n in cluster) + wait * 0.3
+                if score < best_score:
+                    best, best_score, best_t = c, score, t_arr + wait + 15.0
+            if best is None:
+                break
+            cluster.append(best)
+            open_clients.remove(best)
+            kg += demands[best]
+            t = best_t
+        routes[v] = cluster
+    return routes
+
+
+class TestFarFirstRecruitment:
+    """Recrutamento com distância ao cluster mantida: mesmo resultado que a versão candidato a candidato"""
+
+    @pytest.mark.parametrize("seed", [1, 2, 3, 4])
+    def test_igual_ao_recrutamento_original(self, seed):
+        rng = np.random.default_rng(seed)
+        inst = build_instance(n_clients=150, n_warehouses=2, seed=seed)
+        D = np.asarray(inst["distance_matrix"]) * rng.uniform(1.0, 1.3, (152, 152))  # assimétrica, tipo estrada
+        n_vehicles = 8
+        caps = rng.choice([200.0, 400.0, 800.0], n_vehicles).tolist()
+        vehicle_wh = ["A0" if v % 2 else "A1" for v in range(n_vehicles)]
+        client_wh = [rng.choice(["A0", "A1", ""]) for _ in range(150)]
+        starts = rng.choice([480, 540], n_vehicles).tolist()
+        ends = [s + 420 for s in starts]
+        windows = [(0, 1440) if rng.random() < 0.5 else (int(w), int(w) + 120) for w in rng.choice([540, 660, 780], 150)]
+        depots = [0 if wh == "A0" else 1 for wh in vehicle_wh]
+
+        expected = naive_recruit(D, inst["demands"], caps, depots, 2, client_wh, vehicle_wh, starts, ends, windows)
+        active = sorted(range(n_vehicles), key=lambda v: (starts[v], -caps[v]))
+        result = _recruit_far_first_clusters(
+            D, inst["demands"], caps, depots, 2, None, None, client_wh, vehicle_wh,
+            starts, ends, windows, active, "full"
+        )
+        assert result == expected
+        assert any(len(r) > 1 for r in result.values())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,126 @@
+"""
+Testes Unitários - Migrações de schema e planos de execução das consultas críticas
+Falha se alguma consulta de HOT_QUERIES voltar a fazer um full scan (EXPLAIN QUERY PLAN).
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import pytest
+import database
+from utils.schema_migrations import (
+    EXPECTED_INDEXES, GEO_MIGRATIONS, HOT_QUERIES, MULTI_MIGRATIONS,
+    applied_versions, check_schema, full_scans, migrate, migrate_geocoding_db, missing_indexes
+)
+
+
+@pytest.fixture
+def multi_conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "multi.db"))
+    database.init_database()
+    with database.get_db() as conn:
+        yield conn
+
+
+def create_pt_addresses(path):
+    """Same table and indices that setup_database.py creates from the CTT CSV."""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE pt_addresses (
+            full_street TEXT, ART_DESIG TEXT, dd_desig TEXT, cc_desig TEXT, CP4 TEXT, CP3 TEXT, CPALF TEXT,
+            LATITUDE REAL, LONGITUDE REAL, quality_score INTEGER, match_type TEXT, source TEXT,
+            google_place_id TEXT, last_validated TEXT
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO pt_addresses (full_street, dd_desig, cc_desig, CP4, CPALF, LATITUDE, LONGITUDE) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"Rua {i}", "Lisboa", " Lisboa " if i % 2 else "LISBOA", "1000", "LISBOA", 38.7, -9.1) for i in range(20)]
+        + [(f"Rua {i}", "Porto", "Porto", "4000", "PORTO", 41.1, -8.6) for i in range(20)]
+    )
+    conn.execute("CREATE INDEX idx_cp4 ON pt_addresses(CP4)")
+    conn.execute("CREATE INDEX idx_concelho ON pt_addresses(cc_desig)")
+    conn.execute("CREATE INDEX idx_distrito ON pt_addresses(dd_desig)")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def geo_conn(tmp_path):
+    path = str(tmp_path / "geocoding.db")
+    create_pt_addresses(path)
+    assert migrate_geocoding_db(path) == [m.version for m in GEO_MIGRATIONS]
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+class TestSchemaMigrations:
+    """Testes para utils.schema_migrations"""
+
+    def test_init_database_aplica_migracoes(self, multi_conn):
+        assert applied_versions(multi_conn) == [m.version for m in MULTI_MIGRATIONS]
+        assert missing_indexes(multi_conn, EXPECTED_INDEXES["multi"]) == []
+
+    def test_idempotente(self, multi_conn):
+        assert migrate(multi_conn, MULTI_MIGRATIONS) == []
+        database.init_database()
+        assert applied_versions(multi_conn) == [m.version for m in MULTI_MIGRATIONS]
+
+    def test_geo_sem_tabela_fica_pendente(self, tmp_path):
+        path = str(tmp_path / "empty.db")
+        sqlite3.connect(path).close()
+        assert migrate_geocoding_db(path) == []
+        assert migrate_geocoding_db(str(tmp_path / "missing.db")) == []
+        assert not os.path.exists(tmp_path / "missing.db")
+
+    def test_cc_norm_preenchido_e_mantido(self, geo_conn):
+        assert geo_conn.execute("SELECT COUNT(*) FROM pt_addresses WHERE cc_norm = 'LISBOA'").fetchone()[0] == 20
+
+        geo_conn.execute("INSERT INTO pt_addresses (full_street, cc_desig, CP4) VALUES ('Rua Nova', 'Sintra ', '2710')")
+        geo_conn.execute("UPDATE pt_addresses SET cc_desig = 'Matosinhos' WHERE full_street = 'Rua 0' AND CP4 = '4000'")
+        rows = dict(geo_conn.execute("SELECT full_street, cc_norm FROM pt_addresses WHERE CP4 IN ('2710', '4000') AND full_street IN ('Rua Nova', 'Rua 0')"))
+        assert rows == {"Rua Nova": "SINTRA", "Rua 0": "MATOSINHOS"}
+
+
+class TestHotQueryPlans:
+    """Nenhuma consulta crítica pode fazer full scan"""
+
+    @pytest.mark.parametrize("name", sorted(HOT_QUERIES["multi"]))
+    def test_multi(self, multi_conn, name):
+        sql, params = HOT_QUERIES["multi"][name]
+        assert full_scans(multi_conn, sql, params) == []
+
+    @pytest.mark.parametrize("name", sorted(HOT_QUERIES["geo"]))
+    def test_geo(self, geo_conn, name):
+        sql, params = HOT_QUERIES["geo"][name]
+        assert full_scans(geo_conn, sql, params) == []
+
+    def test_detecta_full_scan(self, geo_conn):
+        """A pesquisa antiga (LOWER(cc_desig) LIKE) é apanhada como full scan"""
+        assert full_scans(geo_conn, "SELECT * FROM pt_addresses WHERE LOWER(cc_desig) LIKE ?", ("%lisboa%",))
+
+    def test_relatorio(self, multi_conn, geo_conn):
+        for conn, db in ((multi_conn, "multi"), (geo_conn, "geo")):
+            report = check_schema(conn, db)
+            assert report["pending"] == [] and report["missing_indexes"] == [] and report["full_scans"] == {}
+
+
+class TestSuggestions:
+    """GET /suggestions usa cc_norm e recorre a LIKE para nomes parciais"""
+
+    def test_concelho_exato_e_parcial(self, tmp_path, monkeypatch, geo_conn):
+        import backend.api.geocoding as geocoding_api
+        from backend.api.auth import UserResponse
+        monkeypatch.setattr(geocoding_api, "DB_GEO_PATH", str(tmp_path / "geocoding.db"))
+        user = UserResponse(id=1, nome="U", email="u@x.pt", empresa_id=1, is_admin=False)
+
+        exact = geocoding_api.get_suggestions(concelho="lisboa", current_user=user)
+        partial = geocoding_api.get_suggestions(concelho="Port", current_user=user)
+        assert exact and {s["cp"] for s in exact} == {"1000"}
+        assert partial and {s["cp"] for s in partial} == {"4000"}
+        assert geocoding_api.get_suggestions(cp="1000-001", concelho="Port", current_user=user) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,252 @@
+"""
+Testes Unitários - Recalculo incremental das rotas editadas (RoutePlan) e edição em lote
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+import database
+import backend.api.solver as solver
+import utils.matrix_cache as matrix_cache
+from backend.api.auth import UserResponse
+from backend.api.solver import BatchEditRequest, InsertRequest, RoutePlan, batch_edit_routes, insert_pending_stops
+from utils.matrix_cache import MatrixCache
+from utils.persistence_manager import serialize_state
+from utils.route_store import get_route_changes, load_routes, replace_routes
+
+N_ROUTES = 10
+STOPS_PER_ROUTE = 4
+
+
+def make_state():
+    rows = []
+    d_id = 1
+    for v in range(N_ROUTES):
+        for order in range(1, STOPS_PER_ROUTE + 1):
+            rows.append({
+                "id": d_id, "ID_Original": d_id, "Rota": f"V{v}", "Ordem": order, "Cliente": f"C{d_id}",
+                "Morada": f"Rua {d_id}", "Janela_Horaria": "Qualquer",
+                "Latitude": 38.70 + d_id / 1000, "Longitude": -9.10 - v / 100, "Peso_KG": 10.0, "Volume_m3": 0.1,
+            })
+            d_id += 1
+    rows.append({"id": d_id, "ID_Original": d_id, "Rota": "Por Distribuir", "Ordem": 1, "Cliente": f"C{d_id}",
+                 "Morada": "Rua X", "Janela_Horaria": "Qualquer", "Latitude": 38.8, "Longitude": -9.2})
+    state = {
+        "warehouses_geocoded": pd.DataFrame([{"Nome_Armazem": "A1", "Latitude": 38.72, "Longitude": -9.14}]),
+        "fleet_config": {f"V{v}": {"speed": 40, "start_time": "08:00", "warehouse": "A1"} for v in range(N_ROUTES)},
+    }
+    return state, pd.DataFrame(rows)
+
+
+@pytest.fixture(autouse=True)
+def isolated_matrix_cache(tmp_path, monkeypatch):
+    """optimize_route / insert_pending usam a cache de matrizes: fica em tmp_path, não na raiz do repositório"""
+    monkeypatch.setattr(matrix_cache, "_cache", MatrixCache(db_path=str(tmp_path / "matrix_cache.db")))
+
+
+@pytest.fixture
+def plan(monkeypatch):
+    calls = []
+    original = solver.recalculate_route_stops
+
+    def counting(stops, *args, **kwargs):
+        calls.append(stops[0]["Rota"] if stops else None)
+        return original(stops, *args, **kwargs)
+
+    monkeypatch.setattr(solver, "recalculate_route_stops", counting)
+    state, df = make_state()
+    p = RoutePlan(state, df)
+    p.recalc_calls = calls
+    return p
+
+
+class TestRoutePlan:
+    """Só as rotas afetadas são recalculadas"""
+
+    def test_mover_recalcula_so_origem_e_destino(self, plan):
+        idx = plan.find_stop(delivery_id=2)
+        plan.move(idx, "V5")
+        plan.recompute()
+
+        assert sorted(plan.recalc_calls) == ["V0", "V5"]
+        delta = plan.delta()
+        assert delta["changed_routes"] == ["V0", "V5"]
+        assert {r["Rota"] for r in delta["routes"]} == {"V0", "V5"}
+        assert len(delta["routes"]) == 2 * STOPS_PER_ROUTE
+        moved = plan.df[plan.df["id"] == 2].iloc[0]
+        assert moved["Rota"] == "V5" and moved["Ordem"] == STOPS_PER_ROUTE + 1
+        assert len(plan.df) == N_ROUTES * STOPS_PER_ROUTE + 1
+
+    def test_outras_rotas_intactas(self, plan):
+        before = plan.df[plan.df["Rota"] == "V3"].to_dict(orient="records")
+        plan.reorder("V0", plan.find_stop(delivery_id=4), 1)
+        plan.recompute()
+
+        assert plan.recalc_calls == ["V0"]
+        after = plan.df[plan.df["Rota"] == "V3"][list(before[0])].to_dict(orient="records")
+        assert after == before
+        v0 = plan.route_stops("V0")
+        assert list(v0["id"]) == [4, 1, 2, 3]
+        assert v0.iloc[0]["Dist_Acum"] == v0.iloc[0]["KM_Anterior"]
+
+    def test_desatribuir_e_transferir(self, plan):
+        plan.move(plan.find_stop(client_code="C1"), "Pendente")
+        assert plan.transfer("V1", "V2") == STOPS_PER_ROUTE
+        plan.recompute()
+
+        delta = plan.delta()
+        assert delta["changed_routes"] == ["Por Distribuir", "V0", "V1", "V2"]
+        pending = plan.df[plan.df["Rota"] == "Por Distribuir"]
+        assert sorted(pending["Ordem"]) == [1, 2]
+        assert (pending["Chegada"] == "00:00").all()
+        assert plan.route_stops("V1").empty
+        assert len(plan.route_stops("V2")) == 2 * STOPS_PER_ROUTE
+
+    def test_sem_edicoes_delta_vazio(self, plan):
+        assert plan.optimize_route("Por Distribuir") is False
+        plan.recompute()
+        assert plan.delta() == {"changed_routes": [], "routes": []}
+        assert plan.recalc_calls == []
+
+    def test_otimizar_rota(self, plan):
+        plan.reorder("V0", plan.find_stop(delivery_id=4), 1)
+        plan.reorder("V0", plan.find_stop(delivery_id=1), 3)
+        assert plan.optimize_route("V0") is True
+        plan.recompute()
+
+        assert plan.recalc_calls == ["V0"]
+        # Stops lie on a line heading away from the depot: closest first, no return leg
+        v0 = plan.route_stops("V0")
+        assert list(v0["id"]) == [4, 3, 2, 1]
+        assert list(v0["Ordem"]) == [1, 2, 3, 4]
+
+    def test_trocar_paragens_entre_rotas(self, plan):
+        plan.swap(plan.find_stop(delivery_id=1), plan.find_stop(delivery_id=8))
+        plan.recompute()
+
+        assert sorted(plan.recalc_calls) == ["V0", "V1"]
+        assert list(plan.route_stops("V0")["id"]) == [8, 2, 3, 4]
+        assert list(plan.route_stops("V1")["id"]) == [5, 6, 7, 1]
+
+
+class TestInsertPending:
+    """Inserção mais barata das paragens 'Por Distribuir' nas rotas existentes"""
+
+    def test_insere_na_rota_mais_proxima(self, plan):
+        inserted, remaining = plan.insert_pending()
+        plan.recompute()
+
+        assert remaining == []
+        assert inserted == [{"id": 41, "Rota": "V9", "Ordem": 5, "KM_Extra": pytest.approx(6.73, abs=0.01)}]
+        assert sorted(plan.recalc_calls, key=str) == ["V9"]
+        assert plan.delta()["changed_routes"] == ["Por Distribuir", "V9"]
+        assert list(plan.route_stops("V9")["id"]) == [37, 38, 39, 40, 41]
+
+    def test_respeita_capacidade(self, plan):
+        for name in plan.fleet_dict:
+            plan.fleet_dict[name]["capacity"] = 45.0
+        inserted, remaining = plan.insert_pending()
+
+        assert inserted == [] and remaining == [41]
+        assert plan.dirty == set()
+
+    def test_respeita_janela_horaria(self, plan):
+        idx = plan.find_stop(delivery_id=41)
+        plan.df.at[idx, "Janela_Horaria"] = "07:00 - 07:30"
+        assert plan.insert_pending() == ([], [41])
+
+        plan.df.at[idx, "Janela_Horaria"] = "12:00 - 13:00"
+        inserted, _ = plan.insert_pending()
+        assert inserted[0]["Rota"] == "V9"
+
+    def test_respeita_armazem(self, plan):
+        plan.fleet_dict["V0"]["warehouse"] = "A2"
+        inserted, _ = plan.insert_pending(client_warehouses={41: "A2"})
+        assert [i["Rota"] for i in inserted] == ["V0"]
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "multi.db"))
+    database.init_database()
+    emp = database.criar_empresa("E", "e@x.pt")
+    uid = database.criar_utilizador(emp, "U", "u@x.pt", "pw123456")
+    pid = database.criar_projeto(emp, "P")
+    state, df = make_state()
+    with database.get_db() as conn:
+        conn.execute("INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, 3, 's', ?)",
+                     (pid, uid, serialize_state({**state, "routes_solution": df})))
+        conn.commit()
+    replace_routes(pid, df, uid)
+    user = UserResponse(id=uid, nome="U", email="u@x.pt", empresa_id=emp, is_admin=False)
+    return pid, user
+
+
+class TestBatchEdit:
+    """Endpoint /batch-edit: várias operações, um recálculo e uma escrita"""
+
+    def test_lote_aplicado_e_gravado_uma_vez(self, project):
+        pid, user = project
+        req = BatchEditRequest(project_id=pid, expected_version=1, operations=[
+            {"op": "move", "delivery_id": 1, "new_route": "V1"},
+            {"op": "reorder", "route_name": "V1", "delivery_id": 1, "new_order": 1},
+            {"op": "swap", "delivery_id": 2, "other_delivery_id": 9},
+            {"op": "unassign", "delivery_id": 3},
+            {"op": "transfer", "source_route": "V3", "target_route": "V4"},
+        ])
+        res = batch_edit_routes(req, current_user=user)
+
+        assert res["version"] == 2 and res["applied"] == 5
+        assert res["changed_routes"] == ["Por Distribuir", "V0", "V1", "V2", "V3", "V4"]
+        assert len(get_route_changes(pid, since_version=1)) == 1
+
+        routes = pd.DataFrame(load_routes(pid)[0])
+        v1 = routes[routes["Rota"] == "V1"].sort_values("Ordem")
+        assert list(v1["id"])[:2] == [1, 5]
+        assert routes.set_index("id").loc[3, "Rota"] == "Por Distribuir"
+        assert (routes["Rota"] != "V3").all()
+
+    def test_lote_atomico(self, project):
+        """Uma operação inválida no fim anula todo o lote"""
+        pid, user = project
+        req = BatchEditRequest(project_id=pid, operations=[
+            {"op": "move", "delivery_id": 1, "new_route": "V1"},
+            {"op": "move", "delivery_id": 999, "new_route": "V2"},
+        ])
+        with pytest.raises(HTTPException) as exc:
+            batch_edit_routes(req, current_user=user)
+
+        assert exc.value.status_code == 404
+        assert exc.value.detail.startswith("Operação 2 (move)")
+        routes, version = load_routes(pid)
+        assert version == 1
+        assert next(r for r in routes if r["id"] == 1)["Rota"] == "V0"
+
+    def test_endpoint_insert(self, project):
+        pid, user = project
+        res = insert_pending_stops(InsertRequest(project_id=pid, expected_version=1), current_user=user)
+
+        assert res["version"] == 2
+        assert [i["id"] for i in res["inserted"]] == [41] and res["not_inserted"] == []
+        routes = pd.DataFrame(load_routes(pid)[0])
+        assert (routes["Rota"] != "Por Distribuir").all()
+
+    def test_endpoint_insert_entrega_desconhecida(self, project):
+        pid, user = project
+        with pytest.raises(HTTPException) as exc:
+            insert_pending_stops(InsertRequest(project_id=pid, delivery_ids=[1]), current_user=user)
+        assert exc.value.status_code == 404
+
+    def test_versao_desatualizada(self, project):
+        pid, user = project
+        req = BatchEditRequest(project_id=pid, expected_version=0, operations=[{"op": "unassign", "delivery_id": 1}])
+        with pytest.raises(HTTPException) as exc:
+            batch_edit_routes(req, current_user=user)
+        assert exc.value.status_code == 409
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
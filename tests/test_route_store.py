@@ -0,0 +1,149 @@
+"""
+Testes Unitários - Tabela normalizada de paragens (route_stops) e versões das rotas
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+import streamlit
+import database
+from utils.persistence_manager import create_snapshot, serialize_state
+from utils.route_store import (
+    RouteVersionConflict, get_route_changes, get_route_version, load_project_state,
+    load_routes, replace_routes, save_routes
+)
+
+
+def make_routes():
+    rows = []
+    for r_name, ids in (("V1", [1, 2, 3]), ("V2", [4, 5]), ("Por Distribuir", [6])):
+        for order, d_id in enumerate(ids, 1):
+            rows.append({
+                "id": d_id, "ID_Original": d_id, "Rota": r_name, "Ordem": order,
+                "Cliente": f"C{d_id}", "Morada": f"Rua {d_id}", "Latitude": 38.7 + d_id / 100, "Longitude": -9.1,
+                "Chegada": "10:00", "Saida": "10:15", "KM_Anterior": 1.5, "Dist_Acum": 1.5 * order,
+                "Carga_Acum": 10.0 * order, "Carga_Vol_Acum": 0.1 * order,
+            })
+    return rows
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "multi.db"))
+    database.init_database()
+    emp = database.criar_empresa("E", "e@x.pt")
+    uid = database.criar_utilizador(emp, "U", "u@x.pt", "pw123456")
+    pid = database.criar_projeto(emp, "P")
+    return pid, uid
+
+
+def stored_row_count(pid):
+    with database.get_db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM route_stops WHERE projeto_id = ?", (pid,)).fetchone()[0]
+
+
+class TestRouteStore:
+    """Testes para route_stops / route_changes"""
+
+    def test_replace_e_load(self, project):
+        pid, uid = project
+        version = replace_routes(pid, make_routes(), uid)
+
+        routes, loaded_version = load_routes(pid)
+        assert loaded_version == version == 1
+        assert [r["id"] for r in routes] == [1, 2, 3, 4, 5, 6]
+        assert routes[0]["Cliente"] == "C1" and routes[0]["Rota"] == "V1"
+
+    def test_edicao_so_escreve_linhas_alteradas(self, project):
+        """Mover uma paragem gera um registo com só os campos alterados"""
+        pid, uid = project
+        replace_routes(pid, make_routes(), uid)
+        routes, version = load_routes(pid)
+        routes[2]["Rota"], routes[2]["Ordem"] = "V2", 3
+
+        new_version, written = save_routes(pid, routes, uid, "reassign", expected_version=version)
+
+        assert (new_version, written) == (2, 1)
+        change = get_route_changes(pid, since_version=1)[0]
+        assert change["operation"] == "reassign"
+        assert change["changes"] == [[3, {"Rota": ["V1", "V2"]}]]
+        assert stored_row_count(pid) == 6
+
+    def test_sem_alteracoes_nao_muda_versao(self, project):
+        pid, uid = project
+        replace_routes(pid, make_routes(), uid)
+        routes, version = load_routes(pid)
+
+        assert save_routes(pid, pd.DataFrame(routes), uid, "reorder", expected_version=version) == (version, 0)
+        assert get_route_version(pid) == version
+
+    def test_conflito_de_versao(self, project):
+        """Uma edição baseada numa versão antiga é rejeitada"""
+        pid, uid = project
+        replace_routes(pid, make_routes(), uid)
+        routes, version = load_routes(pid)
+        routes[0]["Ordem"] = 9
+        save_routes(pid, routes, uid, "reorder", expected_version=version)
+
+        routes[1]["Ordem"] = 8
+        with pytest.raises(RouteVersionConflict):
+            save_routes(pid, routes, uid, "reorder", expected_version=version)
+
+    def test_projeto_legado_faz_bootstrap(self, project):
+        """Projetos só com snapshot passam a route_stops na primeira edição"""
+        pid, uid = project
+        payload = serialize_state({"routes_solution": pd.DataFrame(make_routes()), "fleet_config": {"V1": {}}})
+        with database.get_db() as conn:
+            conn.execute("INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, 3, 's', ?)",
+                         (pid, uid, payload))
+            conn.commit()
+
+        state, version = load_project_state(pid)
+        assert version == 0 and load_routes(pid) is None
+
+        df = state["routes_solution"]
+        df.loc[df["id"] == 6, "Rota"] = "V1"
+        assert save_routes(pid, df, uid, "reassign", expected_version=version) == (1, 6)
+
+        state, version = load_project_state(pid)
+        assert version == 1
+        assert state["routes_solution"].set_index("id").loc[6, "Rota"] == "V1"
+        assert state["fleet_config"] == {"V1": {}}
+
+    def test_snapshot_posterior_substitui_plano(self, project, monkeypatch):
+        """Um plano novo guardado por create_snapshot não fica escondido pelas linhas antigas"""
+        pid, uid = project
+        replace_routes(pid, make_routes(), uid)
+
+        new_plan = pd.DataFrame(make_routes())
+        new_plan["Rota"] = "V2"
+        monkeypatch.setattr(streamlit, "session_state", {"routes_solution": new_plan, "fleet_config": {"V2": {}}})
+        create_snapshot(pid, uid, 3)
+
+        state, version = load_project_state(pid)
+        assert version == 2
+        assert set(state["routes_solution"]["Rota"]) == {"V2"}
+        assert {r["Rota"] for r in load_routes(pid)[0]} == {"V2"}
+
+        # Recalcular Rotas guarda routes_solution = None
+        monkeypatch.setattr(streamlit, "session_state", {"routes_solution": None, "fleet_config": {"V2": {}}})
+        create_snapshot(pid, uid, 3)
+
+        state, _ = load_project_state(pid)
+        assert stored_row_count(pid) == 0
+        assert state["routes_solution"] is None
+
+    def test_autosave_sem_alteracoes_nao_muda_versao(self, project, monkeypatch):
+        pid, uid = project
+        version = replace_routes(pid, make_routes(), uid)
+        routes, _ = load_routes(pid)
+
+        monkeypatch.setattr(streamlit, "session_state", {"routes_solution": pd.DataFrame(routes)})
+        create_snapshot(pid, uid, 3)
+        assert get_route_version(pid) == version
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
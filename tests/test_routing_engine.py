@@ -0,0 +1,141 @@
+"""
+Testes Unitários - Fornecedores de matriz (OSRM local / haversine)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+import numpy as np
+from utils.distance_calculator import calculate_haversine_matrix
+from utils.matrix_cache import haversine_block
+from utils.routing_engine import OSRMMatrixProvider, get_matrix_provider
+
+ROAD_FACTOR = 1.2
+
+
+class FakeOSRMHandler(BaseHTTPRequestHandler):
+    """Stand-in /table service: road distance = haversine x 1.2, 50 km/h"""
+    requests_seen = []
+
+    def do_GET(self):
+        parsed = urlsplit(self.path)
+        coords_str = parsed.path.split("/")[-1]
+        coords = [tuple(map(float, c.split(",")))[::-1] for c in coords_str.split(";")]
+        query = parse_qs(parsed.query)
+        sources = [int(i) for i in query["sources"][0].split(";")]
+        destinations = [int(i) for i in query["destinations"][0].split(";")]
+        FakeOSRMHandler.requests_seen.append(len(coords))
+
+        km = haversine_block([coords[i] for i in sources], [coords[j] for j in destinations]) * ROAD_FACTOR
+        body = json.dumps({
+            "code": "Ok",
+            "distances": (km * 1000).tolist(),
+            "durations": (km / 50.0 * 3600).tolist(),
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def fake_osrm():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOSRMHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def random_locations(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return list(zip(rng.uniform(38.6, 38.9, n), rng.uniform(-9.3, -9.0, n)))
+
+
+class TestOSRMMatrixProvider:
+    """Testes para o fornecedor OSRM com tiling"""
+
+    def test_tiling_reconstroi_matriz(self, fake_osrm):
+        """Blocos origem/destino devem ser cosidos na matriz completa"""
+        FakeOSRMHandler.requests_seen.clear()
+        locations = random_locations(23)
+        provider = OSRMMatrixProvider(fake_osrm, block_size=5, max_workers=4, use_cache=False)
+
+        matrix = provider.distance_matrix(locations)
+
+        assert provider.last_source == "osrm"
+        assert matrix.shape == (23, 23)
+        assert np.allclose(matrix, calculate_haversine_matrix(locations) * ROAD_FACTOR, atol=1e-3)
+        # ceil(23/5)^2 tiles, none larger than 2 x block_size coordinates
+        assert len(FakeOSRMHandler.requests_seen) == 25
+        assert max(FakeOSRMHandler.requests_seen) <= 10
+
+    def test_table_assimetrica(self, fake_osrm):
+        """Origens e destinos diferentes devolvem matriz rectangular"""
+        locations = random_locations(12, seed=3)
+        provider = OSRMMatrixProvider(fake_osrm, block_size=4, use_cache=False)
+
+        distances, durations = provider.table(locations[:7], locations[7:])
+
+        assert distances.shape == (7, 5)
+        assert durations.shape == (7, 5)
+        assert not np.isnan(distances).any()
+
+    def test_fallback_haversine(self):
+        """Router indisponível deve devolver haversine e entrar em cooldown"""
+        locations = random_locations(6, seed=5)
+        provider = OSRMMatrixProvider("http://127.0.0.1:9", timeout=0.5, use_cache=False)
+
+        matrix = provider.distance_matrix(locations)
+
+        assert provider.last_source == "haversine"
+        assert np.allclose(matrix, calculate_haversine_matrix(locations))
+        assert provider._down_until > 0
+
+    def test_origem_por_pedido(self, fake_osrm, monkeypatch):
+        """Cópias por pedido partilham sessão e cooldown, mas não a origem da matriz"""
+        import utils.routing_engine as routing_engine
+        shared = OSRMMatrixProvider(fake_osrm, use_cache=False)
+        monkeypatch.setattr(routing_engine, "_osrm_provider", shared)
+        a, b = get_matrix_provider("osrm"), get_matrix_provider("osrm")
+        assert a is not b and a.session is b.session is shared.session
+
+        a.distance_matrix(random_locations(4, seed=1))
+        b.base_url = "http://127.0.0.1:9"
+        b.timeout = 0.5
+        b.distance_matrix(random_locations(4, seed=2))
+
+        assert a.last_source == "osrm" and b.last_source == "haversine"
+        assert shared._down_until > 0 and a._down_until == shared._down_until
+
+    def test_haversine_sem_cache(self, monkeypatch):
+        """O fornecedor por omissão calcula a matriz diretamente, sem passar pela cache SQLite"""
+        import utils.routing_engine as routing_engine
+
+        def no_cache():
+            raise AssertionError("cache de matrizes usada para haversine")
+
+        monkeypatch.setattr(routing_engine, "get_matrix_cache", no_cache)
+        locations = random_locations(8, seed=9)
+        provider = get_matrix_provider("haversine")
+        assert np.allclose(provider.distance_matrix(locations), calculate_haversine_matrix(locations))
+        assert provider.last_source == "haversine"
+
+    def test_fornecedor_desconhecido(self):
+        """Nome de fornecedor inválido deve levantar ValueError"""
+        with pytest.raises(ValueError):
+            get_matrix_provider("google")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,115 @@
+"""
+Testes Unitários - Formato binário de snapshots e compatibilidade com JSON antigo
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from core.session_state import FleetVehicle
+from utils.persistence_manager import deserialize_state, serialize_state
+from utils.snapshot_codec import (
+    MAGIC, SnapshotFormatError, decode_snapshot, encode_snapshot, is_binary_snapshot
+)
+
+
+def sample_clients(n=50):
+    rng = np.random.default_rng(3)
+    return pd.DataFrame({
+        'Morada': [f"Rua {i}, Lisboa" for i in range(n)],
+        'Latitude': rng.uniform(38.6, 38.9, n),
+        'Longitude': rng.uniform(-9.3, -9.0, n),
+        'Nivel_Qualidade': rng.integers(1, 8, n),
+        'Aprovado': rng.random(n) > 0.5,
+        'Observacoes': [None if i % 3 else f"nota {i}" for i in range(n)],
+    })
+
+
+class TestSnapshotCodec:
+    """Testes para o codec binário"""
+
+    def test_roundtrip_preserva_tipos(self):
+        """Colunas numéricas, booleanas, texto e nulos voltam iguais"""
+        df = sample_clients()
+        df['Data'] = pd.date_range("2026-01-01", periods=len(df), freq="h")
+        df['Data_UTC'] = df['Data'].dt.tz_localize("Europe/Lisbon")
+
+        restored = decode_snapshot(encode_snapshot({'clients_geocoded': df, 'phase_1_complete': True}))
+
+        pd.testing.assert_frame_equal(restored['clients_geocoded'], df)
+        assert restored['phase_1_complete'] is True
+
+    def test_indice_nao_sequencial(self):
+        df = sample_clients(10).set_index('Morada')
+        restored = decode_snapshot(encode_snapshot({'df': df}))
+        pd.testing.assert_frame_equal(restored['df'], df)
+
+    def test_dataframe_vazio(self):
+        df = pd.DataFrame(columns=['Morada', 'Latitude'])
+        restored = decode_snapshot(encode_snapshot({'df': df}))
+        assert list(restored['df'].columns) == ['Morada', 'Latitude']
+        assert restored['df'].empty
+
+    def test_header_versionado(self):
+        blob = encode_snapshot({'x': 1})
+        assert blob.startswith(MAGIC)
+        assert is_binary_snapshot(blob)
+        assert not is_binary_snapshot('{"x": 1}')
+
+        future = blob[:len(MAGIC)] + bytes([99]) + blob[len(MAGIC) + 1:]
+        with pytest.raises(SnapshotFormatError):
+            decode_snapshot(future)
+        with pytest.raises(SnapshotFormatError):
+            decode_snapshot(blob[:-5])
+
+    def test_mais_pequeno_que_json(self):
+        """O formato binário comprimido ocupa bem menos que o JSON duplamente codificado"""
+        state = {'clients_geocoded': sample_clients(2000)}
+        legacy = serialize_state(state, fmt='json')
+        binary = serialize_state(state)
+
+        assert isinstance(binary, bytes)
+        assert len(binary) < len(legacy.encode('utf-8')) / 2
+
+
+class TestPersistenceCompat:
+    """serialize_state / deserialize_state com os dois formatos"""
+
+    @pytest.fixture
+    def state(self):
+        return {
+            'clients_geocoded': sample_clients(),
+            'phase_2_complete': True,
+            'fleet_config': {'V1': FleetVehicle(1000.0, 8.0, 0.5, 40.0, '08:00', '18:00', 'Lisboa')},
+            'optimization_params': {'max_time': 30},
+            'routes_solution': object(),
+        }
+
+    def test_roundtrip_binario(self, state):
+        restored = deserialize_state(serialize_state(state))
+
+        pd.testing.assert_frame_equal(restored['clients_geocoded'], state['clients_geocoded'])
+        assert restored['fleet_config']['V1'] == state['fleet_config']['V1']
+        assert restored['optimization_params'] == {'max_time': 30}
+        assert 'routes_solution' not in restored
+
+    def test_le_snapshots_json_antigos(self, state):
+        """Payloads JSON antigos continuam a ser lidos, como str ou bytes"""
+        legacy = serialize_state(state, fmt='json')
+        assert json.loads(legacy)['clients_geocoded']['__type__'] == 'pd_dataframe'
+
+        for payload in (legacy, legacy.encode('utf-8')):
+            restored = deserialize_state(payload)
+            assert restored['fleet_config']['V1'] == state['fleet_config']['V1']
+            assert len(restored['clients_geocoded']) == len(state['clients_geocoded'])
+
+    def test_payload_corrompido_devolve_vazio(self):
+        assert deserialize_state(MAGIC + b"\x01\x01lixo") == {}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,81 @@
+"""
+Testes - Fila de Jobs do Solver (processos, progresso, cancelamento, persistência)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import pytest
+import database
+from backend.solver_jobs import SolverJobManager
+
+
+def fake_solve(payload, emit):
+    """Target de teste: simula a pesquisa com 3 soluções incumbentes"""
+    for cost in (300.0, 250.0, 220.0):
+        emit({"stage": "search", "incumbent_cost": cost})
+        time.sleep(0.3)
+    return {"status": "success", "project_id": payload["project_id"], "routes": []}
+
+
+def slow_solve(payload, emit):
+    emit({"stage": "solving"})
+    time.sleep(60)
+    return {"status": "success"}
+
+
+def failing_solve(payload, emit):
+    raise ValueError("sem veículos")
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "multi.db"))
+    database.init_database()
+    return tmp_path
+
+
+class TestSolverJobManager:
+
+    def test_job_concluido_e_persistido(self, temp_db):
+        manager = SolverJobManager(max_workers=1, target=fake_solve)
+        job = manager.submit(project_id=1, user_id=1, empresa_id=1, params={})
+
+        job = manager.wait(job.id, timeout=60)
+
+        assert job.status == "done"
+        assert job.result["project_id"] == 1
+        assert job.incumbent_cost == 220.0
+        assert job.convergence
+
+        # Um manager novo (ex: após reinício) lê o resultado da base de dados
+        reloaded = SolverJobManager(target=fake_solve).get(job.id)
+        assert reloaded.status == "done"
+        assert reloaded.result["status"] == "success"
+
+    def test_job_com_erro(self, temp_db):
+        manager = SolverJobManager(max_workers=1, target=failing_solve)
+        job = manager.wait(manager.submit(1, 1, 1).id, timeout=60)
+
+        assert job.status == "failed"
+        assert "sem veículos" in job.error
+
+    def test_cancelar_job_em_execucao_e_em_fila(self, temp_db):
+        manager = SolverJobManager(max_workers=1, target=slow_solve)
+        running = manager.submit(1, 1, 1)
+        queued = manager.submit(1, 1, 1)
+
+        deadline = time.time() + 30
+        while manager.get(running.id).status != "running" and time.time() < deadline:
+            time.sleep(0.05)
+
+        manager.cancel(queued.id)
+        manager.cancel(running.id)
+
+        assert manager.wait(queued.id, timeout=5).status == "cancelled"
+        assert manager.wait(running.id, timeout=30).status == "cancelled"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
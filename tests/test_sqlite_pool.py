@@ -0,0 +1,114 @@
+"""
+Testes Unitários - Pool de conexões SQLite (WAL, pragmas, conexões só de leitura)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import threading
+import pytest
+from utils.sqlite_pool import connect, get_pool, pool_stats
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "pool.db")
+    conn = connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.commit()
+    conn.close()
+    yield path
+    get_pool(path).close_all()
+    get_pool(path, readonly=True).close_all()
+
+
+class TestSQLitePool:
+    """Testes para utils.sqlite_pool"""
+
+    def test_pragmas(self, db_path):
+        conn = connect(db_path)
+        try:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] > 0
+        finally:
+            conn.close()
+
+    def test_close_devolve_ao_pool(self, db_path):
+        first = connect(db_path)
+        first.close()
+        first.close()  # segundo close não duplica a conexão no pool
+        second = connect(db_path, row_factory=sqlite3.Row)
+        try:
+            assert second is first
+            assert isinstance(second.execute("SELECT 1 AS x").fetchone(), sqlite3.Row)
+        finally:
+            second.close()
+
+        stats = next(s for s in pool_stats() if s["db_path"] == os.path.abspath(db_path) and s["mode"] == "rw")
+        assert stats["reused"] >= 1 and stats["in_use"] == 0 and stats["idle"] == 1
+
+    def test_transacao_pendente_descartada(self, db_path):
+        conn = connect(db_path)
+        conn.execute("INSERT INTO t (v) VALUES ('x')")
+        conn.close()
+        conn = connect(db_path)
+        try:
+            assert not conn.in_transaction
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        finally:
+            conn.close()
+
+    def test_so_leitura(self, db_path):
+        conn = connect(db_path, readonly=True)
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("INSERT INTO t (v) VALUES ('x')")
+        finally:
+            conn.close()
+
+    def test_ficheiro_recriado(self, db_path):
+        """Conexões inativas para um ficheiro apagado não são reutilizadas"""
+        connect(db_path).close()
+        os.remove(db_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        conn = connect(db_path)
+        try:
+            assert conn.execute("SELECT name FROM sqlite_master WHERE name = 't'").fetchone() is None
+        finally:
+            conn.close()
+
+    def test_escritas_concorrentes(self, db_path):
+        errors = []
+
+        def writer(n):
+            for i in range(50):
+                conn = connect(db_path)
+                try:
+                    conn.execute("INSERT INTO t (v) VALUES (?)", (f"{n}-{i}",))
+                    conn.commit()
+                except sqlite3.Error as e:
+                    errors.append(e)
+                finally:
+                    conn.close()
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert errors == []
+        conn = connect(db_path, readonly=True)
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 200
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
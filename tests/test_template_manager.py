@@ -0,0 +1,67 @@
+"""
+Testes Unitários - Geradores de dados aleatórios (utils.template_manager)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from utils.template_manager import generate_random_deliveries, generate_random_fleet_warehouses
+
+
+@pytest.fixture
+def address_db(tmp_path):
+    """pt_addresses com 200 moradas na área de Lisboa"""
+    path = str(tmp_path / "addresses.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE pt_addresses (
+            full_street TEXT, CP4 TEXT, cc_desig TEXT, dd_desig TEXT,
+            LATITUDE REAL, LONGITUDE REAL, quality_score INTEGER
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO pt_addresses VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"Rua {k}", str(1000 + k), ["Lisboa", "Oeiras", "Sintra"][k % 3], "Lisboa", 38.7 + k * 1e-3, -9.1 - k * 1e-3, 1 + k % 3)
+         for k in range(200)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+class TestRandomGenerators:
+    """generate_random_deliveries / generate_random_fleet_warehouses com semente"""
+
+    def test_entregas_reprodutiveis(self, address_db):
+        """A mesma semente gera o mesmo ficheiro; outra semente, outras moradas"""
+        a = pd.read_excel(BytesIO(generate_random_deliveries(40, db_path=address_db, seed=3)))
+        b = pd.read_excel(BytesIO(generate_random_deliveries(40, db_path=address_db, seed=3)))
+        c = pd.read_excel(BytesIO(generate_random_deliveries(40, db_path=address_db, seed=4)))
+
+        assert len(a) == 40
+        pd.testing.assert_frame_equal(a, b)
+        assert set(a["Morada"]) != set(c["Morada"])
+
+    def test_entregas_sem_coordenadas_em_falta(self, address_db):
+        df = pd.read_excel(BytesIO(generate_random_deliveries(40, db_path=address_db, seed=3, missing_coords=0.0)))
+        assert df["Latitude"].notna().all() and df["Longitude"].notna().all()
+
+    def test_frota_reprodutivel_e_maior(self, address_db):
+        """max_vehicles permite frotas acima de 10 veículos; armazéns trazem coordenadas"""
+        a = pd.read_excel(BytesIO(generate_random_fleet_warehouses(25, db_path=address_db, seed=3, max_vehicles=25)), sheet_name=None)
+        b = pd.read_excel(BytesIO(generate_random_fleet_warehouses(25, db_path=address_db, seed=3, max_vehicles=25)), sheet_name=None)
+
+        assert len(a["Frota"]) == 25
+        pd.testing.assert_frame_equal(a["Frota"], b["Frota"])
+        pd.testing.assert_frame_equal(a["Armazéns"], b["Armazéns"])
+        assert a["Armazéns"]["Latitude"].notna().all()
+        assert len(pd.read_excel(BytesIO(generate_random_fleet_warehouses(25, db_path=address_db)), sheet_name="Frota")) == 10
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,193 @@
+"""
+Testes Unitários - Tempos por fase e perfis (utils.timing) no pipeline /solve
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import logging
+import pstats
+import time
+
+import pandas as pd
+import pytest
+import database
+import utils.timing as timing
+from backend.api.solver import run_solver_pipeline
+from utils.persistence_manager import serialize_state
+from utils.timing import StageTimer, profile, timed
+
+
+@timed("dobro", rows=len)
+def dobro(values):
+    return values + values
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestStageTimer:
+    """Spans, decorator e linha de log JSON"""
+
+    def test_spans_agregados(self):
+        timer = StageTimer("teste")
+        with timer.span("carregar", rows=3):
+            pass
+        for _ in range(2):
+            with timer.span("rotas") as span:
+                span["rows"] = 5
+
+        stages = {s["stage"]: s for s in timer.report()["stages"]}
+        assert stages["carregar"]["calls"] == 1 and stages["carregar"]["rows"] == 3
+        assert stages["rotas"]["calls"] == 2 and stages["rotas"]["rows"] == 10
+        assert timer.report()["total_ms"] >= stages["rotas"]["ms"]
+
+    def test_decorator_so_com_timer_ativo(self):
+        timer = StageTimer("teste")
+        assert dobro([1]) == [1, 1]
+        assert timer.stages == {}
+
+        with timer.activate():
+            dobro([1, 2])
+        assert dobro([3]) == [3, 3]
+        assert timer.stages["dobro"]["calls"] == 1 and timer.stages["dobro"]["rows"] == 4
+
+    def test_span_regista_mesmo_com_erro(self):
+        timer = StageTimer("teste")
+        with pytest.raises(ValueError):
+            with timer.span("falha"):
+                raise ValueError()
+        assert timer.stages["falha"]["calls"] == 1
+
+    def test_log_json(self, caplog):
+        timer = StageTimer("solve_timings")
+        with timer.span("matrix", rows=10):
+            pass
+        with caplog.at_level(logging.INFO, logger="georoute.timing"):
+            timer.log(project_id=7)
+
+        line = json.loads(caplog.records[-1].getMessage())
+        assert line["event"] == "solve_timings" and line["project_id"] == 7
+        assert line["stages"][0]["stage"] == "matrix"
+
+
+class TestProfile:
+    """profile(): cProfile, amostragem de stacks ou nada"""
+
+    @pytest.fixture(autouse=True)
+    def profiling_enabled(self, monkeypatch):
+        monkeypatch.setattr(timing, "PROFILING_ENABLED", True)
+
+    def test_cprofile(self, tmp_path):
+        with profile("cprofile", "job1", str(tmp_path)) as info:
+            busy(0.05)
+        assert info["path"] == str(tmp_path / "job1.prof")
+        stats = pstats.Stats(info["path"])
+        assert any(func[2] == "busy" for func in stats.stats)
+
+    def test_amostragem(self, tmp_path):
+        with profile("sampling", "job2", str(tmp_path)) as info:
+            busy(0.2)
+        with open(info["path"], encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines and any("busy (test_timing.py" in line for line in lines)
+
+    def test_sem_perfil(self, tmp_path):
+        with profile(None, "job3", str(tmp_path)) as info:
+            pass
+        assert info["path"] is None and os.listdir(tmp_path) == []
+
+    def test_desativado_no_servidor(self, tmp_path, monkeypatch):
+        """Sem SOLVER_PROFILING o pedido não escreve nada no disco"""
+        monkeypatch.setattr(timing, "PROFILING_ENABLED", False)
+        with profile("cprofile", "job4", str(tmp_path)) as info:
+            pass
+        assert info["path"] is None and os.listdir(tmp_path) == []
+
+    def test_limite_de_ficheiros(self, tmp_path, monkeypatch):
+        """Só ficam os PROFILE_MAX_FILES perfis mais recentes"""
+        monkeypatch.setattr(timing, "PROFILE_MAX_FILES", 2)
+        (tmp_path / "notas.md").write_text("x")
+        for k in range(4):
+            with profile("cprofile", f"job{k}", str(tmp_path)):
+                pass
+            os.utime(tmp_path / f"job{k}.prof", (k, k))
+        assert sorted(os.listdir(tmp_path)) == ["job2.prof", "job3.prof", "notas.md"]
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "multi.db"))
+    monkeypatch.setattr(timing, "PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(timing, "PROFILING_ENABLED", True)
+    database.init_database()
+    emp = database.criar_empresa("E", "e@x.pt")
+    uid = database.criar_utilizador(emp, "U", "u@x.pt", "pw123456")
+    pid = database.criar_projeto(emp, "P")
+    state = {
+        "warehouses_geocoded": pd.DataFrame([{"Nome_Armazem": "A1", "Latitude": 38.72, "Longitude": -9.14}]),
+        "fleet_config": {f"V{v}": {"capacity": 800, "speed": 50, "start_time": "08:00", "end_time": "18:00", "warehouse": "A1"} for v in range(2)},
+    }
+    with database.get_db() as conn:
+        conn.execute("INSERT INTO snapshots (projeto_id, utilizador_id, fase_atual, nome_snapshot, payload_json) VALUES (?, ?, 2, 's', ?)",
+                     (pid, uid, serialize_state(state)))
+        for i in range(12):
+            conn.execute(
+                "INSERT INTO entregas (projeto_id, codigo_cliente, morada, codigo_postal, peso_kg, volume_m3, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (pid, f"C{i}", f"Rua {i}", "1000-001", 20.0, 0.2, 38.65 + i * 0.01, -9.20 + (i % 4) * 0.03)
+            )
+        conn.commit()
+    return pid, uid, tmp_path
+
+
+class TestSolvePipelineTimings:
+    """run_solver_pipeline devolve os tempos por fase em modo debug"""
+
+    def test_tempos_na_resposta_e_perfil_por_job(self, project):
+        pid, uid, tmp_path = project
+        res = run_solver_pipeline(pid, {"time_limit_seconds": 2, "debug": True, "profile": "cprofile"}, uid, job_id="abc123")
+
+        timings = res["timings"]
+        stages = {s["stage"]: s for s in timings["stages"]}
+        for stage in ["load_snapshot", "load_deliveries", "build_locations", "matrix", "parse_fleet", "solve",
+                      "convert_routes", "recalculate_route_stops", "serialize_snapshot", "snapshot_insert", "save_routes"]:
+            assert stage in stages, stage
+        assert stages["load_deliveries"]["rows"] == 12
+        assert stages["matrix"]["rows"] == 13
+        assert stages["solve"]["ms"] <= timings["total_ms"]
+        assert timings["profile"] == str(tmp_path / "profiles" / f"solve_{pid}_abc123.prof")
+        assert os.path.exists(timings["profile"])
+
+    def test_sem_debug_nao_devolve_tempos(self, project, caplog):
+        pid, uid, _ = project
+        with caplog.at_level(logging.INFO, logger="georoute.timing"):
+            res = run_solver_pipeline(pid, {"time_limit_seconds": 2}, uid)
+
+        assert "timings" not in res
+        line = json.loads(caplog.records[-1].getMessage())
+        assert line["status"] == "success" and line["project_id"] == pid
+
+
+class TestSolvePipelinePortfolio:
+    """Falhas nas estatísticas do portfólio não fazem falhar um solve já guardado"""
+
+    def test_erro_ao_registar_portfolio(self, project, monkeypatch):
+        import backend.api.solver as solver_api
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("database is locked")
+
+        monkeypatch.setattr(solver_api, "_record_portfolio_run", fail)
+        pid, uid, _ = project
+        res = run_solver_pipeline(pid, {"time_limit_seconds": 3, "strategy": "portfolio", "portfolio_workers": 1}, uid)
+
+        assert res["status"] == "success"
+        assert "portfolio" in res["quality_metrics"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,136 @@
+"""
+Address Index - Cache em memória dos candidatos de pt_addresses por CP4
+Cada CP4 é carregado uma vez (uma query pelo índice idx_cp4), com as ruas já
+normalizadas para o fuzzy matching, um sub-índice por concelho e as coordenadas
+em arrays compactos. LRU limitado ao número de CP4 em memória.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from rapidfuzz.utils import default_process
+
+from .sqlite_pool import connect
+
+CP4_CACHE_SIZE = int(os.getenv("GEOCODER_CP4_CACHE_SIZE", "2048"))
+
+
+def normalize_street(text) -> str:
+    """Lowercase, no punctuation, collapsed spaces (rapidfuzz default_process)."""
+    return default_process(str(text or ""))
+
+
+def normalize_concelho(text) -> str:
+    """Same normalization as the old UPPER(TRIM(cc_desig)) filter."""
+    return str(text or "").upper().strip()
+
+
+class CP4Candidates:
+    """All pt_addresses rows of one CP4, in compact form."""
+    __slots__ = ("cp4", "streets", "normalized", "lat", "lon", "_by_concelho", "_choices_by_concelho")
+
+    def __init__(self, cp4: str, rows):
+        self.cp4 = cp4
+        self.streets: List[str] = [r[0] for r in rows]
+        self.normalized: List[str] = [normalize_street(r[0]) for r in rows]
+        self.lat = np.fromiter((r[1] if r[1] is not None else np.nan for r in rows), dtype=np.float64, count=len(rows))
+        self.lon = np.fromiter((r[2] if r[2] is not None else np.nan for r in rows), dtype=np.float64, count=len(rows))
+
+        groups: Dict[str, List[int]] = {}
+        for i, r in enumerate(rows):
+            groups.setdefault(normalize_concelho(r[3]), []).append(i)
+        self._by_concelho = {k: np.asarray(v, dtype=np.int32) for k, v in groups.items()}
+        self._choices_by_concelho: Dict[str, List[str]] = {}
+
+    def __len__(self):
+        return len(self.streets)
+
+    def coords(self, row: int):
+        """(lat, lon) of a row; NULL coordinates (stored as NaN) come back as None."""
+        lat, lon = self.lat[row], self.lon[row]
+        return (None if np.isnan(lat) else float(lat)), (None if np.isnan(lon) else float(lon))
+
+    def candidate_rows(self, concelho: Optional[str] = None) -> np.ndarray:
+        """
+        Row positions for a lookup: the strict CP4 + concelho subset, or the
+        whole CP4 when no concelho is given or the strict subset is empty.
+        """
+        if concelho:
+            rows = self._by_concelho.get(normalize_concelho(concelho))
+            if rows is not None and len(rows):
+                return rows
+        return np.arange(len(self.streets), dtype=np.int32)
+
+    def choices(self, concelho: Optional[str] = None) -> List[str]:
+        """Normalized street strings matching candidate_rows(concelho)."""
+        key = normalize_concelho(concelho) if concelho else ""
+        if key not in self._by_concelho:
+            return self.normalized
+        cached = self._choices_by_concelho.get(key)
+        if cached is None:
+            cached = [self.normalized[i] for i in self._by_concelho[key]]
+            self._choices_by_concelho[key] = cached
+        return cached
+
+
+class CP4Index:
+    """Lazily loaded, LRU-bounded CP4 -> CP4Candidates map for one geocoding DB."""
+
+    def __init__(self, db_path: str, max_entries: int = CP4_CACHE_SIZE):
+        self.db_path = db_path
+        self.max_entries = max(1, int(max_entries))
+        self._entries: "OrderedDict[str, CP4Candidates]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cp4: str) -> CP4Candidates:
+        with self._lock:
+            entry = self._entries.get(cp4)
+            if entry is not None:
+                self._entries.move_to_end(cp4)
+                self.hits += 1
+                return entry
+
+        entry = CP4Candidates(cp4, self._load(cp4))
+        with self._lock:
+            self.misses += 1
+            self._entries[cp4] = entry
+            self._entries.move_to_end(cp4)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, cp4: Optional[str] = None):
+        """Drops one CP4 (after learning new addresses) or the whole index."""
+        with self._lock:
+            if cp4 is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(cp4).split('-')[0].strip(), None)
+
+    def _load(self, cp4: str):
+        conn = connect(self.db_path, readonly=True)
+        try:
+            return conn.execute(
+                "SELECT full_street, LATITUDE, LONGITUDE, cc_desig FROM pt_addresses WHERE CP4 = ?", (cp4,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+
+_indexes: Dict[str, CP4Index] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_cp4_index(db_path: str) -> CP4Index:
+    """One shared index per database file, reused across geocoder instances."""
+    key = os.path.abspath(db_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = CP4Index(db_path)
+            _indexes[key] = index
+        return index
@@ -0,0 +1,376 @@
+"""
+Decomposition - Divisão de instâncias grandes em subproblemas
+Os clientes são separados por armazém (client_warehouses / vehicle_warehouses) e,
+dentro de cada armazém, em setores angulares à volta do armazém (ou, sem
+coordenadas, em grupos à volta de sementes far-first na matriz). A frota de cada
+armazém é repartida pelos setores na proporção da procura. Depois de resolvidos os
+subproblemas, repair_boundaries() insere os clientes que ficaram por distribuir e
+move clientes de fronteira para a rota vizinha quando isso encurta a solução.
+"""
+import math
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .local_search import improve_route
+
+# Above this many clients a single OR-Tools model is split (optimization_params decompose="auto")
+DECOMPOSE_MIN_CLIENTS = int(os.getenv("SOLVER_DECOMPOSE_MIN_CLIENTS", "1500"))
+SECTOR_MAX_CLIENTS = int(os.getenv("SOLVER_SECTOR_MAX_CLIENTS", "400"))
+BOUNDARY_NEIGHBORS = 8
+SERVICE_TIME_MIN = 15.0
+
+
+class Subproblem(NamedTuple):
+    name: str
+    vehicles: List[int]
+    clients: List[int]
+
+
+def _wh_key(name) -> Optional[str]:
+    """Same 'no warehouse' values as the OR-Tools warehouse restriction."""
+    if name is None:
+        return None
+    key = str(name).strip()
+    if key.upper() in ("", "N/A", "NONE", "NAN"):
+        return None
+    return key.lower()
+
+
+def _balanced_cuts(order: Sequence[int], weights: np.ndarray, k: int) -> List[List[int]]:
+    """Splits an ordered client list into k consecutive chunks of similar total weight."""
+    cum = np.cumsum(weights)
+    bounds = np.searchsorted(cum, cum[-1] * np.arange(1, k) / k, side="right")
+    chunks = [list(c) for c in np.split(np.asarray(order), bounds)]
+    return [c for c in chunks if c]
+
+
+def _angular_sectors(clients: List[int], depot: int, locations, weights: np.ndarray, k: int) -> List[List[int]]:
+    d_lat, d_lon = locations[depot]
+    angles = np.array([
+        math.atan2(locations[c][0] - d_lat, (locations[c][1] - d_lon) * math.cos(math.radians(d_lat)))
+        for c in clients
+    ])
+    order = np.argsort(angles, kind="stable")
+    # Start right after the widest empty wedge so no dense area is cut in two there
+    gaps = np.diff(np.r_[angles[order], angles[order][0] + 2 * math.pi])
+    order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+    return _balanced_cuts([clients[i] for i in order], weights[order], k)
+
+
+def _seed_clusters(clients: List[int], depot: int, dist: np.ndarray, k: int) -> List[List[int]]:
+    """Farthest-point seeds on the matrix, every client joins its closest seed."""
+    idx = np.asarray(clients)
+    seeds = [int(idx[np.argmax(dist[depot, idx])])]
+    nearest = dist[seeds[0], idx].copy()
+    while len(seeds) < k:
+        seeds.append(int(idx[np.argmax(nearest)]))
+        np.minimum(nearest, dist[seeds[-1], idx], out=nearest)
+    owner = np.argmin(dist[np.ix_(seeds, idx)], axis=0)
+    return [c for c in (idx[owner == s].tolist() for s in range(k)) if c]
+
+
+def split_instance(
+    dist: np.ndarray,
+    demands: Sequence[float],
+    vehicle_capacities: Sequence[float],
+    depot_indices: Sequence[int],
+    num_warehouses: int,
+    client_warehouses: Optional[Sequence[str]] = None,
+    vehicle_warehouses: Optional[Sequence[str]] = None,
+    locations: Optional[Sequence[Tuple[float, float]]] = None,
+    max_clients: int = SECTOR_MAX_CLIENTS,
+) -> List[Subproblem]:
+    """
+    Warehouse groups first, then sectors of at most ~max_clients clients.
+    Every vehicle and every client ends up in exactly one subproblem.
+    """
+    num_locations = dist.shape[0]
+    groups: Dict[str, List[int]] = {}
+    for v in range(len(vehicle_capacities)):
+        key = _wh_key(vehicle_warehouses[v]) if vehicle_warehouses and v < len(vehicle_warehouses) else None
+        groups.setdefault(key or f"depot:{depot_indices[v]}", []).append(v)
+    if not groups:
+        return []
+    group_depot = {g: int(depot_indices[vs[0]]) for g, vs in groups.items()}
+    group_names = list(groups)
+    depots_arr = np.array([group_depot[g] for g in group_names])
+
+    members: Dict[str, List[int]] = {g: [] for g in group_names}
+    for c in range(num_warehouses, num_locations):
+        c_idx = c - num_warehouses
+        key = _wh_key(client_warehouses[c_idx]) if client_warehouses and c_idx < len(client_warehouses) else None
+        if key not in members:
+            # No (known) warehouse: the closest group's depot
+            key = group_names[int(np.argmin(dist[depots_arr, c]))]
+        members[key].append(c)
+
+    demand_arr = np.zeros(num_locations)
+    n = min(len(demands), num_locations)
+    demand_arr[:n] = np.asarray(demands[:n], dtype=np.float64)
+
+    subproblems = []
+    for g in group_names:
+        clients, vehicles = members[g], groups[g]
+        k = min(max(1, math.ceil(len(clients) / max(1, max_clients))), len(vehicles))
+        if k <= 1 or not clients:
+            subproblems.append(Subproblem(g, list(vehicles), clients))
+            continue
+        weights = demand_arr[clients] + 1e-6
+        depot = group_depot[g]
+        if locations is not None and len(locations) == num_locations:
+            sectors = _angular_sectors(clients, depot, locations, weights, k)
+        else:
+            sectors = _seed_clusters(clients, depot, dist, k)
+
+        # One vehicle per sector (largest to the busiest), the rest where capacity lags demand most
+        sector_demand = np.array([demand_arr[s].sum() for s in sectors])
+        assigned_cap = np.zeros(len(sectors))
+        fleet = {s: [] for s in range(len(sectors))}
+        by_cap = sorted(vehicles, key=lambda v: -float(vehicle_capacities[v]))
+        for s, v in zip(np.argsort(-sector_demand, kind="stable"), by_cap):
+            fleet[int(s)].append(v)
+            assigned_cap[s] += float(vehicle_capacities[v])
+        for v in by_cap[len(sectors):]:
+            s = int(np.argmax(sector_demand - assigned_cap))
+            fleet[s].append(v)
+            assigned_cap[s] += float(vehicle_capacities[v])
+        for s, sector in enumerate(sectors):
+            subproblems.append(Subproblem(f"{g}#{s + 1}", fleet[s], sector))
+    return subproblems
+
+
+def subproblem_inputs(sub: Subproblem, dist: np.ndarray, problem: Dict[str, Any]) -> Tuple[List[int], Dict[str, Any]]:
+    """
+    Local optimize_routes() arguments for one subproblem and the local -> global
+    node map (its depots first, then its clients).
+    """
+    num_warehouses = problem["num_warehouses"]
+    depots = list(dict.fromkeys(int(problem["depot_indices"][v]) for v in sub.vehicles))
+    nodes = depots + list(sub.clients)
+    local_depot = {d: k for k, d in enumerate(depots)}
+
+    def per_node(values):
+        if values is None:
+            return None
+        return [float(values[n]) if n < len(values) else 0.0 for n in nodes]
+
+    def per_client(values):
+        if not values:
+            return None
+        return [values[c - num_warehouses] if c - num_warehouses < len(values) else None for c in sub.clients]
+
+    def per_vehicle(values):
+        if not values:
+            return None
+        return [values[v] for v in sub.vehicles]
+
+    windows = per_client(problem.get("client_time_windows"))
+    if windows is not None:
+        windows = [w if w is not None else (0, 1440) for w in windows]
+    return nodes, dict(
+        distance_matrix=dist[np.ix_(nodes, nodes)],
+        demands=per_node(problem["demands"]),
+        vehicle_capacities=per_vehicle(problem["vehicle_capacities"]),
+        depot_indices=[local_depot[int(problem["depot_indices"][v])] for v in sub.vehicles],
+        volume_demands=per_node(problem.get("volume_demands")),
+        vehicle_volume_capacities=per_vehicle(problem.get("vehicle_volume_capacities")),
+        client_warehouses=per_client(problem.get("client_warehouses")),
+        vehicle_warehouses=per_vehicle(problem.get("vehicle_warehouses")),
+        num_warehouses=len(depots),
+        vehicle_start_times=per_vehicle(problem.get("vehicle_start_times")),
+        vehicle_end_times=per_vehicle(problem.get("vehicle_end_times")),
+        client_time_windows=windows,
+        vehicle_speeds=per_vehicle(problem.get("vehicle_speeds")),
+    )
+
+
+def warehouse_eligibility(
+    client_warehouses: Optional[Sequence[str]], vehicle_warehouses: Optional[Sequence[str]], num_warehouses: int
+) -> Callable[[int, int], bool]:
+    """
+    eligible(node, vehicle) with the OR-Tools rule: a client tied to a warehouse
+    that has vehicles may only go on those vehicles.
+    """
+    vehicle_keys = [_wh_key(w) for w in vehicle_warehouses] if vehicle_warehouses else []
+    known = set(vehicle_keys)
+
+    def eligible(c: int, v: int) -> bool:
+        c_idx = c - num_warehouses
+        key = _wh_key(client_warehouses[c_idx]) if client_warehouses and c_idx < len(client_warehouses) else None
+        return key is None or key not in known or vehicle_keys[v] == key
+
+    return eligible
+
+
+class _RouteTimes:
+    """
+    Schedule check for inter-route moves (same rules as local_search): a stop
+    already late in the sub-solutions may not get later; new stops must meet
+    their window; the return to the depot may not pass the shift end (+15 min).
+    """
+
+    def __init__(self, dist, depots, starts, ends, speeds, windows, num_warehouses):
+        self.dist = dist
+        self.depots, self.starts, self.ends, self.speeds = depots, starts, ends, speeds
+        self.windows = windows
+        self.num_warehouses = num_warehouses
+        self.limit: Dict[int, float] = {}
+        self.end_limit: Dict[int, float] = {}
+
+    def window(self, c: int) -> Tuple[float, float]:
+        c_idx = c - self.num_warehouses
+        if self.windows and 0 <= c_idx < len(self.windows):
+            return self.windows[c_idx]
+        return (0, 1440)
+
+    def schedule(self, v: int, route: Sequence[int]) -> Tuple[List[float], float]:
+        factor = 60.0 / self.speeds[v]
+        t, prev, begin = float(self.starts[v]), self.depots[v], []
+        for c in route:
+            t = max(t + self.dist[prev, c] * factor, self.window(c)[0])
+            begin.append(t)
+            t += SERVICE_TIME_MIN
+            prev = c
+        return begin, t + self.dist[prev, self.depots[v]] * factor
+
+    def freeze(self, v: int, route: Sequence[int]):
+        begin, end = self.schedule(v, route)
+        for c, t in zip(route, begin):
+            self.limit[c] = max(self.window(c)[1], t)
+        self.end_limit[v] = max(self.ends[v] + 15.0, end)
+
+    def feasible(self, v: int, route: Sequence[int]) -> bool:
+        begin, end = self.schedule(v, route)
+        if end > self.end_limit.get(v, self.ends[v] + 15.0) + 1e-9:
+            return False
+        return all(t <= self.limit.get(c, self.window(c)[1]) + 1e-9 for c, t in zip(route, begin))
+
+
+def repair_boundaries(
+    dist: np.ndarray,
+    routes: Dict[int, List[int]],
+    dropped: List[int],
+    sector_of: Dict[int, int],
+    problem: Dict[str, Any],
+    eligible: Callable[[int, int], bool],
+    neighbors: int = BOUNDARY_NEIGHBORS,
+) -> Dict[str, int]:
+    """
+    Joins the sub-solutions in place: inserts dropped clients where it is
+    cheapest, relocates boundary clients (those with a close neighbour in another
+    sector) to a neighbouring route when that is shorter, then re-sequences the
+    changed routes with the local search. Capacity, warehouse eligibility and the
+    schedule rules of _RouteTimes are kept.
+    """
+    num_warehouses = problem["num_warehouses"]
+    num_vehicles = len(problem["vehicle_capacities"])
+    demands = problem["demands"]
+    vol = problem.get("volume_demands")
+    kg_of = lambda c: float(demands[c]) if c < len(demands) else 0.0
+    vol_of = lambda c: float(vol[c]) if vol and c < len(vol) else 0.0
+    caps = [float(x) for x in problem["vehicle_capacities"]]
+    vol_caps = [float(x) for x in problem["vehicle_volume_capacities"]] if problem.get("vehicle_volume_capacities") else [math.inf] * num_vehicles
+    starts = problem.get("vehicle_start_times") or [590] * num_vehicles
+    ends = problem.get("vehicle_end_times") or [1080] * num_vehicles
+    speeds = [
+        float(s) if s else 45.0
+        for s in (problem.get("vehicle_speeds") or [45.0] * num_vehicles)
+    ]
+    depots = [int(d) for d in problem["depot_indices"]]
+    times = _RouteTimes(dist, depots, starts, ends, speeds, problem.get("client_time_windows"), num_warehouses)
+    for v, route in routes.items():
+        times.freeze(v, route)
+
+    route_of = {c: v for v, route in routes.items() for c in route}
+    kg = {v: sum(kg_of(c) for c in r) for v, r in routes.items()}
+    m3 = {v: sum(vol_of(c) for c in r) for v, r in routes.items()}
+    changed = set()
+
+    clients = np.arange(num_warehouses, dist.shape[0])
+    k = min(neighbors, max(1, len(clients) - 1))
+
+    def near(c: int) -> List[int]:
+        row = dist[c, clients].copy()
+        row[c - num_warehouses] = np.inf
+        idx = np.argpartition(row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+        return [int(clients[i]) for i in idx[np.argsort(row[idx])]]
+
+    def best_insertion(c: int, v: int) -> Tuple[float, int]:
+        route = routes[v]
+        path = [depots[v]] + route + [depots[v]]
+        costs = dist[path[:-1], c] + dist[c, path[1:]] - dist[path[:-1], path[1:]]
+        for pos in np.argsort(costs, kind="stable")[:3]:
+            cand = route[:pos] + [c] + route[pos:]
+            if times.feasible(v, cand):
+                return float(costs[pos]), int(pos)
+        return math.inf, -1
+
+    def fits(c: int, v: int) -> bool:
+        return eligible(c, v) and kg[v] + kg_of(c) <= caps[v] + 1e-9 and m3[v] + vol_of(c) <= vol_caps[v] + 1e-9
+
+    def move(c: int, v: int, pos: int):
+        old = route_of.get(c)
+        if old is not None:
+            routes[old].remove(c)
+            kg[old] -= kg_of(c)
+            m3[old] -= vol_of(c)
+            changed.add(old)
+        routes[v].insert(pos, c)
+        kg[v] += kg_of(c)
+        m3[v] += vol_of(c)
+        route_of[c] = v
+        changed.add(v)
+
+    stats = {"inserted": 0, "relocated": 0}
+
+    # 1. Dropped clients: cheapest feasible insertion in a route that serves one of its
+    #    neighbours, or in any other route when none of those can take it
+    for c in sorted(dropped, key=lambda c: -kg_of(c)):
+        near_routes = {route_of[n] for n in near(c) if n in route_of}
+        best = (math.inf, -1, -1)
+        for cand_routes in (near_routes, set(routes) - near_routes):
+            for v in cand_routes:
+                if fits(c, v):
+                    cost, pos = best_insertion(c, v)
+                    if cost < best[0]:
+                        best = (cost, v, pos)
+            if best[1] >= 0:
+                break
+        if best[1] >= 0:
+            move(c, best[1], best[2])
+            dropped.remove(c)
+            stats["inserted"] += 1
+
+    # 2. Boundary clients: relocate across sectors when removal saves more than insertion costs
+    for c in list(route_of):
+        nbrs = near(c)
+        if all(sector_of.get(n) == sector_of.get(c) for n in nbrs):
+            continue
+        v_from = route_of[c]
+        route = routes[v_from]
+        i = route.index(c)
+        prev = route[i - 1] if i > 0 else depots[v_from]
+        nxt = route[i + 1] if i + 1 < len(route) else depots[v_from]
+        gain = dist[prev, c] + dist[c, nxt] - dist[prev, nxt]
+        best = (gain - 1e-6, -1, -1)
+        for v in {route_of[n] for n in nbrs if n in route_of} - {v_from}:
+            if fits(c, v):
+                cost, pos = best_insertion(c, v)
+                if cost < best[0]:
+                    best = (cost, v, pos)
+        if best[1] >= 0:
+            move(c, best[1], best[2])
+            stats["relocated"] += 1
+
+    # 3. Re-sequence every route that changed
+    for v in changed:
+        if len(routes[v]) > 1:
+            routes[v] = improve_route(
+                dist, routes[v], depots[v],
+                windows=[times.window(c) for c in routes[v]], service=SERVICE_TIME_MIN, speed_kmh=speeds[v],
+                start_time=starts[v], end_time=ends[v] + 15.0
+            ).route
+    stats["changed_routes"] = len(changed)
+    return stats
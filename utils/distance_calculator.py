@@ -1,59 +1,143 @@
 import numpy as np
 
+# Radius of earth in kilometers
+EARTH_RADIUS_KM = 6371.0
+
+# Tile edge used when building matrices block by block. A 1024x1024 float64
+# tile is ~8 MB of scratch memory regardless of how many points are given.
+DEFAULT_BLOCK_SIZE = 1024
+
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
-    Calculate the great circle distance between two points 
+    Calculate the great circle distance between two points
     on the earth (specified in decimal degrees).
     Returns distance in kilometers.
     """
     # Convert decimal degrees to radians
     lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-    
+
     # Haversine formula
     dlat = lat2 - lat1
     dlon = lon2 - lon1
     a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
     c = 2 * np.arcsin(np.sqrt(a))
-    
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
 
-def calculate_haversine_matrix(locations):
+    return c * EARTH_RADIUS_KM
+
+
+def _as_coord_array(locations):
+    """Converts a list of (lat, lon) tuples into an (n, 2) float64 array."""
+    arr = np.asarray(locations, dtype=np.float64)
+    if arr.size == 0:
+        return arr.reshape(0, 2)
+    return arr.reshape(-1, 2)
+
+
+def _haversine_block(lat_a, lon_a, cos_a, lat_b, lon_b, cos_b):
+    """
+    Broadcast haversine between two groups of points already in radians.
+    Returns a (len(a), len(b)) float64 block in kilometers.
+    """
+    dlat = lat_b[None, :] - lat_a[:, None]
+    dlon = lon_b[None, :] - lon_a[:, None]
+    a = np.sin(dlat * 0.5) ** 2 + cos_a[:, None] * cos_b[None, :] * np.sin(dlon * 0.5) ** 2
+    np.clip(a, 0.0, 1.0, out=a)
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _euclidean_block(pts_a, pts_b):
+    """Broadcast euclidean distance (in degrees) between two groups of points."""
+    diff_lat = pts_a[:, 0][:, None] - pts_b[:, 0][None, :]
+    diff_lon = pts_a[:, 1][:, None] - pts_b[:, 1][None, :]
+    return np.sqrt(diff_lat * diff_lat + diff_lon * diff_lon)
+
+
+def _tile_ranges(n, block_size):
+    block_size = max(1, int(block_size or DEFAULT_BLOCK_SIZE))
+    return [(s, min(s + block_size, n)) for s in range(0, n, block_size)]
+
+
+def iter_haversine_tiles(locations, block_size=DEFAULT_BLOCK_SIZE, symmetric=True):
+    """
+    Yields (row_start, col_start, block) tiles of the haversine matrix.
+
+    With symmetric=True only tiles on or above the diagonal are produced
+    (the lower half is the transpose). Useful to stream very large matrices
+    into a memmap or a cache without holding the full n x n array.
+    """
+    coords = _as_coord_array(locations)
+    rad = np.radians(coords)
+    lat, lon = rad[:, 0], rad[:, 1]
+    cos_lat = np.cos(lat)
+    ranges = _tile_ranges(len(coords), block_size)
+
+    for bi, (i0, i1) in enumerate(ranges):
+        col_ranges = ranges[bi:] if symmetric else ranges
+        for j0, j1 in col_ranges:
+            block = _haversine_block(
+                lat[i0:i1], lon[i0:i1], cos_lat[i0:i1],
+                lat[j0:j1], lon[j0:j1], cos_lat[j0:j1]
+            )
+            yield i0, j0, block
+
+
+def _fill_symmetric(out, tiles):
+    for i0, j0, block in tiles:
+        i1 = i0 + block.shape[0]
+        j1 = j0 + block.shape[1]
+        out[i0:i1, j0:j1] = block
+        if i0 != j0:
+            out[j0:j1, i0:i1] = block.T
+    np.fill_diagonal(out, 0.0)
+    return out
+
+
+def calculate_haversine_matrix(locations, dtype=np.float64, block_size=DEFAULT_BLOCK_SIZE, out=None):
     """
     Calculate distance matrix using Haversine formula.
-    
+
     Args:
         locations: List of (lat, lon) tuples
-        
+        dtype: Output dtype (np.float32 halves memory for very large n)
+        block_size: Tile edge; only tiles on/above the diagonal are computed
+            and mirrored, so scratch memory stays at block_size^2
+        out: Optional preallocated (n, n) array or np.memmap to fill in place
+
     Returns:
         2D numpy array with distances in kilometers
     """
     n = len(locations)
-    matrix = np.zeros((n, n))
-    
-    for i in range(n):
-        for j in range(n):
-            if i != j:
-                matrix[i][j] = haversine_distance(
-                    locations[i][0], locations[i][1],
-                    locations[j][0], locations[j][1]
-                )
-    
-    return matrix
-
-def calculate_euclidean_matrix(locations):
+    if out is None:
+        out = np.zeros((n, n), dtype=dtype)
+    elif out.shape != (n, n):
+        raise ValueError(f"out has shape {out.shape}, expected {(n, n)}")
+
+    if n == 0:
+        return out
+
+    return _fill_symmetric(out, iter_haversine_tiles(locations, block_size, symmetric=True))
+
+
+def calculate_euclidean_matrix(locations, dtype=np.float64, block_size=DEFAULT_BLOCK_SIZE, out=None):
     """
     Calculate distance matrix using Euclidean distance (current method).
     Returns in degrees (for backward compatibility).
     """
-    loc_array = np.array(locations)
-    n = len(locations)
-    matrix = np.zeros((n, n))
-    
-    for i in range(n):
-        for j in range(n):
-            matrix[i][j] = np.linalg.norm(loc_array[i] - loc_array[j])
-    
-    return matrix
+    coords = _as_coord_array(locations)
+    n = len(coords)
+    if out is None:
+        out = np.zeros((n, n), dtype=dtype)
+    elif out.shape != (n, n):
+        raise ValueError(f"out has shape {out.shape}, expected {(n, n)}")
+
+    if n == 0:
+        return out
+
+    ranges = _tile_ranges(n, block_size)
+    tiles = (
+        (i0, j0, _euclidean_block(coords[i0:i1], coords[j0:j1]))
+        for bi, (i0, i1) in enumerate(ranges)
+        for j0, j1 in ranges[bi:]
+    )
+    return _fill_symmetric(out, tiles)
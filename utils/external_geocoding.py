@@ -0,0 +1,128 @@
+"""
+External Geocoding - Fase assíncrona dos níveis lentos (scraper CP7, Nominatim, Google)
+Corre num event loop dedicado (thread daemon) partilhado pelo processo, para que
+os token buckets e a coalescência de pedidos idênticos em curso sejam globais.
+A fase local/rápida termina logo; esta fase preenche as lacunas em background.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .rate_limit import get_rate_limiter
+
+EXTERNAL_MAX_CONCURRENCY = int(os.getenv("GEOCODE_EXTERNAL_CONCURRENCY", "16"))
+
+# (address, cp4, concelho, local_result_or_None)
+ExternalItem = Tuple[str, Any, Any, Optional[Dict[str, Any]]]
+
+
+class ExternalGeocodingStage:
+    """
+    Runs WaterfallGeocoder.external_waterfall for many items concurrently.
+    Every provider call waits on its process-wide token bucket, and identical
+    (provider, args) calls already in flight are awaited instead of repeated.
+    """
+
+    def __init__(self, max_concurrency: int = EXTERNAL_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._inflight: Dict[Tuple[str, Tuple], asyncio.Future] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+        self.stats = {"provider_calls": 0, "coalesced": 0}
+
+    # ---------- public API ----------
+
+    def submit(self, geocoder, items: List[ExternalItem],
+               on_result: Optional[Callable[[int, Dict[str, Any], Optional[Dict[str, Any]]], None]] = None) -> Future:
+        """
+        Schedules items on the background loop and returns immediately.
+        on_result(position, result, learned) is called (from the loop thread)
+        as each item finishes; the returned Future resolves to the full list.
+        """
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.resolve_many(geocoder, items, on_result), self._loop)
+
+    async def resolve_many(self, geocoder, items: List[ExternalItem], on_result=None):
+        async def run(pos, item):
+            address, cp4, concelho, local = item
+            try:
+                result, learned = await self.resolve_one(geocoder, address, cp4, concelho, local)
+            except Exception as e:
+                print(f"[GEOCODING] Erro na fase externa para '{address}': {e}")
+                result, learned = local or {'quality_level': 8, 'source': 'FAILED', 'score': 0, 'lat': None, 'lon': None, 'address': None}, None
+            if on_result:
+                try:
+                    on_result(pos, result, learned)
+                except Exception as e:
+                    print(f"[GEOCODING] Erro ao gravar resultado externo: {e}")
+            return result, learned
+
+        return await asyncio.gather(*(run(pos, item) for pos, item in enumerate(items)))
+
+    async def resolve_one(self, geocoder, address, cp4, concelho, local_result=None):
+        steps = geocoder.external_waterfall(address, cp4, concelho, local_result)
+        try:
+            provider, args = next(steps)
+            while True:
+                value = await self._call(geocoder, provider, args)
+                provider, args = steps.send(value)
+        except StopIteration as done:
+            return done.value
+
+    # ---------- internals ----------
+
+    async def _call(self, geocoder, provider: str, args: Tuple):
+        key = (provider, tuple(str(a or "").strip().casefold() for a in args))
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            # Wait for the provider's own token before taking a shared slot, so a slow
+            # bucket (Nominatim at 1 QPS) does not hold slots other providers could use
+            await get_rate_limiter(provider).acquire()
+            async with self._get_semaphore():
+                self.stats["provider_calls"] += 1
+                value = await asyncio.to_thread(geocoder.call_provider, provider, args)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; avoid "exception never retrieved" noise
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            self._semaphore = None
+            self._thread = threading.Thread(target=self._loop.run_forever, name="geocode-external", daemon=True)
+            self._thread.start()
+
+
+_stage: Optional[ExternalGeocodingStage] = None
+_stage_lock = threading.Lock()
+
+
+def get_external_stage() -> ExternalGeocodingStage:
+    global _stage
+    with _stage_lock:
+        if _stage is None:
+            _stage = ExternalGeocodingStage()
+        return _stage
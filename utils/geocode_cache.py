@@ -0,0 +1,200 @@
+"""
+Geocode Cache - Cache persistente de resultados de geocodificação (geocoding.db)
+Chave = (morada, CP, concelho) normalizados. Guarda sucessos e falhas com TTL
+próprio, a fonte que produziu o resultado e o modo (fast/full). Correções
+manuais não expiram e substituem qualquer resultado anterior.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .sqlite_pool import connect
+
+GEOCODE_CACHE_TTL_OK_DAYS = float(os.getenv("GEOCODE_CACHE_TTL_OK_DAYS", "90"))
+GEOCODE_CACHE_TTL_FAIL_DAYS = float(os.getenv("GEOCODE_CACHE_TTL_FAIL_DAYS", "7"))
+
+# Expired rows are purged at most once per interval per database
+PURGE_INTERVAL_S = 3600.0
+
+# Quality at or below which a fast (local-only) result is also final for full mode
+FINAL_QUALITY = 2
+
+AddressKey = Tuple[str, str, str]
+
+_initialized: Dict[str, float] = {}
+_init_lock = threading.Lock()
+
+
+def address_key(address, cp, concelho) -> AddressKey:
+    """Dedupe key: whitespace-collapsed, case-folded (morada, CP, concelho)."""
+    def norm(value):
+        return re.sub(r"\s+", " ", str(value or "")).strip().casefold()
+    return norm(address), norm(cp), norm(concelho)
+
+
+def _key_str(key: AddressKey) -> str:
+    return "|".join(key)
+
+
+def _is_failure(result: Optional[Dict[str, Any]]) -> bool:
+    return not result or result.get("lat") is None or result.get("lon") is None
+
+
+class GeocodeResultCache:
+    """
+    Table geocode_cache(cache_key, morada, codigo_postal, concelho, result_json,
+    quality_level, source, status, mode, created_at, expires_at, hits).
+    status is 'ok', 'failed' or 'manual'; expires_at is NULL for manual fixes.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._ensure_table()
+
+    def _connect(self):
+        return connect(self.db_path, row_factory=sqlite3.Row)
+
+    def _ensure_table(self):
+        key = os.path.abspath(self.db_path)
+        with _init_lock:
+            last_purge = _initialized.get(key)
+            now = time.time()
+            if last_purge is not None and now - last_purge < PURGE_INTERVAL_S:
+                return
+            conn = self._connect()
+            try:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS geocode_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        morada TEXT,
+                        codigo_postal TEXT,
+                        concelho TEXT,
+                        result_json TEXT NOT NULL,
+                        quality_level INTEGER,
+                        source TEXT,
+                        status TEXT NOT NULL,
+                        mode TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL,
+                        hits INTEGER DEFAULT 0
+                    )
+                """)
+                conn.execute("DELETE FROM geocode_cache WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+                conn.commit()
+                _initialized[key] = now
+            finally:
+                conn.close()
+
+    # ---------- reads ----------
+
+    def get(self, address, cp, concelho, fast_mode: bool = False) -> Optional[Dict[str, Any]]:
+        return self.get_many([(address, cp, concelho)], fast_mode=fast_mode)[0]
+
+    def get_many(self, items: Iterable[Tuple[Any, Any, Any]], fast_mode: bool = False) -> List[Optional[Dict[str, Any]]]:
+        """
+        Cached results in input order (None = miss). A full-mode lookup only
+        accepts full-mode entries, manual fixes, or fast entries that were
+        already final (quality <= FINAL_QUALITY) since full mode would stop there too.
+        """
+        keys = [_key_str(address_key(*item)) for item in items]
+        if not keys:
+            return []
+        now = time.time()
+        found: Dict[str, sqlite3.Row] = {}
+        conn = self._connect()
+        try:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT * FROM geocode_cache WHERE cache_key IN ({','.join('?' * len(chunk))})"
+                    " AND (expires_at IS NULL OR expires_at >= ?)",
+                    (*chunk, now)
+                ).fetchall()
+                for row in rows:
+                    if fast_mode or row["mode"] == "full" or row["status"] == "manual" or \
+                            (row["status"] == "ok" and (row["quality_level"] or 99) <= FINAL_QUALITY):
+                        found[row["cache_key"]] = row
+            if found:
+                conn.executemany("UPDATE geocode_cache SET hits = hits + 1 WHERE cache_key = ?", [(k,) for k in found])
+                conn.commit()
+        finally:
+            conn.close()
+        return [json.loads(found[k]["result_json"]) if k in found else None for k in keys]
+
+    # ---------- writes ----------
+
+    def put(self, address, cp, concelho, result: Optional[Dict[str, Any]], fast_mode: bool = False):
+        self.put_many([((address, cp, concelho), result)], fast_mode=fast_mode)
+
+    def put_many(self, entries: Iterable[Tuple[Tuple[Any, Any, Any], Optional[Dict[str, Any]]]], fast_mode: bool = False):
+        """Stores resolver outcomes; never overwrites a manual fix."""
+        now = time.time()
+        rows = []
+        for (address, cp, concelho), result in entries:
+            failed = _is_failure(result)
+            ttl_days = GEOCODE_CACHE_TTL_FAIL_DAYS if failed else GEOCODE_CACHE_TTL_OK_DAYS
+            rows.append(self._row(address, cp, concelho, result or {}, "failed" if failed else "ok",
+                                  "fast" if fast_mode else "full", now, now + ttl_days * 86400))
+        if not rows:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany("""
+                INSERT INTO geocode_cache (cache_key, morada, codigo_postal, concelho, result_json, quality_level,
+                                           source, status, mode, created_at, expires_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    result_json = excluded.result_json, quality_level = excluded.quality_level,
+                    source = excluded.source, status = excluded.status, mode = excluded.mode,
+                    created_at = excluded.created_at, expires_at = excluded.expires_at
+                WHERE geocode_cache.status != 'manual'
+            """, rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def put_manual(self, address, cp, concelho, lat: float, lon: float, matched_address: Optional[str] = None):
+        """Manual correction: replaces any cached result and never expires."""
+        result = {
+            'lat': lat,
+            'lon': lon,
+            'address': matched_address or address,
+            'score': 100,
+            'quality_level': 1,
+            'source': 'CORRECAO_MANUAL',
+            'match_type': 'MANUAL'
+        }
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO geocode_cache (cache_key, morada, codigo_postal, concelho, result_json, quality_level,
+                                                      source, status, mode, created_at, expires_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+            """, self._row(address, cp, concelho, result, "manual", "full", time.time(), None))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def invalidate(self, address, cp, concelho):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM geocode_cache WHERE cache_key = ?", (_key_str(address_key(address, cp, concelho)),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row(address, cp, concelho, result, status, mode, created_at, expires_at):
+        return (
+            _key_str(address_key(address, cp, concelho)),
+            str(address or ""), str(cp or ""), str(concelho or ""),
+            json.dumps(result, default=str),
+            result.get('quality_level'),
+            result.get('source'),
+            status, mode, created_at, expires_at
+        )
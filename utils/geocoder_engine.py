@@ -8,6 +8,11 @@ from datetime import datetime
 from .validation import is_in_portugal, validate_cp4
 from .cp_scraper import scrape_cp_data
 from .cp_scraper import scrape_cp_data
+from .address_index import get_cp4_index, normalize_street, normalize_concelho
+from .geocode_cache import GeocodeResultCache
+from .rate_limit import get_rate_limiter
+from .sqlite_pool import connect
+import numpy as np
 import re
 import json
 import os
@@ -15,6 +20,10 @@ import os
 USAGE_FILE = 'config/usage.json'
 LOG_FILE = 'config/google_api_log.csv'
 
+# resolve_batch switches to a parallel rapidfuzz cdist above this many query x candidate pairs
+CDIST_MIN_CELLS = 20000
+CPU_COUNT = os.cpu_count() or 1
+
 class GoogleGeoHandler:
     def __init__(self, api_key):
         self.api_key = api_key
@@ -105,48 +114,170 @@ class GoogleGeoHandler:
             return None
 
 class WaterfallGeocoder:
-    def __init__(self, db_path, google_api_key=None):
+    def __init__(self, db_path, google_api_key=None, use_result_cache: bool = True):
         self.db_path = db_path
         self.google_api_key = google_api_key
         # self.gmaps = googlemaps.Client(key=google_api_key) if google_api_key else None
         self.google_handler = GoogleGeoHandler(google_api_key)
         self.nominatim = Nominatim(user_agent="antigravity_geo_app_v4")
+        self.cp4_index = get_cp4_index(db_path)
+        self.result_cache = None
+        if use_result_cache:
+            try:
+                self.result_cache = GeocodeResultCache(db_path)
+            except sqlite3.Error as e:
+                print(f"Geocode cache disabled: {e}")
 
     def _get_db_connection(self):
-        return sqlite3.connect(self.db_path)
+        return connect(self.db_path)
 
     def resolve_address(self, address, cp4=None, concelho=None, fast_mode: bool = False):
         """
         Main entry point for geocoding.
         Returns a tuple: (result_dict, learned_data_dict_or_None)
         """
-        result = None
-        learned_data = None
+        # Known answers (including known failures) from previous uploads
+        cached = self._cache_get([(address, cp4, concelho)], fast_mode)[0]
+        if cached is not None:
+            return cached, None
+        raw_address = address
         
         # 0. Smart Cleaning
         address = self._clean_address(address)
         
         # --- LEVEL 1: LOCAL DATABASE ---
         result = self._try_local(address, cp4, concelho)
-        
+        resolved = self._resolve_after_local(address, cp4, concelho, result, fast_mode)
+        self._cache_put([((raw_address, cp4, concelho), resolved[0])], fast_mode)
+        return resolved
+
+    def resolve_batch(self, items, fast_mode: bool = True):
+        """
+        Batch version of resolve_address for [(address, cp4, concelho), ...].
+        Addresses sharing a CP4/concelho candidate set are scored in one
+        rapidfuzz cdist call; quality levels are the same as _try_local.
+        Returns [(result_dict, learned_data_dict_or_None), ...] in input order.
+        """
+        items = list(items)
+        output = [(cached, None) if cached is not None else None for cached in self._cache_get(items, fast_mode)]
+        missing = [pos for pos, out in enumerate(output) if out is None]
+        if not missing:
+            return output
+
+        cleaned = [(self._clean_address(items[pos][0]), items[pos][1], items[pos][2]) for pos in missing]
+        local = self._try_local_batch(cleaned)
+        for pos, (address, cp4, concelho), result in zip(missing, cleaned, local):
+            output[pos] = self._resolve_after_local(address, cp4, concelho, result, fast_mode)
+
+        self._cache_put([(items[pos], output[pos][0]) for pos in missing], fast_mode)
+        return output
+
+    def _cache_get(self, items, fast_mode):
+        if self.result_cache is None:
+            return [None] * len(items)
+        try:
+            return self.result_cache.get_many(items, fast_mode=fast_mode)
+        except sqlite3.Error as e:
+            print(f"Geocode cache read error: {e}")
+            return [None] * len(items)
+
+    def _cache_put(self, entries, fast_mode):
+        if self.result_cache is None or not entries:
+            return
+        try:
+            self.result_cache.put_many(entries, fast_mode=fast_mode)
+        except sqlite3.Error as e:
+            print(f"Geocode cache write error: {e}")
+
+    def _try_local_batch(self, items):
+        results = [None] * len(items)
+        groups = {}
+        for pos, (address, cp4, concelho) in enumerate(items):
+            target_cp4 = str(cp4).split('-')[0].strip() if cp4 else None
+            if not (target_cp4 and validate_cp4(target_cp4)):
+                continue
+            groups.setdefault((target_cp4, normalize_concelho(concelho)), []).append(pos)
+
+        for (target_cp4, concelho), positions in groups.items():
+            entry = self.cp4_index.get(target_cp4)
+            if not len(entry):
+                continue
+            rows = entry.candidate_rows(concelho)
+            choices = entry.choices(concelho)
+
+            # Repeated addresses in a file are scored once
+            by_query = {}
+            for pos in positions:
+                by_query.setdefault(normalize_street(items[pos][0]), []).append(pos)
+            queries = list(by_query)
+
+            if CPU_COUNT > 1 and len(queries) * len(choices) >= CDIST_MIN_CELLS:
+                # float64 keeps threshold comparisons identical to extractOne
+                scores = process.cdist(queries, choices, scorer=fuzz.token_set_ratio, processor=None,
+                                       dtype=np.float64, workers=-1)
+                best_idx = scores.argmax(axis=1)
+                best = [(int(best_idx[k]), float(scores[k, best_idx[k]])) for k in range(len(queries))]
+            else:
+                # Single core / small group: extractOne prunes with its running score cutoff
+                best = []
+                for q in queries:
+                    _, score, idx = process.extractOne(q, choices, scorer=fuzz.token_set_ratio, processor=None)
+                    best.append((idx, score))
+
+            for q, (idx, score) in zip(queries, best):
+                for pos in by_query[q]:
+                    results[pos] = self._local_result(entry, int(rows[idx]), score)
+        return results
+
+    def _resolve_after_local(self, address, cp4, concelho, result, fast_mode):
+        """External levels (web scraper, Nominatim, Google) after the local lookup."""
         # If Local is perfect (Level 1 or 2), we stop here.
         if result and result['quality_level'] <= 2:
             return result, None
-            
+        
+        if fast_mode:
+            final_result = result if result else {'quality_level': 8, 'source': 'FAILED', 'score': 0, 'lat': None, 'lon': None, 'address': None}
+            return final_result, None
+
+        # Drive the waterfall synchronously, waiting on the shared per-provider rate limits
+        steps = self.external_waterfall(address, cp4, concelho, result)
+        try:
+            provider, args = next(steps)
+            while True:
+                get_rate_limiter(provider).acquire_sync()
+                provider, args = steps.send(self.call_provider(provider, args))
+        except StopIteration as done:
+            return done.value
+
+    def call_provider(self, provider, args):
+        """Unthrottled call to one external level; callers own the rate limiting."""
+        if provider == 'scraper':
+            return self._try_web_scraper(*args)
+        if provider == 'nominatim':
+            return self._query_nominatim(*args)
+        if provider == 'google':
+            return self._try_google(*args)
+        raise ValueError(f"Unknown geocoding provider: {provider}")
+
+    def external_waterfall(self, address, cp4, concelho, result):
+        """
+        Generator with the slow waterfall levels. Yields (provider, args) requests,
+        receives each provider's result via send() and finally returns
+        (result_dict, learned_data_dict_or_None). Shared by the sync path and
+        the asyncio stage in utils.external_geocoding.
+        """
+        learned_data = None
+        
         # Initialize best_result with what we have (even if None)
         best_result = result
         current_quality = result['quality_level'] if result else 8 # 8 is worst
         
-        if fast_mode:
-            final_result = best_result if best_result else {'quality_level': 8, 'source': 'FAILED', 'score': 0, 'lat': None, 'lon': None, 'address': None}
-            return final_result, learned_data
-        
         # --- LEVEL 1.5: WEB SCRAPER (CP7) ---
         # Try this if we have a full CP7 (xxxx-xxx) and local failed or is poor quality
         # This is slow, so we only do it if we really have a CP7 candidate
         if current_quality > 2 and cp4 and re.match(r'^\d{4}-\d{3}$', str(cp4)):
             cp4_part, cp3_part = str(cp4).split('-')
-            result_web = self._try_web_scraper(cp4_part, cp3_part)
+            result_web = yield 'scraper', (cp4_part, cp3_part)
             
             if result_web:
                 web_quality = result_web['quality_level']
@@ -164,7 +295,7 @@ class WaterfallGeocoder:
         # --- LEVEL 2: OPENSTREETMAP (OSM) ---
         # Only try if current quality is not good enough (e.g. > 2)
         if current_quality > 2:
-            result_osm = self._try_nominatim(address, cp4, concelho)
+            result_osm = yield 'nominatim', (address, cp4, concelho)
             
             if result_osm:
                 osm_quality = result_osm['quality_level']
@@ -183,7 +314,7 @@ class WaterfallGeocoder:
         # --- LEVEL 3: GOOGLE MAPS ---
         # Only try if we still don't have a good result (e.g. > 2) AND we have a key
         if self.google_handler.client and current_quality > 2:
-            result_google = self._try_google(address, cp4, concelho)
+            result_google = yield 'google', (address, cp4, concelho)
             
             if result_google:
                 google_quality = result_google['quality_level']
@@ -235,6 +366,8 @@ class WaterfallGeocoder:
             
             cursor.executemany(query, data_to_insert)
             conn.commit()
+            for row in data_to_insert:
+                self.cp4_index.invalidate(row[3])
             print(f"Batch saved {len(learned_list)} new addresses.")
         except Exception as e:
             conn.rollback()
@@ -243,87 +376,60 @@ class WaterfallGeocoder:
             conn.close()
 
     def _try_local(self, address, cp4, concelho):
-        conn = self._get_db_connection()
-        cursor = conn.cursor()
-        
-        candidates = []
-        
-        # Strategy: Filter by CP4 first (very fast)
-        # Strategy: Filter by CP4 first (very fast)
-        # Extract clean CP4 from potentially full CP7 for DB lookup
+        # Extract clean CP4 from potentially full CP7 for lookup
         target_cp4 = str(cp4).split('-')[0].strip() if cp4 else None
-        
-        if target_cp4 and validate_cp4(target_cp4):
-            # 1. Try Strict Match (CP4 + Concelho)
-            query = "SELECT full_street, LATITUDE, LONGITUDE, CP4, quality_score FROM pt_addresses WHERE CP4 = ?"
-            params = [target_cp4]
-            
-            if concelho:
-                # Use LIKE for case-insensitivity and % for trailing spaces
-                # Or better: UPPER(TRIM(cc_desig))
-                query_strict = query + " AND UPPER(TRIM(cc_desig)) = ?"
-                params_strict = params + [concelho.upper().strip()]
-                
-                cursor.execute(query_strict, params_strict)
-                candidates = cursor.fetchall()
-                
-                # FALLBACK: If strict match fails, try ignoring Concelho (trust CP4)
-                if not candidates:
-                    # print(f"Strict match failed for {concelho}. Retrying with CP4 only...")
-                    cursor.execute(query, params)
-                    candidates = cursor.fetchall()
-            else:
-                cursor.execute(query, params)
-                candidates = cursor.fetchall()
-            
-        if not candidates:
-            conn.close()
+        if not (target_cp4 and validate_cp4(target_cp4)):
             return None
 
-        # Fuzzy Match
-        choices = [c[0] for c in candidates]
-        match = process.extractOne(address, choices, scorer=fuzz.token_set_ratio)
-        
-        conn.close()
-        
-        if match:
-            best_address, score, idx = match
-            row = candidates[idx]
-            
-            # Determine Quality Level (1-8 Scale)
-            quality = 8 # Default Fail
-            
-            if score >= 95: quality = 1
-            elif score >= 85: quality = 2
-            elif score >= 70: quality = 4 # CP4 level confidence
-            elif score >= 50: quality = 5 # Locality/Approx
-            else: quality = 8
-            
-            if quality == 8: 
-                # FALLBACK: We found the CP4, so even if the street name doesn't match well,
-                # we can return a Level 4 (CP4 Centroid/Approx) result.
-                return {
-                    'lat': row[1],
-                    'lon': row[2],
-                    'address': row[0], # Return the DB address as reference
-                    'score': score,
-                    'quality_level': 4, # Force Level 4 because CP4 is valid
-                    'source': 'LOCAL',
-                    'match_type': 'CP4_FALLBACK'
-                }
-            
-            return {
-                'lat': row[1],
-                'lon': row[2],
-                'address': row[0],
-                'score': score,
-                'quality_level': quality,
-                'source': 'LOCAL',
-                'match_type': 'FUZZY'
-            }
-        return None
+        # Candidates come from the in-memory CP4 index: strict CP4 + Concelho,
+        # falling back to CP4 only (trust CP4) when the strict subset is empty
+        entry = self.cp4_index.get(target_cp4)
+        if not len(entry):
+            return None
+        rows = entry.candidate_rows(concelho)
+        choices = entry.choices(concelho)
+
+        # Fuzzy Match (street strings are pre-normalized in the index)
+        match = process.extractOne(normalize_street(address), choices, scorer=fuzz.token_set_ratio, processor=None)
+        if not match:
+            return None
+
+        _, score, idx = match
+        return self._local_result(entry, int(rows[idx]), score)
+
+    @staticmethod
+    def _local_result(entry, row, score):
+        """Builds the LOCAL result for candidate `row` of a CP4 entry given its fuzzy score."""
+        # Determine Quality Level (1-8 Scale)
+        if score >= 95: quality = 1
+        elif score >= 85: quality = 2
+        elif score >= 70: quality = 4 # CP4 level confidence
+        elif score >= 50: quality = 5 # Locality/Approx
+        else: quality = 8
+
+        lat, lon = entry.coords(row)
+        result = {
+            'lat': lat,
+            'lon': lon,
+            'address': entry.streets[row], # Return the DB address as reference
+            'score': score,
+            'quality_level': quality,
+            'source': 'LOCAL',
+            'match_type': 'FUZZY'
+        }
+        if quality == 8:
+            # FALLBACK: We found the CP4, so even if the street name doesn't match well,
+            # we can return a Level 4 (CP4 Centroid/Approx) result.
+            result['quality_level'] = 4
+            result['match_type'] = 'CP4_FALLBACK'
+        return result
 
     def _try_nominatim(self, address, cp4, concelho):
+        # Global 1 req/s limit shared with every other caller in the process
+        get_rate_limiter('nominatim').acquire_sync()
+        return self._query_nominatim(address, cp4, concelho)
+
+    def _query_nominatim(self, address, cp4, concelho):
         try:
             # Structured search is WAY more accurate in Nominatim to prevent "drifting" to other cities.
             query = {
@@ -362,7 +468,6 @@ class WaterfallGeocoder:
                     'source': 'OSM',
                     'match_type': raw.get('type', 'unknown')
                 }
-            time.sleep(1.1) # Respect rate limit
         except Exception as e:
             print(f"Nominatim error: {e}")
         return None
@@ -443,6 +548,7 @@ class WaterfallGeocoder:
                 )
             )
             conn.commit()
+            self.cp4_index.invalidate(str(cp4).split('-')[0] if cp4 else '')
             print(f"Learned new address: {result['address']} from {result['source']}")
         except Exception as e:
             print(f"Error saving to DB: {e}")
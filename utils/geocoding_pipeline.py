@@ -0,0 +1,102 @@
+"""
+Geocoding Pipeline - Geocodificação em lote
+Agrupa linhas com a mesma (morada, CP, concelho), resolve apenas as chaves
+únicas num pool de workers e entrega os resultados por chunks para escrita
+transacional (executemany) e relatório de progresso.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .geocode_cache import AddressKey, address_key
+
+GEOCODE_CHUNK_SIZE = int(os.getenv("GEOCODE_CHUNK_SIZE", "500"))
+GEOCODE_MAX_WORKERS = int(os.getenv("GEOCODE_MAX_WORKERS", "8"))
+
+FAILED_RESULT = {'quality_level': 8, 'source': 'FAILED', 'score': 0, 'lat': None, 'lon': None, 'address': None}
+
+
+def resolve_unique(geocoder, requests: Dict[AddressKey, Tuple[str, str, str]], max_workers: int = GEOCODE_MAX_WORKERS,
+                   fast_mode: bool = True) -> Dict[AddressKey, Dict[str, Any]]:
+    """
+    Resolves each unique key once. `requests` maps key -> original (address, cp, concelho)
+    as first seen in the file. A failing lookup yields FAILED_RESULT instead of raising.
+    """
+    def resolve(item):
+        key, (address, cp, concelho) = item
+        try:
+            res = geocoder.resolve_address(address, cp, concelho, fast_mode=fast_mode)
+            if isinstance(res, tuple):
+                res = res[0]
+        except Exception as e:
+            print(f"[GEOCODING] Erro ao resolver '{address}': {e}")
+            res = None
+        return key, res or dict(FAILED_RESULT)
+
+    items = list(requests.items())
+    if not items:
+        return {}
+
+    if fast_mode and hasattr(geocoder, "resolve_batch"):
+        # Local-only lookups: one vectorized fuzzy match per CP4 instead of a thread per address
+        try:
+            batch = geocoder.resolve_batch([addr for _, addr in items], fast_mode=True)
+            return {key: (res[0] if isinstance(res, tuple) else res) or dict(FAILED_RESULT) for (key, _), res in zip(items, batch)}
+        except Exception as e:
+            print(f"[GEOCODING] resolve_batch falhou, a resolver morada a morada: {e}")
+
+    workers = max(1, min(max_workers, len(items)))
+    if workers == 1:
+        return dict(map(resolve, items))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocode") as executor:
+        return dict(executor.map(resolve, items))
+
+
+def run_geocoding_pipeline(
+    records: Iterable[Dict[str, Any]],
+    geocoder,
+    write_chunk: Callable[[List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]], None],
+    chunk_size: int = GEOCODE_CHUNK_SIZE,
+    max_workers: int = GEOCODE_MAX_WORKERS,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, int]:
+    """
+    Streams records in chunks of chunk_size.
+
+    Each record needs 'address', 'cp' and 'concelho'; records carrying a
+    precomputed 'result' (e.g. coordinates from the file) skip the geocoder.
+    Unique keys are resolved once per pipeline run, so a key repeated across
+    chunks is only geocoded the first time. write_chunk receives
+    [(record, result), ...] and is expected to persist the chunk in one transaction.
+    """
+    records = list(records)
+    total = len(records)
+    resolved: Dict[AddressKey, Dict[str, Any]] = {}
+    stats = {"total": total, "processed": 0, "unique": 0, "geocoded": 0, "chunks": 0}
+
+    for start in range(0, total, max(1, chunk_size)):
+        chunk = records[start:start + chunk_size]
+
+        pending: Dict[AddressKey, Tuple[str, str, str]] = {}
+        keys = []
+        for rec in chunk:
+            if rec.get("result") is not None:
+                keys.append(None)
+                continue
+            key = address_key(rec["address"], rec["cp"], rec["concelho"])
+            keys.append(key)
+            if key not in resolved and key not in pending:
+                pending[key] = (rec["address"], rec["cp"], rec["concelho"])
+
+        resolved.update(resolve_unique(geocoder, pending, max_workers=max_workers))
+        stats["unique"] += len(pending)
+        stats["geocoded"] += sum(1 for k in keys if k is not None)
+
+        write_chunk([(rec, rec["result"] if key is None else resolved[key]) for rec, key in zip(chunk, keys)])
+
+        stats["processed"] += len(chunk)
+        stats["chunks"] += 1
+        if progress_callback:
+            progress_callback(dict(stats))
+
+    return stats
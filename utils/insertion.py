@@ -0,0 +1,206 @@
+"""
+Insertion - Inserção mais barata de paragens pendentes em rotas existentes
+Cada rota guarda arrays com o início de serviço de cada paragem, a folga máxima
+(quanto cada início pode atrasar sem violar nenhuma janela dali para a frente,
+nem o fim de turno) e a carga/volume totais. Assim cada posição candidata é
+avaliada em O(1) e, com numpy, todas as posições de uma rota são avaliadas de
+uma vez para todas as paragens pendentes. As inserções são aplicadas em lote,
+a mais barata primeiro, e só a rota alterada é reavaliada. Usado pelo endpoint
+/api/solver/insert (RoutePlan.insert_pending).
+"""
+import math
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+_EPS = 1e-9
+
+
+class Insertion(NamedTuple):
+    node: int
+    route: int
+    position: int  # index in the route's stop list after the insertion
+    cost: float    # extra distance
+
+
+class InsertionRoute(NamedTuple):
+    depot: int
+    stops: List[int]
+    speed_kmh: float = 50.0
+    start_time: float = 0.0
+    end_time: float = math.inf
+    capacity: float = math.inf
+    volume_capacity: float = math.inf
+    closed: bool = False
+
+
+class _RouteArrays:
+    """Forward service starts and backward push-forward slack of one route."""
+
+    def __init__(self, route: InsertionRoute, dist: np.ndarray, win_s, win_e, service, demand, volume):
+        self.route = route
+        stops = np.asarray(route.stops, dtype=np.int64)
+        self.stops = stops
+        self.factor = 60.0 / route.speed_kmh
+        self.prev = np.r_[route.depot, stops]
+        self.next = np.r_[stops, route.depot]
+        arcs = dist[self.prev, self.next]
+        if not route.closed:
+            arcs[-1] = 0.0
+        self.arcs = arcs
+        self.distance = float(arcs.sum())
+        self.load = float(demand[stops].sum())
+        self.volume = float(volume[stops].sum())
+
+        n = len(stops)
+        arrival = np.empty(n)
+        begin = np.empty(n)
+        t = float(route.start_time)
+        for k in range(n):
+            arrival[k] = t + arcs[k] * self.factor
+            begin[k] = max(arrival[k], win_s[stops[k]])
+            t = begin[k] + service[stops[k]]
+        self.begin = begin
+        # Departure from each position 0..n (0 is the depot)
+        self.departure = np.r_[route.start_time, begin + service[stops]]
+        end = t + (arcs[-1] * self.factor if n else 0.0)
+        # A plan that is already late keeps its lateness but gets no later
+        self.end_limit = max(route.end_time, end)
+        limit = np.maximum(win_e[stops], begin)
+
+        # slack[k]: how far begin[k] may move forward without breaking anything after it
+        slack = np.empty(n)
+        tail = self.end_limit - end
+        for k in range(n - 1, -1, -1):
+            slack[k] = min(limit[k] - begin[k], tail)
+            tail = slack[k] + (begin[k] - arrival[k])
+        self.slack = slack
+
+
+class InsertionEngine:
+    """
+    Batch cheapest insertion of pending nodes into a set of routes.
+
+    dist is a node x node distance matrix (km); per-node arrays (windows,
+    service time, demand, volume) are indexed by the same nodes. Travel time is
+    distance / speed, service starts at max(arrival, window start) and may not
+    start after the window end; the route end (return to the depot for closed
+    routes, the last departure for open ones) may not pass end_time. Stops that
+    are already late in the current plan are never made later.
+    """
+
+    def __init__(
+        self,
+        dist: np.ndarray,
+        routes: Sequence[InsertionRoute],
+        windows: Optional[Dict[int, Tuple[float, float]]] = None,
+        service: Optional[Dict[int, float]] = None,
+        demands: Optional[Dict[int, float]] = None,
+        volumes: Optional[Dict[int, float]] = None,
+        default_service: float = 15.0,
+    ):
+        self.dist = np.asarray(dist, dtype=np.float64)
+        size = self.dist.shape[0]
+        self.win_s = np.zeros(size)
+        self.win_e = np.full(size, math.inf)
+        self.service = np.full(size, float(default_service))
+        self.demand = np.zeros(size)
+        self.volume = np.zeros(size)
+        for node, (s, e) in (windows or {}).items():
+            self.win_s[node], self.win_e[node] = s, (e if e > s else math.inf)
+        for node, value in (service or {}).items():
+            self.service[node] = value
+        for node, value in (demands or {}).items():
+            self.demand[node] = value
+        for node, value in (volumes or {}).items():
+            self.volume[node] = value
+        self.routes = [self._arrays(r) for r in routes]
+
+    def _arrays(self, route: InsertionRoute) -> _RouteArrays:
+        return _RouteArrays(route, self.dist, self.win_s, self.win_e, self.service, self.demand, self.volume)
+
+    @property
+    def stops(self) -> List[List[int]]:
+        return [[int(s) for s in r.stops] for r in self.routes]
+
+    def _evaluate(self, r: int, pending: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Best extra distance and position of each pending node in route r (inf if none fits)."""
+        arr = self.routes[r]
+        route = arr.route
+        n = len(arr.stops)
+        best_cost = np.full(len(pending), math.inf)
+        best_pos = np.zeros(len(pending), dtype=np.int64)
+        fits = (arr.load + self.demand[pending] <= route.capacity + _EPS) & (
+            arr.volume + self.volume[pending] <= route.volume_capacity + _EPS
+        )
+        if not fits.any():
+            return best_cost, best_pos
+
+        cand = pending[fits]
+        to_c = self.dist[np.ix_(arr.prev, cand)].T        # (P, n + 1): position -> pending
+        from_c = self.dist[np.ix_(cand, arr.next)]         # (P, n + 1): pending -> next position
+        if not route.closed:
+            from_c[:, -1] = 0.0
+        cost = to_c + from_c - arr.arcs[None, :]
+
+        begin = np.maximum(arr.departure[None, :] + to_c * arr.factor, self.win_s[cand, None])
+        ok = begin <= self.win_e[cand, None] + _EPS
+        leave = begin + self.service[cand, None]
+        if n:
+            # Push on the stop that follows must fit in its slack
+            push = leave[:, :n] + from_c[:, :n] * arr.factor - arr.begin[None, :]
+            ok[:, :n] &= push <= arr.slack[None, :] + _EPS
+        ok[:, n] &= leave[:, n] + from_c[:, n] * arr.factor <= arr.end_limit + _EPS
+
+        cost = np.where(ok, cost, math.inf)
+        pos = np.argmin(cost, axis=1)
+        best_cost[fits] = cost[np.arange(len(cand)), pos]
+        best_pos[fits] = pos
+        return best_cost, best_pos
+
+    def insert(
+        self,
+        pending: Sequence[int],
+        allowed: Optional[Dict[int, Set[int]]] = None,
+        max_insertions: Optional[int] = None,
+    ) -> List[Insertion]:
+        """
+        Inserts pending nodes one at a time, always the cheapest feasible
+        (node, route, position) left, until none fits or max_insertions is
+        reached. allowed maps a node to the route indices it may go on (all
+        routes when absent). Returns the insertions in the order applied.
+        """
+        nodes = np.asarray(list(dict.fromkeys(int(p) for p in pending)), dtype=np.int64)
+        if not len(nodes) or not self.routes:
+            return []
+        cost = np.full((len(nodes), len(self.routes)), math.inf)
+        pos = np.zeros((len(nodes), len(self.routes)), dtype=np.int64)
+        mask = np.ones_like(cost, dtype=bool)
+        if allowed:
+            for i, node in enumerate(nodes):
+                if int(node) in allowed:
+                    mask[i] = False
+                    mask[i, list(allowed[int(node)])] = True
+        for r in range(len(self.routes)):
+            cost[:, r], pos[:, r] = self._evaluate(r, nodes)
+        cost[~mask] = math.inf
+
+        active = np.ones(len(nodes), dtype=bool)
+        applied: List[Insertion] = []
+        limit = len(nodes) if max_insertions is None else max_insertions
+        while len(applied) < limit:
+            i, r = divmod(int(np.argmin(cost)), len(self.routes))
+            if not math.isfinite(cost[i, r]):
+                break
+            node, k = int(nodes[i]), int(pos[i, r])
+            route = self.routes[r].route
+            self.routes[r] = self._arrays(route._replace(stops=list(route.stops[:k]) + [node] + list(route.stops[k:])))
+            applied.append(Insertion(node, r, k, float(cost[i, r])))
+            active[i] = False
+            cost[i] = math.inf
+            rest = np.flatnonzero(active)
+            if not len(rest):
+                break
+            cost[rest, r], pos[rest, r] = self._evaluate(r, nodes[rest])
+            cost[rest, r] = np.where(mask[rest, r], cost[rest, r], math.inf)
+        return applied
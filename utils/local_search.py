@@ -0,0 +1,267 @@
+"""
+Local Search - Melhoria de uma rota por 2-opt, Or-opt e relocate
+Trabalha sobre arrays (sub-matriz da rota, somas acumuladas dos arcos) para avaliar
+cada movimento em O(1), só experimenta ligações entre os k vizinhos mais próximos
+de cada nó e valida janelas horárias com os horários de início (forward) e as
+folgas máximas (backward) da rota atual. Usado pela estratégia far-first e pela
+reotimização de uma rota no planeamento tático (RoutePlan.optimize_route).
+"""
+import math
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+DEFAULT_NEIGHBORS = 10
+MAX_PASSES = 50
+OR_OPT_MAX_SEGMENT = 3
+_EPS = 1e-9
+
+
+class LocalSearchResult(NamedTuple):
+    route: List[int]
+    distance: float
+    initial_distance: float
+    moves: Dict[str, int]
+    evaluations: int
+    passes: int
+
+
+class RouteLocalSearch:
+    """
+    Intra-route improvement of depot -> clients -> depot (closed) or
+    depot -> clients (open) paths.
+
+    Everything runs on a local copy of the route's sub-matrix: 0 is the start
+    depot, 1..n the clients in the order given and n + 1 the end (the depot, or
+    a zero-cost sink for open paths). path[k] is the local node at position k.
+
+    Time windows use the usual semantics of the solvers: service starts at
+    max(arrival, window start) and must not start after the window end. A
+    route that is already late somewhere is never made later at that stop:
+    each window end is relaxed to the stop's current service start.
+    """
+
+    def __init__(
+        self,
+        dist: np.ndarray,
+        route: Sequence[int],
+        depot: int,
+        closed: bool = True,
+        windows: Optional[Sequence[Tuple[float, float]]] = None,
+        service: Union[float, Sequence[float]] = 0.0,
+        speed_kmh: float = 45.0,
+        start_time: float = 0.0,
+        end_time: Optional[float] = None,
+        neighbors: int = DEFAULT_NEIGHBORS,
+    ):
+        self.nodes = [depot] + list(route) + [depot]
+        self.n = n = len(route)
+        m = n + 2
+        local = np.asarray(dist, dtype=np.float64)[np.ix_(self.nodes, self.nodes)]
+        if not closed:
+            local[:, -1] = 0.0
+            local[-1, :] = 0.0
+        self.D = local.tolist()
+
+        self.timed = windows is not None or end_time is not None
+        if self.timed:
+            speed = speed_kmh if speed_kmh and speed_kmh > 0 else 45.0
+            self.T = (local * (60.0 / speed)).tolist()
+            if isinstance(service, (int, float)):
+                svc = [0.0] + [float(service)] * n + [0.0]
+            else:
+                svc = [0.0] + [float(s) for s in service] + [0.0]
+            self.svc = svc
+            self.e = [0.0] * m
+            self.l = [math.inf] * m
+            if windows is not None:
+                for k, (w_s, w_e) in enumerate(windows, 1):
+                    self.e[k] = float(w_s)
+                    self.l[k] = float(w_e)
+            if end_time is not None:
+                self.l[-1] = float(end_time)
+            self.start_time = float(start_time)
+
+        # k nearest successors / predecessors of every local node (sorted by distance)
+        k = max(1, min(neighbors, m - 1))
+        self.succ = self._nearest(local, exclude=0, k=k)
+        self.pred = self._nearest(local.T, exclude=m - 1, k=k)
+
+        self.path = list(range(m))
+        self.pos = list(range(m))
+        self.evaluations = 0
+        self.moves = {"two_opt": 0, "or_opt": 0, "relocate": 0}
+        self._rebuild()
+        if self.timed:
+            # Never make an already-late stop later than it is now
+            self.l = [max(self.l[node], self.begin[self.pos[node]]) for node in range(m)]
+            self._rebuild()
+        self.initial_distance = self.cf[-1]
+
+    @staticmethod
+    def _nearest(mat: np.ndarray, exclude: int, k: int) -> List[List[int]]:
+        d = mat.copy()
+        np.fill_diagonal(d, np.inf)
+        d[:, exclude] = np.inf
+        if k < d.shape[1]:
+            idx = np.argpartition(d, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.tile(np.arange(d.shape[1]), (d.shape[0], 1))
+        order = np.argsort(np.take_along_axis(d, idx, axis=1), axis=1, kind="stable")
+        return np.take_along_axis(idx, order, axis=1).tolist()
+
+    def _rebuild(self):
+        """Positions, prefix sums of forward/backward arc lengths and the time schedule."""
+        p, D = self.path, self.D
+        for k, node in enumerate(p):
+            self.pos[node] = k
+        cf, cb = [0.0], [0.0]
+        for a, b in zip(p, p[1:]):
+            cf.append(cf[-1] + D[a][b])
+            cb.append(cb[-1] + D[b][a])
+        self.cf, self.cb = cf, cb
+        if not self.timed:
+            return
+        svc, T, e, l = self.svc, self.T, self.e, self.l
+        begin = [self.start_time]
+        for a, b in zip(p, p[1:]):
+            begin.append(max(begin[-1] + svc[a] + T[a][b], e[b]))
+        latest = [0.0] * len(p)
+        latest[-1] = l[p[-1]]
+        for k in range(len(p) - 2, -1, -1):
+            a = p[k]
+            latest[k] = min(l[a], latest[k + 1] - svc[a] - T[a][p[k + 1]])
+        self.begin, self.latest = begin, latest
+
+    def _fits(self, prev_pos: int, nodes, next_pos: int) -> bool:
+        """
+        Feasibility of visiting nodes between the (unchanged) positions prev_pos
+        and next_pos: the schedule is propagated through the changed part only,
+        the rest of the route is covered by latest[next_pos].
+        """
+        if not self.timed:
+            return True
+        svc, T, e, l = self.svc, self.T, self.e, self.l
+        prev = self.path[prev_pos]
+        t = self.begin[prev_pos]
+        for node in nodes:
+            t = max(t + svc[prev] + T[prev][node], e[node])
+            if t > l[node] + _EPS:
+                return False
+            prev = node
+        return t + svc[prev] + T[prev][self.path[next_pos]] <= self.latest[next_pos] + _EPS
+
+    # ---------- moves ----------
+
+    def _two_opt_delta(self, i: int, j: int) -> float:
+        """Reversing path[i..j]; the internal arcs change direction (asymmetric matrices)."""
+        p, D = self.path, self.D
+        a, b = p[i - 1], p[j + 1]
+        return (
+            D[a][p[j]] + D[p[i]][b] - D[a][p[i]] - D[p[j]][b]
+            + (self.cb[j] - self.cb[i]) - (self.cf[j] - self.cf[i])
+        )
+
+    def _try_two_opt(self, i: int, min_gain: float) -> bool:
+        p, pos, n = self.path, self.pos, self.n
+        # New arc path[i-1] -> c, reversing path[i..pos[c]]
+        candidates = [(i, pos[c]) for c in self.succ[p[i - 1]] if i < pos[c] <= n]
+        # New arc c -> path[i+1], reversing path[pos[c]..i]
+        candidates += [(pos[c], i) for c in self.pred[p[i + 1]] if 1 <= pos[c] < i]
+        for a, b in candidates:
+            self.evaluations += 1
+            if self._two_opt_delta(a, b) < -min_gain and self._fits(a - 1, p[a:b + 1][::-1], b + 1):
+                self.path[a:b + 1] = p[a:b + 1][::-1]
+                self.moves["two_opt"] += 1
+                self._rebuild()
+                return True
+        return False
+
+    def _or_opt_delta(self, i: int, seg_len: int, k: int, rev: bool) -> float:
+        p, D = self.path, self.D
+        last = i + seg_len - 1
+        first_n, last_n = (p[last], p[i]) if rev else (p[i], p[last])
+        internal = (self.cb[last] - self.cb[i]) - (self.cf[last] - self.cf[i]) if rev else 0.0
+        return (
+            D[p[i - 1]][p[last + 1]] - D[p[i - 1]][p[i]] - D[p[last]][p[last + 1]]
+            + D[p[k]][first_n] + D[last_n][p[k + 1]] - D[p[k]][p[k + 1]]
+            + internal
+        )
+
+    def _try_or_opt(self, i: int, min_gain: float) -> bool:
+        p, pos, n = self.path, self.pos, self.n
+        for seg_len in range(1, OR_OPT_MAX_SEGMENT + 1):
+            last = i + seg_len - 1
+            if last > n:
+                break
+            # Insert the segment between path[k] and path[k+1]
+            options = [(pos[u], False) for u in self.pred[p[i]]] + [(pos[w] - 1, False) for w in self.succ[p[last]]]
+            if seg_len > 1:
+                options += [(pos[u], True) for u in self.pred[p[last]]] + [(pos[w] - 1, True) for w in self.succ[p[i]]]
+            for k, rev in options:
+                if k < 0 or k > n or i - 1 <= k <= last:
+                    continue
+                self.evaluations += 1
+                if self._or_opt_delta(i, seg_len, k, rev) >= -min_gain:
+                    continue
+                seg = p[i:last + 1]
+                if rev:
+                    seg = seg[::-1]
+                if k < i:
+                    ok = self._fits(k, seg + p[k + 1:i], last + 1)
+                else:
+                    ok = self._fits(i - 1, p[last + 1:k + 1] + seg, k + 1)
+                if not ok:
+                    continue
+                rest = p[:i] + p[last + 1:]
+                at = k + 1 if k < i else k + 1 - seg_len
+                self.path = rest[:at] + seg + rest[at:]
+                self.moves["relocate" if seg_len == 1 else "or_opt"] += 1
+                self._rebuild()
+                return True
+        return False
+
+    def run(self, max_passes: int = MAX_PASSES, min_gain: float = 1e-6) -> LocalSearchResult:
+        passes = 0
+        if self.n > 1:
+            while passes < max_passes:
+                passes += 1
+                improved = False
+                for i in range(1, self.n + 1):
+                    if self._try_two_opt(i, min_gain) | self._try_or_opt(i, min_gain):
+                        improved = True
+                if not improved:
+                    break
+        return LocalSearchResult(
+            route=[self.nodes[x] for x in self.path[1:-1]],
+            distance=float(self.cf[-1]),
+            initial_distance=float(self.initial_distance),
+            moves=dict(self.moves),
+            evaluations=self.evaluations,
+            passes=passes,
+        )
+
+
+def improve_route(
+    dist: np.ndarray,
+    route: Sequence[int],
+    depot: int,
+    closed: bool = True,
+    windows: Optional[Sequence[Tuple[float, float]]] = None,
+    service: Union[float, Sequence[float]] = 0.0,
+    speed_kmh: float = 45.0,
+    start_time: float = 0.0,
+    end_time: Optional[float] = None,
+    neighbors: int = DEFAULT_NEIGHBORS,
+    max_passes: int = MAX_PASSES,
+    min_gain: float = 1e-6,
+) -> LocalSearchResult:
+    """
+    2-opt + Or-opt + relocate on one route of dist node indices.
+    windows / service are aligned with route; the result never makes the route
+    less feasible than the one given.
+    """
+    return RouteLocalSearch(
+        dist, route, depot, closed=closed, windows=windows, service=service, speed_kmh=speed_kmh,
+        start_time=start_time, end_time=end_time, neighbors=neighbors,
+    ).run(max_passes=max_passes, min_gain=min_gain)
@@ -0,0 +1,315 @@
+"""
+Matrix Cache - Armazenamento persistente de matrizes de distância/duração
+Content-addressed: cada matriz é identificada pelo tipo ('haversine_km', 'osrm_duration', ...)
+e pelo conjunto de coordenadas arredondadas. Pedidos com pontos novos reaproveitam a
+maior matriz em cache que partilhe pontos e só calculam as linhas/colunas em falta.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .distance_calculator import calculate_haversine_matrix, _haversine_block
+from .sqlite_pool import connect
+
+MATRIX_CACHE_PATH = os.getenv("MATRIX_CACHE_PATH", "matrix_cache.db")
+MATRIX_CACHE_MAX_MB = float(os.getenv("MATRIX_CACHE_MAX_MB", "512"))
+
+# 5 decimal places ~ 1.1 m: two stops closer than that share a cache key
+COORD_DECIMALS = 5
+
+# Reuse a cached matrix only when it covers at least this share of the requested points
+MIN_REUSE_FRACTION = 0.3
+
+# (sources, destinations) -> len(sources) x len(destinations) block
+BlockFn = Callable[[Sequence[Tuple[float, float]], Sequence[Tuple[float, float]]], np.ndarray]
+
+
+def point_key(lat: float, lon: float) -> str:
+    return f"{round(float(lat), COORD_DECIMALS):.{COORD_DECIMALS}f},{round(float(lon), COORD_DECIMALS):.{COORD_DECIMALS}f}"
+
+
+def haversine_block(sources, destinations) -> np.ndarray:
+    """Block function for the great-circle (km) matrix."""
+    src = np.radians(np.asarray(sources, dtype=np.float64).reshape(-1, 2))
+    dst = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+    return _haversine_block(src[:, 0], src[:, 1], np.cos(src[:, 0]), dst[:, 0], dst[:, 1], np.cos(dst[:, 0]))
+
+
+def _encode(matrix: np.ndarray) -> bytes:
+    buf = BytesIO()
+    np.save(buf, np.ascontiguousarray(matrix), allow_pickle=False)
+    return zlib.compress(buf.getvalue(), 1)
+
+
+def _decode(blob: bytes) -> np.ndarray:
+    return np.load(BytesIO(zlib.decompress(blob)), allow_pickle=False)
+
+
+class MatrixCache:
+    """
+    SQLite-backed LRU store of n x n matrices.
+
+    Tables:
+        matrices(id, kind, set_hash, n, points_json, data, nbytes, hits, last_used)
+        matrix_points(matrix_id, kind, point_key)  -- overlap lookup for incremental fill
+    """
+
+    def __init__(self, db_path: str = MATRIX_CACHE_PATH, max_mb: float = MATRIX_CACHE_MAX_MB):
+        self.db_path = db_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "partial_hits": 0,
+            "misses": 0,
+            "cells_reused": 0,
+            "cells_computed": 0,
+            "evictions": 0,
+        }
+        self._init_db()
+
+    def _connect(self):
+        return connect(self.db_path, row_factory=sqlite3.Row)
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS matrices (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    set_hash TEXT NOT NULL,
+                    n INTEGER NOT NULL,
+                    points_json TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    nbytes INTEGER NOT NULL,
+                    hits INTEGER DEFAULT 0,
+                    last_used REAL NOT NULL,
+                    UNIQUE (kind, set_hash)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS matrix_points (
+                    matrix_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    point_key TEXT NOT NULL,
+                    FOREIGN KEY (matrix_id) REFERENCES matrices (id) ON DELETE CASCADE
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_matrix_points_key ON matrix_points(kind, point_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_matrix_points_matrix ON matrix_points(matrix_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_matrices_lru ON matrices(last_used)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---------- public API ----------
+
+    def haversine_matrix(self, locations: Sequence[Tuple[float, float]], dtype=np.float64) -> np.ndarray:
+        """Drop-in replacement for calculate_haversine_matrix backed by the cache."""
+        if len(locations) < 2:
+            return calculate_haversine_matrix(locations, dtype=dtype)
+        return self.get_or_compute("haversine_km", locations, haversine_block, full_fn=calculate_haversine_matrix).astype(dtype, copy=False)
+
+    def get_or_compute(
+        self,
+        kind: str,
+        locations: Sequence[Tuple[float, float]],
+        block_fn: BlockFn,
+        full_fn: Optional[Callable[[Sequence[Tuple[float, float]]], np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        Returns the (n x n) matrix for `locations` in the given order.
+        Only rows/columns for points not present in the best overlapping cached
+        matrix are computed through block_fn(sources, destinations).
+        """
+        keys = [point_key(lat, lon) for lat, lon in locations]
+        unique_keys = sorted(set(keys))
+        set_hash = hashlib.sha1((kind + "|" + ";".join(unique_keys)).encode()).hexdigest()
+
+        cached = self._load_exact(kind, set_hash)
+        if cached is not None:
+            canon_keys, matrix = cached
+            self._count("hits")
+            self._count("cells_reused", len(unique_keys) ** 2)
+            return self._project(canon_keys, matrix, keys)
+
+        # Canonical point for each unique key (first occurrence wins)
+        key_to_loc: Dict[str, Tuple[float, float]] = {}
+        for k, loc in zip(keys, locations):
+            key_to_loc.setdefault(k, (float(loc[0]), float(loc[1])))
+        canon_locs = [key_to_loc[k] for k in unique_keys]
+        n = len(unique_keys)
+
+        base = self._load_best_overlap(kind, unique_keys)
+        if base is not None:
+            base_keys, base_matrix = base
+            self._count("partial_hits")
+            if set(unique_keys) <= set(base_keys):
+                # Pure subset (e.g. a single route): project without storing a copy
+                self._count("cells_reused", n * n)
+                return self._project(base_keys, base_matrix, keys)
+            matrix = self._incremental_fill(unique_keys, canon_locs, base_keys, base_matrix, block_fn)
+        else:
+            matrix = full_fn(canon_locs) if full_fn else block_fn(canon_locs, canon_locs)
+            matrix = np.asarray(matrix, dtype=np.float64)
+            self._count("misses")
+            self._count("cells_computed", n * n)
+
+        self._store(kind, set_hash, unique_keys, matrix)
+        return self._project(unique_keys, matrix, keys)
+
+    def get_stats(self) -> Dict[str, object]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(nbytes), 0) AS total FROM matrices").fetchone()
+            entries, total = row["entries"], row["total"]
+        finally:
+            conn.close()
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["partial_hits"] + stats["misses"]
+        stats.update({
+            "entries": entries,
+            "size_mb": round(total / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+            "hit_rate": round((stats["hits"] + stats["partial_hits"]) / lookups, 3) if lookups else 0.0,
+            "db_path": self.db_path,
+        })
+        return stats
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM matrix_points")
+            conn.execute("DELETE FROM matrices")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---------- internals ----------
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
+
+    @staticmethod
+    def _project(canon_keys: List[str], matrix: np.ndarray, keys: List[str]) -> np.ndarray:
+        """Reorders a canonical matrix into the caller's order (duplicates allowed)."""
+        pos = {k: i for i, k in enumerate(canon_keys)}
+        idx = np.fromiter((pos[k] for k in keys), dtype=np.intp, count=len(keys))
+        return matrix[np.ix_(idx, idx)]
+
+    def _incremental_fill(self, keys, locs, base_keys, base_matrix, block_fn) -> np.ndarray:
+        n = len(keys)
+        base_pos = {k: i for i, k in enumerate(base_keys)}
+        old = [i for i, k in enumerate(keys) if k in base_pos]
+        new = [i for i, k in enumerate(keys) if k not in base_pos]
+
+        matrix = np.zeros((n, n), dtype=np.float64)
+        old_arr = np.asarray(old, dtype=np.intp)
+        src = np.asarray([base_pos[keys[i]] for i in old], dtype=np.intp)
+        matrix[np.ix_(old_arr, old_arr)] = base_matrix[np.ix_(src, src)]
+
+        if new:
+            new_arr = np.asarray(new, dtype=np.intp)
+            new_locs = [locs[i] for i in new]
+            # New rows against every point, then old rows against the new columns
+            matrix[new_arr, :] = np.asarray(block_fn(new_locs, locs), dtype=np.float64)
+            if old:
+                old_locs = [locs[i] for i in old]
+                matrix[np.ix_(old_arr, new_arr)] = np.asarray(block_fn(old_locs, new_locs), dtype=np.float64)
+            np.fill_diagonal(matrix, 0.0)
+
+        self._count("cells_reused", len(old) ** 2)
+        self._count("cells_computed", n * n - len(old) ** 2)
+        return matrix
+
+    def _load_exact(self, kind, set_hash):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT id, points_json, data FROM matrices WHERE kind = ? AND set_hash = ?", (kind, set_hash)).fetchone()
+            if not row:
+                return None
+            conn.execute("UPDATE matrices SET hits = hits + 1, last_used = ? WHERE id = ?", (time.time(), row["id"]))
+            conn.commit()
+            return json.loads(row["points_json"]), _decode(row["data"])
+        finally:
+            conn.close()
+
+    def _load_best_overlap(self, kind, unique_keys):
+        conn = self._connect()
+        try:
+            best = conn.execute("""
+                SELECT matrix_id, COUNT(*) AS shared
+                FROM matrix_points
+                WHERE kind = ? AND point_key IN (SELECT value FROM json_each(?))
+                GROUP BY matrix_id
+                ORDER BY shared DESC
+                LIMIT 1
+            """, (kind, json.dumps(unique_keys))).fetchone()
+            if not best or best["shared"] < max(2, MIN_REUSE_FRACTION * len(unique_keys)):
+                return None
+            row = conn.execute("SELECT id, points_json, data FROM matrices WHERE id = ?", (best["matrix_id"],)).fetchone()
+            if not row:
+                return None
+            conn.execute("UPDATE matrices SET hits = hits + 1, last_used = ? WHERE id = ?", (time.time(), row["id"]))
+            conn.commit()
+            return json.loads(row["points_json"]), _decode(row["data"])
+        finally:
+            conn.close()
+
+    def _store(self, kind, set_hash, unique_keys, matrix):
+        blob = _encode(matrix)
+        if len(blob) > self.max_bytes:
+            return
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR IGNORE INTO matrices (kind, set_hash, n, points_json, data, nbytes, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (kind, set_hash, len(unique_keys), json.dumps(unique_keys), blob, len(blob), time.time()))
+            if cursor.rowcount:
+                matrix_id = cursor.lastrowid
+                cursor.executemany(
+                    "INSERT INTO matrix_points (matrix_id, kind, point_key) VALUES (?, ?, ?)",
+                    [(matrix_id, kind, k) for k in unique_keys]
+                )
+            self._evict(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _evict(self, cursor):
+        """Drops least-recently-used matrices until the total size fits the cap."""
+        total = cursor.execute("SELECT COALESCE(SUM(nbytes), 0) FROM matrices").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in cursor.execute("SELECT id, nbytes FROM matrices ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            cursor.execute("DELETE FROM matrix_points WHERE matrix_id = ?", (row["id"],))
+            cursor.execute("DELETE FROM matrices WHERE id = ?", (row["id"],))
+            total -= row["nbytes"]
+            self._count("evictions")
+
+
+_cache: Optional[MatrixCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_matrix_cache() -> MatrixCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MatrixCache()
+        return _cache
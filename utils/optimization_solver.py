@@ -1,18 +1,349 @@
 import numpy as np
 import math
-from typing import List, Dict, Any, Tuple, Optional
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Tuple, Optional, Callable
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 
+from .local_search import improve_route
+from .decomposition import (
+    DECOMPOSE_MIN_CLIENTS, SECTOR_MAX_CLIENTS, Subproblem, repair_boundaries, split_instance, subproblem_inputs,
+    warehouse_eligibility
+)
+
+DEFAULT_SPEED_KMH = 45.0
+SERVICE_TIME_MIN = 15.0
+
+# Portfolio mode: diverse first-solution / metaheuristic pairs, most promising first
+# (when the budget only fits a few, the list is cut from the end)
+PORTFOLIO_CONFIGS: List[Dict[str, str]] = [
+    {"name": "savings_gls", "first_solution": "SAVINGS", "metaheuristic": "GUIDED_LOCAL_SEARCH"},
+    {"name": "far_first_gls", "first_solution": "FAR_FIRST", "metaheuristic": "GUIDED_LOCAL_SEARCH"},
+    {"name": "parallel_insertion_gls", "first_solution": "PARALLEL_CHEAPEST_INSERTION", "metaheuristic": "GUIDED_LOCAL_SEARCH"},
+    {"name": "path_cheapest_arc_tabu", "first_solution": "PATH_CHEAPEST_ARC", "metaheuristic": "TABU_SEARCH"},
+    {"name": "savings_sa", "first_solution": "SAVINGS", "metaheuristic": "SIMULATED_ANNEALING"},
+    {"name": "far_first_tabu", "first_solution": "FAR_FIRST", "metaheuristic": "TABU_SEARCH"},
+    {"name": "path_cheapest_arc_gls", "first_solution": "PATH_CHEAPEST_ARC", "metaheuristic": "GUIDED_LOCAL_SEARCH"},
+    {"name": "parallel_insertion_sa", "first_solution": "PARALLEL_CHEAPEST_INSERTION", "metaheuristic": "SIMULATED_ANNEALING"},
+]
+PORTFOLIO_MIN_SECONDS = 3
+PORTFOLIO_WORKERS = int(os.getenv("SOLVER_PORTFOLIO_WORKERS", os.cpu_count() or 1))
+
+# Adaptive search budget: grows with the number of clients, capped by the requested limit
+# (optimization_params time_budget="fixed" keeps the requested limit as is)
+TIME_BUDGET_MIN_SECONDS = 2.0
+TIME_BUDGET_MAX_SECONDS = 30.0
+TIME_BUDGET_CLIENTS_PER_SECOND = 40.0
+# Plateau stop: no incumbent better by more than PLATEAU_EPSILON (relative) for the window,
+# which defaults to a quarter of the budget and at least PLATEAU_MIN_SECONDS
+PLATEAU_EPSILON = 0.001
+PLATEAU_MIN_SECONDS = 1.0
+PLATEAU_BUDGET_FRACTION = 0.25
+CONVERGENCE_MAX_POINTS = 50
+
 def _safe_int_scale(arr, factor=100):
     if arr is None:
         return []
     return [int(round(float(x) * factor)) for x in arr]
 
+def _scaled_distance_matrix(dist: np.ndarray) -> List[List[int]]:
+    """Arc costs in centi-km, built once for RegisterTransitMatrix."""
+    return np.rint(dist * 100.0).astype(np.int64).tolist()
+
+def _scaled_time_matrix(dist: np.ndarray, num_warehouses: int, speed_kmh: float) -> List[List[int]]:
+    """
+    Travel + service minutes (x100) for every arc at the given speed.
+    Service time is charged on the origin node when it is a client.
+    """
+    speed = speed_kmh if speed_kmh and speed_kmh > 0 else DEFAULT_SPEED_KMH
+    service = np.zeros((dist.shape[0], 1))
+    service[num_warehouses:] = SERVICE_TIME_MIN
+    return np.trunc(((dist / speed) * 60.0 + service) * 100.0).astype(np.int64).tolist()
+
+def _unary_vector(values: List[int], num_locations: int) -> List[int]:
+    """Pads/truncates a per-node demand vector to the model size."""
+    vec = list(values[:num_locations])
+    vec.extend([0] * (num_locations - len(vec)))
+    return vec
+
+def _node_vector(values, num_locations: int, default: float = 0.0) -> np.ndarray:
+    """Per-node float vector, padded with default where values is missing or short."""
+    vec = np.full(num_locations, default, dtype=np.float64)
+    if values:
+        n = min(len(values), num_locations)
+        vec[:n] = np.asarray(values[:n], dtype=np.float64)
+    return vec
+
+def _norm_wh(name) -> str:
+    return str(name).strip().lower()
+
+# Candidates scored exactly per recruitment step before checking the lower bound
+RECRUIT_SHORTLIST = 64
+
+def _recruit_far_first_clusters(
+    dist: np.ndarray,
+    demands: List[float],
+    vehicle_capacities: List[float],
+    depot_indices: List[int],
+    num_warehouses: int,
+    volume_demands: Optional[List[float]],
+    vehicle_volume_capacities: Optional[List[float]],
+    client_warehouses: Optional[List[str]],
+    vehicle_warehouses: Optional[List[str]],
+    v_starts: List[int],
+    v_ends: List[int],
+    client_time_windows: Optional[List[Tuple[int, int]]],
+    active_vehicle_indices: List[int],
+    load_mode: str
+) -> Dict[int, List[int]]:
+    """
+    Far-first recruitment: each vehicle takes the outermost eligible client as seed,
+    then repeatedly recruits the feasible client with the lowest
+    distance-to-cluster + 0.3 * wait.
+
+    cluster_dist keeps min(D[node][c] for node in cluster) for every c and is
+    updated with one row per recruit. Since a score is never below cluster_dist,
+    only the RECRUIT_SHORTLIST closest clients are scored first; if the best of
+    them beats the next cluster distance it is the global best, otherwise every
+    open client is scored. Warehouse eligibility masks are built once.
+    """
+    num_locations = dist.shape[0]
+    nodes = np.arange(num_locations)
+    is_client = nodes >= num_warehouses
+    kg = _node_vector(demands, num_locations)
+    vol = _node_vector(volume_demands, num_locations)
+    win_s = np.zeros(num_locations)
+    win_e = np.full(num_locations, 1440.0)
+    if client_time_windows:
+        n_tw = min(len(client_time_windows), num_locations - num_warehouses)
+        if n_tw > 0:
+            tw = np.asarray(client_time_windows[:n_tw], dtype=np.float64).reshape(-1, 2)
+            win_s[num_warehouses:num_warehouses + n_tw] = tw[:, 0]
+            win_e[num_warehouses:num_warehouses + n_tw] = tw[:, 1]
+
+    # Target warehouse per client and the depot its distance is measured from
+    wh_depot = {}
+    for vi, v_wh in enumerate(vehicle_warehouses or []):
+        wh_depot.setdefault(_norm_wh(v_wh), depot_indices[vi])
+    target_wh: List[Optional[str]] = [None] * num_locations
+    depot_of = np.zeros(num_locations, dtype=np.int64)
+    for c in range(num_warehouses, num_locations):
+        c_idx = c - num_warehouses
+        wh = client_warehouses[c_idx] if client_warehouses and c_idx < len(client_warehouses) else None
+        if wh:
+            target_wh[c] = _norm_wh(wh)
+            if vehicle_warehouses:
+                depot_of[c] = wh_depot.get(target_wh[c], 0)
+    depot_dist = dist[depot_of, nodes]
+    untargeted = np.array([t is None for t in target_wh]) & is_client
+    eligible_masks: Dict[Optional[str], np.ndarray] = {}
+
+    def eligible_mask(v_wh) -> np.ndarray:
+        key = _norm_wh(v_wh) if v_wh else None
+        if key not in eligible_masks:
+            if key is None:
+                eligible_masks[key] = is_client.copy()
+            else:
+                eligible_masks[key] = untargeted | np.array([t == key for t in target_wh])
+        return eligible_masks[key]
+
+    open_mask = is_client.copy()
+    total_demand = sum(demands[c] for c in range(num_warehouses, num_locations) if c < len(demands))
+    balanced = load_mode in ["balanced", "equilibrado"]
+    avg_target_load = (total_demand / max(1, len(active_vehicle_indices))) * 1.15 if balanced else 999999.0
+
+    vehicle_routes = {v: [] for v in range(len(vehicle_capacities))}
+    for v in active_vehicle_indices:
+        if not open_mask.any():
+            break
+        depot = depot_indices[v]
+        v_wh = vehicle_warehouses[v] if vehicle_warehouses and v < len(vehicle_warehouses) else None
+        max_kg = float(vehicle_capacities[v])
+        max_vol = float(vehicle_volume_capacities[v]) if vehicle_volume_capacities and v < len(vehicle_volume_capacities) else 999999.0
+        effective_cap_kg = min(max_kg, avg_target_load) if balanced else max_kg
+        shift_limit = v_ends[v] + 15.0
+        elig = eligible_mask(v_wh)
+
+        candidates = np.flatnonzero(open_mask & elig)
+        if len(candidates) == 0:
+            continue
+
+        # 1. Outermost client from matrix D[depot][c]
+        seed = int(candidates[np.argmax(depot_dist[candidates])])
+        assigned_to_v = [seed]
+        open_mask[seed] = False
+        cur_kg = float(kg[seed])
+        cur_vol = float(vol[seed])
+        t_arr_seed = v_starts[v] + (float(dist[depot, seed]) / 45.0) * 60.0
+        current_time = max(t_arr_seed, win_s[seed]) + 15.0
+        current_node = seed
+        cluster_dist = dist[seed].copy()
+        return_dist = dist[:, depot]
+
+        # 2. Recruit closest unassigned clients enforcing CAPACITY AND TIME WINDOWS
+        def score(cands: np.ndarray):
+            t_arr = current_time + (dist[current_node, cands] / 45.0) * 60.0
+            ws = win_s[cands]
+            wait = np.where(ws > 0, np.maximum(0.0, ws - t_arr), 0.0)
+            t_serv_end = t_arr + wait + 15.0
+            feasible = (
+                ((cur_kg + kg[cands]) <= effective_cap_kg) & ((cur_vol + vol[cands]) <= max_vol)
+                & (t_arr + wait <= win_e[cands])
+                & (t_serv_end + (return_dist[cands] / 45.0) * 60.0 <= shift_limit)
+            )
+            scores = np.where(feasible, cluster_dist[cands] + wait * 0.3, np.inf)
+            best = int(np.argmin(scores)) if len(cands) else 0
+            if len(cands) == 0 or not np.isfinite(scores[best]):
+                return None, np.inf, current_time
+            return int(cands[best]), float(scores[best]), float(t_serv_end[best])
+
+        while True:
+            candidates = np.flatnonzero(open_mask & elig)
+            if len(candidates) == 0:
+                break
+            best = (None, np.inf, current_time)
+            if len(candidates) > RECRUIT_SHORTLIST:
+                part = np.argpartition(cluster_dist[candidates], RECRUIT_SHORTLIST)
+                bound = cluster_dist[candidates[part[RECRUIT_SHORTLIST]]]
+                best = score(np.sort(candidates[part[:RECRUIT_SHORTLIST]]))
+                if not best[1] < bound:
+                    best = score(candidates)
+            else:
+                best = score(candidates)
+            best_candidate, _, best_new_time = best
+            if best_candidate is None:
+                break
+            assigned_to_v.append(best_candidate)
+            open_mask[best_candidate] = False
+            cur_kg += float(kg[best_candidate])
+            cur_vol += float(vol[best_candidate])
+            current_node = best_candidate
+            current_time = best_new_time
+            np.minimum(cluster_dist, dist[best_candidate], out=cluster_dist)
+
+        vehicle_routes[v] = assigned_to_v
+    return vehicle_routes
+
+def _time_budget(num_clients: int, params: Dict[str, Any]) -> float:
+    """Search seconds for an instance: size based, never above the requested limit."""
+    requested = float(params.get("time_limit_seconds", params.get("time_limit", 15)) or 15)
+    if str(params.get("time_budget", "adaptive") or "adaptive").lower() == "fixed":
+        return max(3.0, min(requested, TIME_BUDGET_MAX_SECONDS))
+    size_based = TIME_BUDGET_MIN_SECONDS + num_clients / TIME_BUDGET_CLIENTS_PER_SECOND
+    return max(TIME_BUDGET_MIN_SECONDS, min(requested, size_based, TIME_BUDGET_MAX_SECONDS))
+
+class _SearchConvergence:
+    """
+    Incumbent tracking for one OR-Tools search. on_solution() is registered as
+    an at-solution callback and records every improvement (the convergence
+    curve); should_stop() backs a CustomLimit that ends the search once nothing
+    better by more than epsilon has been found for plateau_seconds.
+    """
+    
+    def __init__(self, routing, plateau_seconds: float, epsilon: float, progress_callback=None):
+        self.routing = routing
+        self.plateau_seconds = plateau_seconds
+        self.epsilon = epsilon
+        self.progress_callback = progress_callback
+        self.start = time.perf_counter()
+        self.last_improvement = self.start
+        self.best = None
+        self.curve: List[List[float]] = []
+        self.plateau = False
+        
+    def on_solution(self):
+        cost = self.routing.CostVar().Value()
+        now = time.perf_counter()
+        if self.best is None or cost < self.best * (1.0 - self.epsilon):
+            self.last_improvement = now
+        if self.best is None or cost < self.best:
+            self.best = cost
+            self.curve.append([round(now - self.start, 3), cost / 100.0])
+            if self.progress_callback:
+                self.progress_callback({"stage": "search", "incumbent_cost": cost / 100.0})
+                
+    def should_stop(self) -> bool:
+        # The window only starts with the first solution
+        if not self.plateau and self.best is not None:
+            self.plateau = time.perf_counter() - self.last_improvement >= self.plateau_seconds
+        return self.plateau
+        
+    def report(self, time_limit: float) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.start
+        if self.plateau:
+            reason = "plateau"
+        elif self.best is None:
+            reason = "no_solution"
+        elif elapsed >= time_limit - 0.05:
+            reason = "time_limit"
+        else:
+            reason = "local_optimum"
+        curve = self.curve
+        if len(curve) > CONVERGENCE_MAX_POINTS:
+            step = len(curve) / (CONVERGENCE_MAX_POINTS - 1)
+            curve = [curve[int(k * step)] for k in range(CONVERGENCE_MAX_POINTS - 1)] + [curve[-1]]
+        return {
+            "stop_reason": reason,
+            "time_limit_seconds": round(time_limit, 2),
+            "plateau_seconds": round(self.plateau_seconds, 2),
+            "elapsed_seconds": round(elapsed, 2),
+            "improvements": len(self.curve),
+            "convergence": curve,
+        }
+
+def _solution_key(result: Dict[str, Any]) -> Tuple[int, float]:
+    """Fewer dropped clients first, then shorter total distance."""
+    return len(result.get("dropped_nodes", [])), float(result.get("total_distance", 0.0))
+
+def _processes_available(workers: int) -> bool:
+    """Daemonic processes (e.g. a solver job started as daemon) cannot start children."""
+    return workers > 1 and not multiprocessing.current_process().daemon
+
+def _run_in_processes(fn: Callable, calls: List[tuple], workers: int):
+    """Yields (index, result, error) as the calls finish; runs them in turn when no pool can be used."""
+    if _processes_available(workers):
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(fn, *args): i for i, args in enumerate(calls)}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+    else:
+        for i, args in enumerate(calls):
+            try:
+                yield i, fn(*args), None
+            except Exception as e:
+                yield i, None, e
+
+def _run_subproblem(inputs: Dict[str, Any], params: Dict[str, Any]) -> Tuple[Dict[str, Any], float]:
+    """One decomposition subproblem; module level so it can run in a worker process."""
+    t0 = time.perf_counter()
+    result = AdvancedRouteOptimizer().optimize_routes(**inputs, optimization_params=params)
+    return result, time.perf_counter() - t0
+
+def _run_portfolio_config(config: Dict[str, str], problem: Dict[str, Any], time_limit: int) -> Tuple[Dict[str, Any], float]:
+    """One portfolio member; module level so it can run in a worker process."""
+    t0 = time.perf_counter()
+    params = dict(problem.get("optimization_params") or {})
+    params.update({
+        "strategy": "distance",
+        "first_solution_strategy": config["first_solution"],
+        "metaheuristic": config["metaheuristic"],
+        "time_limit_seconds": time_limit,
+    })
+    result = AdvancedRouteOptimizer().optimize_routes(**{**problem, "optimization_params": params})
+    return result, time.perf_counter() - t0
+
 class AdvancedRouteOptimizer:
-    def __init__(self):
+    def __init__(self, progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None):
         self.manager = None
         self.routing = None
+        # Optional hook called with {"stage", "incumbent_cost"} on every improving solution
+        self.progress_callback = progress_callback
 
     def optimize_routes(
         self,
@@ -29,7 +360,8 @@ class AdvancedRouteOptimizer:
         vehicle_start_times: Optional[List[int]] = None,
         vehicle_end_times: Optional[List[int]] = None,
         client_time_windows: Optional[List[Tuple[int, int]]] = None,
-        locations: Optional[List[Tuple[float, float]]] = None
+        locations: Optional[List[Tuple[float, float]]] = None,
+        vehicle_speeds: Optional[List[float]] = None
     ) -> Dict[str, Any]:
         """
         Pure Distance-Matrix VRP & Far-First Clustering Optimizer:
@@ -43,6 +375,41 @@ class AdvancedRouteOptimizer:
         if load_mode in ["balanced", "equilibrado"] and balance_weight <= 0:
             balance_weight = 50.0
 
+        if params.get("initial_routes") is not None:
+            return self._solve_warm_start(dict(
+                distance_matrix=distance_matrix, demands=demands, vehicle_capacities=vehicle_capacities,
+                depot_indices=depot_indices, optimization_params=params, volume_demands=volume_demands,
+                vehicle_volume_capacities=vehicle_volume_capacities, client_warehouses=client_warehouses,
+                vehicle_warehouses=vehicle_warehouses, num_warehouses=num_warehouses,
+                vehicle_start_times=vehicle_start_times, vehicle_end_times=vehicle_end_times,
+                client_time_windows=client_time_windows, locations=locations, vehicle_speeds=vehicle_speeds
+            ), strategy, balance_weight)
+
+        decompose = params.get("decompose", "auto")
+        num_clients = len(distance_matrix) - num_warehouses
+        if strategy in ["decomposition", "decomposicao", "setores"] or (
+            strategy not in ["far_first", "zona", "zonas", "radial", "portfolio"]
+            and (decompose is True or (decompose == "auto" and num_clients > DECOMPOSE_MIN_CLIENTS))
+        ):
+            return self._solve_decomposed(dict(
+                distance_matrix=distance_matrix, demands=demands, vehicle_capacities=vehicle_capacities,
+                depot_indices=depot_indices, optimization_params=params, volume_demands=volume_demands,
+                vehicle_volume_capacities=vehicle_volume_capacities, client_warehouses=client_warehouses,
+                vehicle_warehouses=vehicle_warehouses, num_warehouses=num_warehouses,
+                vehicle_start_times=vehicle_start_times, vehicle_end_times=vehicle_end_times,
+                client_time_windows=client_time_windows, locations=locations, vehicle_speeds=vehicle_speeds
+            ))
+
+        if strategy == "portfolio" or (params.get("portfolio") and strategy not in ["far_first", "zona", "zonas", "radial"]):
+            return self._solve_portfolio(dict(
+                distance_matrix=distance_matrix, demands=demands, vehicle_capacities=vehicle_capacities,
+                depot_indices=depot_indices, optimization_params=params, volume_demands=volume_demands,
+                vehicle_volume_capacities=vehicle_volume_capacities, client_warehouses=client_warehouses,
+                vehicle_warehouses=vehicle_warehouses, num_warehouses=num_warehouses,
+                vehicle_start_times=vehicle_start_times, vehicle_end_times=vehicle_end_times,
+                client_time_windows=client_time_windows, locations=locations, vehicle_speeds=vehicle_speeds
+            ))
+
         if strategy in ["far_first", "zona", "zonas", "radial"]:
             return self._solve_far_first_matrix_clustering(
                 distance_matrix, demands, vehicle_capacities, depot_indices,
@@ -63,8 +430,292 @@ class AdvancedRouteOptimizer:
                 vehicle_start_times=vehicle_start_times,
                 vehicle_end_times=vehicle_end_times,
                 client_time_windows=client_time_windows,
-                balance_weight=balance_weight
+                balance_weight=balance_weight,
+                vehicle_speeds=vehicle_speeds
+            )
+
+    def _solve_portfolio(self, problem: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Multi-start portfolio: runs several OR-Tools configurations (first solution
+        strategy x metaheuristic) in a process pool within the usual time budget and
+        keeps the best solution. quality_metrics["portfolio"] records every run and
+        the winning configuration.
+        """
+        params = problem["optimization_params"]
+        budget = int(params.get("time_limit_seconds", params.get("time_limit", 15)))
+        budget = max(PORTFOLIO_MIN_SECONDS, min(budget, 30))
+        
+        names = params.get("portfolio_configs")
+        configs = [c for c in PORTFOLIO_CONFIGS if not names or c["name"] in names] or list(PORTFOLIO_CONFIGS)
+        workers = max(1, min(int(params.get("portfolio_workers", PORTFOLIO_WORKERS) or 1), len(configs)))
+        if not _processes_available(workers):
+            # No pool: the configurations run one after another within the same budget
+            workers = 1
+        # Every configuration gets at least PORTFOLIO_MIN_SECONDS; drop the tail when they do not fit
+        configs = configs[:workers * max(1, budget // PORTFOLIO_MIN_SECONDS)]
+        workers = min(workers, len(configs))
+        per_config = max(PORTFOLIO_MIN_SECONDS, budget * workers // len(configs))
+        
+        runs = []
+        best = None
+        best_config = None
+        
+        def collect(config, outcome, error=None):
+            nonlocal best, best_config
+            if error is not None:
+                runs.append({"name": config["name"], "status": "ERROR", "error": str(error)})
+                return
+            result, seconds = outcome
+            runs.append({
+                "name": config["name"],
+                "status": result.get("status"),
+                "total_distance": result.get("total_distance"),
+                "dropped": len(result.get("dropped_nodes", [])),
+                "seconds": round(seconds, 2),
+                "stop_reason": result.get("quality_metrics", {}).get("search", {}).get("stop_reason"),
+            })
+            if best is None or _solution_key(result) < _solution_key(best):
+                best, best_config = result, config
+                if self.progress_callback:
+                    self.progress_callback({"stage": "search", "incumbent_cost": result.get("total_distance"), "config": config["name"]})
+        
+        calls = [(c, problem, per_config) for c in configs]
+        for i, outcome, error in _run_in_processes(_run_portfolio_config, calls, workers):
+            collect(configs[i], outcome, error)
+            
+        if best is None:
+            # Every member failed: same fallback as the single search
+            best = self._solve_far_first_matrix_clustering(
+                problem["distance_matrix"], problem["demands"], problem["vehicle_capacities"], problem["depot_indices"],
+                problem["num_warehouses"], problem["volume_demands"], problem["vehicle_volume_capacities"],
+                problem["client_warehouses"], problem["vehicle_warehouses"],
+                problem["vehicle_start_times"], problem["vehicle_end_times"], problem["client_time_windows"]
             )
+            best_config = {"name": "far_first_fallback", "first_solution": "FAR_FIRST", "metaheuristic": "NONE"}
+            
+        order = {c["name"]: k for k, c in enumerate(configs)}
+        best = dict(best)
+        best["quality_metrics"] = {
+            **best.get("quality_metrics", {}),
+            "portfolio": {
+                "winner": best_config["name"],
+                "first_solution": best_config["first_solution"],
+                "metaheuristic": best_config["metaheuristic"],
+                "workers": workers,
+                "time_limit_per_config": per_config,
+                "runs": sorted(runs, key=lambda r: order.get(r["name"], len(order))),
+            },
+        }
+        return best
+
+    def _solve_decomposed(self, problem: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Very large instances: split by warehouse and then by sector
+        (utils.decomposition), solve the subproblems with OR-Tools in parallel,
+        each with its share of the fleet, and repair the boundaries between them.
+        Routes come back in the usual result format (one route per vehicle).
+        """
+        params = problem["optimization_params"]
+        num_warehouses = problem["num_warehouses"]
+        num_vehicles = len(problem["vehicle_capacities"])
+        dist = np.nan_to_num(np.asarray(problem["distance_matrix"], dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+        
+        subproblems = split_instance(
+            dist, problem["demands"], problem["vehicle_capacities"], problem["depot_indices"], num_warehouses,
+            problem["client_warehouses"], problem["vehicle_warehouses"], problem["locations"],
+            max_clients=int(params.get("sector_max_clients", SECTOR_MAX_CLIENTS))
+        )
+        to_solve = [k for k, sub in enumerate(subproblems) if sub.clients and sub.vehicles]
+        budget = int(params.get("time_limit_seconds", params.get("time_limit", 15)))
+        budget = max(PORTFOLIO_MIN_SECONDS, min(budget, 30))
+        workers = max(1, min(int(params.get("decompose_workers", PORTFOLIO_WORKERS) or 1), len(to_solve) or 1))
+        if not _processes_available(workers):
+            workers = 1
+        per_sub = max(PORTFOLIO_MIN_SECONDS, budget * workers // max(1, len(to_solve)))
+        sub_params = {
+            **params, "strategy": "distance", "decompose": False, "portfolio": False, "time_limit_seconds": per_sub,
+        }
+        
+        routes: Dict[int, List[int]] = {v: [] for v in range(num_vehicles)}
+        dropped: List[int] = []
+        sector_of = {c: k for k, sub in enumerate(subproblems) for c in sub.clients}
+        report = [{"name": sub.name, "clients": len(sub.clients), "vehicles": len(sub.vehicles)} for sub in subproblems]
+        
+        inputs = [subproblem_inputs(subproblems[k], dist, problem) for k in to_solve]
+        calls = [(local, sub_params) for _, local in inputs]
+        for done, (i, outcome, error) in enumerate(_run_in_processes(_run_subproblem, calls, workers), 1):
+            k = to_solve[i]
+            sub, nodes = subproblems[k], inputs[i][0]
+            if error is not None:
+                dropped.extend(sub.clients)
+                report[k]["error"] = str(error)
+            else:
+                result, seconds = outcome
+                for j, local_route in enumerate(result["routes"]):
+                    routes[sub.vehicles[j]] = [nodes[x] for x in local_route[1:-1]]
+                dropped.extend(nodes[x] for x in result["dropped_nodes"])
+                report[k].update({
+                    "total_distance": result.get("total_distance"),
+                    "dropped": len(result["dropped_nodes"]),
+                    "seconds": round(seconds, 2),
+                    "stop_reason": result.get("quality_metrics", {}).get("search", {}).get("stop_reason"),
+                })
+            if self.progress_callback:
+                self.progress_callback({"stage": "decomposition", "subproblems_done": done, "subproblems": len(to_solve)})
+                
+        eligible = warehouse_eligibility(problem["client_warehouses"], problem["vehicle_warehouses"], num_warehouses)
+        repair = repair_boundaries(dist, routes, dropped, sector_of, problem, eligible)
+        
+        result = self._routes_result(dist, routes, dropped, problem)
+        result.update({
+            "quality_metrics": {
+                "decomposition": {
+                    "subproblems": report,
+                    "workers": workers,
+                    "time_limit_per_subproblem": per_sub,
+                    "repair": repair,
+                }
+            },
+        })
+        return result
+
+    def _solve_warm_start(self, problem: Dict[str, Any], strategy: str, balance_weight: float = 0.0) -> Dict[str, Any]:
+        """
+        Re-optimization of an existing plan. optimization_params["initial_routes"]
+        (client nodes per vehicle) is the starting incumbent; routes of
+        "locked_vehicles" are returned untouched and "locked_nodes" ({node: vehicle})
+        stay on their vehicle. OR-Tools starts from the plan with a descent-only
+        search unless a metaheuristic is given; the far-first strategy only inserts
+        the unplanned clients and re-sequences the routes it touched.
+        """
+        params = problem["optimization_params"]
+        num_warehouses = problem["num_warehouses"]
+        num_vehicles = len(problem["vehicle_capacities"])
+        dist = np.nan_to_num(np.asarray(problem["distance_matrix"], dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+        num_locations = dist.shape[0]
+        locked_vehicles = {int(v) for v in params.get("locked_vehicles") or [] if 0 <= int(v) < num_vehicles}
+        
+        # Clean the plan with the model's own rules (scaled integer capacities, warehouse
+        # restriction) so ReadAssignmentFromRoutes accepts it; what does not fit is unplanned
+        demand_units = _safe_int_scale(problem["demands"])
+        volume_units = _safe_int_scale(problem["volume_demands"]) if problem["vehicle_volume_capacities"] else []
+        caps = [max(100, c) for c in _safe_int_scale(problem["vehicle_capacities"])]
+        vol_caps = [max(10, c) for c in _safe_int_scale(problem["vehicle_volume_capacities"])]
+        units = lambda values, c: values[c] if c < len(values) else 0
+        eligible = warehouse_eligibility(problem["client_warehouses"], problem["vehicle_warehouses"], num_warehouses)
+        routes: Dict[int, List[int]] = {v: [] for v in range(num_vehicles)}
+        plan_of: Dict[int, int] = {}
+        for v, route in enumerate(params["initial_routes"][:num_vehicles]):
+            kg = m3 = 0
+            for c in (int(c) for c in route):
+                if c in plan_of or not num_warehouses <= c < num_locations:
+                    continue
+                c_kg, c_m3 = units(demand_units, c), units(volume_units, c)
+                if v not in locked_vehicles and (
+                    not eligible(c, v) or kg + c_kg > caps[v] or (vol_caps and m3 + c_m3 > vol_caps[v])
+                ):
+                    continue
+                routes[v].append(c)
+                plan_of[c] = v
+                kg, m3 = kg + c_kg, m3 + c_m3
+        initial = {v: list(r) for v, r in routes.items()}
+        initial_distance = self._routes_result(dist, initial, [], problem)["total_distance"]
+        
+        locked_nodes = {
+            int(c): int(v) for c, v in (params.get("locked_nodes") or {}).items()
+            if plan_of.get(int(c)) == int(v) and int(v) not in locked_vehicles
+        }
+        free_vehicles = [v for v in range(num_vehicles) if v not in locked_vehicles]
+        free_clients = [c for c in range(num_warehouses, num_locations) if plan_of.get(c) not in locked_vehicles]
+        unplanned = [c for c in free_clients if c not in plan_of]
+        dropped = list(unplanned)
+        search = None
+        
+        if free_vehicles and free_clients:
+            # Unplanned clients go in by cheapest insertion first: clients tied to a warehouse
+            # cannot be inactive in the OR-Tools model, so the incumbent has to contain them
+            free_routes = {v: routes[v] for v in free_vehicles}
+            repair_boundaries(dist, free_routes, dropped, {c: 0 for c in free_clients}, problem, eligible)
+            routes.update(free_routes)
+            if strategy not in ["far_first", "zona", "zonas", "radial"]:
+                # Lateness is soft in the model: what only failed the schedule check goes in by capacity alone
+                load = {v: sum(units(demand_units, c) for c in routes[v]) for v in free_vehicles}
+                vol_load = {v: sum(units(volume_units, c) for c in routes[v]) for v in free_vehicles}
+                for c in list(dropped):
+                    options = [
+                        (dist[a, c] + dist[c, b] - dist[a, b], v, k)
+                        for v in free_vehicles
+                        if eligible(c, v) and load[v] + units(demand_units, c) <= caps[v]
+                        and (not vol_caps or vol_load[v] + units(volume_units, c) <= vol_caps[v])
+                        for k, (a, b) in enumerate(zip(
+                            [problem["depot_indices"][v]] + routes[v], routes[v] + [problem["depot_indices"][v]]
+                        ))
+                    ]
+                    if options:
+                        _, v, k = min(options)
+                        routes[v].insert(k, c)
+                        load[v] += units(demand_units, c)
+                        vol_load[v] += units(volume_units, c)
+                        dropped.remove(c)
+                nodes, local = subproblem_inputs(Subproblem("warm_start", free_vehicles, free_clients), dist, problem)
+                local_of = {n: i for i, n in enumerate(nodes)}
+                local_params = {
+                    **params, "strategy": "distance", "decompose": False, "portfolio": False,
+                    "metaheuristic": params.get("metaheuristic") or "GREEDY_DESCENT",
+                    "initial_routes": [[local_of[c] for c in routes[v]] for v in free_vehicles],
+                    "locked_nodes": {local_of[c]: free_vehicles.index(v) for c, v in locked_nodes.items()},
+                }
+                result = self._solve_ortools_vrp_savings(
+                    optimization_params=local_params, balance_weight=balance_weight, **local
+                )
+                for j, local_route in enumerate(result["routes"]):
+                    routes[free_vehicles[j]] = [nodes[x] for x in local_route[1:-1]]
+                dropped = [nodes[x] for x in result["dropped_nodes"]]
+                search = result.get("quality_metrics", {}).get("search")
+                
+        result = self._routes_result(dist, routes, dropped, problem)
+        route_of = {c: v for v, route in routes.items() for c in route}
+        result["quality_metrics"] = {
+            "warm_start": {
+                "initial_distance": initial_distance,
+                "planned_stops": len(plan_of),
+                "unplanned_stops": len(unplanned),
+                "inserted": sum(1 for c in unplanned if c in route_of),
+                "moved_stops": sum(1 for c, v in plan_of.items() if route_of.get(c, v) != v),
+                "changed_routes": sum(1 for v in range(num_vehicles) if routes[v] != initial[v]),
+                "locked_routes": len(locked_vehicles),
+                "locked_stops": len(locked_nodes),
+            }
+        }
+        if search is not None:
+            result["quality_metrics"]["search"] = search
+        return result
+
+    @staticmethod
+    def _routes_result(dist: np.ndarray, routes: Dict[int, List[int]], dropped: List[int], problem: Dict[str, Any]) -> Dict[str, Any]:
+        """Standard result dict from per-vehicle client lists in global node indices."""
+        final_routes, route_distances, route_loads, route_volumes, route_times = [], [], [], [], []
+        demands, volume_demands = problem["demands"], problem["volume_demands"]
+        for v in range(len(problem["vehicle_capacities"])):
+            depot = int(problem["depot_indices"][v])
+            path = [depot] + routes[v] + [depot]
+            r_dist = float(sum(dist[a, b] for a, b in zip(path, path[1:])))
+            final_routes.append(path)
+            route_distances.append(round(r_dist, 2))
+            route_loads.append(round(sum(float(demands[c]) for c in routes[v] if c < len(demands)), 2))
+            route_volumes.append(round(sum(float(volume_demands[c]) for c in routes[v] if volume_demands and c < len(volume_demands)), 2))
+            route_times.append(round((r_dist / 45.0) * 60.0 + len(routes[v]) * 15.0, 1))
+            
+        return {
+            "routes": final_routes,
+            "dropped_nodes": sorted(dropped),
+            "total_distance": round(sum(route_distances), 2),
+            "route_distances": route_distances,
+            "route_loads": route_loads,
+            "route_volumes": route_volumes,
+            "route_times": route_times,
+            "status": "SUCCESS",
+        }
 
     def _solve_ortools_vrp_savings(
         self,
@@ -81,7 +732,8 @@ class AdvancedRouteOptimizer:
         vehicle_start_times: Optional[List[int]],
         vehicle_end_times: Optional[List[int]],
         client_time_windows: Optional[List[Tuple[int, int]]],
-        balance_weight: float = 0.0
+        balance_weight: float = 0.0,
+        vehicle_speeds: Optional[List[float]] = None
     ) -> Dict[str, Any]:
         num_locations = len(distance_matrix)
         num_vehicles = len(vehicle_capacities)
@@ -100,7 +752,11 @@ class AdvancedRouteOptimizer:
 
         v_starts = vehicle_start_times if vehicle_start_times else [590] * num_vehicles
         v_ends = vehicle_end_times if vehicle_end_times else [1080] * num_vehicles
-        time_limit = int(optimization_params.get("time_limit_seconds", optimization_params.get("time_limit", 15)))
+        time_limit = _time_budget(num_locations - num_warehouses, optimization_params)
+        plateau_seconds = float(optimization_params.get("plateau_seconds") or max(PLATEAU_MIN_SECONDS, time_limit * PLATEAU_BUDGET_FRACTION))
+        plateau_epsilon = float(optimization_params.get("plateau_epsilon", PLATEAU_EPSILON))
+        first_solution = str(optimization_params.get("first_solution_strategy", "SAVINGS") or "SAVINGS").upper()
+        metaheuristic = str(optimization_params.get("metaheuristic", "GUIDED_LOCAL_SEARCH") or "GUIDED_LOCAL_SEARCH").upper()
 
         try:
             starts = [int(depot_indices[i]) for i in range(num_vehicles)]
@@ -109,18 +765,9 @@ class AdvancedRouteOptimizer:
             self.manager = pywrapcp.RoutingIndexManager(num_locations, num_vehicles, starts, ends)
             self.routing = pywrapcp.RoutingModel(self.manager)
             
-            # 1. Distance callback & cost on Matrix D[i][j]
-            def distance_callback(from_index, to_index):
-                try:
-                    from_node = self.manager.IndexToNode(from_index)
-                    to_node = self.manager.IndexToNode(to_index)
-                    if 0 <= from_node < len(distance_matrix) and 0 <= to_node < len(distance_matrix[0]):
-                        return int(round(float(distance_matrix[from_node][to_node]) * 100))
-                except Exception:
-                    pass
-                return 0
-                
-            transit_callback_index = self.routing.RegisterTransitCallback(distance_callback)
+            # 1. Arc cost from the precomputed integer matrix D[i][j] (no Python per-arc callback)
+            dist_np = np.nan_to_num(np.asarray(distance_matrix, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+            transit_callback_index = self.routing.RegisterTransitMatrix(_scaled_distance_matrix(dist_np))
             self.routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
             
             # 2. Weight Capacity Dimension
@@ -128,16 +775,7 @@ class AdvancedRouteOptimizer:
             clean_capacities = _safe_int_scale(vehicle_capacities)
             clean_capacities = [max(100, c) for c in clean_capacities]
             
-            def demand_callback(from_index):
-                try:
-                    from_node = self.manager.IndexToNode(from_index)
-                    if 0 <= from_node < len(clean_demands):
-                        return clean_demands[from_node]
-                except Exception:
-                    pass
-                return 0
-                
-            demand_callback_index = self.routing.RegisterUnaryTransitCallback(demand_callback)
+            demand_callback_index = self.routing.RegisterUnaryTransitVector(_unary_vector(clean_demands, num_locations))
             self.routing.AddDimensionWithVehicleCapacity(
                 demand_callback_index,
                 0,
@@ -156,16 +794,7 @@ class AdvancedRouteOptimizer:
                 clean_v_capacities = _safe_int_scale(vehicle_volume_capacities)
                 clean_v_capacities = [max(10, vc) for vc in clean_v_capacities]
                 
-                def volume_callback(from_index):
-                    try:
-                        from_node = self.manager.IndexToNode(from_index)
-                        if 0 <= from_node < len(clean_v_demands):
-                            return clean_v_demands[from_node]
-                    except Exception:
-                        pass
-                    return 0
-                        
-                volume_callback_index = self.routing.RegisterUnaryTransitCallback(volume_callback)
+                volume_callback_index = self.routing.RegisterUnaryTransitVector(_unary_vector(clean_v_demands, num_locations))
                 self.routing.AddDimensionWithVehicleCapacity(
                     volume_callback_index,
                     0,
@@ -174,29 +803,35 @@ class AdvancedRouteOptimizer:
                     'Volume'
                 )
                 
-            # 4. Time Dimension
-            def time_callback(from_index, to_index):
-                try:
-                    from_node = self.manager.IndexToNode(from_index)
-                    to_node = self.manager.IndexToNode(to_index)
-                    if 0 <= from_node < len(distance_matrix) and 0 <= to_node < len(distance_matrix[0]):
-                        dist = float(distance_matrix[from_node][to_node])
-                        travel_min = (dist / 45.0) * 60.0
-                        service_min = 15.0 if from_node >= num_warehouses else 0.0
-                        return int((travel_min + service_min) * 100)
-                except Exception:
-                    pass
-                return 0
-                
-            time_callback_index = self.routing.RegisterTransitCallback(time_callback)
+            # 4. Time Dimension: one integer matrix per distinct vehicle speed
+            speeds = [
+                float(vehicle_speeds[v]) if vehicle_speeds and v < len(vehicle_speeds) and vehicle_speeds[v] else DEFAULT_SPEED_KMH
+                for v in range(num_vehicles)
+            ]
+            time_callback_by_speed = {}
+            for speed in speeds:
+                if speed not in time_callback_by_speed:
+                    time_callback_by_speed[speed] = self.routing.RegisterTransitMatrix(
+                        _scaled_time_matrix(dist_np, num_warehouses, speed)
+                    )
+                    
             horizon_scaled = int(1440 * 100)
-            self.routing.AddDimension(
-                time_callback_index,
-                horizon_scaled,
-                horizon_scaled,
-                False,
-                'Time'
-            )
+            if len(time_callback_by_speed) == 1:
+                self.routing.AddDimension(
+                    time_callback_by_speed[speeds[0]],
+                    horizon_scaled,
+                    horizon_scaled,
+                    False,
+                    'Time'
+                )
+            else:
+                self.routing.AddDimensionWithVehicleTransits(
+                    [time_callback_by_speed[speed] for speed in speeds],
+                    horizon_scaled,
+                    horizon_scaled,
+                    False,
+                    'Time'
+                )
             
             time_dimension = self.routing.GetDimensionOrDie('Time')
             
@@ -246,19 +881,55 @@ class AdvancedRouteOptimizer:
                                 if node_idx_in_model != -1:
                                     self.routing.VehicleVar(node_idx_in_model).SetValues(allowed_vehicles)
 
-            # 7. Search Parameters: CLARKE-WRIGHT SAVINGS STRATEGY
+            # Locked stops stay on their vehicle and can no longer be dropped
+            for node, vehicle_id in (optimization_params.get("locked_nodes") or {}).items():
+                self.routing.VehicleVar(self.manager.NodeToIndex(int(node))).SetValues([int(vehicle_id)])
+
+            # 7. Search Parameters: CLARKE-WRIGHT SAVINGS + GLS unless the params pick another pair
             search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-            search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.SAVINGS
-            search_parameters.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
-            search_parameters.time_limit.seconds = max(3, min(time_limit, 30))
+            search_parameters.first_solution_strategy = getattr(
+                routing_enums_pb2.FirstSolutionStrategy, first_solution, routing_enums_pb2.FirstSolutionStrategy.SAVINGS
+            )
+            search_parameters.local_search_metaheuristic = getattr(
+                routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic, routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+            )
+            search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))
+            
+            # Improvements feed the convergence curve and progress; a plateau ends the search early
+            convergence = _SearchConvergence(self.routing, plateau_seconds, plateau_epsilon, self.progress_callback)
+            self.routing.AddAtSolutionCallback(convergence.on_solution)
+            self.routing.AddSearchMonitor(self.routing.solver().CustomLimit(convergence.should_stop))
             
-            solution = self.routing.SolveWithParameters(search_parameters)
+            solution = None
+            initial_routes = optimization_params.get("initial_routes")
+            if initial_routes is None and first_solution == "FAR_FIRST":
+                # Seed the search with the far-first clusters instead of a constructive heuristic
+                seed = self._solve_far_first_matrix_clustering(
+                    distance_matrix, demands, vehicle_capacities, depot_indices,
+                    num_warehouses, volume_demands, vehicle_volume_capacities,
+                    client_warehouses, vehicle_warehouses,
+                    v_starts, v_ends, client_time_windows
+                )
+                initial_routes = [route[1:-1] for route in seed["routes"]]
+            if initial_routes is not None:
+                self.routing.CloseModelWithParameters(search_parameters)
+                initial = self.routing.ReadAssignmentFromRoutes(
+                    [[self.manager.NodeToIndex(int(n)) for n in route] for route in initial_routes], True
+                )
+                if initial is not None:
+                    solution = self.routing.SolveFromAssignmentWithParameters(initial, search_parameters)
+                elif optimization_params.get("initial_routes") is not None:
+                    print("[OR-Tools] Initial routes rejected by the model, solving from scratch.")
+            if solution is None:
+                solution = self.routing.SolveWithParameters(search_parameters)
             
             if solution:
-                return self._extract_solution(
+                result = self._extract_solution(
                     solution, num_vehicles, num_locations, num_warehouses,
                     distance_matrix, demands, volume_demands
                 )
+                result["quality_metrics"] = {"search": convergence.report(time_limit)}
+                return result
         except Exception as e:
             print(f"[OR-Tools Savings Error: {e}] Falling back to matrix clustering.")
             
@@ -292,7 +963,7 @@ class AdvancedRouteOptimizer:
         1. Uses D[depot][c] to identify the outermost unassigned client.
         2. Recruits unassigned clients k that minimize D[c, k] (closest pair in distance matrix).
         3. Enforces that neighboring nodes in distance matrix are packed into the same vehicle.
-        4. Sequences each vehicle using 2-Opt and window feasibility.
+        4. Sequences each vehicle with 2-Opt / Or-opt local search (utils.local_search) and window feasibility.
         """
         num_vehicles = len(vehicle_capacities)
         num_locations = len(distance_matrix)
@@ -306,128 +977,13 @@ class AdvancedRouteOptimizer:
         ]
         active_vehicle_indices.sort(key=lambda v: (v_starts[v], -float(vehicle_capacities[v])))
         
-        unassigned_clients = list(range(num_warehouses, num_locations))
-        
-        # Precompute distance to depot from matrix D
-        depot_dists = {}
-        for c in unassigned_clients:
-            c_idx = c - num_warehouses
-            target_wh = client_warehouses[c_idx] if client_warehouses and c_idx < len(client_warehouses) else None
-            depot_node = 0
-            if vehicle_warehouses and target_wh:
-                for vi, v_wh in enumerate(vehicle_warehouses):
-                    if str(v_wh).strip().lower() == str(target_wh).strip().lower():
-                        depot_node = depot_indices[vi]
-                        break
-            
-            depot_dists[c] = {
-                "dist": float(distance_matrix[depot_node][c]),
-                "depot": depot_node,
-                "target_wh": target_wh
-            }
-
-        total_demand = sum(demands[c] for c in unassigned_clients if c < len(demands))
-        avg_target_load = (total_demand / max(1, len(active_vehicle_indices))) * 1.15 if load_mode in ["balanced", "equilibrado"] else 999999.0
-
-        vehicle_routes = {v: [] for v in range(num_vehicles)}
-        
-        for v in active_vehicle_indices:
-            if not unassigned_clients:
-                break
-                
-            depot = depot_indices[v]
-            v_wh = vehicle_warehouses[v] if vehicle_warehouses and v < len(vehicle_warehouses) else None
-            max_kg = float(vehicle_capacities[v])
-            max_vol = float(vehicle_volume_capacities[v]) if vehicle_volume_capacities and v < len(vehicle_volume_capacities) else 999999.0
-            
-            effective_cap_kg = min(max_kg, avg_target_load) if load_mode in ["balanced", "equilibrado"] else max_kg
-            shift_duration_min = max(60, v_ends[v] - v_starts[v])
-            
-            eligible = [
-                c for c in unassigned_clients
-                if not depot_dists[c]["target_wh"] or not v_wh or str(depot_dists[c]["target_wh"]).strip().lower() == str(v_wh).strip().lower()
-            ]
-            if not eligible:
-                continue
-                
-            # 1. Outermost client from matrix D[depot][c]
-            eligible.sort(key=lambda c: depot_dists[c]["dist"], reverse=True)
-            seed = eligible[0]
-            
-            assigned_to_v = [seed]
-            unassigned_clients.remove(seed)
-            cur_kg = float(demands[seed]) if seed < len(demands) else 0.0
-            cur_vol = float(volume_demands[seed]) if volume_demands and seed < len(volume_demands) else 0.0
-            
-            # 2. Recruit closest unassigned clients enforcing CAPACITY AND TIME WINDOWS
-            current_time = v_starts[v]
-            current_node = seed
-            win_s = client_time_windows[seed - num_warehouses][0] if client_time_windows and (seed - num_warehouses) < len(client_time_windows) else 0
-            dist_to_seed = float(distance_matrix[depot][seed])
-            t_arr_seed = current_time + (dist_to_seed / 45.0) * 60.0
-            current_time = max(t_arr_seed, win_s) + 15.0
-            
-            while unassigned_clients:
-                rem_eligible = [
-                    c for c in unassigned_clients
-                    if not depot_dists[c]["target_wh"] or not v_wh or str(depot_dists[c]["target_wh"]).strip().lower() == str(v_wh).strip().lower()
-                ]
-                if not rem_eligible:
-                    break
-                    
-                best_candidate = None
-                best_score = float('inf')
-                best_new_time = current_time
-                
-                for c in rem_eligible:
-                    c_kg = float(demands[c]) if c < len(demands) else 0.0
-                    c_vol = float(volume_demands[c]) if volume_demands and c < len(volume_demands) else 0.0
-                    
-                    if (cur_kg + c_kg) > effective_cap_kg or (cur_vol + c_vol) > max_vol:
-                        continue
-                        
-                    dist_from_last = float(distance_matrix[current_node][c])
-                    t_arr_c = current_time + (dist_from_last / 45.0) * 60.0
-                    
-                    c_win_s, c_win_e = 0, 1440
-                    c_idx = c - num_warehouses
-                    if client_time_windows and 0 <= c_idx < len(client_time_windows):
-                        c_win_s, c_win_e = client_time_windows[c_idx]
-                        
-                    wait_m = max(0.0, c_win_s - t_arr_c) if c_win_s > 0 else 0.0
-                    serv_start = t_arr_c + wait_m
-                    
-                    # Do not assign if it arrives after window end
-                    if serv_start > c_win_e:
-                        continue
-                        
-                    t_serv_end = serv_start + 15.0
-                    ret_dist = float(distance_matrix[c][depot])
-                    t_return = t_serv_end + (ret_dist / 45.0) * 60.0
-                    
-                    # Do not exceed vehicle shift end
-                    if t_return > v_ends[v] + 15.0:
-                        continue
-                        
-                    dist_to_cluster = min(float(distance_matrix[node][c]) for node in assigned_to_v)
-                    score = dist_to_cluster + (wait_m * 0.3)
-                    
-                    if score < best_score:
-                        best_score = score
-                        best_candidate = c
-                        best_new_time = t_serv_end
-                        
-                if best_candidate is not None:
-                    assigned_to_v.append(best_candidate)
-                    unassigned_clients.remove(best_candidate)
-                    cur_kg += float(demands[best_candidate]) if best_candidate < len(demands) else 0.0
-                    cur_vol += float(volume_demands[best_candidate]) if volume_demands and best_candidate < len(volume_demands) else 0.0
-                    current_node = best_candidate
-                    current_time = best_new_time
-                else:
-                    break
-                    
-            vehicle_routes[v] = assigned_to_v
+        dist = np.asarray(distance_matrix, dtype=np.float64)
+        vehicle_routes = _recruit_far_first_clusters(
+            dist, demands, vehicle_capacities, depot_indices,
+            num_warehouses, volume_demands, vehicle_volume_capacities,
+            client_warehouses, vehicle_warehouses, v_starts, v_ends, client_time_windows,
+            active_vehicle_indices, load_mode
+        )
 
         # 3. Sequencing with 2-Opt & Time Windows
         final_routes = []
@@ -449,40 +1005,20 @@ class AdvancedRouteOptimizer:
                 route_times.append(0.0)
                 continue
                 
-            def get_window_start(node):
+            def get_window(node):
                 c_idx = node - num_warehouses
                 if client_time_windows and 0 <= c_idx < len(client_time_windows):
-                    return client_time_windows[c_idx][0]
-                return 0
+                    return client_time_windows[c_idx]
+                return (0, 1440)
                 
-            ordered = sorted(cluster, key=lambda n: (get_window_start(n) // 120, distance_matrix[depot][n]))
+            ordered = sorted(cluster, key=lambda n: (get_window(n)[0] // 120, distance_matrix[depot][n]))
             
-            # 2-Opt local refinement
-            improved = True
-            iterations = 0
-            while improved and iterations < 30:
-                improved = False
-                iterations += 1
-                for i in range(len(ordered) - 1):
-                    for j in range(i + 1, len(ordered)):
-                        if get_window_start(ordered[i]) > get_window_start(ordered[j]):
-                            continue
-                            
-                        prev_node = depot if i == 0 else ordered[i - 1]
-                        next_node = depot if j == len(ordered) - 1 else ordered[j + 1]
-                        
-                        curr_dist = (
-                            distance_matrix[prev_node][ordered[i]] +
-                            distance_matrix[ordered[j]][next_node]
-                        )
-                        new_dist = (
-                            distance_matrix[prev_node][ordered[j]] +
-                            distance_matrix[ordered[i]][next_node]
-                        )
-                        
-                        if new_dist < curr_dist - 0.05:
-                            ordered[i:j+1] = reversed(ordered[i:j+1])
-                            improved = True
+            # 2-Opt / Or-opt / relocate refinement that keeps the windows and the shift feasible
+            ordered = improve_route(
+                dist, ordered, depot,
+                windows=[get_window(n) for n in ordered], service=SERVICE_TIME_MIN, speed_kmh=DEFAULT_SPEED_KMH,
+                start_time=v_starts[v], end_time=v_ends[v] + 15.0, min_gain=0.05
+            ).route
                             
             route_path = [depot] + ordered + [depot]
             final_routes.append(route_path)
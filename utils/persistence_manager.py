@@ -3,9 +3,14 @@ Persistence Manager Utility
 Handles serialization and storage of working Streamlit sessions into the database snapshots.
 """
 import json
+import os
 import pandas as pd
 from database import get_db
 from datetime import datetime
+from utils.snapshot_codec import decode_snapshot, encode_snapshot, is_binary_snapshot
+
+# 'binary' (default) or 'json' to keep writing legacy payloads during a rollback
+SNAPSHOT_FORMAT = os.getenv("SNAPSHOT_FORMAT", "binary").lower()
 
 # Define which session keys we actually want to save between phases
 CRITICAL_KEYS = [
@@ -21,67 +26,92 @@ CRITICAL_KEYS = [
     'optimization_params'
 ]
 
-def serialize_state(session_state):
-    """Converts streamlit session state payload into a serializable JSON dictionary."""
+# Marker for session values that are not persisted
+_SKIP = object()
+
+
+def _pack_value(val):
+    """Packs FleetVehicle dicts; DataFrames and primitives pass through."""
     import dataclasses
     from core.session_state import FleetVehicle
+
+    if isinstance(val, pd.DataFrame):
+        return val
+    # Handle FleetVehicle dataclass dicts specifically
+    if isinstance(val, dict):
+        serialized_dict = {}
+        for k, v in val.items():
+            if isinstance(v, FleetVehicle):
+                d = dataclasses.asdict(v)
+                d['__type__'] = 'FleetVehicle'
+                serialized_dict[k] = d
+            else:
+                serialized_dict[k] = v
+        return serialized_dict
+    if isinstance(val, (list, int, float, str, bool)) or val is None:
+        return val
+    return _SKIP
+
+
+def serialize_state(session_state, fmt=None):
+    """
+    Converts the session state into a snapshot payload.
+    Binary (columnar + zlib, see utils.snapshot_codec) by default; SNAPSHOT_FORMAT=json
+    or fmt='json' writes the legacy JSON string.
+    """
+    fmt = fmt or SNAPSHOT_FORMAT
     payload = {}
-    
+
     for key in CRITICAL_KEYS:
         if key not in session_state:
             continue
-            
-        val = session_state[key]
-        
-        # Handle Pandas Dataframes
-        if isinstance(val, pd.DataFrame):
-            payload[key] = {
+
+        val = _pack_value(session_state[key])
+        if val is _SKIP:
+            continue
+        if fmt == 'json' and isinstance(val, pd.DataFrame):
+            val = {
                 '__type__': 'pd_dataframe',
                 'data': val.to_json(orient='split', date_format='iso')
             }
-        # Handle FleetVehicle dataclass dicts specifically
-        elif isinstance(val, dict):
-            serialized_dict = {}
-            for k, v in val.items():
-                if isinstance(v, FleetVehicle):
-                    d = dataclasses.asdict(v)
-                    d['__type__'] = 'FleetVehicle'
-                    serialized_dict[k] = d
-                else:
-                    serialized_dict[k] = v
-            payload[key] = serialized_dict
-        elif isinstance(val, (list, int, float, str, bool)) or val is None:
-             payload[key] = val
-             
-    return json.dumps(payload)
+        payload[key] = val
 
-def deserialize_state(payload_json):
-    """Reconstructs actual Python objects (like DataFrames) from JSON payload."""
+    if fmt == 'json':
+        return json.dumps(payload)
+    return encode_snapshot(payload)
+
+
+def _restore_value(val):
     from core.session_state import FleetVehicle
-    try:
-        raw = json.loads(payload_json)
-        restored = {}
-        
-        for key, val in raw.items():
-            # Detect packed dataframe markers
-            if isinstance(val, dict) and val.get('__type__') == 'pd_dataframe':
-                from io import StringIO
-                json_data = val['data']
-                restored[key] = pd.read_json(StringIO(json_data), orient='split')
-            # Detect packed FleetVehicle dicts
-            elif isinstance(val, dict):
-                reconstructed_dict = {}
-                for k, v in val.items():
-                    if isinstance(v, dict) and v.get('__type__') == 'FleetVehicle':
-                        data = {inner_k: inner_v for inner_k, inner_v in v.items() if inner_k != '__type__'}
-                        reconstructed_dict[k] = FleetVehicle(**data)
-                    else:
-                        reconstructed_dict[k] = v
-                restored[key] = reconstructed_dict
+
+    # Detect packed dataframe markers (legacy JSON snapshots)
+    if isinstance(val, dict) and val.get('__type__') == 'pd_dataframe':
+        from io import StringIO
+        return pd.read_json(StringIO(val['data']), orient='split')
+    # Detect packed FleetVehicle dicts
+    if isinstance(val, dict):
+        reconstructed_dict = {}
+        for k, v in val.items():
+            if isinstance(v, dict) and v.get('__type__') == 'FleetVehicle':
+                data = {inner_k: inner_v for inner_k, inner_v in v.items() if inner_k != '__type__'}
+                reconstructed_dict[k] = FleetVehicle(**data)
             else:
-                restored[key] = val
-                
-        return restored
+                reconstructed_dict[k] = v
+        return reconstructed_dict
+    return val
+
+
+def deserialize_state(payload_json):
+    """Reconstructs Python objects (DataFrames, FleetVehicle) from a binary or legacy JSON payload."""
+    try:
+        if is_binary_snapshot(payload_json):
+            raw = decode_snapshot(payload_json)
+        else:
+            if isinstance(payload_json, (bytes, bytearray, memoryview)):
+                payload_json = bytes(payload_json).decode('utf-8')
+            raw = json.loads(payload_json)
+
+        return {key: _restore_value(val) for key, val in raw.items()}
     except Exception as e:
         print(f"[PERSISTENCE ERROR] Failed to deserialize: {e}")
         return {}
@@ -109,7 +139,22 @@ def create_snapshot(projeto_id, utilizador_id, fase_atual, snapshot_name=None):
         """, (projeto_id, utilizador_id, fase_atual, snapshot_name, payload))
         
         conn.commit()
-        return cursor.lastrowid
+        snapshot_id = cursor.lastrowid
+        
+    if 'routes_solution' in st.session_state:
+        _sync_route_stops(projeto_id, utilizador_id, snapshot_id, st.session_state['routes_solution'])
+    return snapshot_id
+
+def _sync_route_stops(projeto_id, utilizador_id, snapshot_id, routes):
+    """
+    Puts route_stops on the plan this snapshot saved (None clears it), so the
+    row-level copy never hides a newer plan saved from the planner.
+    """
+    from utils.route_store import save_routes
+
+    if routes is None:
+        routes = []
+    save_routes(projeto_id, routes, utilizador_id, "snapshot", snapshot_id=snapshot_id)
 
 def get_snapshots_for_project(projeto_id, limit=5):
     """Retrieves list of recent snapshots for picking."""
@@ -124,20 +169,35 @@ def get_snapshots_for_project(projeto_id, limit=5):
         """, (projeto_id, limit))
         return cursor.fetchall()
 
+def _overlay_route_stops(cursor, projeto_id, snapshot_id, restored):
+    """Manual route edits live row-level in route_stops; apply them unless restoring a snapshot older than their base."""
+    from utils.route_store import load_routes
+
+    cursor.execute("SELECT rotas_snapshot_id FROM projetos WHERE id = ?", (projeto_id,))
+    proj = cursor.fetchone()
+    base_id = proj['rotas_snapshot_id'] if proj else None
+    if base_id is not None and snapshot_id < base_id:
+        return restored
+
+    stored = load_routes(projeto_id)
+    if stored is not None:
+        restored['routes_solution'] = pd.DataFrame(stored[0])
+    return restored
+
 def load_snapshot_into_session(snapshot_id):
     """Fetches payload from DB and overwrites streamlit session state."""
     import streamlit as st
     
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT fase_atual, payload_json FROM snapshots WHERE id = ?", (snapshot_id,))
+        cursor.execute("SELECT fase_atual, projeto_id, payload_json FROM snapshots WHERE id = ?", (snapshot_id,))
         row = cursor.fetchone()
         
         if row:
             fase = row['fase_atual']
             payload = row['payload_json']
             
-            restored = deserialize_state(payload)
+            restored = _overlay_route_stops(cursor, row['projeto_id'], snapshot_id, deserialize_state(payload))
             
             # Perform update
             from core.session_state import get_state, set_state
@@ -0,0 +1,71 @@
+"""
+Rate Limit - Token buckets partilhados por fornecedor externo
+Um bucket por fornecedor e por processo, usado tanto pelo caminho síncrono
+(resolve_address) como pela fase assíncrona de geocodificação externa.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict
+
+# Nominatim usage policy: absolute maximum of 1 request per second
+NOMINATIM_QPS = min(1.0, float(os.getenv("NOMINATIM_QPS", "1")))
+GOOGLE_GEOCODE_QPS = float(os.getenv("GOOGLE_GEOCODE_QPS", "10"))
+CP_SCRAPER_QPS = float(os.getenv("CP_SCRAPER_QPS", "2"))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Callers reserve a token up front and wait for
+    their slot, so concurrent waiters are served in order at `rate` per second.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes one token and returns how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1.0
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire_sync(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+_DEFAULT_RATES = {
+    "nominatim": (NOMINATIM_QPS, 1),
+    "google": (GOOGLE_GEOCODE_QPS, max(1, int(GOOGLE_GEOCODE_QPS))),
+    "scraper": (CP_SCRAPER_QPS, 1),
+}
+
+
+def get_rate_limiter(provider: str) -> TokenBucket:
+    """Process-wide bucket for a provider ('nominatim', 'google', 'scraper')."""
+    with _buckets_lock:
+        bucket = _buckets.get(provider)
+        if bucket is None:
+            rate, burst = _DEFAULT_RATES.get(provider, (1.0, 1))
+            bucket = TokenBucket(rate, burst)
+            _buckets[provider] = bucket
+        return bucket
@@ -0,0 +1,278 @@
+"""
+Route Store - Paragens das rotas numa tabela normalizada (route_stops)
+O snapshot da otimização continua a ser a base; as edições manuais passam a ser
+UPDATEs linha a linha em route_stops, com um contador de versão por projeto
+(projetos.versao_rotas) e um registo compacto de alterações (route_changes)
+em vez de um novo snapshot completo por cada drag-and-drop.
+"""
+import json
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from database import get_db
+
+# Route-level fields kept in their own columns (the ones manual edits change);
+# the descriptive delivery fields live in dados_json.
+ROUTE_COLUMNS = {
+    "Rota": "rota",
+    "Armazem": "armazem",
+    "Ordem": "ordem",
+    "Chegada": "chegada",
+    "Tempo_Espera": "tempo_espera",
+    "Tempo_Entrega": "tempo_entrega",
+    "Saida": "saida",
+    "KM_Anterior": "km_anterior",
+    "Dist_Acum": "dist_acum",
+    "Carga_Acum": "carga_acum",
+    "Carga_Vol_Acum": "carga_vol_acum",
+}
+_FIELDS = list(ROUTE_COLUMNS)
+_SQL_COLUMNS = [ROUTE_COLUMNS[f] for f in _FIELDS]
+
+
+class RouteVersionConflict(Exception):
+    """The project's routes changed since they were loaded (optimistic concurrency)."""
+
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (isinstance(value, float) and (math.isnan(value) or math.isinf(value))):
+        return None
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+def _stop_id(row: Dict[str, Any], position: int) -> int:
+    for key in ("id", "ID_Original"):
+        value = _plain(row.get(key))
+        if value is not None:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                pass
+    return position + 1
+
+
+def _split_row(row: Dict[str, Any], position: int) -> Tuple[int, Tuple, str]:
+    values = tuple(_plain(row.get(f)) for f in _FIELDS)
+    dados = {k: _plain(v) for k, v in row.items() if k not in ROUTE_COLUMNS and k != "id"}
+    # Missing and NaN are the same thing once rows go through a DataFrame
+    dados = {k: v for k, v in dados.items() if v is not None}
+    return _stop_id(row, position), values, json.dumps(dados, sort_keys=True, default=str)
+
+
+def _join_row(entrega_id: int, values, dados_json: str) -> Dict[str, Any]:
+    row = {"id": entrega_id}
+    row.update(json.loads(dados_json or "{}"))
+    row.update(zip(_FIELDS, values))
+    return row
+
+
+def _natural_key(name) -> Tuple:
+    s = str(name or "")
+    pending = "PENDENTE" in s.upper() or "DISTRIBUIR" in s.upper()
+    return (pending, [int(p) if p.isdigit() else p.lower() for p in re.split(r"(\d+)", s)])
+
+
+def _rows_to_records(rows) -> List[Dict[str, Any]]:
+    records = [_join_row(r["entrega_id"], tuple(r[c] for c in _SQL_COLUMNS), r["dados_json"]) for r in rows]
+    records.sort(key=lambda r: (_natural_key(r.get("Rota")), r.get("Ordem") or 0))
+    return records
+
+
+def _records(routes) -> List[Dict[str, Any]]:
+    if isinstance(routes, pd.DataFrame):
+        return routes.to_dict(orient="records")
+    return list(routes or [])
+
+
+# ---------- reads ----------
+
+def get_route_version(project_id: int, conn=None) -> int:
+    def query(c):
+        row = c.execute("SELECT versao_rotas FROM projetos WHERE id = ?", (project_id,)).fetchone()
+        return int(row[0] or 0) if row else 0
+    if conn is not None:
+        return query(conn)
+    with get_db() as c:
+        return query(c)
+
+
+def load_routes(project_id: int) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+    """(route rows, version) from route_stops, or None if the project has none stored yet."""
+    with get_db() as conn:
+        rows = conn.execute("SELECT * FROM route_stops WHERE projeto_id = ?", (project_id,)).fetchall()
+        if not rows:
+            return None
+        return _rows_to_records(rows), get_route_version(project_id, conn)
+
+
+def load_project_state(project_id: int) -> Tuple[Optional[Dict[str, Any]], int]:
+    """
+    Latest snapshot state with routes_solution taken from route_stops when present.
+    Returns (None, 0) when the project has no snapshot.
+    """
+    from utils.persistence_manager import deserialize_state
+
+    with get_db() as conn:
+        row = conn.execute("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1",
+                           (project_id,)).fetchone()
+    if not row:
+        return None, 0
+    state_dict = deserialize_state(row["payload_json"])
+    stored = load_routes(project_id)
+    if stored is not None:
+        routes, version = stored
+        state_dict["routes_solution"] = pd.DataFrame(routes)
+        return state_dict, version
+    return state_dict, get_route_version(project_id)
+
+
+def get_route_changes(project_id: int, since_version: int = 0) -> List[Dict[str, Any]]:
+    with get_db() as conn:
+        rows = conn.execute(
+            "SELECT versao, utilizador_id, operacao, alteracoes_json, created_at FROM route_changes "
+            "WHERE projeto_id = ? AND versao > ? ORDER BY versao ASC",
+            (project_id, since_version)
+        ).fetchall()
+    return [{
+        "version": r["versao"],
+        "user_id": r["utilizador_id"],
+        "operation": r["operacao"],
+        "changes": json.loads(r["alteracoes_json"] or "[]"),
+        "created_at": r["created_at"],
+    } for r in rows]
+
+
+# ---------- writes ----------
+
+def _bump_version(conn, project_id: int, expected_version: Optional[int]) -> int:
+    if expected_version is None:
+        conn.execute("UPDATE projetos SET versao_rotas = COALESCE(versao_rotas, 0) + 1 WHERE id = ?", (project_id,))
+    else:
+        cur = conn.execute(
+            "UPDATE projetos SET versao_rotas = COALESCE(versao_rotas, 0) + 1 WHERE id = ? AND COALESCE(versao_rotas, 0) = ?",
+            (project_id, expected_version)
+        )
+        if cur.rowcount == 0:
+            raise RouteVersionConflict(f"project {project_id} routes are no longer at version {expected_version}")
+    return get_route_version(project_id, conn)
+
+
+def _insert_rows(conn, project_id: int, version: int, split_rows):
+    conn.executemany(
+        f"INSERT INTO route_stops (projeto_id, entrega_id, {', '.join(_SQL_COLUMNS)}, dados_json, versao) "
+        f"VALUES (?, ?, {', '.join('?' * len(_SQL_COLUMNS))}, ?, ?)",
+        [(project_id, sid, *values, dados, version) for sid, values, dados in split_rows]
+    )
+
+
+def _record_change(conn, project_id: int, version: int, user_id, operation: str, changes):
+    conn.execute(
+        "INSERT INTO route_changes (projeto_id, versao, utilizador_id, operacao, alteracoes_json) VALUES (?, ?, ?, ?, ?)",
+        (project_id, version, user_id, operation, json.dumps(changes, separators=(",", ":"), default=str))
+    )
+
+
+def replace_routes(project_id: int, routes, user_id, operation: str = "solve", snapshot_id: Optional[int] = None) -> int:
+    """Stores a whole new solution (after /solve); returns the new version."""
+    split_rows = list({row[0]: row for row in (_split_row(r, i) for i, r in enumerate(_records(routes)))}.values())
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = _bump_version(conn, project_id, None)
+            conn.execute("DELETE FROM route_stops WHERE projeto_id = ?", (project_id,))
+            _insert_rows(conn, project_id, version, split_rows)
+            if snapshot_id is not None:
+                conn.execute("UPDATE projetos SET rotas_snapshot_id = ? WHERE id = ?", (snapshot_id, project_id))
+            _record_change(conn, project_id, version, user_id, operation,
+                           {"stops": len(split_rows), "snapshot_id": snapshot_id})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return version
+
+
+def save_routes(project_id: int, routes, user_id, operation: str,
+                expected_version: Optional[int] = None, snapshot_id: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Diffs routes against route_stops and writes only the rows that changed.
+    The change record keeps [entrega_id, {field: [old, new]}] pairs instead of
+    a copy of the plan. Projects that only have a legacy snapshot are
+    bootstrapped with a full insert. snapshot_id, when given, becomes the
+    snapshot the rows are based on (even if no row changed).
+    Returns (new version, rows written).
+    """
+    new_rows = {}
+    for i, r in enumerate(_records(routes)):
+        sid, values, dados = _split_row(r, i)
+        new_rows[sid] = (values, dados)
+
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = {
+                r["entrega_id"]: (tuple(r[c] for c in _SQL_COLUMNS), r["dados_json"])
+                for r in conn.execute("SELECT * FROM route_stops WHERE projeto_id = ?", (project_id,))
+            }
+            if snapshot_id is not None:
+                conn.execute("UPDATE projetos SET rotas_snapshot_id = ? WHERE id = ?", (snapshot_id, project_id))
+            if not current:
+                if not new_rows:
+                    conn.commit()
+                    return get_route_version(project_id, conn), 0
+                version = _bump_version(conn, project_id, expected_version)
+                _insert_rows(conn, project_id, version, [(sid, v, d) for sid, (v, d) in new_rows.items()])
+                _record_change(conn, project_id, version, user_id, operation, {"bootstrap": len(new_rows)})
+                conn.commit()
+                return version, len(new_rows)
+
+            changes, updates, inserts = [], [], []
+            for sid, (values, dados) in new_rows.items():
+                old = current.get(sid)
+                if old is None:
+                    inserts.append((sid, values, dados))
+                    changes.append([sid, "+"])
+                    continue
+                old_values, old_dados = old
+                if values == old_values and dados == old_dados:
+                    continue
+                diff = {f: [o, n] for f, o, n in zip(_FIELDS, old_values, values) if o != n}
+                if dados != old_dados:
+                    diff["dados"] = 1
+                changes.append([sid, diff])
+                updates.append((*values, dados, sid))
+            removed = [sid for sid in current if sid not in new_rows]
+            changes.extend([sid, "-"] for sid in removed)
+
+            if not changes:
+                conn.commit()
+                return get_route_version(project_id, conn), 0
+
+            version = _bump_version(conn, project_id, expected_version)
+            if updates:
+                conn.executemany(
+                    f"UPDATE route_stops SET {', '.join(f'{c} = ?' for c in _SQL_COLUMNS)}, dados_json = ?, versao = ? "
+                    "WHERE projeto_id = ? AND entrega_id = ?",
+                    [(*u[:-1], version, project_id, u[-1]) for u in updates]
+                )
+            if inserts:
+                _insert_rows(conn, project_id, version, inserts)
+            if removed:
+                conn.executemany("DELETE FROM route_stops WHERE projeto_id = ? AND entrega_id = ?",
+                                 [(project_id, sid) for sid in removed])
+            _record_change(conn, project_id, version, user_id, operation, changes)
+            conn.commit()
+            return version, len(updates) + len(inserts) + len(removed)
+        except Exception:
+            conn.rollback()
+            raise
@@ -1,10 +1,260 @@
+import copy
 import requests
 import json
+import os
+import threading
+import time
 import polyline
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .distance_calculator import calculate_haversine_matrix
+from .matrix_cache import get_matrix_cache, haversine_block
+
+OSRM_URL = os.getenv("OSRM_URL", "http://localhost:5000")
+MATRIX_PROVIDER = os.getenv("MATRIX_PROVIDER", "haversine")
+
+# OSRM's default --max-table-size is 100 coordinates per request (sources + destinations)
+OSRM_TABLE_BLOCK = int(os.getenv("OSRM_TABLE_BLOCK", "50"))
+OSRM_MAX_WORKERS = int(os.getenv("OSRM_MAX_WORKERS", "8"))
+OSRM_TIMEOUT_S = float(os.getenv("OSRM_TIMEOUT_S", "10"))
+OSRM_RETRIES = 2
+
+# After a failure the router is skipped (haversine used) for this long
+OSRM_COOLDOWN_S = 60.0
+
+# Detour applied to the great-circle distance for pairs the router cannot connect
+UNROUTABLE_DETOUR_FACTOR = 1.3
+
+
+def _pooled_session(pool_size: int, retries: int = OSRM_RETRIES) -> requests.Session:
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.2,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class MatrixProvider:
+    """
+    Interface for distance matrix sources used by the solver.
+    distance_matrix() always returns an (n x n) float64 array in kilometres
+    and sets last_source to the backend that actually produced it.
+    """
+    name = "base"
+
+    def __init__(self):
+        self.last_source = self.name
+
+    def distance_matrix(self, locations) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HaversineMatrixProvider(MatrixProvider):
+    """
+    Great-circle matrices. Computed directly by default: the vectorized builder
+    is faster than a round trip through the SQLite matrix cache, which is kept
+    for the expensive sources (OSRM).
+    """
+    name = "haversine"
+
+    def __init__(self, use_cache: bool = False):
+        super().__init__()
+        self.use_cache = use_cache
+
+    def distance_matrix(self, locations) -> np.ndarray:
+        self.last_source = self.name
+        if self.use_cache:
+            return get_matrix_cache().haversine_matrix(locations)
+        return calculate_haversine_matrix(locations)
+
+
+class _RouterState:
+    """Router health shared by every copy of an OSRM provider."""
+
+    def __init__(self):
+        self.down_until = 0.0
+        self.lock = threading.Lock()
+
+
+class OSRMMatrixProvider(MatrixProvider):
+    """
+    Road-network matrices from an OSRM-compatible /table service.
+
+    Large n x n requests are split into source/destination tiles of at most
+    block_size points each, fetched concurrently over one pooled session and
+    stitched back together. Results go through the persistent matrix cache,
+    so only tiles touching new points are requested. Falls back to haversine
+    when the router is unreachable.
+    """
+    name = "osrm"
+
+    def __init__(self, base_url: str = OSRM_URL, block_size: int = OSRM_TABLE_BLOCK,
+                 max_workers: int = OSRM_MAX_WORKERS, timeout: float = OSRM_TIMEOUT_S,
+                 profile: str = "driving", use_cache: bool = True):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.block_size = max(1, int(block_size))
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.profile = profile
+        self.use_cache = use_cache
+        self.fallback = HaversineMatrixProvider()
+        self.session = _pooled_session(self.max_workers)
+        self._state = _RouterState()
+
+    @property
+    def _down_until(self) -> float:
+        return self._state.down_until
+
+    def for_request(self) -> "OSRMMatrixProvider":
+        """
+        Copy for a single request: shares the pooled session and the router
+        cooldown, but has its own last_source.
+        """
+        provider = copy.copy(self)
+        provider.last_source = self.name
+        provider.fallback = HaversineMatrixProvider()
+        return provider
+
+    # ---------- public API ----------
+
+    def distance_matrix(self, locations) -> np.ndarray:
+        if len(locations) < 2:
+            self.last_source = self.name
+            return calculate_haversine_matrix(locations)
+        if time.monotonic() < self._down_until:
+            return self._fall_back(locations, "router marcado como indisponível")
+
+        try:
+            if self.use_cache:
+                kind = f"osrm_km@{self.base_url}/{self.profile}"
+                matrix = get_matrix_cache().get_or_compute(kind, locations, self._distance_block)
+            else:
+                matrix = self._distance_block(locations, locations)
+        except (requests.RequestException, RuntimeError, ValueError, KeyError) as e:
+            with self._state.lock:
+                self._state.down_until = time.monotonic() + OSRM_COOLDOWN_S
+            return self._fall_back(locations, f"{type(e).__name__}: {str(e)[:200]}")
+
+        self.last_source = self.name
+        return matrix
+
+    def table(self, sources, destinations):
+        """
+        Tiled /table call. Returns (distances_m, durations_s) arrays of shape
+        (len(sources), len(destinations)); unroutable pairs are NaN.
+        Raises on transport or router errors.
+        """
+        sources = [(float(a), float(b)) for a, b in sources]
+        destinations = [(float(a), float(b)) for a, b in destinations]
+        distances = np.full((len(sources), len(destinations)), np.nan)
+        durations = np.full((len(sources), len(destinations)), np.nan)
+
+        src_ranges = [(s, min(s + self.block_size, len(sources))) for s in range(0, len(sources), self.block_size)]
+        dst_ranges = [(s, min(s + self.block_size, len(destinations))) for s in range(0, len(destinations), self.block_size)]
+        tiles = [(sr, dr) for sr in src_ranges for dr in dst_ranges]
+
+        def fetch(tile):
+            (i0, i1), (j0, j1) = tile
+            return tile, self._fetch_tile(sources[i0:i1], destinations[j0:j1])
+
+        workers = min(self.max_workers, len(tiles))
+        if workers <= 1:
+            results = map(fetch, tiles)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            results = executor.map(fetch, tiles)
+        try:
+            for ((i0, i1), (j0, j1)), (dist_block, dur_block) in results:
+                distances[i0:i1, j0:j1] = dist_block
+                durations[i0:i1, j0:j1] = dur_block
+        finally:
+            if workers > 1:
+                executor.shutdown(wait=True, cancel_futures=True)
+        return distances, durations
+
+    # ---------- internals ----------
+
+    def _fall_back(self, locations, reason) -> np.ndarray:
+        print(f"[OSRM] A usar haversine como fallback: {reason}")
+        matrix = self.fallback.distance_matrix(locations)
+        self.last_source = self.fallback.name
+        return matrix
+
+    def _distance_block(self, sources, destinations) -> np.ndarray:
+        distances_m, _ = self.table(sources, destinations)
+        km = distances_m / 1000.0
+        missing = np.isnan(km)
+        if missing.any():
+            km[missing] = haversine_block(sources, destinations)[missing] * UNROUTABLE_DETOUR_FACTOR
+        return km
+
+    def _fetch_tile(self, sources, destinations):
+        if list(sources) == list(destinations):
+            # Diagonal tile: send each coordinate once
+            coords = list(sources)
+            src_idx = dst_idx = range(len(coords))
+        else:
+            coords = list(sources) + list(destinations)
+            src_idx = range(len(sources))
+            dst_idx = range(len(sources), len(coords))
+        coords_str = ";".join(f"{lon:.6f},{lat:.6f}" for lat, lon in coords)
+        params = {
+            "sources": ";".join(str(i) for i in src_idx),
+            "destinations": ";".join(str(i) for i in dst_idx),
+            "annotations": "duration,distance",
+        }
+        url = f"{self.base_url}/table/v1/{self.profile}/{coords_str}"
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("code") != "Ok":
+            raise RuntimeError(f"OSRM Error: {data.get('message') or data.get('code')}")
+        dist = np.array(data["distances"], dtype=np.float64)
+        dur = np.array(data["durations"], dtype=np.float64)
+        expected = (len(sources), len(destinations))
+        if dist.shape != expected or dur.shape != expected:
+            raise ValueError(f"OSRM table shape {dist.shape}, expected {expected}")
+        return dist, dur
+
+
+def get_matrix_provider(name: str = None) -> MatrixProvider:
+    """Provider selected per request or through MATRIX_PROVIDER (haversine | osrm)."""
+    name = (name or MATRIX_PROVIDER or "haversine").lower()
+    if name == "osrm":
+        # Per-request copy so concurrent requests do not overwrite each other's last_source
+        return _shared_osrm_provider().for_request()
+    if name != "haversine":
+        raise ValueError(f"Unknown matrix provider: {name}")
+    return HaversineMatrixProvider()
+
+
+_osrm_provider = None
+_osrm_lock = threading.Lock()
+
+
+def _shared_osrm_provider() -> OSRMMatrixProvider:
+    # One pooled session and cooldown state per process
+    global _osrm_provider
+    with _osrm_lock:
+        if _osrm_provider is None:
+            _osrm_provider = OSRMMatrixProvider()
+        return _osrm_provider
+
 
 class OSRMRouter:
     def __init__(self, base_url="http://router.project-osrm.org"):
         self.base_url = base_url
+        self.session = _pooled_session(OSRM_MAX_WORKERS)
 
     def get_distance_matrix(self, locations):
         """
@@ -19,26 +269,15 @@ class OSRMRouter:
         if not locations:
             return None
 
-        # Format coordinates string: "lon,lat;lon,lat;..."
-        coords_str = ";".join([f"{lon},{lat}" for lat, lon in locations])
-        
-        url = f"{self.base_url}/table/v1/driving/{coords_str}"
-        params = {
-            'annotations': 'duration,distance'
-        }
+        # Tiled so that large inputs stay under the server's table size limit
+        provider = OSRMMatrixProvider(self.base_url, use_cache=False)
+        provider.session = self.session
 
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['code'] != 'Ok':
-                print(f"OSRM Error: {data.get('message')}")
-                return None
-                
+            distances, durations = provider.table(locations, locations)
             return {
-                'durations': data['durations'],
-                'distances': data['distances']
+                'durations': [[None if np.isnan(v) else float(v) for v in row] for row in durations],
+                'distances': [[None if np.isnan(v) else float(v) for v in row] for row in distances]
             }
         except Exception as e:
             print(f"Error fetching matrix: {e}")
@@ -66,7 +305,7 @@ class OSRMRouter:
         }
 
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params, timeout=OSRM_TIMEOUT_S)
             response.raise_for_status()
             data = response.json()
             
@@ -0,0 +1,189 @@
+"""
+Schema Migrations - Alterações versionadas ao schema (índices, colunas normalizadas)
+Cada base (geocoding_multi.db, geocoding.db) tem a sua lista ordenada de migrações e
+uma tabela schema_migrations com as versões aplicadas. HOT_QUERIES lista as consultas
+críticas; full_scans() usa EXPLAIN QUERY PLAN para detetar as que voltam a varrer a
+tabela inteira (ver tests/test_query_plans.py).
+"""
+import os
+import sqlite3
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .sqlite_pool import connect
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: Sequence[str]
+    # Table that must already exist; if missing, this and later migrations wait
+    requires: Optional[str] = None
+
+
+# ---------- geocoding_multi.db ----------
+
+MULTI_MIGRATIONS: List[Migration] = [
+    Migration(1, "hot_query_indexes", [
+        # Latest snapshot of a project (ORDER BY id DESC LIMIT 1 walks the index backwards)
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_projeto ON snapshots (projeto_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_entregas_projeto ON entregas (projeto_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_frota_projeto ON frota (projeto_id, is_active)",
+        "CREATE INDEX IF NOT EXISTS idx_projetos_empresa ON projetos (empresa_id, updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_route_changes_projeto ON route_changes (projeto_id, versao)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_logs_empresa ON usage_logs (empresa_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_metricas_projeto ON metricas_projeto (projeto_id, data)",
+        "CREATE INDEX IF NOT EXISTS idx_solver_jobs_projeto ON solver_jobs (projeto_id, created_at)",
+    ]),
+    Migration(2, "solver_portfolio_runs", [
+        # Winning configuration of every portfolio solve, to tune the default search from production data
+        """CREATE TABLE IF NOT EXISTS solver_portfolio_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            projeto_id INTEGER NOT NULL,
+            num_clientes INTEGER,
+            winner TEXT NOT NULL,
+            first_solution TEXT,
+            metaheuristic TEXT,
+            total_distance REAL,
+            dropped INTEGER,
+            runs_json TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (projeto_id) REFERENCES projetos (id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_portfolio_runs_created ON solver_portfolio_runs (created_at, winner)",
+    ]),
+]
+
+# ---------- geocoding.db ----------
+
+GEO_MIGRATIONS: List[Migration] = [
+    Migration(1, "pt_addresses_cc_norm", [
+        # Normalized concelho, computed by SQLite itself so stored values and query
+        # parameters (cc_norm = UPPER(TRIM(?))) always go through the same function
+        "ALTER TABLE pt_addresses ADD COLUMN cc_norm TEXT",
+        "UPDATE pt_addresses SET cc_norm = UPPER(TRIM(cc_desig))",
+        """CREATE TRIGGER IF NOT EXISTS trg_pt_addresses_cc_norm_ins AFTER INSERT ON pt_addresses
+           BEGIN UPDATE pt_addresses SET cc_norm = UPPER(TRIM(NEW.cc_desig)) WHERE rowid = NEW.rowid; END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_pt_addresses_cc_norm_upd AFTER UPDATE OF cc_desig ON pt_addresses
+           BEGIN UPDATE pt_addresses SET cc_norm = UPPER(TRIM(NEW.cc_desig)) WHERE rowid = NEW.rowid; END""",
+        "CREATE INDEX IF NOT EXISTS idx_pt_addresses_cp4_cc_norm ON pt_addresses (CP4, cc_norm)",
+        "CREATE INDEX IF NOT EXISTS idx_pt_addresses_cc_norm ON pt_addresses (cc_norm)",
+    ], requires="pt_addresses"),
+]
+
+# name -> (sql, sample params); none of them may need a full table scan
+HOT_QUERIES: Dict[str, Dict[str, Tuple[str, Tuple]]] = {
+    "multi": {
+        "latest_snapshot": ("SELECT payload_json FROM snapshots WHERE projeto_id = ? ORDER BY id DESC LIMIT 1", (1,)),
+        "project_deliveries": ("SELECT * FROM entregas WHERE projeto_id = ? ORDER BY id ASC", (1,)),
+        "project_deliveries_unordered": ("SELECT * FROM entregas WHERE projeto_id = ?", (1,)),
+        "delete_project_deliveries": ("DELETE FROM entregas WHERE projeto_id = ?", (1,)),
+        "active_fleet": ("SELECT * FROM frota WHERE projeto_id = ? AND is_active = 1", (1,)),
+        "company_projects": ("SELECT * FROM projetos WHERE empresa_id = ? ORDER BY updated_at DESC", (1,)),
+        "route_stops": ("SELECT * FROM route_stops WHERE projeto_id = ?", (1,)),
+        "route_changes": ("SELECT versao, operacao, alteracoes_json FROM route_changes WHERE projeto_id = ? AND versao > ? ORDER BY versao ASC", (1, 0)),
+        "recent_activity": ("SELECT * FROM usage_logs WHERE empresa_id = ? ORDER BY created_at DESC LIMIT 10", (1,)),
+        "project_metrics": ("SELECT * FROM metricas_projeto WHERE projeto_id = ? ORDER BY data DESC LIMIT ?", (1, 30)),
+        "portfolio_wins": ("SELECT winner, COUNT(*) FROM solver_portfolio_runs WHERE created_at >= ? GROUP BY winner", ("2000-01-01",)),
+    },
+    "geo": {
+        "cp4_candidates": ("SELECT full_street, LATITUDE, LONGITUDE, cc_desig FROM pt_addresses WHERE CP4 = ?", ("1000",)),
+        "cp4_concelho": ("SELECT full_street, LATITUDE, LONGITUDE FROM pt_addresses WHERE CP4 = ? AND cc_norm = UPPER(TRIM(?))", ("1000", "Lisboa")),
+        "concelho": ("SELECT DISTINCT full_street, CP4, cc_desig, LATITUDE, LONGITUDE FROM pt_addresses WHERE cc_norm = UPPER(TRIM(?)) AND LATITUDE IS NOT NULL LIMIT 50", ("Lisboa",)),
+        "cp4_info": ("SELECT dd_desig, cc_desig, CPALF FROM pt_addresses WHERE CP4 = ? LIMIT 1", ("1000",)),
+    },
+}
+
+EXPECTED_INDEXES = {
+    "multi": [s.split(" ON ")[0].split()[-1] for m in MULTI_MIGRATIONS for s in m.statements if "CREATE INDEX" in s],
+    "geo": [s.split(" ON ")[0].split()[-1] for m in GEO_MIGRATIONS for s in m.statements if "CREATE INDEX" in s],
+}
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def applied_versions(conn: sqlite3.Connection) -> List[int]:
+    if not _table_exists(conn, "schema_migrations"):
+        return []
+    return [r[0] for r in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+
+
+def migrate(conn: sqlite3.Connection, migrations: Sequence[Migration]) -> List[int]:
+    """Applies pending migrations in order, one transaction each; returns the versions applied."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    done = set(applied_versions(conn))
+    applied = []
+    for m in sorted(migrations, key=lambda m: m.version):
+        if m.version in done:
+            continue
+        if m.requires and not _table_exists(conn, m.requires):
+            break
+        conn.execute("BEGIN")
+        try:
+            for statement in m.statements:
+                try:
+                    conn.execute(statement)
+                except sqlite3.OperationalError as e:
+                    # Column already added by an older ad-hoc upgrade
+                    if "duplicate column" not in str(e):
+                        raise
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (m.version, m.name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(m.version)
+    return applied
+
+
+def migrate_geocoding_db(db_path: str) -> List[int]:
+    """Migrates geocoding.db if it exists (it is created by setup_database.py, never here)."""
+    if not os.path.exists(db_path):
+        return []
+    conn = connect(db_path)
+    try:
+        return migrate(conn, GEO_MIGRATIONS)
+    finally:
+        conn.close()
+
+
+def missing_indexes(conn: sqlite3.Connection, names: Sequence[str]) -> List[str]:
+    present = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    return [n for n in names if n not in present]
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()) -> List[str]:
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params))]
+
+
+def full_scans(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()) -> List[str]:
+    """Plan steps that read a whole table or index ('SCAN x'), as opposed to 'SEARCH x USING INDEX'."""
+    return [d for d in explain(conn, sql, params) if d.startswith("SCAN") and not d.startswith("SCAN CONSTANT")]
+
+
+def check_schema(conn: sqlite3.Connection, db: str) -> Dict[str, Any]:
+    """Applied versions, missing indexes and the hot queries that fall back to a full scan."""
+    migrations = MULTI_MIGRATIONS if db == "multi" else GEO_MIGRATIONS
+    scans = {}
+    for name, (sql, params) in HOT_QUERIES[db].items():
+        try:
+            found = full_scans(conn, sql, params)
+        except sqlite3.OperationalError as e:
+            found = [f"ERROR: {e}"]
+        if found:
+            scans[name] = found
+    versions = applied_versions(conn)
+    return {
+        "applied": versions,
+        "pending": [m.version for m in migrations if m.version not in versions],
+        "missing_indexes": missing_indexes(conn, EXPECTED_INDEXES[db]),
+        "full_scans": scans,
+    }
@@ -0,0 +1,202 @@
+"""
+Snapshot Codec - Formato binário, colunar e comprimido para snapshots de sessão
+Substitui o JSON duplamente codificado (DataFrame.to_json dentro de json.dumps).
+Cada DataFrame é guardado coluna a coluna (numpy em bruto para colunas numéricas,
+booleanas e datas; JSON para colunas de objetos) e o conjunto é comprimido com zlib.
+
+Layout (v1):
+    MAGIC (6 bytes) | VERSION (u8) | COMPRESSION (u8) | body
+    body (após descompressão) = header_len (u32 LE) | header JSON | blocos de colunas
+
+O header JSON descreve os valores simples e, para cada DataFrame, o índice e as
+colunas com (offset, length) dentro da zona de blocos.
+"""
+import json
+import struct
+import zlib
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"GRSNAP"
+FORMAT_VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+# Level 1 compresses a 20k-delivery snapshot ~2.5x faster than level 6 for ~10% more bytes
+ZLIB_LEVEL = 1
+
+_PREFIX = struct.Struct("<6sBB")
+_HEADER_LEN = struct.Struct("<I")
+
+
+class SnapshotFormatError(ValueError):
+    """Raised when a binary snapshot payload is truncated, corrupt or of an unknown version."""
+
+
+def is_binary_snapshot(payload: Union[bytes, bytearray, memoryview, str, None]) -> bool:
+    return isinstance(payload, (bytes, bytearray, memoryview)) and bytes(payload[:len(MAGIC)]) == MAGIC
+
+
+# ---------- column encoding ----------
+
+def _jsonable(value):
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    converted = _jsonable(value)
+    return str(value) if converted is value else converted
+
+
+def _encode_values(values, blocks: List[bytes], offset: int) -> Tuple[Dict[str, Any], int]:
+    """Encodes one column/index as a block; returns its descriptor and the new offset."""
+    dtype = values.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        raw = np.ascontiguousarray(values.array.asi8).tobytes()
+        desc = {"kind": "datetime_tz", "dtype": str(dtype), "tz": str(dtype.tz), "unit": dtype.unit}
+    elif isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        arr = np.ascontiguousarray(np.asarray(values))
+        raw = arr.tobytes()
+        desc = {"kind": "numpy", "dtype": arr.dtype.str}
+    else:
+        obj = np.asarray(values, dtype=object)
+        missing = pd.isna(obj)
+        if missing.any():
+            obj = obj.copy()
+            obj[missing] = None
+        raw = json.dumps(obj.tolist(), default=_json_default).encode("utf-8")
+        desc = {"kind": "json", "dtype": str(dtype)}
+    blocks.append(raw)
+    desc.update(offset=offset, length=len(raw))
+    return desc, offset + len(raw)
+
+
+def _decode_values(desc: Dict[str, Any], data: memoryview, nrows: int):
+    raw = data[desc["offset"]:desc["offset"] + desc["length"]]
+    if len(raw) != desc["length"]:
+        raise SnapshotFormatError("column block out of range")
+    kind = desc["kind"]
+    if kind == "numpy":
+        return np.frombuffer(raw, dtype=np.dtype(desc["dtype"]), count=nrows).copy()
+    if kind == "datetime_tz":
+        i8 = np.frombuffer(raw, dtype="<i8", count=nrows)
+        return pd.DatetimeIndex(i8.view(f"datetime64[{desc.get('unit', 'ns')}]")).tz_localize("UTC").tz_convert(desc["tz"]).array
+    values = json.loads(bytes(raw).decode("utf-8"))
+    if desc["dtype"] != "object":
+        try:
+            return pd.array(values, dtype=desc["dtype"])
+        except (TypeError, ValueError):
+            pass
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def _frame_supported(df: pd.DataFrame) -> bool:
+    return (not isinstance(df.columns, pd.MultiIndex) and not isinstance(df.index, pd.MultiIndex)
+            and df.columns.is_unique and all(isinstance(c, (str, int, np.integer)) for c in df.columns))
+
+
+def _encode_frame(df: pd.DataFrame, blocks: List[bytes], offset: int) -> Tuple[Dict[str, Any], int]:
+    if not _frame_supported(df):
+        # Rare shapes keep the legacy representation inside the binary container
+        return {"kind": "json_split", "data": df.to_json(orient="split", date_format="iso")}, offset
+
+    if isinstance(df.index, pd.RangeIndex):
+        index = {"kind": "range", "start": df.index.start, "stop": df.index.stop, "step": df.index.step,
+                 "name": df.index.name}
+    else:
+        index, offset = _encode_values(df.index, blocks, offset)
+        index["name"] = df.index.name
+
+    columns = []
+    for name in df.columns:
+        desc, offset = _encode_values(df[name], blocks, offset)
+        desc["name"] = _jsonable(name)
+        columns.append(desc)
+    return {"kind": "columnar", "nrows": len(df), "index": index, "columns": columns}, offset
+
+
+def _decode_frame(desc: Dict[str, Any], data: memoryview) -> pd.DataFrame:
+    if desc["kind"] == "json_split":
+        from io import StringIO
+        return pd.read_json(StringIO(desc["data"]), orient="split")
+
+    nrows = desc["nrows"]
+    index_desc = desc["index"]
+    if index_desc["kind"] == "range":
+        index = pd.RangeIndex(index_desc["start"], index_desc["stop"], index_desc["step"], name=index_desc["name"])
+    else:
+        index = pd.Index(_decode_values(index_desc, data, nrows), name=index_desc["name"])
+
+    columns = {c["name"]: _decode_values(c, data, nrows) for c in desc["columns"]}
+    return pd.DataFrame(columns, index=index)
+
+
+# ---------- public API ----------
+
+def encode_snapshot(payload: Dict[str, Any], compress: bool = True) -> bytes:
+    """
+    payload maps session keys to DataFrames or JSON-compatible values
+    (FleetVehicle dicts must already be packed by the caller).
+    """
+    blocks: List[bytes] = []
+    offset = 0
+    values: Dict[str, Any] = {}
+    frames: Dict[str, Any] = {}
+    for key, val in payload.items():
+        if isinstance(val, pd.DataFrame):
+            frames[key], offset = _encode_frame(val, blocks, offset)
+        else:
+            values[key] = val
+
+    header = json.dumps({"keys": list(payload.keys()), "values": values, "frames": frames},
+                        separators=(",", ":"), default=_json_default).encode("utf-8")
+    body = b"".join([_HEADER_LEN.pack(len(header)), header, *blocks])
+    if compress:
+        return _PREFIX.pack(MAGIC, FORMAT_VERSION, COMPRESSION_ZLIB) + zlib.compress(body, ZLIB_LEVEL)
+    return _PREFIX.pack(MAGIC, FORMAT_VERSION, COMPRESSION_NONE) + body
+
+
+def decode_snapshot(blob: Union[bytes, bytearray, memoryview]) -> Dict[str, Any]:
+    blob = bytes(blob)
+    if len(blob) < _PREFIX.size:
+        raise SnapshotFormatError("payload too short")
+    magic, version, compression = _PREFIX.unpack_from(blob)
+    if magic != MAGIC:
+        raise SnapshotFormatError("not a binary snapshot")
+    if version > FORMAT_VERSION:
+        raise SnapshotFormatError(f"unsupported snapshot version {version}")
+
+    body = blob[_PREFIX.size:]
+    if compression == COMPRESSION_ZLIB:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as e:
+            raise SnapshotFormatError(f"corrupt snapshot body: {e}") from e
+    elif compression != COMPRESSION_NONE:
+        raise SnapshotFormatError(f"unknown compression {compression}")
+
+    if len(body) < _HEADER_LEN.size:
+        raise SnapshotFormatError("missing header")
+    (header_len,) = _HEADER_LEN.unpack_from(body)
+    header_end = _HEADER_LEN.size + header_len
+    header = json.loads(body[_HEADER_LEN.size:header_end].decode("utf-8"))
+    data = memoryview(body)[header_end:]
+
+    values, frames = header["values"], header["frames"]
+    restored = {}
+    for key in header["keys"]:
+        restored[key] = _decode_frame(frames[key], data) if key in frames else values.get(key)
+    return restored
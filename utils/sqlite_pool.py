@@ -0,0 +1,231 @@
+"""
+SQLite Pool - Conexões partilhadas por ficheiro de base de dados
+Cada ficheiro (geocoding_multi.db, geocoding.db, matrix_cache.db, ...) tem um pool
+de conexões já abertas e configuradas (WAL, synchronous=NORMAL, mmap, cache,
+busy_timeout). conn.close() devolve a conexão ao pool em vez de a fechar, por isso
+o código existente (get_db, try/finally conn.close()) funciona sem alterações.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+POOL_MAX_IDLE = int(os.getenv("SQLITE_POOL_MAX_IDLE", "8"))
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "32"))
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool."""
+
+    _pool: Optional["SQLitePool"] = None
+    _checked_out = False
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+        else:
+            self._pool.release(self)
+
+    def close_for_real(self):
+        self._pool = None
+        super().close()
+
+
+def _apply_pragmas(conn: sqlite3.Connection, readonly: bool):
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_MB * 1024 * 1024}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_MB * 1024}")
+    if readonly:
+        return
+    try:
+        # Persistent in the file; readers no longer block the writer and vice versa
+        conn.execute("PRAGMA journal_mode = WAL")
+    except sqlite3.OperationalError:
+        pass
+    conn.execute("PRAGMA synchronous = NORMAL")
+
+
+def _file_id(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class SQLitePool:
+    """
+    Idle connections for one database file. There is no cap on connections in
+    use (nested get_db() calls must not deadlock); at most max_idle are kept
+    open between requests. Idle connections are dropped when the file is
+    replaced (deleted / recreated) or after a fork.
+    """
+
+    def __init__(self, path: str, readonly: bool = False, max_idle: int = POOL_MAX_IDLE):
+        self.path = os.path.abspath(path)
+        self.readonly = readonly
+        self.max_idle = max_idle
+        self._idle: List[PooledConnection] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._file_id = None
+        self.stats = {
+            "opened": 0,
+            "reused": 0,
+            "released": 0,
+            "discarded": 0,
+            "errors": 0,
+            "in_use": 0,
+            "peak_in_use": 0,
+            "open_ms": 0.0,
+        }
+
+    def _open(self) -> PooledConnection:
+        t0 = time.perf_counter()
+        if self.readonly:
+            target, uri = Path(self.path).as_uri() + "?mode=ro", True
+        else:
+            target, uri = self.path, False
+        conn = sqlite3.connect(target, uri=uri, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               factory=PooledConnection)
+        try:
+            _apply_pragmas(conn, self.readonly)
+        except sqlite3.Error:
+            conn.close_for_real()
+            raise
+        conn._pool = self
+        with self._lock:
+            self.stats["opened"] += 1
+            self.stats["open_ms"] += (time.perf_counter() - t0) * 1000
+            self._file_id = _file_id(self.path)
+        return conn
+
+    def _drop_idle(self):
+        for conn in self._idle:
+            try:
+                conn.close_for_real()
+            except sqlite3.Error:
+                pass
+        self.stats["discarded"] += len(self._idle)
+        self._idle = []
+
+    def acquire(self, row_factory=None) -> PooledConnection:
+        file_id = _file_id(self.path)
+        conn = None
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Inherited from the parent process: never reuse
+                self._idle, self._pid = [], os.getpid()
+            if file_id != self._file_id:
+                self._drop_idle()
+            if self._idle:
+                conn = self._idle.pop()
+                self.stats["reused"] += 1
+        if conn is None:
+            try:
+                conn = self._open()
+            except sqlite3.Error:
+                with self._lock:
+                    self.stats["errors"] += 1
+                raise
+        conn.row_factory = row_factory
+        conn._checked_out = True
+        with self._lock:
+            self.stats["in_use"] += 1
+            self.stats["peak_in_use"] = max(self.stats["peak_in_use"], self.stats["in_use"])
+        return conn
+
+    def release(self, conn: PooledConnection):
+        with self._lock:
+            if not conn._checked_out:
+                return
+            conn._checked_out = False
+            self.stats["in_use"] -= 1
+        keep = True
+        try:
+            if conn.in_transaction:
+                # Same as closing without commit: discard the pending changes
+                conn.rollback()
+        except sqlite3.Error:
+            keep = False
+        with self._lock:
+            stale = os.getpid() != self._pid or _file_id(self.path) != self._file_id
+            if keep and not stale and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                self.stats["released"] += 1
+                return
+            self.stats["discarded"] += 1
+            if not keep:
+                self.stats["errors"] += 1
+        conn.close_for_real()
+
+    def close_all(self):
+        with self._lock:
+            self._drop_idle()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            idle = len(self._idle)
+        acquired = stats["opened"] + stats["reused"]
+        stats.update({
+            "db_path": self.path,
+            "mode": "ro" if self.readonly else "rw",
+            "idle": idle,
+            "max_idle": self.max_idle,
+            "open_ms": round(stats["open_ms"], 2),
+            "reuse_rate": round(stats["reused"] / acquired, 3) if acquired else 0.0,
+        })
+        return stats
+
+
+_pools: Dict[Tuple[str, bool], SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str, readonly: bool = False) -> SQLitePool:
+    key = (os.path.abspath(path), readonly)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SQLitePool(path, readonly=readonly)
+        return pool
+
+
+def connect(path: str, readonly: bool = False, row_factory=None) -> sqlite3.Connection:
+    """
+    Pooled, tuned connection to path; close() returns it to the pool.
+    readonly=True opens with mode=ro (the file must exist).
+    """
+    if path in ("", ":memory:") or str(path).startswith("file:"):
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.row_factory = row_factory
+        return conn
+    return get_pool(path, readonly).acquire(row_factory)
+
+
+@contextmanager
+def pooled_connection(path: str, readonly: bool = False, row_factory=None):
+    conn = connect(path, readonly=readonly, row_factory=row_factory)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [p.get_stats() for p in pools]
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for p in pools:
+        p.close_all()
@@ -110,19 +110,32 @@ def create_fleet_warehouses_template():
     buffer.seek(0)
     return buffer.getvalue()
 
-def generate_random_fleet_warehouses(n_vehicles=5, db_path=DB_FILE):
+def _sample_addresses(conn, query, n, seed=None):
+    """
+    n rows of an address query: ORDER BY RANDOM() when seed is None, otherwise
+    a seeded sample of the matching rows (same rows and order for the same seed).
+    """
+    if seed is None:
+        return pd.read_sql_query(f"{query} ORDER BY RANDOM() LIMIT ?", conn, params=(n,))
+    df = pd.read_sql_query(f"{query} ORDER BY rowid", conn)
+    return df.sample(n=min(n, len(df)), random_state=seed).reset_index(drop=True)
+
+def generate_random_fleet_warehouses(n_vehicles=5, db_path=DB_FILE, seed=None, max_vehicles=10):
     """
     Generate random fleet and warehouses for testing.
     Creates 3 random warehouses in Lisboa area and distributes vehicles among them.
     
     Args:
-        n_vehicles: Number of vehicles to generate (3-10)
+        n_vehicles: Number of vehicles to generate (3-max_vehicles)
         db_path: Path to geocoding database
+        seed: Seed for a reproducible fleet (None for a different one each call)
+        max_vehicles: Upper bound for n_vehicles (benchmarks use larger fleets)
     
     Returns:
         Excel file bytes with 2 sheets
     """
-    n_vehicles = max(3, min(10, n_vehicles))
+    n_vehicles = max(3, min(max_vehicles, n_vehicles))
+    rnd = random.Random(seed)
     
     # Sample 3 random addresses from Lisboa area for warehouses
     conn = sqlite3.connect(db_path)
@@ -134,11 +147,9 @@ def generate_random_fleet_warehouses(n_vehicles=5, db_path=DB_FILE):
         AND LATITUDE IS NOT NULL
         AND LONGITUDE IS NOT NULL
         AND cc_desig IN ('Lisboa', 'Cascais', 'Sintra', 'Oeiras', 'Loures')
-        ORDER BY RANDOM()
-        LIMIT 3
     """
     
-    df_wh_addresses = pd.read_sql_query(query, conn)
+    df_wh_addresses = _sample_addresses(conn, query, 3, seed)
     conn.close()
     
     if len(df_wh_addresses) < 3:
@@ -150,13 +161,15 @@ def generate_random_fleet_warehouses(n_vehicles=5, db_path=DB_FILE):
     
     for i, row in df_wh_addresses.iterrows():
         cp4 = str(row['CP4']) if pd.notna(row['CP4']) else ''
-        cp7 = f"{cp4}-{random.randint(100, 999):03d}" if cp4 else ''
+        cp7 = f"{cp4}-{rnd.randint(100, 999):03d}" if cp4 else ''
         
         warehouses.append({
             'Nome_Armazem': warehouse_names[i],
             'Morada': row['full_street'],
             'CP': cp7 if cp7 else cp4,
-            'Localidade': row['cc_desig'] if pd.notna(row['cc_desig']) else 'Lisboa'
+            'Localidade': row['cc_desig'] if pd.notna(row['cc_desig']) else 'Lisboa',
+            'Latitude': row['LATITUDE'],
+            'Longitude': row['LONGITUDE']
         })
     
     df_warehouses = pd.DataFrame(warehouses)
@@ -173,30 +186,30 @@ def generate_random_fleet_warehouses(n_vehicles=5, db_path=DB_FILE):
     
     # First, assign 1 vehicle to each warehouse
     for i in range(3):
-        vtype = random.choice(vehicle_types)
+        vtype = rnd.choice(vehicle_types)
         fleet.append({
             'Veiculo': f"{vtype[0]} {i+1}",
             'Armazem': warehouse_names[i],
-            'Capacidade_KG': vtype[1] + random.randint(-50, 50),
-            'Cap_Volume_m3': vtype[2] + round(random.uniform(-0.5, 0.5), 1),
-            'Custo_KM': round(vtype[3] + random.uniform(-0.05, 0.05), 2),
-            'Velocidade_Media': vtype[4] + random.randint(-5, 5),
-            'Horario_Inicio': random.choice(['07:00', '08:00', '09:00']),
-            'Horario_Fim': random.choice(['17:00', '18:00', '19:00'])
+            'Capacidade_KG': vtype[1] + rnd.randint(-50, 50),
+            'Cap_Volume_m3': vtype[2] + round(rnd.uniform(-0.5, 0.5), 1),
+            'Custo_KM': round(vtype[3] + rnd.uniform(-0.05, 0.05), 2),
+            'Velocidade_Media': vtype[4] + rnd.randint(-5, 5),
+            'Horario_Inicio': rnd.choice(['07:00', '08:00', '09:00']),
+            'Horario_Fim': rnd.choice(['17:00', '18:00', '19:00'])
         })
     
     # Add remaining vehicles randomly
     for i in range(3, n_vehicles):
-        vtype = random.choice(vehicle_types)
+        vtype = rnd.choice(vehicle_types)
         fleet.append({
             'Veiculo': f"{vtype[0]} {i+1}",
-            'Armazem': random.choice(warehouse_names),
-            'Capacidade_KG': vtype[1] + random.randint(-50, 50),
-            'Cap_Volume_m3': vtype[2] + round(random.uniform(-0.5, 0.5), 1),
-            'Custo_KM': round(vtype[3] + random.uniform(-0.05, 0.05), 2),
-            'Velocidade_Media': vtype[4] + random.randint(-5, 5),
-            'Horario_Inicio': random.choice(['07:00', '08:00', '09:00']),
-            'Horario_Fim': random.choice(['17:00', '18:00', '19:00'])
+            'Armazem': rnd.choice(warehouse_names),
+            'Capacidade_KG': vtype[1] + rnd.randint(-50, 50),
+            'Cap_Volume_m3': vtype[2] + round(rnd.uniform(-0.5, 0.5), 1),
+            'Custo_KM': round(vtype[3] + rnd.uniform(-0.05, 0.05), 2),
+            'Velocidade_Media': vtype[4] + rnd.randint(-5, 5),
+            'Horario_Inicio': rnd.choice(['07:00', '08:00', '09:00']),
+            'Horario_Fim': rnd.choice(['17:00', '18:00', '19:00'])
         })
     
     df_fleet = pd.DataFrame(fleet)
@@ -212,7 +225,8 @@ def generate_random_fleet_warehouses(n_vehicles=5, db_path=DB_FILE):
 
 # ==================== RANDOM DATA GENERATION ====================
 
-def generate_random_deliveries(n_deliveries=50, quality_levels=None, db_path=DB_FILE, distrito='Lisboa'):
+def generate_random_deliveries(n_deliveries=50, quality_levels=None, db_path=DB_FILE, distrito='Lisboa',
+                               seed=None, missing_coords=0.3):
     """
     Generate random deliveries using real addresses from the database.
     
@@ -221,10 +235,13 @@ def generate_random_deliveries(n_deliveries=50, quality_levels=None, db_path=DB_
         quality_levels: List of quality levels to filter (1-7), None for all
         db_path: Path to geocoding database
         distrito: District to filter addresses (default: Lisboa)
+        seed: Seed for a reproducible file (None for a different one each call)
+        missing_coords: Share of rows without coordinates (to exercise geocoding)
     
     Returns:
         Excel file bytes
     """
+    rnd = random.Random(seed)
     if quality_levels is None:
         quality_levels = [1, 2, 3, 4, 5]  # Default to good quality
     
@@ -246,11 +263,9 @@ def generate_random_deliveries(n_deliveries=50, quality_levels=None, db_path=DB_
             dd_desig LIKE '%{distrito}%' 
             OR cc_desig LIKE '%{distrito}%'
         )
-        ORDER BY RANDOM()
-        LIMIT ?
     """
     
-    df_addresses = pd.read_sql_query(query, conn, params=(n_deliveries,))
+    df_addresses = _sample_addresses(conn, query, n_deliveries, seed)
     conn.close()
     
     if len(df_addresses) == 0:
@@ -262,10 +277,10 @@ def generate_random_deliveries(n_deliveries=50, quality_levels=None, db_path=DB_
     for i, row in df_addresses.iterrows():
         # Generate CP7 from CP4 if available
         cp4 = str(row['CP4']) if pd.notna(row['CP4']) else ''
-        cp7 = f"{cp4}-{random.randint(100, 999):03d}" if cp4 else ''
+        cp7 = f"{cp4}-{rnd.randint(100, 999):03d}" if cp4 else ''
         
-        # Randomly hide coordinates for 30% of rows to simulate realistic messy inputs!
-        provide_coords = random.random() < 0.7 
+        # Randomly hide coordinates for some rows to simulate realistic messy inputs!
+        provide_coords = rnd.random() >= missing_coords
         
         delivery = {
             'Codigo_Cliente': f"CL{i+1:04d}",
@@ -275,16 +290,16 @@ def generate_random_deliveries(n_deliveries=50, quality_levels=None, db_path=DB_
             'Concelho': row['cc_desig'] if pd.notna(row['cc_desig']) else '',
             'Latitude': row['LATITUDE'] if provide_coords else None,
             'Longitude': row['LONGITUDE'] if provide_coords else None,
-            'Peso_KG': round(random.uniform(5, 200), 1),
-            'Volume_m3': round(random.uniform(0.1, 2.0), 2),
-            'Prioridade': random.choice([1, 1, 2, 2, 2, 3]),
-            'Janela_Inicio': random.choice(['08:00', '09:00', '10:00']),
+            'Peso_KG': round(rnd.uniform(5, 200), 1),
+            'Volume_m3': round(rnd.uniform(0.1, 2.0), 2),
+            'Prioridade': rnd.choice([1, 1, 2, 2, 2, 3]),
+            'Janela_Inicio': rnd.choice(['08:00', '09:00', '10:00']),
             'Janela_Fim': '13:00',
             'Janela2_Inicio': '14:00',
             'Janela2_Fim': '18:00',
             'Janela3_Inicio': None,
             'Janela3_Fim': None,
-            'Observacoes': random.choice(['', '', '', 'Fragil', 'Urgente'])
+            'Observacoes': rnd.choice(['', '', '', 'Fragil', 'Urgente'])
         }
         deliveries.append(delivery)
     
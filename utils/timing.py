@@ -0,0 +1,185 @@
+"""
+Timing - Tempos por fase (spans) e perfis de pedidos longos
+StageTimer regista a duração e o número de linhas de cada fase de um pedido
+(span() como context manager, @timed como decorator para funções chamadas lá
+dentro). Os tempos vão para o log como uma linha JSON e, em modo debug, para a
+resposta. profile() embrulha um pedido em cProfile ou num amostrador de stacks
+e grava o resultado num ficheiro por job; só com SOLVER_PROFILING ativo e com
+um limite de ficheiros na pasta (os mais antigos são apagados).
+"""
+import cProfile
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("georoute.timing")
+
+PROFILE_DIR = os.getenv("SOLVER_PROFILE_DIR", "profiles")
+PROFILE_MODES = ("cprofile", "sampling")
+# Profiles are written only when the operator turns them on
+PROFILING_ENABLED = os.getenv("SOLVER_PROFILING", "false").lower() in ("1", "true", "yes")
+# Dumps kept in PROFILE_DIR; older ones are deleted after each new dump
+PROFILE_MAX_FILES = int(os.getenv("SOLVER_PROFILE_MAX_FILES", "50"))
+# Stack sampling period of the "sampling" profiler
+SAMPLE_INTERVAL_S = 0.005
+
+_current: "contextvars.ContextVar[Optional[StageTimer]]" = contextvars.ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    Per-request stage durations. Spans with the same name are merged (calls,
+    total ms and rows add up), so a per-route helper shows up once.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, stage: str, seconds: float, rows: Optional[int] = None):
+        entry = self.stages.setdefault(stage, {"stage": stage, "ms": 0.0, "calls": 0})
+        entry["ms"] += seconds * 1000.0
+        entry["calls"] += 1
+        if rows is not None:
+            entry["rows"] = entry.get("rows", 0) + int(rows)
+
+    @contextmanager
+    def span(self, stage: str, rows: Optional[int] = None):
+        """Times the block; the yielded dict's "rows" may be set inside it."""
+        info = {"rows": rows}
+        t0 = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.add(stage, time.perf_counter() - t0, info["rows"])
+
+    @contextmanager
+    def activate(self):
+        """Makes this the timer that @timed functions report to (per thread / task)."""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def report(self) -> Dict[str, Any]:
+        stages: List[Dict[str, Any]] = []
+        for entry in self.stages.values():
+            stages.append({**entry, "ms": round(entry["ms"], 1)})
+        return {"total_ms": round((time.perf_counter() - self.start) * 1000.0, 1), "stages": stages}
+
+    def log(self, **context):
+        """One structured JSON line with the stage timings and the given context."""
+        logger.info(json.dumps({"event": self.name, **context, **self.report()}, default=str))
+
+
+def timed(stage: str, rows: Optional[Callable[[Any], int]] = None):
+    """
+    Decorator: records each call into the active StageTimer (no-op without one).
+    rows, if given, maps the return value to a row count.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = _current.get()
+            if timer is None:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            result = func(*args, **kwargs)
+            timer.add(stage, time.perf_counter() - t0, rows(result) if rows else None)
+            return result
+        return wrapper
+    return decorator
+
+
+class _StackSampler:
+    """Samples one thread's stack every interval; writes collapsed stacks (flamegraph input)."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _prune_profiles(directory: str, keep: int):
+    """Deletes the oldest dumps so that at most `keep` remain in directory."""
+    dumps = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith((".prof", ".txt"))]
+    dumps.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in dumps[max(0, keep):]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def profile(mode: Optional[str], name: str, directory: Optional[str] = None):
+    """
+    Profiles the block when mode is "cprofile" (pstats dump, .prof) or
+    "sampling" (collapsed stacks, .txt); any other mode, or PROFILING_ENABLED
+    off, profiles nothing. Yields a dict whose "path" is set to the dump file
+    once the block ends.
+    """
+    info: Dict[str, Any] = {"path": None}
+    mode = str(mode or "").lower()
+    if not PROFILING_ENABLED or mode not in PROFILE_MODES:
+        yield info
+        return
+
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.{'prof' if mode == 'cprofile' else 'txt'}")
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield info
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            info["path"] = path
+            _prune_profiles(directory, PROFILE_MAX_FILES)
+    else:
+        sampler = _StackSampler(threading.get_ident())
+        sampler.start()
+        try:
+            yield info
+        finally:
+            sampler.stop()
+            sampler.dump(path)
+            info["path"] = path
+            _prune_profiles(directory, PROFILE_MAX_FILES)